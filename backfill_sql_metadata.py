@@ -0,0 +1,24 @@
+import argparse
+import asyncio
+import json
+from services.sql_metadata_backfill import backfill_sql_metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rellena los metadatos SQL (tipo, tablas, huellas) de los casos existentes"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=500,
+        help="Casos analizados y actualizados por sentencia",
+    )
+    args = parser.parse_args()
+
+    summary = asyncio.run(backfill_sql_metadata(batch_size=args.batch_size))
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
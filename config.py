@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -6,8 +8,127 @@ class Settings(BaseSettings):
     db_name: str
     db_user: str
     db_password: str
-    
+    db_pool_min: int = 1
+    db_pool_max: int = 10
+    # Segundos que una consulta espera una conexión libre del pool
+    db_pool_timeout: float = 30
+    # Intentos de una consulta ante errores de conexión (failover, conexiones
+    # cortadas) y espera exponencial con jitter entre ellos. Las escrituras
+    # solo se reintentan si no llegaron a enviarse.
+    db_retry_attempts: int = 3
+    db_retry_backoff_ms: float = 50
+    db_retry_backoff_max_ms: float = 1000
+    # Circuit breaker por nodo: fallos de conexión seguidos para abrirlo y
+    # segundos hasta dejar pasar una consulta de prueba
+    db_breaker_failure_threshold: int = 5
+    db_breaker_reset_seconds: float = 10
+    # Conexiones que deben quedar libres para ejecutar consultas en paralelo
+    db_parallel_reserve: int = 1
+    # Nodos PostgreSQL con los casos (DSN separados por comas). Vacío: todos los
+    # datos en DB_HOST. Con shards, DB_HOST queda como nodo de metadatos.
+    db_shards: str = ""
+    # Antigüedad máxima (segundos) de los facets servidos desde caché
+    facets_max_staleness: int = 30
+    # Agrupación de inserciones (group commit): desactivada por defecto
+    write_batch_enabled: bool = False
+    write_batch_max_rows: int = 100
+    # Espera máxima de una inserción antes de que su lote se escriba
+    write_batch_max_wait_ms: float = 5
+    # Tiempo máximo que una inserción espera el resultado de su lote
+    write_batch_timeout_ms: float = 5000
+    # Con sharding, buscar envíos duplicados también en los shards que no
+    # corresponden al hash (casos anteriores a esa regla de reparto)
+    duplicate_check_all_shards: bool = True
+    # statement_timeout (ms) de las consultas según la ruta; 0 desactiva
+    statement_timeout_list_ms: int = 10000
+    statement_timeout_read_ms: int = 5000
+    statement_timeout_write_ms: int = 5000
+    # Control de admisión: peticiones simultáneas por clase de ruta, tamaño
+    # de la cola de espera y plazo máximo en ella antes de responder 503.
+    # Los límites dejan margen en el pool (DB_POOL_MAX) para las consultas
+    # en paralelo del listado.
+    admission_enabled: bool = True
+    admission_read_limit: int = 6
+    admission_write_limit: int = 3
+    admission_queue_size: int = 50
+    admission_queue_timeout_ms: float = 2000
+    admission_retry_after_seconds: int = 1
+    # Idempotency-Key en la creación de casos: vigencia de una clave, tiempo
+    # que una petición puede retener una clave sin terminar y espera máxima
+    # de un reintento simultáneo antes de responder 409
+    idempotency_ttl_hours: float = 24
+    idempotency_lock_seconds: float = 30
+    idempotency_wait_seconds: float = 10
+    idempotency_sweep_interval_seconds: float = 300
+    # Trazas: none (desactivadas), file (OTLP-JSON en TRACING_FILE_PATH),
+    # otlp (POST a un colector OTLP/HTTP) o log
+    tracing_exporter: str = "none"
+    tracing_file_path: str = "traces.jsonl"
+    tracing_otlp_endpoint: str = "http://localhost:4318/v1/traces"
+    # Fracción de peticiones trazadas cuando quien llama no envía traceparent
+    tracing_sample_rate: float = 1.0
+    # Token de las rutas /api/admin (perfilado y tracemalloc) y de la
+    # cabecera X-Profile; vacío las desactiva
+    admin_token: str = ""
+    # Captura de la carga real (forma saneada de cada petición) en un NDJSON
+    # rotado por tamaño, para reproducirla con replay_workload.py
+    workload_capture_enabled: bool = False
+    workload_capture_path: str = "workload_capture.jsonl"
+    workload_capture_max_mb: float = 50
+    workload_capture_backups: int = 5
+    workload_capture_sample_rate: float = 1.0
+    # sql_query y execution_result de más de PAYLOAD_INLINE_MAX_BYTES se
+    # guardan comprimidos fuera de la fila; en ella queda un avance de
+    # PAYLOAD_PREVIEW_BYTES
+    payload_inline_max_bytes: int = 64 * 1024
+    payload_preview_bytes: int = 2048
+    # Compresión de las respuestas de la API (zstd/br si están instalados,
+    # gzip siempre) a partir de este tamaño en bytes
+    compression_enabled: bool = True
+    compression_min_bytes: int = 1024
+    # ETag del listado (filtros + versión de la tabla en cada shard): las
+    # consultas repetidas sin cambios responden 304 sin cuerpo
+    listing_etag_enabled: bool = True
+    # Caché de lecturas de casos en dos niveles: L1 en cada proceso y L2
+    # compartida por los workers. CACHE_BACKEND: none (desactivada), memory
+    # (L2 dentro del proceso: un solo worker o pruebas) o redis (servidor
+    # compatible con el protocolo de Redis en CACHE_REDIS_URL)
+    cache_backend: str = "none"
+    cache_redis_url: str = "redis://localhost:6379/0"
+    cache_redis_pool_size: int = 8
+    # Plazo de cada operación con la L2; al vencer se lee de la BD
+    cache_redis_timeout_ms: float = 100
+    # Vigencia de las entradas en L2 y en L1. La de L1 es corta: si la L2 no
+    # responde, las invalidaciones de otros workers no llegan
+    cache_ttl_seconds: float = 300
+    cache_l1_ttl_seconds: float = 10
+    cache_l1_max_entries: int = 10000
+    # Las entradas de L2 a partir de este tamaño se guardan comprimidas
+    cache_compress_min_bytes: int = 512
+    # Tras invalidar una clave, tiempo en que L2 no acepta volver a llenarla
+    cache_invalidation_window_ms: float = 2000
+    # Protección contra estampidas entre workers: duración del candado de
+    # carga de una clave y espera máxima del valor antes de ir a la BD
+    cache_lock_ms: float = 2000
+    cache_lock_wait_ms: float = 200
+    # Fracción de peticiones cuyo desglose de tiempos se registra en el log;
+    # las que superan TIMING_LOG_SLOW_MS se registran siempre
+    timing_log_sample_rate: float = 0.01
+    timing_log_slow_ms: float = 1000
+
     class Config:
         env_file = ".env"
 
-settings = Settings()
\ No newline at end of file
+
+@lru_cache
+def get_settings() -> Settings:
+    """Load settings on first use instead of at import time"""
+    return Settings()
+
+
+def __getattr__(name):
+    # Compatibilidad con ``from config import settings``: la configuración
+    # se sigue cargando solo cuando alguien la pide.
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,58 +1,368 @@
-import psycopg2
-from psycopg2 import pool
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT, ISOLATION_LEVEL_DEFAULT
-from database.support_queries import CREATE_CASE_TABLE
-from config import settings
+import asyncio
+import time
+from threading import BoundedSemaphore, Lock
+from typing import Optional
+from database.support_queries import (
+    ADD_PAYLOAD_COLUMNS,
+    ADD_SQL_METADATA_COLUMNS,
+    CREATE_CASE_INDEXES,
+    CREATE_CASE_TABLE,
+    CREATE_EVENT_ID_SEQUENCE,
+    CREATE_EVENT_INDEXES,
+    CREATE_EVENT_TABLE,
+    CREATE_IDEMPOTENCY_INDEXES,
+    CREATE_IDEMPOTENCY_TABLE,
+    CREATE_PAYLOAD_TABLE,
+    CREATE_WRITE_TXID_TRIGGER,
+)
+from config import get_settings
+from database.resilience import backoff_delay, get_breaker, is_connection_error
+from utils.metrics import metrics
+from utils.profiling import run_profiled
+from utils.statement_timeout import current_statement_timeout
+from utils.timing import record, record_query
+from utils.tracing import SPAN_KIND_CLIENT, current_span, start_span
+
+# psycopg2 se importa dentro de las funciones: importar este módulo no debe
+# cargar el driver ni abrir conexiones (arranque rápido y tests sin BD).
 
 class Database:
-    def __init__(self):
-        self.connection_pool = psycopg2.pool.SimpleConnectionPool(
-            1, 10,
+    def __init__(self, dsn: Optional[str] = None, name: str = "default"):
+        # Sin dsn se usan DB_HOST/DB_PORT/... de la configuración
+        self.dsn = dsn
+        self.name = name
+        self._connection_pool = None
+        self._slots = None
+        self._lock = Lock()
+        self.parallel_reserve = 1
+        self.acquire_timeout = 30.0
+
+    @property
+    def connection_pool(self):
+        """Create the pool on first use"""
+        if self._connection_pool is None:
+            with self._lock:
+                if self._connection_pool is None:
+                    self._connection_pool = self._create_pool()
+                    # ThreadedConnectionPool lanza PoolError en vez de esperar
+                    # cuando se agota: cada hilo reserva un hueco antes de getconn
+                    self._slots = BoundedSemaphore(self._connection_pool.maxconn)
+        return self._connection_pool
+
+    @property
+    def is_open(self):
+        return self._connection_pool is not None
+
+    def _create_pool(self):
+        from psycopg2 import pool
+
+        settings = get_settings()
+        self.parallel_reserve = settings.db_parallel_reserve
+        self.acquire_timeout = settings.db_pool_timeout
+        # Pool seguro entre hilos: las consultas se ejecutan fuera del event loop
+        if self.dsn:
+            return pool.ThreadedConnectionPool(
+                settings.db_pool_min, settings.db_pool_max, dsn=self.dsn
+            )
+        return pool.ThreadedConnectionPool(
+            settings.db_pool_min, settings.db_pool_max,
             host=settings.db_host,
             port=settings.db_port,
             user=settings.db_user,
             password=settings.db_password
         )
 
+    def pool_usage(self):
+        """Return (connections in use, max connections), or None if not open"""
+        connection_pool = self._connection_pool
+        if connection_pool is None:
+            return None
+        # _used es interno de psycopg2 pero es la única forma de medir el uso
+        return len(connection_pool._used), connection_pool.maxconn
+
+    def has_headroom(self, needed: int) -> bool:
+        """Whether ``needed`` connections can be taken leaving the reserve free"""
+        usage = self.pool_usage()
+        if usage is None:
+            # El pool se creará con todas sus conexiones libres
+            return True
+        in_use, max_connections = usage
+        return max_connections - in_use >= needed + self.parallel_reserve
+
+    def open(self):
+        """Eagerly create the pool (used by the app lifespan)"""
+        return self.connection_pool
+
     def get_connection(self, autocommit=False):
-        conn = self.connection_pool.getconn()
-        if autocommit:
-            conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        """Take a connection, waiting up to ``acquire_timeout`` for a free one"""
+        connection_pool = self.connection_pool
+        slots = self._slots
+        if not slots.acquire(timeout=self.acquire_timeout):
+            from psycopg2.pool import PoolError
+            metrics.increment("db_pool_timeouts_total")
+            raise PoolError(
+                f"No hay conexiones libres en el pool '{self.name}' "
+                f"tras {self.acquire_timeout:g} s"
+            )
+        try:
+            conn = connection_pool.getconn()
+            while conn.closed:
+                # Cerrada por un fallo anterior: se descarta y se toma otra
+                connection_pool.putconn(conn, close=True)
+                conn = connection_pool.getconn()
+            if autocommit:
+                from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        except BaseException:
+            slots.release()
+            raise
         return conn
 
     def return_connection(self, connection):
-        connection.set_isolation_level(ISOLATION_LEVEL_DEFAULT)
-        self.connection_pool.putconn(connection)
+        from psycopg2.extensions import ISOLATION_LEVEL_DEFAULT
+        # Sin la propiedad connection_pool: devolver una conexión no debe
+        # reabrir un pool cerrado por close_all_connections()
+        connection_pool = self._connection_pool
+        slots = self._slots
+        try:
+            if connection_pool is None:
+                connection.close()
+                return
+            connection.set_isolation_level(ISOLATION_LEVEL_DEFAULT)
+            connection_pool.putconn(connection)
+        finally:
+            if slots is not None:
+                slots.release()
+
+    def discard_connection(self, connection):
+        """Close a broken connection instead of returning it to the pool"""
+        connection_pool = self._connection_pool
+        slots = self._slots
+        try:
+            if connection_pool is not None:
+                connection_pool.putconn(connection, close=True)
+                metrics.increment("db_connections_evicted_total")
+            else:
+                connection.close()
+        finally:
+            if slots is not None:
+                slots.release()
 
     def close_all_connections(self):
-        self.connection_pool.closeall()
+        with self._lock:
+            if self._connection_pool is not None:
+                self._connection_pool.closeall()
+                self._connection_pool = None
+                self._slots = None
 
 db = Database()
 
-async def execute(query, params=None, fetch_one=False, fetch_all=False, autocommit=False):
-    conn = db.get_connection(autocommit=autocommit)
+metrics.register_gauge("db_pool_in_use", lambda: (db.pool_usage() or (0, 0))[0])
+metrics.register_gauge("db_pool_max", lambda: (db.pool_usage() or (0, 0))[1])
+
+def get_database(shard: Optional[int] = None) -> Database:
+    """Database for a shard index; ``None`` is the main (metadata) node"""
+    if shard is None:
+        return db
+    from database.sharding import get_router
+    return get_router().databases[shard]
+
+class QueryCancelled(Exception):
+    """The query was cancelled before it reached the database"""
+
+
+class _QueryHandle:
+    """Connection running a query, so another thread can cancel it server-side"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._connection = None
+        self.cancelled = False
+        # Si la consulta pudo llegar al servidor (decide si reintentar escrituras)
+        self.sent = False
+
+    def attach(self, connection):
+        with self._lock:
+            if self.cancelled:
+                raise QueryCancelled("Consulta cancelada")
+            self._connection = connection
+            self.sent = True
+
+    def detach(self):
+        with self._lock:
+            self._connection = None
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            connection = self._connection
+        if connection is not None:
+            # Envía una petición de cancelación al servidor; la consulta en
+            # curso falla enseguida y la conexión vuelve al pool
+            connection.cancel()
+
+
+async def execute(query, params=None, fetch_one=False, fetch_all=False, autocommit=False, shard=None,
+                  row_count=False, idempotent=None):
+    """Run ``query`` on a pooled connection of ``shard`` (``None``: main node).
+
+    Connection failures are retried with jittered backoff when it is safe:
+    always if the query never reached the server, otherwise only for
+    ``idempotent`` queries (by default, SELECTs). The node's circuit breaker
+    fails fast with ``DatabaseUnavailable`` while the database is down.
+    """
+    # psycopg2 es bloqueante: la consulta corre en un hilo para no bloquear el
+    # event loop y permitir que varias consultas avancen a la vez
+    start = time.perf_counter()
+    statement_timeout_ms = current_statement_timeout()
+    breaker = get_breaker(shard)
+    with start_span("db.query", SPAN_KIND_CLIENT) as span:
+        if span is not None:
+            _describe_query(span, query, shard, statement_timeout_ms)
+        attempt = 0
+        try:
+            while True:
+                attempt += 1
+                probe = breaker.before_call()
+                handle = _QueryHandle()
+                task = asyncio.ensure_future(asyncio.to_thread(
+                    run_profiled, _execute_sync, get_database(shard), query, params, fetch_one,
+                    fetch_all, autocommit, row_count, statement_timeout_ms, handle,
+                ))
+                try:
+                    # El hilo no se puede interrumpir: si la petición se cancela (el
+                    # cliente se desconectó) se cancela la consulta en el servidor y se
+                    # espera a que el hilo devuelva la conexión
+                    result = await asyncio.shield(task)
+                except asyncio.CancelledError:
+                    breaker.release(probe)
+                    handle.cancel()
+                    metrics.increment("db_queries_cancelled_total")
+                    await asyncio.gather(task, return_exceptions=True)
+                    raise
+                except Exception as e:
+                    if not is_connection_error(e):
+                        # El servidor respondió: el error es de la consulta
+                        breaker.record_success(probe)
+                        raise
+                    breaker.record_failure(probe)
+                    settings = get_settings()
+                    if idempotent is None:
+                        idempotent = _is_read_only(query)
+                    if attempt >= settings.db_retry_attempts or (handle.sent and not idempotent):
+                        raise
+                    metrics.increment("db_retries_total")
+                    if span is not None:
+                        span.set_attribute("db.retries", attempt)
+                    await asyncio.sleep(backoff_delay(
+                        attempt, settings.db_retry_backoff_ms, settings.db_retry_backoff_max_ms
+                    ))
+                    continue
+                breaker.record_success(probe)
+                return result
+        finally:
+            record_query(query, shard, (time.perf_counter() - start) * 1000)
+
+def _is_read_only(query) -> bool:
+    from utils.sql_analyzer import is_read_only
+    return is_read_only(query)
+
+def _describe_query(span, query, shard, statement_timeout_ms):
+    """Span attributes with the shape of the query (never its parameters)"""
+    from utils.sql_analyzer import analyze_sql
+    analysis = analyze_sql(query)
+    span.set_attribute("db.system", "postgresql")
+    span.set_attribute("db.operation", analysis.statement_type)
+    span.set_attribute("db.sql.table", analysis.target_tables)
+    span.set_attribute("db.query.fingerprint", analysis.fingerprint)
+    if shard is not None:
+        span.set_attribute("db.shard", shard)
+    if statement_timeout_ms:
+        span.set_attribute("db.statement_timeout_ms", statement_timeout_ms)
+
+def _execute_sync(database, query, params, fetch_one, fetch_all, autocommit, row_count=False,
+                  statement_timeout_ms=None, handle=None):
+    start = time.perf_counter()
+    conn = database.get_connection(autocommit=autocommit)
+    acquire_ms = (time.perf_counter() - start) * 1000
+    record("db-acquire", acquire_ms)
+    # asyncio.to_thread copia el contexto: este es el span de execute()
+    span = current_span()
+    if span is not None:
+        span.set_attribute("db.pool_wait_ms", round(acquire_ms, 3))
+    if statement_timeout_ms and not autocommit:
+        # SET LOCAL dura lo que la transacción y va en el mismo envío
+        query = f"SET LOCAL statement_timeout = {int(statement_timeout_ms)};\n{query}"
+    broken = False
     try:
+        if handle is not None:
+            handle.attach(conn)
         with conn.cursor() as cursor:
             cursor.execute(query, params)
             if fetch_one:
                 result = cursor.fetchone()
             elif fetch_all:
                 result = cursor.fetchall()
+            elif row_count:
+                result = cursor.rowcount
             else:
                 result = None
+            if span is not None:
+                span.set_attribute("db.rows", _rows(result, fetch_one, fetch_all, cursor))
             if not autocommit:
                 conn.commit()
             return result
     except Exception as e:
-        if not autocommit:
+        broken = is_connection_error(e)
+        if not autocommit and not broken:
             conn.rollback()
         raise e
     finally:
-        db.return_connection(conn)
+        if handle is not None:
+            handle.detach()
+        if broken:
+            database.discard_connection(conn)
+        else:
+            database.return_connection(conn)
 
-async def drop_database(db_name: str):
-    """Drop a database if it exists"""
-    # Connect to default 'postgres' database for admin operations
+def _rows(result, fetch_one, fetch_all, cursor) -> int:
+    if fetch_one:
+        return 0 if result is None else 1
+    if fetch_all:
+        return len(result)
+    return max(getattr(cursor, "rowcount", -1), 0)
+
+def stream_rows(query, params=None, chunk_size=5000, cursor_name="stream_cursor", shard=None):
+    """Yield result rows in chunks through a server-side (named) cursor.
+
+    Only ``chunk_size`` rows are held in memory at a time, so large tables
+    can be read without materializing the full result. Synchronous: meant
+    for batch jobs, not request handlers.
+    """
+    database = get_database(shard)
+    conn = database.get_connection()
+    try:
+        with conn.cursor(name=cursor_name) as cursor:
+            cursor.itersize = chunk_size
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        database.return_connection(conn)
+
+def _admin_connection():
+    """Connect to the default 'postgres' database for admin operations"""
+    import psycopg2
+    from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+    settings = get_settings()
     admin_conn = psycopg2.connect(
         host=settings.db_host,
         port=settings.db_port,
@@ -61,6 +371,11 @@ async def drop_database(db_name: str):
         database='postgres'
     )
     admin_conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    return admin_conn
+
+async def drop_database(db_name: str):
+    """Drop a database if it exists"""
+    admin_conn = _admin_connection()
     try:
         with admin_conn.cursor() as cursor:
             cursor.execute(f"DROP DATABASE IF EXISTS {db_name}")
@@ -69,15 +384,7 @@ async def drop_database(db_name: str):
 
 async def create_database(db_name: str):
     """Create a new database"""
-    # Connect to default 'postgres' database for admin operations
-    admin_conn = psycopg2.connect(
-        host=settings.db_host,
-        port=settings.db_port,
-        user=settings.db_user,
-        password=settings.db_password,
-        database='postgres'
-    )
-    admin_conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    admin_conn = _admin_connection()
     try:
         with admin_conn.cursor() as cursor:
             cursor.execute(f"CREATE DATABASE {db_name}")
@@ -85,5 +392,42 @@ async def create_database(db_name: str):
         admin_conn.close()
 
 async def create_tables():
-    """Create tables in the current database"""
-    await execute(CREATE_CASE_TABLE)
\ No newline at end of file
+    """Create tables and indexes on every shard, and the metadata tables on the main node"""
+    from database.sharding import get_router
+    router = get_router()
+    for shard in range(router.count):
+        await execute(CREATE_CASE_TABLE, shard=shard)
+        await execute(ADD_SQL_METADATA_COLUMNS, shard=shard)
+        await execute(ADD_PAYLOAD_COLUMNS, shard=shard)
+        for statement in CREATE_PAYLOAD_TABLE:
+            await execute(statement, shard=shard)
+        for statement in CREATE_WRITE_TXID_TRIGGER:
+            await execute(statement, shard=shard)
+        await create_indexes(shard=shard)
+        await create_event_table(shard=shard, shard_count=router.count)
+    await create_idempotency_table()
+
+async def create_idempotency_table():
+    """Create the idempotency key table on the main (metadata) node"""
+    await execute(CREATE_IDEMPOTENCY_TABLE)
+    for statement in CREATE_IDEMPOTENCY_INDEXES:
+        await execute(statement)
+
+async def create_indexes(shard=None):
+    """Create the indexes used by the list filters"""
+    for statement in CREATE_CASE_INDEXES:
+        await execute(statement, shard=shard)
+
+async def create_event_table(shard=None, shard_count=1):
+    """Create the append-only case event log and its indexes.
+
+    The event id sequence of shard ``k`` out of ``n`` yields k+1, k+1+n, ...
+    so ids are unique across shards and cross-shard cursors stay valid.
+    """
+    position = shard or 0
+    await execute(
+        CREATE_EVENT_ID_SEQUENCE.format(step=shard_count, start=position + 1), shard=shard
+    )
+    await execute(CREATE_EVENT_TABLE, shard=shard)
+    for statement in CREATE_EVENT_INDEXES:
+        await execute(statement, shard=shard)
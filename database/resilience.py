@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import random
+import time
+from threading import Lock
+from typing import Dict, Optional
+from config import get_settings
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Tolerancia a caídas de PostgreSQL (failover, conexiones inactivas cortadas):
+# - Los errores de conexión se distinguen de los errores de la consulta.
+# - execute() reintenta con espera exponencial y jitter las lecturas y las
+#   escrituras que no llegaron a enviarse.
+# - Un circuit breaker por nodo corta las llamadas mientras la BD no
+#   responde y deja pasar una sola consulta de prueba cada cierto tiempo.
+
+# SQLSTATE de conexión (08xxx) y de servidor apagándose o arrancando (57P0x)
+_CONNECTION_SQLSTATE_PREFIXES = ("08", "57P")
+
+BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class DatabaseUnavailable(Exception):
+    """Raised without touching the pool while a node's circuit breaker is open"""
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """Whether ``error`` means the connection (not the query) failed"""
+    import psycopg2
+
+    if not isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+        return False
+    # Sin SQLSTATE: libpq perdió la conexión. Con SQLSTATE solo cuentan los de
+    # conexión; statement_timeout (57014) o un deadlock (40P01) no.
+    pgcode = getattr(error, "pgcode", None)
+    return pgcode is None or pgcode.startswith(_CONNECTION_SQLSTATE_PREFIXES)
+
+
+def is_infrastructure_error(error: BaseException) -> bool:
+    """Whether ``error`` is a failure of the database, not of the request.
+
+    Connection losses, timeouts, an exhausted pool or an open breaker: the
+    same request may succeed later, so the caller should get a 5xx.
+    """
+    import psycopg2
+    from psycopg2.pool import PoolError
+
+    return isinstance(error, (
+        DatabaseUnavailable, PoolError, asyncio.TimeoutError,
+        psycopg2.OperationalError, psycopg2.InterfaceError,
+    ))
+
+
+def backoff_delay(attempt: int, base_ms: float, max_ms: float) -> float:
+    """Seconds to wait before retry ``attempt`` (1-based): exponential with full jitter"""
+    return random.uniform(0, min(max_ms, base_ms * 2 ** (attempt - 1))) / 1000
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe.
+
+    After ``failure_threshold`` connection failures in a row the breaker
+    opens and calls fail fast for ``reset_seconds``. Then one call is let
+    through as a probe: if it succeeds the breaker closes, otherwise it
+    opens again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == "open" and self._clock() - self._opened_at >= self.reset_seconds:
+            self._state = "half_open"
+        return self._state
+
+    def before_call(self) -> bool:
+        """Admit a call; returns True if it is the half-open probe.
+
+        Raises ``DatabaseUnavailable`` while the breaker is open.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == "closed":
+                return False
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                metrics.increment("db_breaker_probes_total")
+                return True
+            retry_in = max(0.0, self.reset_seconds - (self._clock() - self._opened_at))
+        metrics.increment("db_breaker_rejected_total")
+        raise DatabaseUnavailable(
+            f"La base de datos '{self.name}' no está disponible; "
+            f"se reintentará en {retry_in:.0f} s"
+        )
+
+    def record_success(self, probe: bool = False):
+        with self._lock:
+            self._failures = 0
+            if self._state != "closed":
+                logger.info("Circuit breaker de '%s' cerrado: la base de datos responde", self.name)
+            self._state = "closed"
+            if probe:
+                self._probing = False
+
+    def record_failure(self, probe: bool = False):
+        with self._lock:
+            self._failures += 1
+            if probe:
+                self._probing = False
+            if probe or (self._state == "closed" and self._failures >= self.failure_threshold):
+                if self._state != "open":
+                    metrics.increment("db_breaker_opened_total")
+                    logger.warning(
+                        "Circuit breaker de '%s' abierto tras %d fallos de conexión",
+                        self.name, self._failures,
+                    )
+                self._state = "open"
+                self._opened_at = self._clock()
+
+    def release(self, probe: bool):
+        """Give the probe slot back when the probing call ended without a verdict"""
+        if probe:
+            with self._lock:
+                self._probing = False
+
+
+_breakers: Dict[Optional[int], CircuitBreaker] = {}
+_breakers_lock = Lock()
+
+
+def get_breaker(shard: Optional[int] = None) -> CircuitBreaker:
+    """Circuit breaker of a shard (``None`` is the main node), built from the settings"""
+    if shard is None:
+        # Sin sharding el nodo principal es el shard 0: un solo breaker
+        from database.sharding import get_router
+        if get_router().count == 1:
+            shard = 0
+    breaker = _breakers.get(shard)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(shard)
+            if breaker is None:
+                from database.sharding import get_router
+                settings = get_settings()
+                main = shard is None or get_router().count == 1
+                label = "main" if main else f"shard{shard}"
+                breaker = _breakers[shard] = CircuitBreaker(
+                    label, settings.db_breaker_failure_threshold, settings.db_breaker_reset_seconds
+                )
+                metrics.register_gauge(
+                    f"db_breaker_{label}_state", lambda b=breaker: BREAKER_STATES[b.state]
+                )
+    return breaker
+
+
+def reset_breakers():
+    with _breakers_lock:
+        _breakers.clear()
+
+
+metrics.register_gauge(
+    "db_breakers_open",
+    lambda: sum(1 for breaker in list(_breakers.values()) if breaker.state != "closed"),
+)
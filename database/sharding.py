@@ -0,0 +1,80 @@
+import uuid
+from threading import Lock
+from typing import Dict, Iterable, List
+from config import get_settings
+from database.connection import Database, db
+
+# Reparto horizontal de support_cases (y sus eventos) entre varios nodos.
+# Cada caso vive en el shard que indica el hash de su id; las consultas que
+# no conocen el id se reparten entre todos los shards y se combinan.
+
+
+class ShardRouter:
+    def __init__(self, databases: List[Database]):
+        if not databases:
+            raise ValueError("Se requiere al menos un shard")
+        self.databases = databases
+
+    @property
+    def count(self) -> int:
+        return len(self.databases)
+
+    def shard_for(self, case_id) -> int:
+        """Owning shard of a case: its UUID as an integer modulo the shard count"""
+        if self.count == 1:
+            return 0
+        return uuid.UUID(str(case_id)).int % self.count
+
+    def shard_for_key(self, key: str) -> int:
+        """Shard for a hex hash key (e.g. a submission hash)"""
+        return int(key, 16) % self.count
+
+    def new_case_id(self, shard: int) -> uuid.UUID:
+        """Random case id owned by ``shard``.
+
+        Lets cases that must be checked against each other (same submission
+        hash) live on the same shard; takes ``count`` tries on average.
+        """
+        while True:
+            case_id = uuid.uuid4()
+            if self.shard_for(case_id) == shard:
+                return case_id
+
+    def group_by_shard(self, ids: Iterable) -> Dict[int, List[str]]:
+        """Split ids by owning shard, keeping their relative order"""
+        groups = {}
+        for case_id in ids:
+            groups.setdefault(self.shard_for(case_id), []).append(str(case_id))
+        return groups
+
+    def close_all_connections(self):
+        for database in self.databases:
+            database.close_all_connections()
+
+
+_router = None
+_router_lock = Lock()
+
+
+def build_router(shards: str) -> ShardRouter:
+    dsns = [dsn.strip() for dsn in shards.split(",") if dsn.strip()]
+    if not dsns:
+        return ShardRouter([db])
+    return ShardRouter([Database(dsn, name=f"shard{i}") for i, dsn in enumerate(dsns)])
+
+
+def get_router() -> ShardRouter:
+    """Router built from DB_SHARDS on first use"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = build_router(get_settings().db_shards)
+    return _router
+
+
+def set_router(router: ShardRouter):
+    """Replace the router (tests and tools)"""
+    global _router
+    with _router_lock:
+        _router = router
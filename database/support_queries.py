@@ -1,7 +1,12 @@
-GET_PAGINATED_CASES = """
-SELECT 
-    id, title, description, database_name, schema_name, 
-    sql_query, executed_by, status, created_at, updated_at, execution_result
+CASE_COLUMNS = """
+    id, title, description, database_name, schema_name,
+    sql_query, executed_by, status, priority, created_at, updated_at, execution_result,
+    statement_type, target_tables, sql_fingerprint,
+    sql_query_bytes, execution_result_bytes
+"""
+
+GET_PAGINATED_CASES = f"""
+SELECT {CASE_COLUMNS}
 FROM support_cases
 ORDER BY created_at DESC
 LIMIT %s OFFSET %s
@@ -11,6 +16,190 @@ GET_TOTAL_CASES = """
 SELECT COUNT(*) FROM support_cases
 """
 
+GET_CASE_BY_ID = f"""
+SELECT {CASE_COLUMNS}
+FROM support_cases
+WHERE id = %s
+"""
+
+GET_CASES_BY_IDS = f"""
+SELECT {CASE_COLUMNS}
+FROM support_cases
+WHERE id = ANY(%s::uuid[])
+"""
+
+# Estados en los que un caso cuenta como abierto para detectar envíos
+# duplicados. El mismo literal se usa en el índice parcial y en las consultas
+# para que el planificador pueda usar ese índice.
+OPEN_CASE_STATUSES = ("pendiente", "en_proceso", "en_pausa")
+OPEN_STATUS_CONDITION = "status IN (" + ", ".join(f"'{s}'" for s in OPEN_CASE_STATUSES) + ")"
+
+# Columnas de texto que pueden guardarse fuera de la fila, comprimidas
+PAYLOAD_FIELDS = ("sql_query", "execution_result")
+PAYLOAD_ENCODING = "zlib"
+
+# Cada escritura registra su evento en support_case_events dentro de la misma
+# sentencia (y por tanto de la misma transacción) que modifica el caso.
+#
+# La inserción se omite si ya hay un caso abierto con el mismo
+# submission_hash (salvo allow_duplicate). El bloqueo advisory por hash,
+# tomado en la misma transacción, serializa los envíos idénticos simultáneos;
+# se toman en orden para que dos lotes no se bloqueen entre sí.
+#
+# Un sql_query grande llega ya comprimido (services/payload_service.py): en
+# la fila queda el avance y su tamaño, y el texto completo se guarda en
+# support_case_payloads en la misma sentencia, solo si el caso se inserta.
+INSERT_CASE_ROW = (
+    "(%s::uuid, %s, %s, %s, %s, %s, %s, %s, %s::timestamp, %s::timestamp, %s,"
+    " %s, %s::text[], %s, %s, %s::boolean, %s::integer, %s::bytea)"
+)
+
+LOCK_SUBMISSIONS = """
+SELECT pg_advisory_xact_lock(hashtextextended(k, 0))
+FROM (SELECT DISTINCT k FROM unnest(%s::text[]) AS k ORDER BY k) AS keys;
+"""
+
+INSERT_CASE = LOCK_SUBMISSIONS + f"""
+WITH candidate (
+    id, title, description, database_name, schema_name,
+    sql_query, executed_by, status, created_at, updated_at, priority,
+    statement_type, target_tables, sql_fingerprint, submission_hash, allow_duplicate,
+    sql_query_bytes, sql_query_payload
+) AS (
+    VALUES {INSERT_CASE_ROW}
+),
+inserted AS (
+    INSERT INTO support_cases (
+        id, title, description, database_name, schema_name,
+        sql_query, executed_by, status, created_at, updated_at, priority,
+        statement_type, target_tables, sql_fingerprint, submission_hash, sql_query_bytes
+    )
+    SELECT
+        id, title, description, database_name, schema_name,
+        sql_query, executed_by, status, created_at, updated_at, priority,
+        statement_type, target_tables, sql_fingerprint, submission_hash, sql_query_bytes
+    FROM candidate AS c
+    WHERE c.allow_duplicate OR NOT EXISTS (
+        SELECT 1 FROM support_cases AS s
+        WHERE s.submission_hash = c.submission_hash AND s.{OPEN_STATUS_CONDITION}
+    )
+    RETURNING id, status, executed_by, created_at
+),
+event AS (
+    INSERT INTO support_case_events (case_id, event_type, to_value, actor, occurred_at)
+    SELECT id, 'created', status, executed_by, created_at FROM inserted
+),
+payload AS (
+    INSERT INTO support_case_payloads (case_id, field, encoding, byte_length, data)
+    SELECT c.id, 'sql_query', '{PAYLOAD_ENCODING}', c.sql_query_bytes, c.sql_query_payload
+    FROM candidate AS c
+    JOIN inserted AS i ON i.id = c.id
+    WHERE c.sql_query_payload IS NOT NULL
+)
+SELECT id FROM inserted
+"""
+
+def build_insert_cases_query(rows: int) -> str:
+    """Multi-row INSERT_CASE for ``rows`` cases (see insert_cases_params)"""
+    values = ",\n        ".join([INSERT_CASE_ROW] * rows)
+    return INSERT_CASE.replace(f"VALUES {INSERT_CASE_ROW}", f"VALUES\n        {values}")
+
+
+def insert_cases_params(rows) -> tuple:
+    """Parameters of build_insert_cases_query: the submission hashes to lock, then each row"""
+    return ([row[14] for row in rows],) + tuple(value for row in rows for value in row)
+
+
+GET_OPEN_CASE_BY_SUBMISSION = f"""
+SELECT {CASE_COLUMNS}
+FROM support_cases
+WHERE submission_hash = %s AND {OPEN_STATUS_CONDITION}
+ORDER BY created_at
+LIMIT 1
+"""
+
+# Actualizaciones masivas en una sola sentencia: "target" bloquea las filas
+# pedidas y devuelve el valor previo, "updated" aplica el cambio solo a las
+# que admiten la transición, "events" registra cada cambio aplicado y el
+# SELECT final informa el resultado por ID.
+BULK_UPDATE_STATUS = """
+WITH target AS (
+    SELECT id, status FROM support_cases
+    WHERE id = ANY(%s::uuid[])
+    FOR UPDATE
+),
+updated AS (
+    UPDATE support_cases AS c
+    SET status = %s, updated_at = %s
+    FROM target AS t
+    WHERE c.id = t.id AND t.status = ANY(%s)
+    RETURNING c.id, c.status, c.updated_at
+),
+events AS (
+    INSERT INTO support_case_events (case_id, event_type, from_value, to_value, actor, occurred_at)
+    SELECT u.id, 'status_changed', t.status, u.status, %s, u.updated_at
+    FROM updated AS u
+    JOIN target AS t ON t.id = u.id
+)
+SELECT t.id, t.status, u.id IS NOT NULL
+FROM target AS t
+LEFT JOIN updated AS u ON u.id = t.id
+"""
+
+BULK_UPDATE_PRIORITY = """
+WITH target AS (
+    SELECT id, priority FROM support_cases
+    WHERE id = ANY(%s::uuid[])
+    FOR UPDATE
+),
+updated AS (
+    UPDATE support_cases AS c
+    SET priority = %s, updated_at = %s
+    FROM target AS t
+    WHERE c.id = t.id AND t.priority <> %s
+    RETURNING c.id, c.priority, c.updated_at
+),
+events AS (
+    INSERT INTO support_case_events (case_id, event_type, from_value, to_value, actor, occurred_at)
+    SELECT u.id, 'priority_changed', t.priority, u.priority, %s, u.updated_at
+    FROM updated AS u
+    JOIN target AS t ON t.id = u.id
+)
+SELECT t.id, t.priority, u.id IS NOT NULL
+FROM target AS t
+LEFT JOIN updated AS u ON u.id = t.id
+"""
+
+EVENT_COLUMNS = "id, case_id, event_type, from_value, to_value, actor, occurred_at"
+
+# Línea de tiempo de un caso: índice (case_id, id), paginación por keyset
+GET_CASE_EVENTS = f"""
+SELECT {EVENT_COLUMNS}
+FROM support_case_events
+WHERE case_id = %s AND id > %s
+ORDER BY id
+LIMIT %s
+"""
+
+# Versión de support_cases en un shard para el ETag del listado. El trigger
+# fija write_txid en cada inserción y actualización, así que max(write_txid)
+# cambia con cada escritura; se lee del extremo del índice. Una transacción
+# con un id menor que aún no ha confirmado no movería el máximo al hacerlo:
+# por eso la versión incluye también los ids en curso por debajo del máximo,
+# que salen de esa lista al terminar.
+GET_CASES_VERSION = """
+WITH latest AS (
+    SELECT coalesce(max(write_txid), 0) AS txid FROM support_cases
+)
+SELECT latest.txid, ARRAY(
+    SELECT x::text::bigint
+    FROM pg_snapshot_xip(pg_current_snapshot()) AS x
+    WHERE x::text::bigint < latest.txid
+    ORDER BY 1
+)
+FROM latest
+"""
+
 CREATE_CASE_TABLE = """
 CREATE TABLE IF NOT EXISTS support_cases (
     id UUID PRIMARY KEY,
@@ -24,6 +213,383 @@ CREATE TABLE IF NOT EXISTS support_cases (
     created_at TIMESTAMP NOT NULL,
     updated_at TIMESTAMP NOT NULL,
     execution_result TEXT,
-    priority VARCHAR(50) NOT NULL
+    priority VARCHAR(50) NOT NULL,
+    statement_type VARCHAR(20),
+    target_tables TEXT[],
+    sql_fingerprint VARCHAR(16),
+    submission_hash VARCHAR(32),
+    write_txid BIGINT,
+    sql_query_bytes INTEGER,
+    execution_result_bytes INTEGER
 )
-"""
\ No newline at end of file
+"""
+
+# Metadatos extraídos de sql_query (utils/sql_analyzer.py) en tablas creadas
+# antes de que existieran estas columnas; backfill_sql_metadata.py los rellena
+ADD_SQL_METADATA_COLUMNS = """
+ALTER TABLE support_cases
+    ADD COLUMN IF NOT EXISTS statement_type VARCHAR(20),
+    ADD COLUMN IF NOT EXISTS target_tables TEXT[],
+    ADD COLUMN IF NOT EXISTS sql_fingerprint VARCHAR(16),
+    ADD COLUMN IF NOT EXISTS submission_hash VARCHAR(32)
+"""
+
+# Transacción que escribió la fila por última vez, fijada por la base de datos
+# (no por la aplicación). La exportación incremental de snapshots lee por
+# rangos de este valor: todo id de transacción menor que el xmin del snapshot
+# actual pertenece a una transacción ya terminada (requiere PostgreSQL 13+).
+CREATE_WRITE_TXID_TRIGGER = [
+    "ALTER TABLE support_cases ADD COLUMN IF NOT EXISTS write_txid BIGINT",
+    "CREATE INDEX IF NOT EXISTS idx_support_cases_write_txid ON support_cases (write_txid)",
+    """
+    CREATE OR REPLACE FUNCTION support_cases_stamp_write_txid() RETURNS trigger AS $$
+    BEGIN
+        NEW.write_txid := pg_current_xact_id()::text::bigint;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS support_cases_write_txid ON support_cases",
+    """
+    CREATE TRIGGER support_cases_write_txid
+    BEFORE INSERT OR UPDATE ON support_cases
+    FOR EACH ROW EXECUTE FUNCTION support_cases_stamp_write_txid()
+    """,
+]
+
+# Textos grandes fuera de la fila: support_cases conserva un avance y, en
+# <campo>_bytes, el tamaño completo en bytes (NULL si el texto está entero en
+# la fila). Los datos ya van comprimidos: STORAGE EXTERNAL evita que
+# PostgreSQL intente comprimirlos otra vez. La tabla vive en el shard del caso.
+ADD_PAYLOAD_COLUMNS = """
+ALTER TABLE support_cases
+    ADD COLUMN IF NOT EXISTS sql_query_bytes INTEGER,
+    ADD COLUMN IF NOT EXISTS execution_result_bytes INTEGER
+"""
+
+CREATE_PAYLOAD_TABLE = [
+    """
+    CREATE TABLE IF NOT EXISTS support_case_payloads (
+        case_id UUID NOT NULL,
+        field VARCHAR(32) NOT NULL,
+        encoding VARCHAR(16) NOT NULL,
+        byte_length INTEGER NOT NULL,
+        data BYTEA NOT NULL,
+        PRIMARY KEY (case_id, field)
+    )
+    """,
+    "ALTER TABLE support_case_payloads ALTER COLUMN data SET STORAGE EXTERNAL",
+]
+
+# Texto de un campo: lo que hay en la fila y, si se guardó fuera, la
+# codificación y el tamaño de los datos comprimidos (se leen por trozos con
+# GET_PAYLOAD_SLICE)
+GET_CASE_PAYLOAD = {
+    field: f"""
+SELECT c.{field}, c.{field}_bytes, p.encoding, octet_length(p.data)
+FROM support_cases AS c
+LEFT JOIN support_case_payloads AS p ON p.case_id = c.id AND p.field = '{field}'
+WHERE c.id = %s
+"""
+    for field in PAYLOAD_FIELDS
+}
+
+# Un trozo de los datos comprimidos (substring empieza en 1). Con STORAGE
+# EXTERNAL PostgreSQL solo lee los bloques TOAST que cubre el trozo.
+GET_PAYLOAD_SLICE = """
+SELECT substring(data FROM %s FOR %s) FROM support_case_payloads
+WHERE case_id = %s AND field = %s
+"""
+
+# Casos existentes con textos grandes aún en la fila, recorridos por id. Los
+# que no tienen submission_hash se dejan para después del backfill de
+# metadatos, que necesita el sql_query completo. octet_length lee el tamaño
+# de la cabecera TOAST sin descomprimir el valor.
+GET_CASES_WITH_LARGE_PAYLOADS = """
+SELECT id, sql_query, execution_result FROM support_cases
+WHERE id > %s AND submission_hash IS NOT NULL AND (
+    (sql_query_bytes IS NULL AND octet_length(sql_query) > %s)
+    OR (execution_result_bytes IS NULL AND octet_length(execution_result) > %s)
+)
+ORDER BY id
+LIMIT %s
+"""
+
+STORE_CASE_PAYLOAD = {
+    field: f"""
+WITH stored AS (
+    INSERT INTO support_case_payloads (case_id, field, encoding, byte_length, data)
+    VALUES (%s::uuid, '{field}', '{PAYLOAD_ENCODING}', %s, %s)
+    ON CONFLICT (case_id, field) DO UPDATE
+    SET encoding = EXCLUDED.encoding, byte_length = EXCLUDED.byte_length, data = EXCLUDED.data
+)
+UPDATE support_cases SET {field} = %s, {field}_bytes = %s
+WHERE id = %s::uuid
+"""
+    for field in PAYLOAD_FIELDS
+}
+
+GET_CASES_WITHOUT_SQL_METADATA = """
+SELECT id, sql_query, database_name, schema_name FROM support_cases
+WHERE submission_hash IS NULL AND id > %s
+ORDER BY id
+LIMIT %s
+"""
+
+SQL_METADATA_ROW = "(%s::uuid, %s, %s::text[], %s, %s)"
+
+
+def build_sql_metadata_update(rows: int) -> str:
+    """UPDATE of the SQL metadata columns for ``rows`` (id, type, tables, fingerprint, hash)"""
+    values = ", ".join([SQL_METADATA_ROW] * rows)
+    return f"""
+UPDATE support_cases AS c
+SET statement_type = v.statement_type,
+    target_tables = v.target_tables,
+    sql_fingerprint = v.sql_fingerprint,
+    submission_hash = v.submission_hash
+FROM (VALUES {values}) AS v (id, statement_type, target_tables, sql_fingerprint, submission_hash)
+WHERE c.id = v.id AND c.submission_hash IS NULL
+"""
+
+# Registro de eventos de solo inserción. occurred_at crece con el orden físico
+# de inserción, por lo que un índice BRIN (muy pequeño) basta para las
+# consultas por ventana de tiempo; la línea de tiempo por caso usa un btree.
+CREATE_EVENT_ID_SEQUENCE = """
+CREATE SEQUENCE IF NOT EXISTS support_case_events_id_seq
+INCREMENT BY {step} START WITH {start}
+"""
+
+CREATE_EVENT_TABLE = """
+CREATE TABLE IF NOT EXISTS support_case_events (
+    id BIGINT PRIMARY KEY DEFAULT nextval('support_case_events_id_seq'),
+    case_id UUID NOT NULL,
+    event_type VARCHAR(50) NOT NULL,
+    from_value VARCHAR(50),
+    to_value VARCHAR(50),
+    actor VARCHAR(255),
+    occurred_at TIMESTAMP NOT NULL
+)
+"""
+
+CREATE_EVENT_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_support_case_events_occurred_brin"
+    " ON support_case_events USING brin (occurred_at)",
+    "CREATE INDEX IF NOT EXISTS idx_support_case_events_case ON support_case_events (case_id, id)",
+    """
+    CREATE OR REPLACE FUNCTION support_case_events_append_only() RETURNS trigger AS $$
+    BEGIN
+        RAISE EXCEPTION 'support_case_events es de solo inserción';
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS support_case_events_append_only ON support_case_events",
+    """
+    CREATE TRIGGER support_case_events_append_only
+    BEFORE UPDATE OR DELETE ON support_case_events
+    FOR EACH ROW EXECUTE FUNCTION support_case_events_append_only()
+    """,
+]
+
+# Índices que cubren los filtros de PaginationParams; los compuestos con
+# created_at permiten servir "filtro + ORDER BY created_at DESC LIMIT" sin sort.
+CREATE_CASE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_support_cases_created_at ON support_cases (created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_support_cases_updated_at ON support_cases (updated_at)",
+    "CREATE INDEX IF NOT EXISTS idx_support_cases_status_created ON support_cases (status, created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_support_cases_database_created ON support_cases (database_name, created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_support_cases_schema ON support_cases (schema_name)",
+    "CREATE INDEX IF NOT EXISTS idx_support_cases_executed_by ON support_cases (executed_by)",
+    "CREATE INDEX IF NOT EXISTS idx_support_cases_priority ON support_cases (priority)",
+    "CREATE INDEX IF NOT EXISTS idx_support_cases_statement_created ON support_cases (statement_type, created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_support_cases_target_tables ON support_cases USING gin (target_tables)",
+    "CREATE INDEX IF NOT EXISTS idx_support_cases_fingerprint ON support_cases (sql_fingerprint)",
+    # Búsqueda O(1) de un envío idéntico entre los casos abiertos
+    "CREATE INDEX IF NOT EXISTS idx_support_cases_open_submission"
+    f" ON support_cases USING hash (submission_hash) WHERE {OPEN_STATUS_CONDITION}",
+]
+
+# (campo, columna, cast) de los filtros que aceptan varios valores
+MULTI_VALUE_FILTERS = [
+    ("id", "id", "::uuid[]"),
+    ("status", "status", ""),
+    ("database_name", "database_name", ""),
+    ("schema_name", "schema_name", ""),
+    ("executed_by", "executed_by", ""),
+    ("priority", "priority", ""),
+    ("statement_type", "statement_type", ""),
+    ("sql_fingerprint", "sql_fingerprint", ""),
+]
+
+# (campo, columna de tipo array): coincide si comparte algún valor (&&, GIN)
+ARRAY_FILTERS = [
+    ("target_table", "target_tables"),
+]
+
+RANGE_FILTERS = [
+    ("start_date", "created_at >= %s"),
+    ("end_date", "created_at <= %s"),
+    ("updated_start_date", "updated_at >= %s"),
+    ("updated_end_date", "updated_at <= %s"),
+]
+
+
+def build_case_filters(filters: dict, exclude=()):
+    """Compile filter values into a WHERE clause and its parameters.
+
+    Multi-value filters become ``col = ANY(%s)`` with a single array
+    parameter (``col = %s`` for one value), so any combination of filters
+    is still one statement. Fields listed in ``exclude`` are skipped.
+    """
+    conditions = []
+    params = []
+    for field, column, cast in MULTI_VALUE_FILTERS:
+        value = filters.get(field)
+        if value is None or field in exclude:
+            continue
+        if isinstance(value, (str, bytes)) or not isinstance(value, (list, tuple, set)):
+            value = [value]
+        values = [str(v) for v in value]
+        if not values:
+            continue
+        if len(values) == 1:
+            conditions.append(f"{column} = %s")
+            params.append(values[0])
+        else:
+            conditions.append(f"{column} = ANY(%s{cast})")
+            params.append(values)
+
+    for field, column in ARRAY_FILTERS:
+        value = filters.get(field)
+        if not value or field in exclude:
+            continue
+        if isinstance(value, str):
+            value = [value]
+        conditions.append(f"{column} && %s::text[]")
+        params.append([str(v) for v in value])
+
+    for field, condition in RANGE_FILTERS:
+        value = filters.get(field)
+        if value is not None and field not in exclude:
+            conditions.append(condition)
+            params.append(value)
+
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    return where, params
+
+
+FACET_FIELDS = ["database_name", "schema_name", "executed_by", "status", "priority", "statement_type"]
+
+
+def build_facets_query(filters: dict):
+    """Build one UNION ALL statement with the distinct values of every facet.
+
+    Each facet is counted with all the *other* active filters applied, so a
+    dropdown still lists the alternatives to its own current selection.
+    """
+    parts = []
+    params = []
+    for field in FACET_FIELDS:
+        where, facet_params = build_case_filters(filters, exclude=(field,))
+        parts.append(
+            f"SELECT '{field}' AS facet, {field}::text AS value, COUNT(*) AS total"
+            f" FROM support_cases{where} GROUP BY {field}"
+        )
+        params.extend(facet_params)
+    return "\nUNION ALL\n".join(parts), params
+
+
+def build_events_query(start, end, event_types=None, actors=None, after=None, limit=100):
+    """Events in a time window ordered by (occurred_at, id), paginated by keyset.
+
+    ``after`` is the ``(occurred_at, id)`` of the last event of the previous
+    page. Its occurred_at also raises the lower bound of the window, so each
+    page only scans the BRIN ranges from that point on.
+    """
+    conditions = ["occurred_at >= %s", "occurred_at < %s"]
+    params = [start, end]
+    if after is not None:
+        after_occurred_at, after_id = after
+        params[0] = max(start, after_occurred_at)
+        conditions.append("(occurred_at, id) > (%s, %s)")
+        params.extend([after_occurred_at, after_id])
+    for column, values in (("event_type", event_types), ("actor", actors)):
+        if values:
+            conditions.append(f"{column} = ANY(%s)")
+            params.append(list(values))
+    query = (
+        f"SELECT {EVENT_COLUMNS} FROM support_case_events"
+        f" WHERE {' AND '.join(conditions)} ORDER BY occurred_at, id LIMIT %s"
+    )
+    params.append(limit)
+    return query, params
+
+# Claves de idempotencia de POST /api/support-cases/ (nodo de metadatos). La
+# clave primaria serializa los envíos simultáneos con la misma clave: el
+# segundo INSERT espera solo a que se confirme el primero (bloqueo de fila del
+# índice único, no de la tabla) y luego ve el conflicto.
+CREATE_IDEMPOTENCY_TABLE = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key VARCHAR(255) PRIMARY KEY,
+    request_hash VARCHAR(64) NOT NULL,
+    status_code INTEGER,
+    response JSONB,
+    created_at TIMESTAMP NOT NULL,
+    locked_until TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+)
+"""
+
+CREATE_IDEMPOTENCY_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys (expires_at)",
+]
+
+# Reclama la clave: inserta, o reutiliza una fila vencida o una reclamación
+# abandonada (sin respuesta y con locked_until vencido) de la misma petición.
+# Devuelve una fila solo si esta llamada es la dueña de la clave. Los tiempos
+# son del reloj de la base de datos, común a todas las instancias.
+CLAIM_IDEMPOTENCY_KEY = """
+INSERT INTO idempotency_keys AS k (key, request_hash, created_at, locked_until, expires_at)
+VALUES (
+    %s, %s, now(),
+    now() + %s * interval '1 second',
+    now() + %s * interval '1 second'
+)
+ON CONFLICT (key) DO UPDATE
+SET request_hash = EXCLUDED.request_hash,
+    status_code = NULL,
+    response = NULL,
+    created_at = EXCLUDED.created_at,
+    locked_until = EXCLUDED.locked_until,
+    expires_at = EXCLUDED.expires_at
+WHERE k.expires_at <= now()
+   OR (k.status_code IS NULL AND k.locked_until <= now() AND k.request_hash = EXCLUDED.request_hash)
+RETURNING key
+"""
+
+GET_IDEMPOTENCY_KEY = """
+SELECT request_hash, status_code, response FROM idempotency_keys
+WHERE key = %s AND expires_at > now()
+"""
+
+COMPLETE_IDEMPOTENCY_KEY = """
+UPDATE idempotency_keys
+SET status_code = %s, response = %s::jsonb, locked_until = NULL
+WHERE key = %s AND request_hash = %s AND status_code IS NULL
+"""
+
+RELEASE_IDEMPOTENCY_KEY = """
+DELETE FROM idempotency_keys
+WHERE key = %s AND request_hash = %s AND status_code IS NULL
+"""
+
+# Borrado por lotes: no mantiene bloqueadas muchas filas a la vez
+SWEEP_IDEMPOTENCY_KEYS = """
+DELETE FROM idempotency_keys
+WHERE key IN (
+    SELECT key FROM idempotency_keys
+    WHERE expires_at <= now()
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+)
+"""
@@ -0,0 +1,36 @@
+import argparse
+import json
+from services.snapshot_export import SnapshotDirectoryNotEmpty, SnapshotExporter
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Exporta support_cases a archivos Parquet particionados por mes"
+    )
+    parser.add_argument("output_dir", help="Directorio destino del snapshot")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help=(
+            "Exportar todas las filas ignorando la marca de agua (_watermark.json); "
+            "el directorio debe estar vacío o no existir"
+        ),
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=5000,
+        help="Filas leídas por lote desde el cursor del servidor",
+    )
+    args = parser.parse_args()
+
+    exporter = SnapshotExporter(args.output_dir, chunk_size=args.chunk_size)
+    try:
+        summary = exporter.run(incremental=not args.full)
+    except SnapshotDirectoryNotEmpty as e:
+        raise SystemExit(f"Error: {e}")
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
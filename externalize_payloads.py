@@ -0,0 +1,24 @@
+import argparse
+import asyncio
+import json
+from services.payload_service import externalize_payloads
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Mueve los sql_query y execution_result grandes de los casos existentes a support_case_payloads"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=100,
+        help="Casos leídos por consulta",
+    )
+    args = parser.parse_args()
+
+    summary = asyncio.run(externalize_payloads(batch_size=args.batch_size))
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
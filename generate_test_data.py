@@ -4,7 +4,9 @@ import random
 from faker import Faker
 import asyncio
 from enum import Enum
-from database.connection import execute, create_database, drop_database
+from database.connection import execute, create_database, create_event_table, create_indexes, drop_database
+from database.support_queries import CREATE_WRITE_TXID_TRIGGER
+from utils.sql_analyzer import analyze_sql, submission_hash
 
 # Configure Faker for Spanish data
 fake = Faker('es_ES')
@@ -65,6 +67,8 @@ async def setup_database():
     print("Creando tablas...")
     # First ensure the table doesn't exist
     await execute("DROP TABLE IF EXISTS support_cases")
+    await execute("DROP TABLE IF EXISTS support_case_events")
+    await execute("DROP SEQUENCE IF EXISTS support_case_events_id_seq")
     
     # Then create it with the new schema
     await execute(f"""
@@ -80,9 +84,18 @@ async def setup_database():
         priority VARCHAR(50) NOT NULL,
         created_at TIMESTAMP NOT NULL,
         updated_at TIMESTAMP NOT NULL,
-        execution_result TEXT
+        execution_result TEXT,
+        statement_type VARCHAR(20),
+        target_tables TEXT[],
+        sql_fingerprint VARCHAR(16),
+        submission_hash VARCHAR(32),
+        write_txid BIGINT
     )
     """)
+    for statement in CREATE_WRITE_TXID_TRIGGER:
+        await execute(statement)
+    await create_indexes()
+    await create_event_table()
     print("Estructura de base de datos creada exitosamente")
 
 def generate_sql_query(case_type: str) -> str:
@@ -130,12 +143,19 @@ def generate_description(title: str) -> str:
 async def insert_test_case(case_data: dict):
     """Insert a test case into the database"""
     query = """
-    INSERT INTO support_cases (
-        id, title, description, database_name, schema_name, 
-        sql_query, executed_by, status, priority, created_at, 
-        updated_at, execution_result
-    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    WITH inserted AS (
+        INSERT INTO support_cases (
+            id, title, description, database_name, schema_name, 
+            sql_query, executed_by, status, priority, created_at, 
+            updated_at, execution_result, statement_type, target_tables, sql_fingerprint,
+            submission_hash
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        RETURNING id, status, executed_by, created_at
+    )
+    INSERT INTO support_case_events (case_id, event_type, to_value, actor, occurred_at)
+    SELECT id, 'created', status, executed_by, created_at FROM inserted
     """
+    analysis = analyze_sql(case_data["sql_query"])
     values = (
         str(case_data["id"]),
         case_data["title"],
@@ -148,7 +168,11 @@ async def insert_test_case(case_data: dict):
         case_data["priority"],
         case_data["created_at"],
         case_data["updated_at"],
-        case_data["execution_result"]
+        case_data["execution_result"],
+        analysis.statement_type,
+        analysis.target_tables,
+        analysis.fingerprint,
+        submission_hash(case_data["sql_query"], case_data["database_name"], case_data["schema_name"])
     )
     await execute(query, values)
 
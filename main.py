@@ -1,38 +1,106 @@
-import uvicorn
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware  # Add this import
 
 from database.connection import db
+from database.sharding import get_router
+from routes.admin import router as admin_router
+from routes.metrics import router as metrics_router
 from routes.support_cases import router as support_cases_router
+from services.case_cache import case_cache
+from services.idempotency_service import IdempotencyService
+from services.write_batcher import case_batcher
+from utils.admission import AdmissionMiddleware
+from utils.cache import close_cache_backend
+from utils.compression import CompressionMiddleware
+from utils.disconnect import CancelOnDisconnectMiddleware
 from utils.exceptions_handler import validation_exception_handler
+from utils.profiling import ProfileRequestMiddleware
+from utils.server_timing import ServerTimingMiddleware
+from utils.tracing import TracingMiddleware, shutdown_tracing
+from utils.workload_capture import WorkloadCaptureMiddleware, close_capture
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # La configuración y el pool se inicializan aquí y no al importar el
+    # módulo. Si la BD no responde, el pool se reintenta en la primera
+    # consulta en lugar de impedir el arranque.
+    try:
+        db.open()
+        for database in get_router().databases:
+            database.open()
+    except Exception as e:
+        logger.warning("No se pudo abrir el pool de conexiones: %s", e)
+    sweeper = asyncio.create_task(IdempotencyService.run_sweeper())
+    # Invalidaciones de la caché de casos publicadas por los demás workers
+    case_cache.start()
+    yield
+    sweeper.cancel()
+    await case_cache.stop()
+    await close_cache_backend()
+    # Escribir los lotes pendientes antes de cerrar los pools
+    await case_batcher.drain()
+    db.close_all_connections()
+    get_router().close_all_connections()
+    shutdown_tracing()
+    close_capture()
+
 
 app = FastAPI(
     title="Finkargo Support Tracker API",
     description="API para el sistema de trazabilidad de casos de soporte",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
+# Perfilado de una petición con X-Profile: 1 y el token de administración.
+# Es la más interna: no mide la espera en la cola de admisión.
+app.add_middleware(ProfileRequestMiddleware)
+
+# Límite de peticiones simultáneas por clase de ruta (503 con Retry-After al
+# saturarse). Va por dentro de CORS para que los 503 lleven sus cabeceras.
+app.add_middleware(AdmissionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"], 
+    allow_origins=["*"],
     allow_credentials=True,
-    allow_methods=["*"],  
-    allow_headers=["*"],  
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["Server-Timing", "Idempotent-Replayed", "Retry-After", "X-Profile-Id", "ETag"],
 )
 
-app.add_exception_handler(RequestValidationError, validation_exception_handler)
+# Compresión negociada (Accept-Encoding) de las respuestas de la API
+app.add_middleware(CompressionMiddleware)
 
-@app.on_event("startup")
-async def startup():
-    pass
+# Desglose de tiempos por petición (cabecera Server-Timing y log muestreado)
+app.add_middleware(ServerTimingMiddleware)
 
-@app.on_event("shutdown")
-async def shutdown():
-    db.close_all_connections()
+# Span raíz de cada petición (continúa la traza de quien llama con traceparent)
+app.add_middleware(TracingMiddleware)
+
+# Forma saneada de cada petición para reproducir la carga real (desactivada
+# por defecto); mide la latencia que ve el cliente, incluida la admisión
+app.add_middleware(WorkloadCaptureMiddleware)
+
+# La más externa: si el cliente se desconecta se cancela toda la petición,
+# incluida la espera en la cola de admisión y las consultas en curso
+app.add_middleware(CancelOnDisconnectMiddleware)
+
+app.add_exception_handler(RequestValidationError, validation_exception_handler)
 
 app.include_router(support_cases_router)
+app.include_router(metrics_router)
+app.include_router(admin_router)
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    import uvicorn
+
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -1,7 +1,8 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field, validator
 from datetime import datetime
 from uuid import UUID
+from models.support_schema import CaseStatus, PriorityLevel
 
 
 class SupportCase(BaseModel):
@@ -17,6 +18,14 @@ class SupportCase(BaseModel):
     updated_at: datetime
     execution_result: Optional[str] = None
     priority: str = Field("baja")
+    # Metadatos extraídos de sql_query (None en casos aún sin backfill)
+    statement_type: Optional[str] = None
+    target_tables: Optional[List[str]] = None
+    sql_fingerprint: Optional[str] = None
+    # Tamaño completo en bytes cuando el campo solo trae un avance (el texto
+    # completo se descarga de /case/{id}/payload/{campo}); None si está entero
+    sql_query_bytes: Optional[int] = None
+    execution_result_bytes: Optional[int] = None
 
 
 class PaginatedResponse(BaseModel):
@@ -49,6 +58,9 @@ class SupportCaseCreatedResponse(BaseModel):
     case: Optional[SupportCase] = Field(
         None, description="Detalles completos del caso creado"
     )
+    existing_case: Optional[SupportCase] = Field(
+        None, description="Caso abierto con la misma consulta, si el envío es un duplicado"
+    )
 
 class CaseResponse(BaseModel):
     success: bool
@@ -69,6 +81,10 @@ class SupportCaseCreateRequest(BaseModel):
         "pending", description="Status of the support case (pendiente/completado)"
     )
     priority: str = Field(..., description="Priority level (baja/media/alta)")
+    allow_duplicate: bool = Field(
+        False,
+        description="Create the case even if an open case has the same query, database and schema",
+    )
 
     @validator('priority')
     def validate_priority(cls, v):
@@ -84,3 +100,93 @@ class SupportCaseCreateRequest(BaseModel):
             raise ValueError(f"Status must be one of: {', '.join(allowed_statuses)}")
         return v
 
+
+class BulkStatusUpdateRequest(BaseModel):
+    ids: List[UUID] = Field(
+        ..., min_length=1, max_length=1000, description="IDs of the cases to update"
+    )
+    status: CaseStatus = Field(..., description="New status for every case")
+    changed_by: Optional[str] = Field(
+        None, max_length=255, description="User who makes the change (event log)"
+    )
+
+
+class BulkPriorityUpdateRequest(BaseModel):
+    ids: List[UUID] = Field(
+        ..., min_length=1, max_length=1000, description="IDs of the cases to update"
+    )
+    priority: PriorityLevel = Field(..., description="New priority for every case")
+    changed_by: Optional[str] = Field(
+        None, max_length=255, description="User who makes the change (event log)"
+    )
+
+
+class BulkUpdateResult(BaseModel):
+    id: UUID
+    outcome: str = Field(
+        ..., description="updated, unchanged, not_found o invalid_transition"
+    )
+    previous: Optional[str] = None
+    current: Optional[str] = None
+
+
+class BulkUpdateResponse(BaseModel):
+    success: bool
+    message: str
+    updated: int = 0
+    results: List[BulkUpdateResult] = []
+
+
+class BatchCaseRequest(BaseModel):
+    ids: List[UUID] = Field(
+        ..., min_length=1, max_length=200, description="IDs of the cases to fetch"
+    )
+
+
+class BatchCaseResult(BaseModel):
+    id: UUID
+    found: bool
+    case: Optional[SupportCase] = None
+
+
+class BatchCaseResponse(BaseModel):
+    success: bool
+    message: str
+    found: int = 0
+    results: List[BatchCaseResult] = []
+
+
+class FacetValue(BaseModel):
+    value: Optional[str] = None
+    count: int
+
+
+class FacetsResponse(BaseModel):
+    success: bool
+    message: str
+    facets: Dict[str, List[FacetValue]] = {}
+    generated_at: Optional[datetime] = None
+    cached: bool = False
+
+
+class CaseEvent(BaseModel):
+    id: int
+    case_id: UUID
+    event_type: str = Field(..., description="created, status_changed o priority_changed")
+    from_value: Optional[str] = None
+    to_value: Optional[str] = None
+    actor: Optional[str] = None
+    occurred_at: datetime
+
+
+class CaseEventsResponse(BaseModel):
+    success: bool
+    message: str
+    items: List[CaseEvent] = []
+    next_after_id: Optional[int] = Field(
+        None, description="Cursor for the next page (after_id), null on the last page"
+    )
+    next_after_occurred_at: Optional[datetime] = Field(
+        None,
+        description="With next_after_id, cursor for the next page of the time window query (after_occurred_at)",
+    )
@@ -1,8 +1,11 @@
-from pydantic import BaseModel, Field, conint, validator
-from typing import Optional
+from fastapi import Query
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, Field, ValidationError, conint, validator
+from typing import List, Optional
 from datetime import datetime
 from uuid import UUID
 from enum import Enum
+from utils.sql_analyzer import STATEMENT_TYPES
 
 
 class CaseStatus(str, Enum):
@@ -19,6 +22,28 @@ class PriorityLevel(str, Enum):
     HIGH = "alta"
 
 
+# Transiciones de estado permitidas; completado es terminal y un caso
+# rechazado solo puede reabrirse como pendiente.
+STATUS_TRANSITIONS = {
+    CaseStatus.PENDING: {
+        CaseStatus.IN_PROGRESS, CaseStatus.ON_HOLD, CaseStatus.REJECTED, CaseStatus.COMPLETED
+    },
+    CaseStatus.IN_PROGRESS: {
+        CaseStatus.PENDING, CaseStatus.ON_HOLD, CaseStatus.REJECTED, CaseStatus.COMPLETED
+    },
+    CaseStatus.ON_HOLD: {CaseStatus.PENDING, CaseStatus.IN_PROGRESS, CaseStatus.REJECTED},
+    CaseStatus.REJECTED: {CaseStatus.PENDING},
+    CaseStatus.COMPLETED: set(),
+}
+
+
+def allowed_source_statuses(target: CaseStatus) -> list:
+    """Statuses from which a case may move to ``target``"""
+    return sorted(
+        source.value for source, targets in STATUS_TRANSITIONS.items() if target in targets
+    )
+
+
 class SupportCase(BaseModel):
     id: UUID
     status: CaseStatus
@@ -65,20 +90,150 @@ class SupportCase(BaseModel):
         from_attributes = True
 
 
+MULTI_VALUE_FIELDS = (
+    "id", "status", "database_name", "schema_name", "executed_by", "priority",
+    "statement_type", "target_table", "sql_fingerprint",
+)
+
+
 class PaginationParams(BaseModel):
-    id: Optional[str] = None
+    id: Optional[List[str]] = None
     page: conint(gt=0) = 1
     size: conint(gt=0, le=100) = 10
-    status: Optional[str] = None
-    database_name: Optional[str] = None
-    schema_name: Optional[str] = None
+    status: Optional[List[str]] = None
+    database_name: Optional[List[str]] = None
+    schema_name: Optional[List[str]] = None
     start_date: Optional[datetime] = None
     end_date: Optional[datetime] = None
-    executed_by: Optional[str] = None
-    priority: Optional[str] = None
+    updated_start_date: Optional[datetime] = None
+    updated_end_date: Optional[datetime] = None
+    executed_by: Optional[List[str]] = None
+    priority: Optional[List[str]] = None
+    statement_type: Optional[List[str]] = None
+    target_table: Optional[List[str]] = None
+    sql_fingerprint: Optional[List[str]] = None
 
     @validator("page", "size", pre=True)
     def validate_numbers(cls, v):
         if not isinstance(v, int):
             raise ValueError("must be an integer")
         return v
+
+    @validator(*MULTI_VALUE_FIELDS, pre=True)
+    def split_multi_values(cls, v):
+        # Acepta valores repetidos (?status=a&status=b) y separados por comas
+        # (?status=a,b); elimina vacíos y duplicados conservando el orden.
+        if v is None:
+            return None
+        if isinstance(v, str):
+            v = [v]
+        values = []
+        for item in v:
+            for part in str(item).split(","):
+                part = part.strip()
+                if part and part not in values:
+                    values.append(part)
+        return values or None
+
+    @validator("id")
+    def validate_ids(cls, v):
+        if v is None:
+            return v
+        for value in v:
+            try:
+                UUID(value)
+            except ValueError:
+                raise ValueError(f"ID inválido: {value}")
+        return v
+
+    @validator("status")
+    def validate_status_values(cls, v):
+        allowed = [status.value for status in CaseStatus]
+        if v is not None and any(value not in allowed for value in v):
+            raise ValueError(f"Estado inválido. Debe ser uno de: {', '.join(allowed)}")
+        return v
+
+    @validator("priority")
+    def validate_priority_values(cls, v):
+        allowed = [priority.value for priority in PriorityLevel]
+        if v is not None and any(value not in allowed for value in v):
+            raise ValueError(f"Prioridad inválida. Debe ser uno de: {', '.join(allowed)}")
+        return v
+
+    @validator("statement_type")
+    def validate_statement_types(cls, v):
+        if v is None:
+            return v
+        v = [value.upper() for value in v]
+        if any(value not in STATEMENT_TYPES for value in v):
+            raise ValueError(f"Tipo de sentencia inválido. Debe ser uno de: {', '.join(STATEMENT_TYPES)}")
+        return v
+
+    @validator("target_table")
+    def normalize_target_tables(cls, v):
+        # target_tables guarda los nombres sin comillas en minúsculas, como
+        # PostgreSQL; solo un nombre entre comillas conserva mayúsculas
+        if v is None:
+            return v
+        return [
+            value[1:-1] if len(value) > 1 and value[0] == value[-1] == '"' else value.lower()
+            for value in v
+        ]
+
+    @validator("sql_fingerprint")
+    def validate_fingerprints(cls, v):
+        if v is not None:
+            for value in v:
+                if len(value) != 16 or any(c not in "0123456789abcdef" for c in value):
+                    raise ValueError(f"Huella SQL inválida: {value}")
+        return v
+
+    def filters(self) -> dict:
+        """Filter values without the pagination fields"""
+        return self.dict(exclude={"page", "size"})
+
+    @classmethod
+    def as_query(
+        cls,
+        id: Optional[List[str]] = Query(None),
+        page: int = Query(1),
+        size: int = Query(10),
+        status: Optional[List[str]] = Query(None),
+        database_name: Optional[List[str]] = Query(None),
+        schema_name: Optional[List[str]] = Query(None),
+        start_date: Optional[datetime] = Query(None),
+        end_date: Optional[datetime] = Query(None),
+        updated_start_date: Optional[datetime] = Query(None),
+        updated_end_date: Optional[datetime] = Query(None),
+        executed_by: Optional[List[str]] = Query(None),
+        priority: Optional[List[str]] = Query(None),
+        statement_type: Optional[List[str]] = Query(None),
+        target_table: Optional[List[str]] = Query(None),
+        sql_fingerprint: Optional[List[str]] = Query(None),
+    ) -> "PaginationParams":
+        """FastAPI dependency: reads repeated query params into the model.
+
+        FastAPI only maps list fields to the query string when they are
+        declared with ``Query``, so the parameters are listed here and
+        validated by the model itself.
+        """
+        try:
+            return cls(
+                id=id,
+                page=page,
+                size=size,
+                status=status,
+                database_name=database_name,
+                schema_name=schema_name,
+                start_date=start_date,
+                end_date=end_date,
+                updated_start_date=updated_start_date,
+                updated_end_date=updated_end_date,
+                executed_by=executed_by,
+                priority=priority,
+                statement_type=statement_type,
+                target_table=target_table,
+                sql_fingerprint=sql_fingerprint,
+            )
+        except ValidationError as e:
+            raise RequestValidationError(e.errors(include_url=False))
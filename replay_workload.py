@@ -0,0 +1,46 @@
+import argparse
+import asyncio
+import json
+from services.workload_replay import WorkloadReplayer, load_records
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Reproduce una carga capturada (WORKLOAD_CAPTURE_ENABLED) contra una instancia"
+    )
+    parser.add_argument(
+        "captures",
+        nargs="+",
+        help="Archivos NDJSON de la captura (incluidos los rotados, p. ej. workload_capture.jsonl.1)",
+    )
+    parser.add_argument("--base-url", default="http://localhost:8000", help="Instancia destino")
+    parser.add_argument(
+        "--speed",
+        default="1",
+        help="Velocidad respecto a la captura: 1, 10, ... o 'max' (tan rápido como sea posible)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=32,
+        help="Peticiones simultáneas como máximo",
+    )
+    parser.add_argument(
+        "--include-writes",
+        action="store_true",
+        help="Reproducir también creaciones y actualizaciones (modifican la base de datos)",
+    )
+    args = parser.parse_args()
+
+    replayer = WorkloadReplayer(
+        args.base_url,
+        speed=None if args.speed == "max" else float(args.speed),
+        concurrency=args.concurrency,
+        include_writes=args.include_writes,
+    )
+    summary = asyncio.run(replayer.run(load_records(args.captures)))
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, Header, Query
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from utils.profiling import (
+    MAX_SAMPLE_SECONDS,
+    ProfilerBusy,
+    allocation_report,
+    collapsed,
+    get_profile,
+    is_admin,
+    list_profiles,
+    sample_stacks,
+    start_tracemalloc,
+    stop_tracemalloc,
+)
+
+
+router = APIRouter(
+    prefix="/api/admin",
+    tags=["Admin"],
+)
+
+
+def _forbidden(admin_token: Optional[str]) -> Optional[JSONResponse]:
+    """403 response unless ``admin_token`` is the configured ADMIN_TOKEN"""
+    if is_admin(admin_token):
+        return None
+    return JSONResponse(
+        status_code=403,
+        content={
+            "success": False,
+            "message": "Se requiere un token de administración válido",
+            "error_code": "FORBIDDEN",
+        },
+    )
+
+
+@router.post(
+    "/profile",
+    summary="Sample all threads for N seconds",
+    description="Wall-clock sampling profile of the worker, as collapsed stacks for flame graphs",
+)
+async def sample_profile(
+    seconds: float = Query(10, gt=0, le=MAX_SAMPLE_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=1000),
+    include_idle: bool = Query(False),
+    x_admin_token: Optional[str] = Header(None),
+):
+    """
+    Sampling profile of every thread (event loop and query threads)
+
+    Parameters:
+    - seconds: sampling duration (max 60)
+    - interval_ms: time between samples
+    - include_idle: keep samples of threads waiting for work
+
+    Returns collapsed stacks (``thread;outer;...;inner count``), the input of
+    flamegraph.pl and speedscope.
+    """
+    forbidden = _forbidden(x_admin_token)
+    if forbidden:
+        return forbidden
+    try:
+        counts = await asyncio.to_thread(sample_stacks, seconds, interval_ms, include_idle)
+    except ProfilerBusy as e:
+        return JSONResponse(
+            status_code=409,
+            content={"success": False, "message": str(e), "error_code": "PROFILER_BUSY"},
+        )
+    return PlainTextResponse(collapsed(counts))
+
+
+@router.get(
+    "/profiles",
+    summary="List stored request profiles",
+    description="Profiles of requests sent with X-Profile: 1, newest first",
+)
+async def get_profiles(x_admin_token: Optional[str] = Header(None)):
+    forbidden = _forbidden(x_admin_token)
+    if forbidden:
+        return forbidden
+    return {"success": True, "profiles": list_profiles()}
+
+
+@router.get(
+    "/profiles/{profile_id}",
+    summary="Download a request profile",
+    description="cProfile data of one request as pstats (binary) or text",
+)
+async def get_request_profile(
+    profile_id: str,
+    format: str = Query("text", pattern="^(text|pstats)$"),
+    sort: str = Query("cumulative", pattern="^(cumulative|tottime|calls)$"),
+    limit: int = Query(50, gt=0, le=1000),
+    x_admin_token: Optional[str] = Header(None),
+):
+    """
+    Download the profile of one request
+
+    Parameters:
+    - format: text (pstats report) or pstats (file for pstats, snakeviz or gprof2dot)
+    - sort, limit: ordering and number of functions of the text report
+    """
+    forbidden = _forbidden(x_admin_token)
+    if forbidden:
+        return forbidden
+    profile = get_profile(profile_id)
+    if profile is None:
+        return JSONResponse(
+            status_code=404,
+            content={"success": False, "message": "Perfil no encontrado", "error_code": "NOT_FOUND"},
+        )
+    if format == "pstats":
+        return Response(
+            profile.pstats_bytes(),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="{profile_id}.pstats"'},
+        )
+    return PlainTextResponse(profile.text(limit, sort))
+
+
+@router.post(
+    "/tracemalloc/start",
+    summary="Start tracking allocations",
+    description="Starts tracemalloc and takes the baseline snapshot",
+)
+async def start_allocation_tracking(
+    frames: int = Query(1, ge=1, le=25),
+    x_admin_token: Optional[str] = Header(None),
+):
+    forbidden = _forbidden(x_admin_token)
+    if forbidden:
+        return forbidden
+    started = await asyncio.to_thread(start_tracemalloc, frames)
+    return {
+        "success": True,
+        "message": "Seguimiento de memoria iniciado" if started else "El seguimiento ya estaba activo",
+    }
+
+
+@router.post(
+    "/tracemalloc/stop",
+    summary="Stop tracking allocations",
+    description="Stops tracemalloc and frees its data",
+)
+async def stop_allocation_tracking(x_admin_token: Optional[str] = Header(None)):
+    forbidden = _forbidden(x_admin_token)
+    if forbidden:
+        return forbidden
+    stopped = stop_tracemalloc()
+    return {
+        "success": True,
+        "message": "Seguimiento de memoria detenido" if stopped else "El seguimiento no estaba activo",
+    }
+
+
+@router.get(
+    "/tracemalloc",
+    summary="Top allocation sites",
+    description="Top allocation sites now, or their growth since tracking started",
+)
+async def get_allocations(
+    limit: int = Query(20, gt=0, le=500),
+    group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+    compare: bool = Query(False),
+    x_admin_token: Optional[str] = Header(None),
+):
+    """
+    Top allocation sites
+
+    Parameters:
+    - limit: number of sites
+    - group_by: lineno, filename or traceback
+    - compare: growth since /tracemalloc/start instead of current usage
+    """
+    forbidden = _forbidden(x_admin_token)
+    if forbidden:
+        return forbidden
+    report = await asyncio.to_thread(allocation_report, limit, group_by, compare)
+    if not report["tracing"]:
+        return JSONResponse(
+            status_code=409,
+            content={
+                "success": False,
+                "message": "El seguimiento de memoria no está activo",
+                "error_code": "TRACEMALLOC_NOT_STARTED",
+            },
+        )
+    return {"success": True, **report}
@@ -0,0 +1,25 @@
+from fastapi import APIRouter
+from utils.metrics import metrics
+
+
+router = APIRouter(
+    prefix="/api/metrics",
+    tags=["Metrics"],
+)
+
+
+@router.get(
+    "/",
+    summary="Get service metrics",
+    description="Returns in-process counters, gauges and latency histograms",
+)
+async def get_metrics():
+    """
+    Get service metrics
+
+    Returns:
+    - counters: monotonically increasing counters
+    - gauges: current values (pool usage, queue depth, ...)
+    - histograms: count/sum/avg/p50/p95/p99/max of recent observations (ms)
+    """
+    return metrics.snapshot()
@@ -1,30 +1,65 @@
+import json
+import logging
 from datetime import datetime
-from fastapi import APIRouter, Depends, Body
-from fastapi.responses import JSONResponse
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Body, Header, Path, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from database.resilience import is_infrastructure_error
+from services.event_service import EventService
+from services.facet_service import FacetService
+from services.idempotency_service import IdempotencyService, request_fingerprint
+from services.payload_service import PayloadService
 from services.support_service import SupportService
-from models.support_responses import PaginatedResponse, SupportCaseCreateRequest, CaseResponse
+from models.support_responses import (
+    BatchCaseRequest,
+    BatchCaseResponse,
+    BulkPriorityUpdateRequest,
+    BulkStatusUpdateRequest,
+    BulkUpdateResponse,
+    CaseEventsResponse,
+    CaseResponse,
+    FacetsResponse,
+    PaginatedResponse,
+    SupportCaseCreateRequest,
+)
 from models.support_schema import PaginationParams
 from utils.exceptions_handler import ErrorResponse
+from utils.metrics import metrics
+from utils.server_timing import TimedRoute
+from utils.statement_timeout import statement_timeout
+
+logger = logging.getLogger(__name__)
 
+# Respuestas de POST / que se guardan bajo la Idempotency-Key: las que un
+# reintento obtendría igual. Las demás liberan la clave.
+IDEMPOTENT_STORED_STATUSES = {200, 409, 422}
 
 router = APIRouter(
     prefix="/api/support-cases",
     tags=["Support Cases"],
+    route_class=TimedRoute,
 )
 
 
 @router.get(
     "/",
+    dependencies=[Depends(statement_timeout("list"))],
     response_model=PaginatedResponse,
     summary="Get paginated support cases",
     description="Returns a paginated list of support cases with metadata",
     responses={
+        304: {"description": "Sin cambios desde el ETag enviado en If-None-Match"},
         400: {"model": ErrorResponse, "description": "Error en la solicitud"},
         422: {"model": ErrorResponse, "description": "Error de validación"},
         500: {"model": ErrorResponse, "description": "Error interno del servidor"},
     },
 )
-async def get_support_cases(pagination: PaginationParams = Depends()):
+async def get_support_cases(
+    http_response: Response,
+    pagination: PaginationParams = Depends(PaginationParams.as_query),
+    if_none_match: Optional[str] = Header(None),
+):
     """
     Get paginated support cases with filters
 
@@ -37,12 +72,35 @@ async def get_support_cases(pagination: PaginationParams = Depends()):
     - schema_name: Filter by schema name (optional)
     - start_date: Filter cases created after this date (optional)
     - end_date: Filter cases created before this date (optional)
+    - updated_start_date: Filter cases updated after this date (optional)
+    - updated_end_date: Filter cases updated before this date (optional)
     - executed_by: Filter by user who executed the case (optional)
+    - priority: Filter by priority (optional)
+    - statement_type: Filter by SQL statement type, e.g. DELETE (optional)
+    - target_table: Filter by a table touched by the SQL (optional)
+    - sql_fingerprint: Filter by normalized SQL fingerprint (optional)
+
+    id, status, database_name, schema_name, executed_by, priority,
+    statement_type, target_table and sql_fingerprint accept
+    several values, repeated (?status=pendiente&status=en_proceso) or
+    comma-separated (?status=pendiente,en_proceso).
+
+    The response carries a weak ETag; sending it back in If-None-Match
+    returns 304 without a body while no case has changed.
 
     Returns:
     - Paginated list of filtered cases
     """
     try:
+        etag = await SupportService.get_listing_etag(
+            pagination.filters(), pagination.page, pagination.size
+        )
+        if etag is not None:
+            headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+            if _etag_matches(if_none_match, etag):
+                metrics.increment("listing_not_modified_total")
+                return Response(status_code=304, headers=headers)
+
         response = await SupportService.get_paginated_cases(
             id=pagination.id,
             page=pagination.page,
@@ -54,6 +112,12 @@ async def get_support_cases(pagination: PaginationParams = Depends()):
             end_date=pagination.end_date,
             executed_by=pagination.executed_by,
             priority=pagination.priority,
+            updated_start_date=pagination.updated_start_date,
+            updated_end_date=pagination.updated_end_date,
+            statement_type=pagination.statement_type,
+            target_table=pagination.target_table,
+            sql_fingerprint=pagination.sql_fingerprint,
+            etag=etag,
         )
 
         if not response.success:
@@ -66,6 +130,8 @@ async def get_support_cases(pagination: PaginationParams = Depends()):
                 },
             )
 
+        if etag is not None:
+            http_response.headers.update(headers)
         return response
 
     except Exception as e:
@@ -79,8 +145,57 @@ async def get_support_cases(pagination: PaginationParams = Depends()):
             },
         )
 
+@router.get(
+    "/facets",
+    dependencies=[Depends(statement_timeout("list"))],
+    response_model=FacetsResponse,
+    summary="Get filter facets",
+    description="Returns the distinct values with counts of every filterable field",
+    responses={
+        400: {"model": ErrorResponse, "description": "Error en la solicitud"},
+        422: {"model": ErrorResponse, "description": "Error de validación"},
+        500: {"model": ErrorResponse, "description": "Error interno del servidor"},
+    },
+)
+async def get_facets(pagination: PaginationParams = Depends(PaginationParams.as_query)):
+    """
+    Get filter facets for the dropdowns
+
+    Accepts the same filters as the case list (page and size are ignored).
+    Each facet is counted with the other active filters applied.
+
+    Returns:
+    - database_name, schema_name, executed_by, status and priority values
+      with their counts, served from a cache of bounded staleness
+    """
+    try:
+        response = await FacetService.get_facets(pagination.filters())
+
+        if not response.success:
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "success": False,
+                    "message": response.message,
+                    "error_code": "INVALID_REQUEST",
+                },
+            )
+
+        return response
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={
+                "success": False,
+                "message": "Error interno del servidor",
+                "error_code": "INTERNAL_SERVER_ERROR",
+                "detail": str(e),
+            },
+        )
+
 @router.get(
     "/case/{case_id}",
+    dependencies=[Depends(statement_timeout("read"))],
     response_model=CaseResponse,  # Now matches our return structure
     summary="Get a support case by ID",
     description="Returns a single support case by its ID",
@@ -129,18 +244,248 @@ async def get_case_by_id(case_id: str):
             },
         )
 
+@router.get(
+    "/case/{case_id}/events",
+    dependencies=[Depends(statement_timeout("read"))],
+    response_model=CaseEventsResponse,
+    summary="Get the event timeline of a support case",
+    description="Returns the events of a case in the order they happened",
+    responses={
+        400: {"model": ErrorResponse, "description": "Error en la solicitud"},
+        422: {"model": ErrorResponse, "description": "Error de validación"},
+        500: {"model": ErrorResponse, "description": "Error interno del servidor"},
+    },
+)
+async def get_case_events(
+    case_id: str,
+    limit: int = Query(100, gt=0, le=1000),
+    after_id: int = Query(0, ge=0),
+):
+    """
+    Get the event timeline of a support case
+
+    Parameters:
+    - case_id: The ID of the case (required)
+    - limit: Maximum number of events (default: 100, max: 1000)
+    - after_id: Return events after this event ID (next_after_id of the previous page)
+    """
+    try:
+        response = await EventService.get_case_timeline(case_id, limit=limit, after_id=after_id)
+
+        if not response.success:
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "success": False,
+                    "message": response.message,
+                    "error_code": "INVALID_REQUEST",
+                },
+            )
+
+        return response
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={
+                "success": False,
+                "message": "Error interno del servidor",
+                "error_code": "INTERNAL_SERVER_ERROR",
+                "detail": str(e),
+            },
+        )
+
+@router.get(
+    "/case/{case_id}/payload/{field}",
+    dependencies=[Depends(statement_timeout("read"))],
+    response_class=StreamingResponse,
+    summary="Download the full sql_query or execution_result of a case",
+    description="Streams the complete text of a field that list and detail responses only preview",
+    responses={
+        200: {"content": {"text/plain": {}}, "description": "Texto completo del campo"},
+        400: {"model": ErrorResponse, "description": "Error en la solicitud"},
+        404: {"model": ErrorResponse, "description": "Caso o campo no encontrado"},
+        500: {"model": ErrorResponse, "description": "Error interno del servidor"},
+    },
+)
+async def get_case_payload(
+    case_id: str,
+    field: str = Path(..., pattern="^(sql_query|execution_result)$"),
+):
+    """
+    Download the full text of a large field
+
+    Parameters:
+    - case_id: The ID of the case (required)
+    - field: sql_query or execution_result
+
+    Cases whose field is larger than PAYLOAD_INLINE_MAX_BYTES only carry a
+    preview in the other endpoints, with the full size in
+    ``<field>_bytes``; this endpoint streams the complete text.
+    """
+    try:
+        payload = await PayloadService.open_payload(case_id, field)
+        if payload.outcome == "invalid_id":
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "success": False,
+                    "message": "El ID proporcionado no es válido",
+                    "error_code": "INVALID_REQUEST",
+                },
+            )
+        if payload.outcome != "found":
+            return JSONResponse(
+                status_code=404,
+                content={
+                    "success": False,
+                    "message": (
+                        f"No se encontró ningún caso con ID {case_id}"
+                        if payload.outcome == "not_found"
+                        else f"El caso no tiene {field}"
+                    ),
+                    "error_code": "NOT_FOUND",
+                },
+            )
+        return StreamingResponse(
+            payload.chunks,
+            media_type="text/plain; charset=utf-8",
+            headers={"Content-Length": str(payload.byte_length)},
+        )
+    except Exception as e:
+        return _internal_error(e)
+
+@router.get(
+    "/events",
+    dependencies=[Depends(statement_timeout("read"))],
+    response_model=CaseEventsResponse,
+    summary="Get support case events in a time window",
+    description="Returns the events of every case between two dates",
+    responses={
+        400: {"model": ErrorResponse, "description": "Error en la solicitud"},
+        422: {"model": ErrorResponse, "description": "Error de validación"},
+        500: {"model": ErrorResponse, "description": "Error interno del servidor"},
+    },
+)
+async def get_events(
+    start: datetime = Query(...),
+    end: datetime = Query(...),
+    event_type: Optional[List[str]] = Query(None),
+    actor: Optional[List[str]] = Query(None),
+    limit: int = Query(100, gt=0, le=1000),
+    after_occurred_at: Optional[datetime] = Query(None),
+    after_id: Optional[int] = Query(None, ge=0),
+):
+    """
+    Get support case events in a time window
+
+    Parameters:
+    - start: Window start, inclusive (required)
+    - end: Window end, exclusive (required, at most 31 days after start)
+    - event_type: Filter by event type: created, status_changed, priority_changed (optional)
+    - actor: Filter by the user who caused the event (optional)
+    - limit: Maximum number of events (default: 100, max: 1000)
+    - after_occurred_at, after_id: Return events after this one (next_after_occurred_at
+      and next_after_id of the previous page; both or neither)
+    """
+    try:
+        response = await EventService.get_events(
+            start=start,
+            end=end,
+            event_type=event_type,
+            actor=actor,
+            limit=limit,
+            after_occurred_at=after_occurred_at,
+            after_id=after_id,
+        )
+
+        if not response.success:
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "success": False,
+                    "message": response.message,
+                    "error_code": "INVALID_REQUEST",
+                },
+            )
+
+        return response
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={
+                "success": False,
+                "message": "Error interno del servidor",
+                "error_code": "INTERNAL_SERVER_ERROR",
+                "detail": str(e),
+            },
+        )
+
+@router.post(
+    "/batch",
+    dependencies=[Depends(statement_timeout("read"))],
+    response_model=BatchCaseResponse,
+    summary="Get several support cases by ID",
+    description="Returns the requested cases in request order with one query",
+    responses={
+        400: {"model": ErrorResponse, "description": "Error en la solicitud"},
+        422: {"model": ErrorResponse, "description": "Error de validación"},
+        500: {"model": ErrorResponse, "description": "Error interno del servidor"},
+    },
+)
+async def get_cases_batch(batch: BatchCaseRequest = Body(...)):
+    """
+    Get several support cases by ID
+
+    Parameters:
+    - ids: IDs of the cases to retrieve (max 200)
+
+    Returns:
+    - One entry per requested ID, in request order, with found=false for
+      IDs that do not exist
+    """
+    try:
+        response = await SupportService.get_cases_by_ids(batch.ids)
+
+        if not response.success:
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "success": False,
+                    "message": response.message,
+                    "error_code": "INVALID_REQUEST",
+                },
+            )
+
+        return response
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={
+                "success": False,
+                "message": "Error interno del servidor",
+                "error_code": "INTERNAL_SERVER_ERROR",
+                "detail": str(e),
+            },
+        )
+
 @router.post(
     "/",
+    dependencies=[Depends(statement_timeout("write"))],
     summary="Create a new support case",
     description="Creates a new support case with the provided data",
     responses={
         201: {"description": "Caso creado exitosamente"},
         400: {"model": ErrorResponse, "description": "Error en la solicitud"},
+        409: {"model": ErrorResponse, "description": "Ya existe un caso abierto con la misma consulta"},
         422: {"model": ErrorResponse, "description": "Error de validación"},
         500: {"model": ErrorResponse, "description": "Error interno del servidor"},
+        503: {"model": ErrorResponse, "description": "Base de datos no disponible, reintentar"},
     },
 )
-async def create_support_case(case_data: SupportCaseCreateRequest = Body(...)):
+async def create_support_case(
+    case_data: SupportCaseCreateRequest = Body(...),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", min_length=1, max_length=255),
+):
     """
     Create a new support case
 
@@ -152,10 +497,68 @@ async def create_support_case(case_data: SupportCaseCreateRequest = Body(...)):
     - sql_query: SQL query to be executed
     - executed_by: User who executed the query
     - priority: Case priority (baja/media/alta)
+    - allow_duplicate: Create it even if an open case has the same query (default: false)
+    - Idempotency-Key header: Retries with the same key and body get the
+      stored response instead of creating another case (optional)
 
     Returns:
     - Created case information with success status
+    - 409 with the existing open case when the same sql_query was already
+      filed against the same database and schema
+    - 503 with Retry-After when the database failed; the key is released
     """
+    if idempotency_key is None:
+        return await _create_support_case(case_data)
+
+    try:
+        request_hash = request_fingerprint(jsonable_encoder(case_data))
+        claim = await IdempotencyService.claim(idempotency_key, request_hash)
+    except Exception as e:
+        return _internal_error(e)
+
+    if claim.outcome == "replay":
+        return JSONResponse(
+            status_code=claim.status_code,
+            content=claim.body,
+            headers={"Idempotent-Replayed": "true"},
+        )
+    if claim.outcome == "mismatch":
+        return JSONResponse(
+            status_code=422,
+            content={
+                "success": False,
+                "message": "La clave de idempotencia ya se usó con otra solicitud",
+                "error_code": "IDEMPOTENCY_KEY_REUSED",
+            },
+        )
+    if claim.outcome == "in_progress":
+        return JSONResponse(
+            status_code=409,
+            content={
+                "success": False,
+                "message": "Otra solicitud con la misma clave de idempotencia sigue en curso",
+                "error_code": "IDEMPOTENCY_IN_PROGRESS",
+            },
+            headers={"Retry-After": "1"},
+        )
+
+    response = await _create_support_case(case_data)
+    try:
+        if response.status_code in IDEMPOTENT_STORED_STATUSES:
+            await IdempotencyService.complete(
+                idempotency_key, request_hash, response.status_code, json.loads(response.body)
+            )
+        else:
+            # Cualquier otro resultado (un error del servidor) no se guarda:
+            # el reintento vuelve a intentarlo
+            await IdempotencyService.release(idempotency_key, request_hash)
+    except Exception as e:
+        # El caso ya está creado: se responde igual; la clave sin completar
+        # se libera sola al vencer idempotency_lock_seconds
+        logger.warning("No se pudo guardar la respuesta idempotente: %s", e)
+    return response
+
+async def _create_support_case(case_data: SupportCaseCreateRequest) -> JSONResponse:
     try:
         response = await SupportService.create_support_case(
             title=case_data.title,
@@ -165,6 +568,150 @@ async def create_support_case(case_data: SupportCaseCreateRequest = Body(...)):
             sql_query=case_data.sql_query,
             executed_by=case_data.executed_by,
             priority=case_data.priority,
+            allow_duplicate=case_data.allow_duplicate,
+        )
+
+        if response.existing_case is not None:
+            return JSONResponse(
+                status_code=409,
+                content={
+                    "success": False,
+                    "message": response.message,
+                    "error_code": "DUPLICATE_CASE",
+                    "existing_case": jsonable_encoder(response.existing_case),
+                },
+            )
+
+        if not response.success:
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "success": False,
+                    "message": response.message,
+                    "error_code": "INVALID_REQUEST",
+                },
+            )
+
+        return JSONResponse(status_code=200, content=jsonable_encoder(response))
+    except Exception as e:
+        if is_infrastructure_error(e):
+            return _database_unavailable(e)
+        return _internal_error(e)
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of If-None-Match against ``etag``"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+def _database_unavailable(e: Exception) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={
+            "success": False,
+            "message": "La base de datos no está disponible, intenta de nuevo en unos segundos",
+            "error_code": "DATABASE_UNAVAILABLE",
+            "detail": str(e),
+        },
+        headers={"Retry-After": "1"},
+    )
+
+def _internal_error(e: Exception) -> JSONResponse:
+    return JSONResponse(
+        status_code=500,
+        content={
+            "success": False,
+            "message": "Error interno del servidor",
+            "error_code": "INTERNAL_SERVER_ERROR",
+            "detail": str(e),
+        },
+    )
+
+@router.patch(
+    "/status",
+    dependencies=[Depends(statement_timeout("write"))],
+    response_model=BulkUpdateResponse,
+    summary="Bulk update the status of support cases",
+    description="Moves many cases to a new status in a single statement",
+    responses={
+        400: {"model": ErrorResponse, "description": "Error en la solicitud"},
+        422: {"model": ErrorResponse, "description": "Error de validación"},
+        500: {"model": ErrorResponse, "description": "Error interno del servidor"},
+    },
+)
+async def bulk_update_status(update: BulkStatusUpdateRequest = Body(...)):
+    """
+    Bulk update the status of support cases
+
+    Parameters:
+    - ids: IDs of the cases to update (max 1000)
+    - status: New status (pendiente/en_proceso/en_pausa/completado/rechazado)
+    - changed_by: User who makes the change (optional, stored in the event log)
+
+    Returns:
+    - Outcome per ID: updated, unchanged, not_found or invalid_transition
+    """
+    try:
+        response = await SupportService.bulk_update_status(
+            ids=update.ids,
+            status=update.status.value,
+            changed_by=update.changed_by,
+        )
+
+        if not response.success:
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "success": False,
+                    "message": response.message,
+                    "error_code": "INVALID_REQUEST",
+                },
+            )
+
+        return response
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={
+                "success": False,
+                "message": "Error interno del servidor",
+                "error_code": "INTERNAL_SERVER_ERROR",
+                "detail": str(e),
+            },
+        )
+
+@router.patch(
+    "/priority",
+    dependencies=[Depends(statement_timeout("write"))],
+    response_model=BulkUpdateResponse,
+    summary="Bulk update the priority of support cases",
+    description="Re-prioritizes many cases in a single statement",
+    responses={
+        400: {"model": ErrorResponse, "description": "Error en la solicitud"},
+        422: {"model": ErrorResponse, "description": "Error de validación"},
+        500: {"model": ErrorResponse, "description": "Error interno del servidor"},
+    },
+)
+async def bulk_update_priority(update: BulkPriorityUpdateRequest = Body(...)):
+    """
+    Bulk update the priority of support cases
+
+    Parameters:
+    - ids: IDs of the cases to update (max 1000)
+    - priority: New priority (baja/media/alta)
+    - changed_by: User who makes the change (optional, stored in the event log)
+
+    Returns:
+    - Outcome per ID: updated, unchanged or not_found
+    """
+    try:
+        response = await SupportService.bulk_update_priority(
+            ids=update.ids,
+            priority=update.priority.value,
+            changed_by=update.changed_by,
         )
 
         if not response.success:
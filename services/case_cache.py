@@ -0,0 +1,10 @@
+from utils.cache import TwoLevelCache
+
+# Cachés de lectura de casos (ver utils/cache.py), compartidas por los
+# servicios que leen o modifican filas de support_cases:
+# - case_cache: un caso por id. Se invalida en cada escritura del caso.
+# - listing_cache: páginas del listado por su ETag, que ya incluye la versión
+#   de la tabla en cada shard; una escritura cambia la clave, así que nunca
+#   se invalidan y solo expiran.
+case_cache = TwoLevelCache("case")
+listing_cache = TwoLevelCache("listing", l1_max_entries=256)
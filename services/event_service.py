@@ -0,0 +1,115 @@
+import asyncio
+import heapq
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional
+from database.connection import execute
+from database.sharding import get_router
+from database.support_queries import GET_CASE_EVENTS, build_events_query
+from models.support_responses import CaseEvent, CaseEventsResponse
+from utils.timing import timing_span
+from utils.tracing import traced
+
+# Ventana máxima de una consulta por rango de tiempo: mantiene acotado el
+# número de bloques que el índice BRIN entrega al ordenamiento
+MAX_EVENT_WINDOW = timedelta(days=31)
+
+
+def _row_to_event(row) -> CaseEvent:
+    return CaseEvent(
+        id=row[0],
+        case_id=row[1],
+        event_type=row[2],
+        from_value=row[3],
+        to_value=row[4],
+        actor=row[5],
+        occurred_at=row[6],
+    )
+
+
+def _events_response(rows, limit: int, message: str) -> CaseEventsResponse:
+    with timing_span("mapping"):
+        items = [_row_to_event(row) for row in rows]
+    last = items[-1] if len(items) == limit else None
+    return CaseEventsResponse(
+        success=True,
+        message=message,
+        items=items,
+        next_after_id=last.id if last else None,
+        next_after_occurred_at=last.occurred_at if last else None,
+    )
+
+
+class EventService:
+
+    @staticmethod
+    @traced("EventService.get_case_timeline")
+    async def get_case_timeline(case_id: str, limit: int = 100, after_id: int = 0) -> CaseEventsResponse:
+        try:
+            try:
+                uuid.UUID(case_id)
+            except ValueError:
+                return CaseEventsResponse(
+                    success=False,
+                    message="El ID proporcionado no es válido",
+                )
+
+            rows = await execute(
+                GET_CASE_EVENTS, (case_id, after_id, limit), fetch_all=True,
+                shard=get_router().shard_for(case_id)
+            ) or []
+            return _events_response(rows, limit, f"Se obtuvieron {len(rows)} eventos del caso")
+        except Exception as e:
+            return CaseEventsResponse(
+                success=False,
+                message=f"Error al obtener los eventos del caso: {str(e)}",
+            )
+
+    @staticmethod
+    @traced("EventService.get_events")
+    async def get_events(
+        start: datetime,
+        end: datetime,
+        event_type: Optional[List[str]] = None,
+        actor: Optional[List[str]] = None,
+        limit: int = 100,
+        after_occurred_at: Optional[datetime] = None,
+        after_id: Optional[int] = None,
+    ) -> CaseEventsResponse:
+        try:
+            if (after_occurred_at is None) != (after_id is None):
+                return CaseEventsResponse(
+                    success=False,
+                    message="after_occurred_at y after_id deben enviarse juntos",
+                )
+            if end <= start:
+                return CaseEventsResponse(
+                    success=False,
+                    message="La fecha final debe ser posterior a la inicial",
+                )
+            if end - start > MAX_EVENT_WINDOW:
+                return CaseEventsResponse(
+                    success=False,
+                    message=f"La ventana de tiempo no puede superar {MAX_EVENT_WINDOW.days} días",
+                )
+
+            after = (after_occurred_at, after_id) if after_id is not None else None
+            query, params = build_events_query(start, end, event_type, actor, after, limit)
+            # Cada shard devuelve sus eventos ordenados por (occurred_at, id);
+            # los ids son únicos entre shards (secuencias intercaladas), así
+            # que la combinación por esa clave es un orden total y el cursor
+            # vale para todos los shards
+            shard_rows = await asyncio.gather(*(
+                execute(query, tuple(params), fetch_all=True, shard=shard)
+                for shard in range(get_router().count)
+            ))
+            merged = heapq.merge(
+                *(rows or [] for rows in shard_rows), key=lambda row: (row[6], row[0])
+            )
+            rows = list(merged)[:limit]
+            return _events_response(rows, limit, f"Se obtuvieron {len(rows)} eventos")
+        except Exception as e:
+            return CaseEventsResponse(
+                success=False,
+                message=f"Error al obtener los eventos: {str(e)}",
+            )
@@ -0,0 +1,158 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+from config import get_settings
+from database.connection import execute
+from database.sharding import get_router
+from database.support_queries import FACET_FIELDS, build_facets_query
+from models.support_responses import FacetsResponse, FacetValue
+from utils.metrics import metrics
+from utils.tracing import traced
+
+MAX_CACHED_SCOPES = 256
+
+
+def facet_cache_key(filters: dict) -> str:
+    """Stable key for a filter combination (order of values does not matter)"""
+    normalized = {}
+    for field, value in filters.items():
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            value = sorted(str(v) for v in value)
+        normalized[field] = value
+    return json.dumps(normalized, sort_keys=True, default=str)
+
+
+class FacetCache:
+    """In-process facet cache.
+
+    The unscoped entry (no filters) is kept current incrementally on every
+    write made through this process. Scoped entries and writes from other
+    workers are covered by a bounded staleness: entries older than
+    ``facets_max_staleness`` seconds are recomputed.
+    """
+
+    UNSCOPED = facet_cache_key({})
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._locks = {}
+
+    def get(self, key: str, max_staleness: float):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry["loaded_at"] > max_staleness:
+            self._entries.pop(key, None)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, counts: dict) -> dict:
+        entry = self._entries[key] = {
+            "counts": counts,
+            "loaded_at": time.monotonic(),
+            "generated_at": datetime.utcnow(),
+        }
+        self._entries.move_to_end(key)
+        while len(self._entries) > MAX_CACHED_SCOPES:
+            evicted, _ = self._entries.popitem(last=False)
+            lock = self._locks.get(evicted)
+            if lock is not None and not lock.locked():
+                del self._locks[evicted]
+        return entry
+
+    def lock(self, key: str) -> asyncio.Lock:
+        # Un solo cálculo por combinación de filtros aunque lleguen varias
+        # peticiones a la vez con la caché vacía
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    def _adjust(self, field: str, value, delta: int):
+        entry = self._entries.get(self.UNSCOPED)
+        if entry is None or value is None:
+            return
+        values = entry["counts"].setdefault(field, {})
+        values[value] = values.get(value, 0) + delta
+        if values[value] <= 0:
+            del values[value]
+        entry["generated_at"] = datetime.utcnow()
+
+    def record_created(self, case):
+        """Count a newly created case in the unscoped entry"""
+        for field in FACET_FIELDS:
+            self._adjust(field, getattr(case, field), 1)
+
+    def record_changed(self, field: str, previous, current):
+        """Move one case from ``previous`` to ``current`` in the unscoped entry"""
+        if previous == current:
+            return
+        self._adjust(field, previous, -1)
+        self._adjust(field, current, 1)
+
+    def clear(self):
+        self._entries.clear()
+        self._locks.clear()
+
+
+facet_cache = FacetCache()
+
+
+class FacetService:
+
+    @staticmethod
+    @traced("FacetService.get_facets")
+    async def get_facets(filters: Optional[dict] = None) -> FacetsResponse:
+        try:
+            filters = filters or {}
+            key = facet_cache_key(filters)
+            max_staleness = get_settings().facets_max_staleness
+
+            entry = facet_cache.get(key, max_staleness)
+            cached = entry is not None
+            if entry is None:
+                async with facet_cache.lock(key):
+                    entry = facet_cache.get(key, max_staleness)
+                    if entry is None:
+                        metrics.increment("facets_cache_miss_total")
+                        query, params = build_facets_query(filters)
+                        shard_rows = await asyncio.gather(*(
+                            execute(query, tuple(params), fetch_all=True, shard=shard)
+                            for shard in range(get_router().count)
+                        ))
+                        counts = {field: {} for field in FACET_FIELDS}
+                        for rows in shard_rows:
+                            for field, value, total in rows or []:
+                                counts[field][value] = counts[field].get(value, 0) + total
+                        entry = facet_cache.put(key, counts)
+            if cached:
+                metrics.increment("facets_cache_hit_total")
+
+            facets = {
+                field: [
+                    FacetValue(value=value, count=count)
+                    for value, count in sorted(
+                        entry["counts"].get(field, {}).items(),
+                        key=lambda item: (-item[1], item[0] or ""),
+                    )
+                ]
+                for field in FACET_FIELDS
+            }
+            return FacetsResponse(
+                success=True,
+                message="Facets obtenidos exitosamente",
+                facets=facets,
+                generated_at=entry["generated_at"],
+                cached=cached,
+            )
+        except Exception as e:
+            return FacetsResponse(
+                success=False,
+                message=f"Error al obtener los facets: {str(e)}",
+            )
@@ -0,0 +1,117 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import NamedTuple, Optional
+from config import get_settings
+from database.connection import execute
+from database.support_queries import (
+    CLAIM_IDEMPOTENCY_KEY,
+    COMPLETE_IDEMPOTENCY_KEY,
+    GET_IDEMPOTENCY_KEY,
+    RELEASE_IDEMPOTENCY_KEY,
+    SWEEP_IDEMPOTENCY_KEYS,
+)
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Cabecera Idempotency-Key de POST /api/support-cases/: el primer envío con
+# una clave la reclama, crea el caso y guarda la respuesta; los reintentos con
+# la misma clave reciben esa respuesta sin volver a escribir. Las claves viven
+# IDEMPOTENCY_TTL_HOURS y un barrido periódico borra las vencidas.
+
+SWEEP_BATCH_SIZE = 1000
+
+
+class IdempotencyClaim(NamedTuple):
+    # "acquired": esta petición debe procesarse y completar la clave;
+    # "replay": ya hay respuesta guardada; "mismatch": la clave se usó con
+    # otro cuerpo; "in_progress": otra petición con la clave sigue en curso
+    outcome: str
+    status_code: Optional[int] = None
+    body: Optional[dict] = None
+
+
+def request_fingerprint(payload: dict) -> str:
+    """SHA-256 of the request body, independent of key order"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class IdempotencyService:
+
+    @staticmethod
+    async def claim(key: str, request_hash: str) -> IdempotencyClaim:
+        """Claim ``key`` or return what a previous request with it left.
+
+        A concurrent request with the same key waits (polling, without
+        locks) up to ``IDEMPOTENCY_WAIT_SECONDS`` for the first one to finish.
+        """
+        settings = get_settings()
+        deadline = time.monotonic() + settings.idempotency_wait_seconds
+        delay = 0.05
+        while True:
+            claimed = await execute(
+                CLAIM_IDEMPOTENCY_KEY,
+                (key, request_hash, settings.idempotency_lock_seconds,
+                 settings.idempotency_ttl_hours * 3600),
+                fetch_one=True,
+            )
+            if claimed:
+                return IdempotencyClaim("acquired")
+
+            row = await execute(GET_IDEMPOTENCY_KEY, (key,), fetch_one=True)
+            # Sin fila: vencida o liberada entre las dos sentencias; se vuelve
+            # a reclamar con la misma espera y el mismo plazo
+            if row is not None:
+                stored_hash, status_code, body = row
+                if stored_hash != request_hash:
+                    metrics.increment("idempotency_mismatches_total")
+                    return IdempotencyClaim("mismatch")
+                if status_code is not None:
+                    metrics.increment("idempotency_replays_total")
+                    if isinstance(body, str):
+                        body = json.loads(body)
+                    return IdempotencyClaim("replay", status_code, body)
+            if time.monotonic() + delay > deadline:
+                metrics.increment("idempotency_in_progress_total")
+                return IdempotencyClaim("in_progress")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    @staticmethod
+    async def complete(key: str, request_hash: str, status_code: int, body: dict):
+        """Store the response of a claimed key so retries can replay it"""
+        await execute(
+            COMPLETE_IDEMPOTENCY_KEY,
+            (status_code, json.dumps(body, default=str), key, request_hash),
+        )
+
+    @staticmethod
+    async def release(key: str, request_hash: str):
+        """Drop an unfinished claim (the request failed) so a retry can run"""
+        await execute(RELEASE_IDEMPOTENCY_KEY, (key, request_hash))
+
+    @staticmethod
+    async def sweep(batch_size: int = SWEEP_BATCH_SIZE) -> int:
+        """Delete expired keys in batches; returns the number deleted"""
+        deleted = 0
+        while True:
+            count = await execute(SWEEP_IDEMPOTENCY_KEYS, (batch_size,), row_count=True)
+            deleted += count
+            if count < batch_size:
+                break
+        metrics.increment("idempotency_swept_total", deleted)
+        return deleted
+
+    @staticmethod
+    async def run_sweeper():
+        """Sweep expired keys every ``IDEMPOTENCY_SWEEP_INTERVAL_SECONDS`` (app lifespan)"""
+        while True:
+            await asyncio.sleep(get_settings().idempotency_sweep_interval_seconds)
+            try:
+                await IdempotencyService.sweep()
+            except Exception as e:
+                logger.warning("No se pudieron borrar las claves de idempotencia vencidas: %s", e)
@@ -0,0 +1,190 @@
+import asyncio
+import uuid
+import zlib
+from typing import AsyncIterator, Iterator, NamedTuple, Optional, Tuple
+from config import get_settings
+from database.connection import execute
+from database.sharding import get_router
+from database.support_queries import (
+    ADD_PAYLOAD_COLUMNS,
+    CREATE_PAYLOAD_TABLE,
+    GET_CASE_PAYLOAD,
+    GET_CASES_WITH_LARGE_PAYLOADS,
+    GET_PAYLOAD_SLICE,
+    PAYLOAD_ENCODING,
+    STORE_CASE_PAYLOAD,
+)
+from services.case_cache import case_cache
+from utils.metrics import metrics
+from utils.tracing import traced
+
+# sql_query y execution_result de varios MB: por encima de
+# PAYLOAD_INLINE_MAX_BYTES el texto completo se guarda comprimido en
+# support_case_payloads y en la fila queda un avance de
+# PAYLOAD_PREVIEW_BYTES y el tamaño completo (<campo>_bytes). Los listados y
+# la consulta por id solo leen la fila; el texto completo se sirve por
+# streaming desde GET /api/support-cases/case/{id}/payload/{campo}, leyendo
+# los datos comprimidos por trozos y descomprimiendo por bloques.
+
+COMPRESSION_LEVEL = 6
+STREAM_CHUNK_BYTES = 64 * 1024
+# Datos comprimidos leídos de la BD por consulta
+READ_CHUNK_BYTES = 1024 * 1024
+MIN_UUID = "00000000-0000-0000-0000-000000000000"
+
+
+class CasePayload(NamedTuple):
+    # "found": chunks produce el texto completo en UTF-8; "invalid_id": el id
+    # no es un UUID; "not_found": no existe el caso; "empty": el caso no
+    # tiene valor en ese campo
+    outcome: str
+    byte_length: int = 0
+    chunks: Optional[AsyncIterator[bytes]] = None
+
+
+def split_payload(
+    text: Optional[str], inline_max_bytes: int, preview_bytes: int
+) -> Tuple[Optional[str], Optional[int], Optional[bytes]]:
+    """(inline text, full size in bytes, compressed text) for storing ``text``.
+
+    Texts up to ``inline_max_bytes`` stay whole in the row and the last two
+    values are None.
+    """
+    if text is None:
+        return None, None, None
+    data = text.encode("utf-8")
+    if len(data) <= inline_max_bytes:
+        return text, None, None
+    # Avance cortado en un límite de carácter
+    preview = data[:preview_bytes].decode("utf-8", "ignore")
+    compressed = zlib.compress(data, COMPRESSION_LEVEL)
+    metrics.increment("payloads_stored_total")
+    metrics.observe("payload_compression_ratio", len(data) / max(len(compressed), 1))
+    return preview, len(data), compressed
+
+
+def _decompress_piece(decompressor, piece, chunk_size: int) -> Iterator[bytes]:
+    # max_length acota cada bloque aunque la razón de compresión sea alta
+    while piece:
+        chunk = decompressor.decompress(piece, chunk_size)
+        if chunk:
+            yield chunk
+        piece = decompressor.unconsumed_tail
+
+
+def iter_decompressed(data, encoding: str, chunk_size: int = STREAM_CHUNK_BYTES) -> Iterator[bytes]:
+    """Decompress a stored payload in pieces of at most ``chunk_size`` bytes"""
+    if encoding != PAYLOAD_ENCODING:
+        raise ValueError(f"Codificación de payload no soportada: {encoding}")
+    view = memoryview(data)
+    decompressor = zlib.decompressobj()
+    for start in range(0, len(view), chunk_size):
+        yield from _decompress_piece(decompressor, view[start:start + chunk_size], chunk_size)
+    tail = decompressor.flush()
+    if tail:
+        yield tail
+
+
+async def _iter_stored(
+    case_id: str, field: str, shard: int, stored_bytes: int, chunk_size: int = STREAM_CHUNK_BYTES,
+) -> AsyncIterator[bytes]:
+    """Read a stored payload READ_CHUNK_BYTES compressed bytes at a time and decompress it"""
+    decompressor = zlib.decompressobj()
+    for offset in range(0, stored_bytes, READ_CHUNK_BYTES):
+        row = await execute(
+            GET_PAYLOAD_SLICE, (offset + 1, READ_CHUNK_BYTES, case_id, field),
+            fetch_one=True, shard=shard,
+        )
+        if row is None:
+            raise LookupError(f"El {field} del caso {case_id} ya no existe")
+        for chunk in _decompress_piece(decompressor, row[0], chunk_size):
+            yield chunk
+    tail = decompressor.flush()
+    if tail:
+        yield tail
+
+
+async def _iter_text(data: bytes, chunk_size: int = STREAM_CHUNK_BYTES) -> AsyncIterator[bytes]:
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size]
+
+
+class PayloadService:
+
+    @staticmethod
+    @traced("PayloadService.open_payload")
+    async def open_payload(case_id: str, field: str) -> CasePayload:
+        """Full text of ``field`` of a case, as a chunk iterator for streaming"""
+        try:
+            uuid.UUID(case_id)
+        except ValueError:
+            return CasePayload("invalid_id")
+        shard = get_router().shard_for(case_id)
+        row = await execute(GET_CASE_PAYLOAD[field], (case_id,), fetch_one=True, shard=shard)
+        if not row:
+            return CasePayload("not_found")
+        inline, byte_length, encoding, stored_bytes = row
+        if stored_bytes is not None:
+            # Antes de responder: un error a mitad del streaming ya no puede ser un 500
+            if encoding != PAYLOAD_ENCODING:
+                raise ValueError(f"Codificación de payload no soportada: {encoding}")
+            metrics.increment("payload_streams_total")
+            return CasePayload(
+                "found", byte_length, _iter_stored(str(case_id), field, shard, stored_bytes)
+            )
+        if inline is None:
+            return CasePayload("empty")
+        text = inline.encode("utf-8")
+        return CasePayload("found", len(text), _iter_text(text))
+
+
+async def externalize_shard(shard: int, batch_size: int = 100) -> int:
+    """Move the large payloads of existing cases of one shard out of the row.
+
+    Walks the shard by id (keyset) and only touches values still inline, so
+    it can be interrupted and run again. Returns the number of values moved.
+    """
+    settings = get_settings()
+    await execute(ADD_PAYLOAD_COLUMNS, shard=shard)
+    for statement in CREATE_PAYLOAD_TABLE:
+        await execute(statement, shard=shard)
+    limit = settings.payload_inline_max_bytes
+    last_id = MIN_UUID
+    moved = 0
+    while True:
+        rows = await execute(
+            GET_CASES_WITH_LARGE_PAYLOADS, (last_id, limit, limit, batch_size),
+            fetch_all=True, shard=shard,
+        )
+        if not rows:
+            break
+        changed_ids = []
+        for case_id, sql_query, execution_result in rows:
+            for field, text in (("sql_query", sql_query), ("execution_result", execution_result)):
+                preview, byte_length, compressed = split_payload(
+                    text, limit, settings.payload_preview_bytes
+                )
+                if compressed is None:
+                    continue
+                await execute(
+                    STORE_CASE_PAYLOAD[field],
+                    (str(case_id), byte_length, compressed, preview, byte_length, str(case_id)),
+                    shard=shard,
+                )
+                moved += 1
+                changed_ids.append(str(case_id))
+        # La fila cambió (avance y tamaño): fuera de las cachés de los workers
+        await case_cache.invalidate(changed_ids)
+        last_id = str(rows[-1][0])
+        if len(rows) < batch_size:
+            break
+    return moved
+
+
+async def externalize_payloads(batch_size: int = 100) -> dict:
+    """Externalize every shard concurrently; returns values moved per shard"""
+    router = get_router()
+    counts = await asyncio.gather(*(
+        externalize_shard(shard, batch_size) for shard in range(router.count)
+    ))
+    return {f"shard{shard}": count for shard, count in enumerate(counts)}
@@ -0,0 +1,246 @@
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Optional
+from database.support_queries import CASE_COLUMNS
+
+# Exportación de support_cases a Parquet particionado por mes de created_at
+# (estilo Hive: created_month=YYYY-MM/part-*.parquet). pyarrow es opcional y
+# solo se importa al exportar.
+
+WATERMARK_FILE = "_watermark.json"
+
+COLUMNS = [
+    "id", "title", "description", "database_name", "schema_name",
+    "sql_query", "executed_by", "status", "priority", "created_at",
+    "updated_at", "execution_result",
+]
+
+# Columnas de baja cardinalidad: se guardan con codificación de diccionario
+DICTIONARY_COLUMNS = ["status", "priority", "database_name", "executed_by"]
+
+# La marca de agua no es un updated_at (lo fija la aplicación, con su reloj y
+# antes del commit) sino, por shard, el horizonte de transacciones: el xmin
+# del snapshot, por debajo del cual toda transacción ya terminó. Cada
+# ejecución exporta las filas escritas en [horizonte anterior, horizonte
+# actual); una transacción lenta que confirma después queda por encima del
+# horizonte y entra en la ejecución siguiente.
+SNAPSHOT_HORIZON = "SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint"
+
+# write_txid es NULL en filas anteriores a la columna: solo la exportación
+# completa las incluye
+EXPORT_QUERY = f"""
+SELECT {CASE_COLUMNS}
+FROM support_cases
+WHERE write_txid IS NULL OR write_txid < %s
+"""
+
+INCREMENTAL_EXPORT_QUERY = f"""
+SELECT {CASE_COLUMNS}
+FROM support_cases
+WHERE write_txid >= %s AND write_txid < %s
+ORDER BY write_txid, id
+"""
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError(
+            "pyarrow es necesario para exportar snapshots: pip install pyarrow"
+        )
+    return pyarrow, pyarrow.parquet
+
+
+def arrow_schema():
+    pa, _ = _require_pyarrow()
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    fields = []
+    for column in COLUMNS:
+        if column in DICTIONARY_COLUMNS:
+            fields.append(pa.field(column, dictionary))
+        elif column in ("created_at", "updated_at"):
+            fields.append(pa.field(column, pa.timestamp("us")))
+        else:
+            fields.append(pa.field(column, pa.string()))
+    return pa.schema(fields)
+
+
+class SnapshotDirectoryNotEmpty(Exception):
+    """A full export would add a second copy of rows already in the directory"""
+
+
+def _has_partitions(output_dir: str) -> bool:
+    for entry in os.scandir(output_dir):
+        if entry.is_dir() and entry.name.startswith("created_month="):
+            if any(name.endswith(".parquet") for name in os.listdir(entry.path)):
+                return True
+    return False
+
+
+def read_watermark(output_dir: str) -> Optional[dict]:
+    """Transaction horizon per shard of the last export, or None"""
+    path = os.path.join(output_dir, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        data = json.load(f)
+    if "shards" not in data:
+        # Marca de agua antigua (por updated_at): se vuelve a exportar todo
+        return None
+    return {int(shard): horizon for shard, horizon in data["shards"].items()}
+
+
+def write_watermark(output_dir: str, horizons: dict, rows: int):
+    # Se escribe con rename atómico y solo al terminar la exportación
+    path = os.path.join(output_dir, WATERMARK_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({
+            "shards": {str(shard): horizon for shard, horizon in sorted(horizons.items())},
+            "rows": rows,
+            "exported_at": datetime.utcnow().isoformat(),
+        }, f)
+    os.replace(tmp_path, path)
+
+
+def _shard_horizon(shard: int) -> int:
+    from database.connection import get_database
+    database = get_database(shard)
+    conn = database.get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(SNAPSHOT_HORIZON)
+            horizon = cursor.fetchone()[0]
+        conn.commit()
+        return horizon
+    finally:
+        database.return_connection(conn)
+
+
+class SnapshotExporter:
+    """Stream support_cases into month-partitioned Parquet files.
+
+    ``stream`` is a callable ``(query, params, chunk_size, shard) -> iterable
+    of row chunks`` (by default the server-side cursor from
+    database.connection) and ``horizon`` a callable ``(shard) -> int`` with
+    the shard's current transaction horizon.
+    """
+
+    def __init__(self, output_dir: str, chunk_size: int = 5000, stream=None,
+                 horizon=None, shards: Optional[int] = None, compression: str = "zstd"):
+        self.output_dir = output_dir
+        self.chunk_size = chunk_size
+        self.compression = compression
+        if stream is None:
+            from database.connection import stream_rows
+
+            def stream(query, params, chunk_size, shard):
+                return stream_rows(
+                    query, params, chunk_size, cursor_name="snapshot_export", shard=shard
+                )
+        if shards is None:
+            from database.sharding import get_router
+            shards = get_router().count
+        self.stream = stream
+        self.horizon = horizon or _shard_horizon
+        self.shards = shards
+
+    def run(self, incremental: bool = True) -> dict:
+        """Export changed rows (or all rows) and advance the watermark.
+
+        Raises ``SnapshotDirectoryNotEmpty`` if every row would be exported
+        (``incremental=False`` or no usable watermark) into a directory that
+        already has partitions.
+        """
+        pa, pq = _require_pyarrow()
+        os.makedirs(self.output_dir, exist_ok=True)
+        schema = arrow_schema()
+
+        watermark = read_watermark(self.output_dir) if incremental else None
+        if watermark is None and _has_partitions(self.output_dir):
+            # Los archivos no se reescriben: exportar todo otra vez encima
+            # duplicaría cada fila ya exportada
+            raise SnapshotDirectoryNotEmpty(
+                f"{self.output_dir} ya contiene un snapshot; la exportación completa "
+                "necesita un directorio vacío o nuevo"
+            )
+        # El horizonte se toma antes de leer: todo lo que queda por debajo ya
+        # está confirmado (o abortado) y es visible para la lectura
+        horizons = {shard: self.horizon(shard) for shard in range(self.shards)}
+
+        run_id = datetime.utcnow().strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:8]
+        writers = {}
+        rows_written = 0
+        try:
+            for shard, upper in horizons.items():
+                lower = (watermark or {}).get(shard)
+                if lower is None:
+                    query, params = EXPORT_QUERY, (upper,)
+                else:
+                    query, params = INCREMENTAL_EXPORT_QUERY, (lower, upper)
+                for chunk in self.stream(query, params, self.chunk_size, shard):
+                    for month, rows in self._group_by_month(chunk).items():
+                        writer = writers.get(month)
+                        if writer is None:
+                            writer = writers[month] = self._open_writer(pq, schema, month, run_id)
+                        writer[0].write_table(self._to_table(pa, schema, rows))
+                    rows_written += len(chunk)
+        except BaseException:
+            for parquet_writer, tmp_path, _ in writers.values():
+                parquet_writer.close()
+                os.remove(tmp_path)
+            raise
+
+        files = []
+        for parquet_writer, tmp_path, final_path in writers.values():
+            parquet_writer.close()
+            os.replace(tmp_path, final_path)
+            files.append(final_path)
+
+        write_watermark(self.output_dir, horizons, rows_written)
+
+        return {
+            "rows": rows_written,
+            "files": sorted(files),
+            "partitions": sorted(writers),
+            "watermark": horizons,
+            "incremental": watermark is not None,
+        }
+
+    @staticmethod
+    def _group_by_month(chunk) -> dict:
+        groups = {}
+        for row in chunk:
+            groups.setdefault(row[9].strftime("%Y-%m"), []).append(row)
+        return groups
+
+    def _open_writer(self, pq, schema, month: str, run_id: str):
+        partition_dir = os.path.join(self.output_dir, f"created_month={month}")
+        os.makedirs(partition_dir, exist_ok=True)
+        final_path = os.path.join(partition_dir, f"part-{run_id}.parquet")
+        tmp_path = final_path + ".tmp"
+        writer = pq.ParquetWriter(
+            tmp_path,
+            schema,
+            compression=self.compression,
+            use_dictionary=DICTIONARY_COLUMNS,
+        )
+        return writer, tmp_path, final_path
+
+    @staticmethod
+    def _to_table(pa, schema, rows):
+        columns = list(zip(*rows))
+        arrays = []
+        for index, field in enumerate(schema):
+            values = columns[index]
+            if field.name == "id":
+                values = [str(value) for value in values]
+            if pa.types.is_dictionary(field.type):
+                arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(values, type=field.type))
+        return pa.Table.from_arrays(arrays, schema=schema)
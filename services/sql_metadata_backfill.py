@@ -0,0 +1,56 @@
+import asyncio
+from database.connection import create_indexes, execute
+from database.sharding import get_router
+from database.support_queries import (
+    ADD_SQL_METADATA_COLUMNS,
+    GET_CASES_WITHOUT_SQL_METADATA,
+    build_sql_metadata_update,
+)
+from services.case_cache import case_cache
+from utils.sql_analyzer import analyze_sql, submission_hash
+
+# Rellena statement_type, target_tables, sql_fingerprint y submission_hash en
+# casos creados antes de que existieran esas columnas. Recorre cada shard por
+# id (keyset), en lotes, y solo toca filas que siguen sin submission_hash: se
+# puede interrumpir y relanzar sin repetir trabajo. No modifica updated_at.
+# Los índices se crean al final, cuando las columnas ya tienen datos.
+
+MIN_UUID = "00000000-0000-0000-0000-000000000000"
+
+
+async def backfill_shard(shard: int, batch_size: int = 500) -> int:
+    """Backfill one shard; returns the number of rows updated"""
+    await execute(ADD_SQL_METADATA_COLUMNS, shard=shard)
+    last_id = MIN_UUID
+    updated = 0
+    while True:
+        rows = await execute(
+            GET_CASES_WITHOUT_SQL_METADATA, (last_id, batch_size), fetch_all=True, shard=shard
+        )
+        if not rows:
+            break
+        params = []
+        for case_id, sql_query, database_name, schema_name in rows:
+            analysis = analyze_sql(sql_query)
+            params.extend((
+                str(case_id), analysis.statement_type, analysis.target_tables,
+                analysis.fingerprint,
+                submission_hash(sql_query, database_name or "", schema_name or ""),
+            ))
+        await execute(build_sql_metadata_update(len(rows)), tuple(params), shard=shard)
+        await case_cache.invalidate([str(row[0]) for row in rows])
+        updated += len(rows)
+        last_id = str(rows[-1][0])
+        if len(rows) < batch_size:
+            break
+    await create_indexes(shard=shard)
+    return updated
+
+
+async def backfill_sql_metadata(batch_size: int = 500) -> dict:
+    """Backfill every shard concurrently; returns rows updated per shard"""
+    router = get_router()
+    counts = await asyncio.gather(*(
+        backfill_shard(shard, batch_size) for shard in range(router.count)
+    ))
+    return {f"shard{shard}": count for shard, count in enumerate(counts)}
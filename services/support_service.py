@@ -1,13 +1,117 @@
+import asyncio
+import hashlib
+import heapq
+import time
 import uuid
 from datetime import datetime
-from typing import Optional, Tuple
+from itertools import islice
+from typing import List, Optional, Tuple, Union
 from fastapi import HTTPException
+from config import get_settings
 from database.connection import execute
-from models.support_responses import PaginatedResponse, SupportCase, SupportCaseCreatedResponse, CaseResponse
+from database.resilience import is_infrastructure_error
+from database.sharding import get_router
+from database.support_queries import (
+    BULK_UPDATE_PRIORITY,
+    BULK_UPDATE_STATUS,
+    CASE_COLUMNS,
+    GET_CASE_BY_ID,
+    GET_CASES_VERSION,
+    GET_CASES_BY_IDS,
+    GET_OPEN_CASE_BY_SUBMISSION,
+    INSERT_CASE,
+    build_case_filters,
+    insert_cases_params,
+)
+from models.support_responses import (
+    BatchCaseResponse,
+    BatchCaseResult,
+    BulkUpdateResponse,
+    BulkUpdateResult,
+    CaseResponse,
+    PaginatedResponse,
+    SupportCase,
+    SupportCaseCreatedResponse,
+)
+from models.support_schema import CaseStatus, PriorityLevel, allowed_source_statuses
+from services.case_cache import case_cache, listing_cache
+from services.facet_service import facet_cache, facet_cache_key
+from services.payload_service import split_payload
+from services.write_batcher import case_batcher
+from utils.metrics import metrics
+from utils.sql_analyzer import analyze_sql, submission_hash
+from utils.timing import timing_span
+from utils.tracing import traced
+
+MultiValue = Optional[Union[str, List[str]]]
+
+# Forma de la respuesta del listado: cambiarla invalida los ETag emitidos
+LISTING_FORMAT = "2"
+
+
+async def _timed(coro):
+    """Await ``coro`` and return (result, elapsed ms)"""
+    start = time.perf_counter()
+    result = await coro
+    return result, (time.perf_counter() - start) * 1000
+
+
+async def _execute_by_shard(query: str, ids: List[str], params: tuple = (),
+                            idempotent: Optional[bool] = None) -> list:
+    """Run ``query`` once per shard with that shard's ids as first parameter"""
+    groups = get_router().group_by_shard(ids)
+    results = await asyncio.gather(*(
+        execute(query, (shard_ids,) + params, fetch_all=True, shard=shard, idempotent=idempotent)
+        for shard, shard_ids in groups.items()
+    ))
+    return [row for rows in results for row in (rows or [])]
+
 
 class SupportService:
 
     @staticmethod
+    def _row_to_case(row) -> SupportCase:
+        """Map a row selected with CASE_COLUMNS to a SupportCase"""
+        return SupportCase(
+            id=row[0],
+            title=row[1],
+            description=row[2],
+            database_name=row[3],
+            schema_name=row[4],
+            sql_query=row[5],
+            executed_by=row[6],
+            status=row[7],
+            priority=row[8],
+            created_at=row[9],
+            updated_at=row[10],
+            execution_result=row[11],
+            statement_type=row[12],
+            target_tables=row[13],
+            sql_fingerprint=row[14],
+            sql_query_bytes=row[15],
+            execution_result_bytes=row[16],
+        )
+
+    @staticmethod
+    async def _load_case(case_id: str) -> Optional[SupportCase]:
+        case_data = await execute(
+            GET_CASE_BY_ID, (case_id,), fetch_one=True,
+            shard=get_router().shard_for(case_id)
+        )
+        if not case_data:
+            return None
+        with timing_span("mapping"):
+            return SupportService._row_to_case(case_data)
+
+    @staticmethod
+    async def _load_cases(ids: List[str]) -> dict:
+        rows = await _execute_by_shard(GET_CASES_BY_IDS, ids)
+        with timing_span("mapping"):
+            cases = [SupportService._row_to_case(row) for row in rows]
+        return {str(case.id): case for case in cases}
+
+    @staticmethod
+    @traced("SupportService.get_case_by_id")
     async def get_case_by_id(
         case_id: str
     ) -> SupportCaseCreatedResponse:
@@ -22,7 +126,7 @@ class SupportService:
             
             # Validar que el ID tenga formato UUID
             try:
-                uuid.UUID(case_id)
+                case_id = str(uuid.UUID(case_id))
             except ValueError:
                 return SupportCaseCreatedResponse(
                     message="El ID proporcionado no es válido",
@@ -30,38 +134,19 @@ class SupportService:
                     case=None
                 )
             
-            # Construir la consulta
-            query = "SELECT * FROM support_cases WHERE id = %s"
-            params = (case_id,)
-            
-            # Ejecutar la consulta
-            case_data = await execute(query, params, fetch_one=True)
-            print(case_data)
+            # Caché de casos o, si no está, el shard dueño del caso
+            case = await case_cache.get_or_load(
+                case_id, SupportCase, lambda: SupportService._load_case(case_id)
+            )
             
             # Si no se encuentra el caso
-            if not case_data:
+            if case is None:
                 return SupportCaseCreatedResponse(
                     message=f"No se encontró ningún caso con ID {case_id}",
                     success=False,
                     case=None
                 )
             
-            # Mapear los datos a un objeto SupportCase
-            case = SupportCase(
-                id=case_data[0],
-                title=case_data[1],
-                description=case_data[2],
-                database_name=case_data[3],
-                schema_name=case_data[4],
-                sql_query=case_data[5],
-                executed_by=case_data[6],
-                status=case_data[7],
-                priority=case_data[8],
-                created_at=case_data[9],
-                updated_at=case_data[10],
-                execution_result=case_data[11] if len(case_data) > 11 else None
-            )
-            
             return SupportCaseCreatedResponse(
                 message="Caso encontrado exitosamente",
                 success=True,
@@ -76,18 +161,126 @@ class SupportService:
             )
     
     @staticmethod
+    @traced("SupportService.get_cases_by_ids")
+    async def get_cases_by_ids(ids: List[uuid.UUID]) -> BatchCaseResponse:
+        """Resolve many IDs with one query, keeping the request order"""
+        try:
+            requested = [str(case_id) for case_id in ids]
+            unique_ids = list(dict.fromkeys(requested))
+
+            # Solo los que no están en caché van a la BD (una consulta por shard)
+            cases = await case_cache.get_many_or_load(
+                unique_ids, SupportCase, SupportService._load_cases
+            )
+
+            # Una entrada por ID pedido (incluidos repetidos) en el mismo orden
+            results = [
+                BatchCaseResult(id=case_id, found=case_id in cases, case=cases.get(case_id))
+                for case_id in requested
+            ]
+            return BatchCaseResponse(
+                success=True,
+                message=f"Se encontraron {len(cases)} de {len(unique_ids)} casos",
+                found=len(cases),
+                results=results,
+            )
+        except Exception as e:
+            return BatchCaseResponse(
+                success=False,
+                message=f"Error al buscar los casos: {str(e)}",
+            )
+
+    @staticmethod
+    async def _fetch_page_and_count(page_query: tuple, count_query: tuple, shard: int = 0):
+        """Run the page and COUNT queries, concurrently when the pool allows it"""
+        start = time.perf_counter()
+        if get_router().databases[shard].has_headroom(2):
+            (cases_data, page_ms), (total_records, count_ms) = await asyncio.gather(
+                _timed(execute(*page_query, fetch_all=True, shard=shard)),
+                _timed(execute(*count_query, fetch_one=True, shard=shard)),
+            )
+            wall_ms = (time.perf_counter() - start) * 1000
+            metrics.increment("paginated_queries_parallel_total")
+            metrics.observe("paginated_queries_saved_ms", max(0.0, page_ms + count_ms - wall_ms))
+        else:
+            cases_data = await execute(*page_query, fetch_all=True, shard=shard)
+            total_records = await execute(*count_query, fetch_one=True, shard=shard)
+            wall_ms = (time.perf_counter() - start) * 1000
+            metrics.increment("paginated_queries_sequential_total")
+        metrics.observe("paginated_queries_ms", wall_ms)
+        return cases_data, total_records
+
+    @staticmethod
+    async def _fetch_sharded_page(where: str, filter_params: list, page: int, size: int):
+        """Fan out to every shard and k-way merge by created_at DESC.
+
+        Each shard only returns the first page*size rows of its own order,
+        which is the most any single shard can contribute to the page.
+        """
+        router = get_router()
+        prefix_query = (
+            f"SELECT {CASE_COLUMNS} FROM support_cases{where}"
+            " ORDER BY created_at DESC, id DESC LIMIT %s"
+        )
+        count_query = f"SELECT COUNT(*) FROM support_cases{where}"
+        shard_results = await asyncio.gather(*(
+            SupportService._fetch_page_and_count(
+                (prefix_query, tuple(filter_params + [page * size])),
+                (count_query, tuple(filter_params)),
+                shard=shard,
+            )
+            for shard in range(router.count)
+        ))
+        metrics.increment("paginated_queries_sharded_total")
+
+        merged = heapq.merge(
+            *(rows or [] for rows, _ in shard_results),
+            key=lambda row: (row[9], str(row[0])),
+            reverse=True,
+        )
+        page_rows = list(islice(merged, (page - 1) * size, page * size))
+        total = sum(count[0] for _, count in shard_results if count)
+        return page_rows, (total,)
+
+    @staticmethod
+    @traced("SupportService.get_listing_etag")
+    async def get_listing_etag(filters: dict, page: int, size: int) -> Optional[str]:
+        """Weak ETag of a listing page: filter key plus the table version of every shard.
+
+        Taken before the page is read, so the page is never older than its tag.
+        """
+        if not get_settings().listing_etag_enabled:
+            return None
+        versions = await asyncio.gather(*(
+            execute(GET_CASES_VERSION, fetch_one=True, shard=shard)
+            for shard in range(get_router().count)
+        ))
+        key = facet_cache_key({**filters, "page": page, "size": size})
+        state = ";".join(f"{txid}:{','.join(map(str, in_progress))}" for txid, in_progress in versions)
+        digest = hashlib.sha256(f"{LISTING_FORMAT}|{key}|{state}".encode()).hexdigest()[:32]
+        return f'W/"{digest}"'
+
+    @staticmethod
+    @traced("SupportService.get_paginated_cases")
     async def get_paginated_cases(
-        id: Optional[str] = None,
+        id: MultiValue = None,
         page: int = 1, 
         size: int = 10,
-        status: Optional[str] = None,
-        database_name: Optional[str] = None,
-        schema_name: Optional[str] = None,
+        status: MultiValue = None,
+        database_name: MultiValue = None,
+        schema_name: MultiValue = None,
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None,
-        executed_by: Optional[str] = None,
-        priority: Optional[str] = None
+        executed_by: MultiValue = None,
+        priority: MultiValue = None,
+        updated_start_date: Optional[datetime] = None,
+        updated_end_date: Optional[datetime] = None,
+        statement_type: MultiValue = None,
+        target_table: MultiValue = None,
+        sql_fingerprint: MultiValue = None,
+        etag: Optional[str] = None
     ) -> PaginatedResponse:
+        """Page of cases; with the ``etag`` of the listing, served from the listing cache"""
         try:
             # Validación de parámetros
             if page < 1:
@@ -112,89 +305,79 @@ class SupportService:
                     total_pages=0
                 )
             
-            # Construcción de la consulta base
-            base_query = "SELECT * FROM support_cases WHERE 1=1"
-            count_query = "SELECT COUNT(*) FROM support_cases WHERE 1=1"
-            params = []
-            count_params = []
-            
-            # Añadir filtros condicionales
-            filters = [
-                (status, "status"),
-                (database_name, "database_name"),
-                (schema_name, "schema_name"),
-                (executed_by, "executed_by"),
-                (id, "id"),
-                (priority, "priority")
-            ]
-            
-            date_filters = [
-                (start_date, "created_at >= %s"),
-                (end_date, "created_at <= %s")
-            ]
-            
-            for value, field in filters:
-                if value is not None:
-                    base_query += f" AND {field} = %s"
-                    count_query += f" AND {field} = %s"
-                    params.append(value)
-                    count_params.append(value)
-            
-            for value, condition in date_filters:
-                if value is not None:
-                    base_query += f" AND {condition}"
-                    count_query += f" AND {condition}"
-                    params.append(value)
-                    count_params.append(value)
+            # Construcción de la consulta: cada filtro multivalor se compila a
+            # "= ANY(%s)" con un único parámetro de tipo array
+            where, filter_params = build_case_filters({
+                "id": id,
+                "status": status,
+                "database_name": database_name,
+                "schema_name": schema_name,
+                "executed_by": executed_by,
+                "priority": priority,
+                "start_date": start_date,
+                "end_date": end_date,
+                "updated_start_date": updated_start_date,
+                "updated_end_date": updated_end_date,
+                "statement_type": statement_type,
+                "target_table": target_table,
+                "sql_fingerprint": sql_fingerprint,
+            })
+
+            async def load_page() -> PaginatedResponse:
+                if get_router().count > 1:
+                    cases_data, total_records = await SupportService._fetch_sharded_page(
+                        where, filter_params, page, size
+                    )
+                else:
+                    base_query = (
+                        f"SELECT {CASE_COLUMNS} FROM support_cases{where}"
+                        " ORDER BY created_at DESC LIMIT %s OFFSET %s"
+                    )
+                    count_query = f"SELECT COUNT(*) FROM support_cases{where}"
+                    params = filter_params + [size, (page - 1) * size]
+                    count_params = list(filter_params)
+
+                    # Ejecutar consultas: en paralelo si el pool tiene conexiones
+                    # libres de sobra, secuencialmente si está bajo presión
+                    cases_data, total_records = await SupportService._fetch_page_and_count(
+                        (base_query, tuple(params)), (count_query, tuple(count_params))
+                    )
             
-            # Añadir ordenación y paginación
-            base_query += " ORDER BY created_at DESC LIMIT %s OFFSET %s"
-            params.extend([size, (page - 1) * size])
+                # Procesar resultados
+                if not cases_data:
+                    cases_data = []
             
-            # Ejecutar consultas
-            cases_data = await execute(base_query, tuple(params), fetch_all=True)
-            total_records = await execute(count_query, tuple(count_params), fetch_one=True)
+                if not total_records or not isinstance(total_records, Tuple):
+                    return PaginatedResponse(
+                        message="Error en el formato de datos recibidos",
+                        success=False,
+                        items=[],
+                        total=0,
+                        page=page,
+                        size=size,
+                        total_pages=0
+                    )
             
-            # Procesar resultados
-            if not cases_data:
-                cases_data = []
+                with timing_span("mapping"):
+                    cases = [SupportService._row_to_case(case) for case in cases_data]
             
-            if not total_records or not isinstance(total_records, Tuple):
                 return PaginatedResponse(
-                    message="Error en el formato de datos recibidos",
-                    success=False,
-                    items=[],
-                    total=0,
+                    message=f"Se obtuvieron {len(cases)} casos",
+                    success=True,
+                    items=cases,
+                    total=total_records[0],
                     page=page,
                     size=size,
-                    total_pages=0
+                    total_pages=(total_records[0] // size) + (1 if total_records[0] % size > 0 else 0),
                 )
-            
-            cases = [
-                SupportCase(
-                    id=case[0],
-                    title=case[1],
-                    description=case[2],
-                    database_name=case[3],
-                    schema_name=case[4],
-                    sql_query=case[5],
-                    executed_by=case[6],
-                    status=case[7],
-                    priority=case[8],
-                    created_at=case[9],
-                    updated_at=case[10],
-                    execution_result=case[11],
-                ) for case in cases_data
-            ]
-            
-            return PaginatedResponse(
-                message=f"Se obtuvieron {len(cases)} casos",
-                success=True,
-                items=cases,
-                total=total_records[0],
-                page=page,
-                size=size,
-                total_pages=(total_records[0] // size) + (1 if total_records[0] % size > 0 else 0),
+
+            if etag is None:
+                return await load_page()
+            # Con ETag la página no cambia mientras no cambie la tabla: se
+            # comparte entre peticiones y workers sin invalidarla
+            return await listing_cache.get_or_load(
+                etag, PaginatedResponse, load_page,
+                cacheable=lambda response: response.success,
             )
             
         except Exception as e:
@@ -209,6 +392,7 @@ class SupportService:
             )
     
     @staticmethod
+    @traced("SupportService.create_support_case")
     async def create_support_case(
         title: str,
         description: str,
@@ -216,7 +400,8 @@ class SupportService:
         schema_name: str,
         sql_query: str,
         executed_by: str,
-        priority: str
+        priority: str,
+        allow_duplicate: bool = False
     ) -> SupportCaseCreatedResponse:
         try:
         
@@ -227,26 +412,60 @@ class SupportService:
                     message="Todos los campos son obligatorios",
                     case=None
                 )
+            # Statement type, target tables and fingerprint for indexed filtering
+            analysis = analyze_sql(sql_query)
+            # Same fix (query + database + schema) filed twice: cases with the
+            # same hash are placed on the same shard and checked there
+            duplicate_key = submission_hash(sql_query, database_name, schema_name)
+            router = get_router()
+            shard = router.shard_for_key(duplicate_key)
+            # A multi-MB script is stored compressed outside the row
+            settings = get_settings()
+            stored_query, sql_query_bytes, sql_query_payload = split_payload(
+                sql_query, settings.payload_inline_max_bytes, settings.payload_preview_bytes
+            )
+
             # Generate case data
-            case_id = uuid.uuid4()
+            case_id = router.new_case_id(shard)
             current_time = datetime.utcnow()
             initial_status = "pendiente"  # Default status for new cases
 
-            # Insert into database
-            query = """
-                INSERT INTO support_cases (
-                    id, title, description, database_name, schema_name,
-                    sql_query, executed_by, status, created_at, updated_at, priority
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-            """
+            # Insert into database (the "created" event goes in the same statement);
+            # nothing is inserted if an open case has the same submission hash
             params = (
                 str(case_id), title, description, database_name, schema_name,
-                sql_query, executed_by, initial_status, current_time, current_time, priority
+                stored_query, executed_by, initial_status, current_time, current_time, priority,
+                analysis.statement_type, analysis.target_tables, analysis.fingerprint,
+                duplicate_key, allow_duplicate, sql_query_bytes, sql_query_payload
             )
 
-            # Execute the query
-            result = await execute(query, params, fetch_one=True)
+            # Cases created before hash placement (filled by the backfill) stay
+            # on the shard of their id: look them up on the other shards too
+            if not allow_duplicate and router.count > 1 and settings.duplicate_check_all_shards:
+                legacy = await asyncio.gather(*(
+                    execute(GET_OPEN_CASE_BY_SUBMISSION, (duplicate_key,), fetch_one=True, shard=other)
+                    for other in range(router.count)
+                    if other != shard
+                ))
+                existing = next((row for row in legacy if row), None)
+                if existing:
+                    return SupportService._duplicate_response(existing)
+
+            # With write batching the row is committed together with concurrent inserts
+            if settings.write_batch_enabled:
+                result = await case_batcher.submit(params, shard=shard)
+            else:
+                result = await execute(
+                    INSERT_CASE, insert_cases_params([params]), fetch_one=True, shard=shard,
+                    idempotent=False,
+                )
+
+            if not result and not allow_duplicate:
+                existing = await execute(
+                    GET_OPEN_CASE_BY_SUBMISSION, (duplicate_key,), fetch_one=True, shard=shard
+                )
+                if existing:
+                    return SupportService._duplicate_response(existing)
 
             if not result:
                 return SupportCaseCreatedResponse(
@@ -255,27 +474,127 @@ class SupportService:
                     case=None,
                 )
 
+            case = SupportCase(
+                id=case_id,
+                title=title,
+                description=description,
+                database_name=database_name,
+                schema_name=schema_name,
+                sql_query=stored_query,
+                executed_by=executed_by,
+                status=initial_status,
+                created_at=current_time,
+                updated_at=current_time,
+                priority=priority,
+                statement_type=analysis.statement_type,
+                target_tables=analysis.target_tables,
+                sql_fingerprint=analysis.fingerprint,
+                sql_query_bytes=sql_query_bytes,
+            )
+            facet_cache.record_created(case)
+
             # Return success response
             return SupportCaseCreatedResponse(
                 success=True,
                 message="Caso de soporte creado exitosamente",
-                case=SupportCase(
-                    id=case_id,
-                    title=title,
-                    description=description,
-                    database_name=database_name,
-                    schema_name=schema_name,
-                    sql_query=sql_query,
-                    executed_by=executed_by,
-                    status=initial_status,
-                    created_at=current_time,
-                    updated_at=current_time,
-                    priority=priority
-                )
+                case=case
             )
         except Exception as e:
+            if is_infrastructure_error(e):
+                # No es un error de la solicitud: la ruta responde 5xx y un
+                # reintento con la misma clave de idempotencia vuelve a intentarlo
+                raise
             return SupportCaseCreatedResponse(
                 success=False,
                 message=f"Error al crear el caso de soporte: {str(e)}",
                 case=None,
-            )
\ No newline at end of file
+            )
+
+    @staticmethod
+    def _duplicate_response(existing_row) -> SupportCaseCreatedResponse:
+        """Conflict response pointing at the open case with the same submission"""
+        metrics.increment("duplicate_submissions_total")
+        existing_case = SupportService._row_to_case(existing_row)
+        return SupportCaseCreatedResponse(
+            success=False,
+            message=(
+                f"Ya existe un caso abierto ({existing_case.id}) con la misma "
+                "consulta para esta base de datos y esquema"
+            ),
+            case=None,
+            existing_case=existing_case,
+        )
+
+    @staticmethod
+    async def _bulk_update(query: str, field: str, ids: List[uuid.UUID], params: tuple, target: str) -> BulkUpdateResponse:
+        """Run a set-based bulk UPDATE and report the outcome of every ID"""
+        # Conservar el orden de la solicitud sin IDs repetidos
+        unique_ids = list(dict.fromkeys(str(case_id) for case_id in ids))
+        # Una sentencia por shard implicado (una sola sin sharding)
+        rows = await _execute_by_shard(query, unique_ids, params, idempotent=False)
+        found = {str(row[0]): (row[1], row[2]) for row in rows}
+
+        results = []
+        updated = 0
+        changed_ids = []
+        for case_id in unique_ids:
+            if case_id not in found:
+                results.append(BulkUpdateResult(id=case_id, outcome="not_found"))
+                continue
+            previous, was_updated = found[case_id]
+            if was_updated:
+                updated += 1
+                changed_ids.append(case_id)
+                outcome, current = "updated", target
+                facet_cache.record_changed(field, previous, current)
+            elif previous == target:
+                outcome, current = "unchanged", previous
+            else:
+                outcome, current = "invalid_transition", previous
+            results.append(BulkUpdateResult(
+                id=case_id, outcome=outcome, previous=previous, current=current
+            ))
+        # Los demás workers borran estos casos de su caché local
+        await case_cache.invalidate(changed_ids)
+
+        return BulkUpdateResponse(
+            success=True,
+            message=f"Se actualizaron {updated} de {len(unique_ids)} casos",
+            updated=updated,
+            results=results,
+        )
+
+    @staticmethod
+    @traced("SupportService.bulk_update_status")
+    async def bulk_update_status(
+        ids: List[uuid.UUID], status: str, changed_by: Optional[str] = None
+    ) -> BulkUpdateResponse:
+        try:
+            target = CaseStatus(status)
+            allowed = allowed_source_statuses(target)
+            return await SupportService._bulk_update(
+                BULK_UPDATE_STATUS, "status", ids,
+                (target.value, datetime.utcnow(), allowed, changed_by), target.value
+            )
+        except Exception as e:
+            return BulkUpdateResponse(
+                success=False,
+                message=f"Error al actualizar el estado de los casos: {str(e)}",
+            )
+
+    @staticmethod
+    @traced("SupportService.bulk_update_priority")
+    async def bulk_update_priority(
+        ids: List[uuid.UUID], priority: str, changed_by: Optional[str] = None
+    ) -> BulkUpdateResponse:
+        try:
+            target = PriorityLevel(priority)
+            return await SupportService._bulk_update(
+                BULK_UPDATE_PRIORITY, "priority", ids,
+                (target.value, datetime.utcnow(), target.value, changed_by), target.value
+            )
+        except Exception as e:
+            return BulkUpdateResponse(
+                success=False,
+                message=f"Error al actualizar la prioridad de los casos: {str(e)}",
+            )
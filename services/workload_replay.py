@@ -0,0 +1,254 @@
+import asyncio
+import json
+import re
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+import httpx
+from utils.metrics import _percentile
+
+# Reproducción de una carga capturada con WorkloadCaptureMiddleware contra
+# una instancia (normalmente local). Los tokens de la captura se sustituyen
+# de forma determinista por valores de los casos de esa instancia, las
+# fechas relativas se anclan al momento de la reproducción y los textos se
+# rellenan con su longitud original. Las escrituras se omiten salvo que se
+# pidan explícitamente.
+
+WRITE_METHODS = {"POST", "PATCH", "PUT", "DELETE"}
+# POST que solo leen
+READ_ONLY_ROUTES = {("POST", "/api/support-cases/batch")}
+_RELATIVE_RE = re.compile(r"^-?\d+s$")
+
+# Campo de un caso de la instancia con el que se sustituye cada token
+POOL_FIELDS = {
+    "id": "id",
+    "ids": "id",
+    "case_id": "id",
+    "database_name": "database_name",
+    "schema_name": "schema_name",
+    "executed_by": "executed_by",
+    "actor": "executed_by",
+    "changed_by": "executed_by",
+    "target_table": "target_tables",
+    "sql_fingerprint": "sql_fingerprint",
+}
+
+
+def load_records(paths: Iterable[str]) -> List[dict]:
+    """Captured records from NDJSON files, in capture order"""
+    records = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+    records.sort(key=lambda record: record["ts"])
+    return records
+
+
+def build_pools(cases: List[dict]) -> Dict[str, list]:
+    """Distinct values per case field, used to resolve tokens"""
+    pools = defaultdict(list)
+    for case in cases:
+        for field in set(POOL_FIELDS.values()):
+            value = case.get(field)
+            for item in value if isinstance(value, list) else [value]:
+                if item is not None and item not in pools[field]:
+                    pools[field].append(item)
+    return dict(pools)
+
+
+class Materializer:
+    """Turn a sanitized record back into a concrete request for this instance"""
+
+    def __init__(self, pools: Dict[str, list], now: Optional[float] = None):
+        self.pools = pools
+        self.now = time.time() if now is None else now
+
+    def _from_pool(self, name: str, seed: str):
+        pool = self.pools.get(POOL_FIELDS.get(name, ""), [])
+        if not pool:
+            return None
+        return pool[int.from_bytes(seed.encode(), "big") % len(pool)]
+
+    def value(self, name: str, value):
+        if isinstance(value, str) and value.startswith("~"):
+            return self._from_pool(name, value)
+        if isinstance(value, str) and _RELATIVE_RE.match(value):
+            moment = self.now + int(value[:-1])
+            return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(moment))
+        if isinstance(value, dict) and "bytes" in value:
+            return _filler(name, value["bytes"])
+        return value
+
+    def request(self, record: dict, index: int = 0):
+        """(method, url, query params, json body) or None if a token cannot be resolved"""
+        url = record["route"]
+        for name, value in record.get("path_params", {}).items():
+            resolved = self.value(name, value)
+            if resolved is None:
+                return None
+            url = url.replace("{" + name + "}", str(resolved))
+
+        params = []
+        for name, value in record.get("params", {}).items():
+            for item in value if isinstance(value, list) else [value]:
+                resolved = self.value(name, item)
+                if resolved is not None:
+                    params.append((name, resolved))
+
+        body = None
+        if record.get("body") is not None:
+            body = {}
+            for name, value in record["body"].items():
+                if isinstance(value, dict) and "count" in value:
+                    pool = self.pools.get(POOL_FIELDS.get(name, ""), [])
+                    if not pool:
+                        return None
+                    # Distintos registros toman ids distintos de forma repetible
+                    body[name] = [pool[(index + i) % len(pool)] for i in range(value["count"])]
+                else:
+                    body[name] = self.value(name, value)
+        return record["method"], url, params, body
+
+
+def _filler(name: str, size: int) -> str:
+    # Cada relleno es único para que las creaciones no se tomen por duplicados
+    marker = uuid.uuid4().hex
+    if name == "sql_query":
+        text = f"SELECT 1 /* replay {marker} "
+        return text + "x" * max(0, size - len(text) - 3) + " */"
+    return (f"replay {marker} " + "x" * size)[:max(size, 1)]
+
+
+def _summary(values: List[float]) -> dict:
+    ordered = sorted(values)
+    return {
+        "p50": round(_percentile(ordered, 0.5), 3),
+        "p95": round(_percentile(ordered, 0.95), 3),
+        "p99": round(_percentile(ordered, 0.99), 3),
+        "max": round(ordered[-1], 3) if ordered else 0.0,
+    }
+
+
+def _change(before: float, after: float):
+    return round((after - before) / before * 100, 1) if before else None
+
+
+class WorkloadReplayer:
+    """Drive an instance with captured traffic and compare against the capture.
+
+    ``speed`` scales the original inter-arrival times (1 = real time, 10 =
+    ten times faster); ``None`` sends requests as fast as possible with up
+    to ``concurrency`` in flight.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        speed: Optional[float] = 1.0,
+        concurrency: int = 32,
+        include_writes: bool = False,
+        client: Optional[httpx.AsyncClient] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.speed = speed
+        self.concurrency = concurrency
+        self.include_writes = include_writes
+        self._client = client
+
+    async def _load_pools(self, client: httpx.AsyncClient) -> Dict[str, list]:
+        response = await client.get(f"{self.base_url}/api/support-cases/", params={"size": 100})
+        response.raise_for_status()
+        return build_pools(response.json().get("items", []))
+
+    def _selected(self, records: List[dict]) -> List[dict]:
+        return [
+            record for record in records
+            if self.include_writes
+            or record["method"] not in WRITE_METHODS
+            or (record["method"], record["route"].rstrip("/")) in READ_ONLY_ROUTES
+        ]
+
+    async def run(self, records: List[dict]) -> dict:
+        client = self._client or httpx.AsyncClient(timeout=30)
+        try:
+            pools = await self._load_pools(client)
+            selected = self._selected(records)
+            report = await self._replay(client, selected, pools)
+            report["excluded_writes"] = len(records) - len(selected)
+            return report
+        finally:
+            if self._client is None:
+                await client.aclose()
+
+    async def _replay(self, client, records: List[dict], pools) -> dict:
+        materializer = Materializer(pools)
+        results = []
+        skipped = 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+        origin = records[0]["ts"] if records else 0.0
+        started = time.perf_counter()
+
+        async def send(index: int, record: dict):
+            request = materializer.request(record, index)
+            if request is None:
+                return None
+            method, url, params, body = request
+            if self.speed is not None:
+                delay = (record["ts"] - origin) / self.speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.request(
+                        method, self.base_url + url, params=params, json=body
+                    )
+                    # Bytes recibidos: comprimidos, como los que midió la captura
+                    status, size = response.status_code, response.num_bytes_downloaded
+                except httpx.HTTPError:
+                    status, size = None, 0
+                return record, status, (time.perf_counter() - start) * 1000, size
+
+        for outcome in await asyncio.gather(*(send(i, r) for i, r in enumerate(records))):
+            if outcome is None:
+                skipped += 1
+            else:
+                results.append(outcome)
+        elapsed = time.perf_counter() - started
+        return self._report(records, results, skipped, elapsed)
+
+    def _report(self, records, results, skipped: int, elapsed: float) -> dict:
+        captured_span = records[-1]["ts"] - records[0]["ts"] if len(records) > 1 else 0.0
+        by_route = defaultdict(list)
+        for record, status, latency_ms, size in results:
+            by_route[f"{record['method']} {record['route']}"].append((record, status, latency_ms, size))
+
+        routes = {}
+        for route, entries in sorted(by_route.items()):
+            captured = _summary([record["duration_ms"] for record, _, _, _ in entries])
+            replayed = _summary([latency for _, _, latency, _ in entries])
+            routes[route] = {
+                "requests": len(entries),
+                "errors": sum(1 for _, status, _, _ in entries if status is None or status >= 500),
+                "status_mismatches": sum(1 for record, status, _, _ in entries if status != record["status"]),
+                "captured_ms": captured,
+                "replayed_ms": replayed,
+                "p50_change_pct": _change(captured["p50"], replayed["p50"]),
+                "p95_change_pct": _change(captured["p95"], replayed["p95"]),
+                "captured_avg_bytes": round(sum(r["response_bytes"] for r, _, _, _ in entries) / len(entries)),
+                "replayed_avg_bytes": round(sum(size for _, _, _, size in entries) / len(entries)),
+            }
+
+        return {
+            "requests": len(results),
+            "skipped": skipped,
+            "speed": self.speed if self.speed is not None else "max",
+            "elapsed_s": round(elapsed, 3),
+            "captured_rps": round(len(records) / captured_span, 2) if captured_span else None,
+            "replayed_rps": round(len(results) / elapsed, 2) if elapsed else None,
+            "routes": routes,
+        }
@@ -0,0 +1,188 @@
+import asyncio
+import contextvars
+import time
+from typing import Optional
+from config import get_settings
+from database.connection import execute
+from database.resilience import is_connection_error
+from database.support_queries import INSERT_CASE, build_insert_cases_query, insert_cases_params
+from utils.metrics import metrics
+from utils.statement_timeout import set_statement_timeout
+
+# Agrupación de inserciones (group commit): las llamadas concurrentes a
+# create_support_case se acumulan durante unos milisegundos (o hasta N filas)
+# y se escriben con un único INSERT de varias filas en una sola transacción,
+# de modo que el commit (y su fsync) se paga una vez por lote.
+
+
+class _Batch:
+    def __init__(self):
+        self.items = []
+        self.timer = None
+
+
+class CaseWriteBatcher:
+    """Collect concurrent case inserts per shard and flush them together.
+
+    No insert waits more than ``max_wait_ms`` before its batch is sent: the
+    batch is flushed when the timer fires or as soon as it reaches
+    ``max_rows``, and new inserts start a fresh batch while the previous one
+    is still being written.
+    """
+
+    def __init__(
+        self,
+        max_rows: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+        timeout_ms: Optional[float] = None,
+    ):
+        self._max_rows = max_rows
+        self._max_wait_ms = max_wait_ms
+        self._timeout_ms = timeout_ms
+        self._pending = {}
+        self._flushing = set()
+
+    @property
+    def max_rows(self) -> int:
+        return self._max_rows or get_settings().write_batch_max_rows
+
+    @property
+    def max_wait_ms(self) -> float:
+        if self._max_wait_ms is not None:
+            return self._max_wait_ms
+        return get_settings().write_batch_max_wait_ms
+
+    @property
+    def timeout_ms(self) -> float:
+        if self._timeout_ms is not None:
+            return self._timeout_ms
+        return get_settings().write_batch_timeout_ms
+
+    async def submit(self, params: tuple, shard: int = 0):
+        """Queue one INSERT_CASE row; returns the inserted ``(id,)`` row or None.
+
+        Raises ``asyncio.TimeoutError`` if the row is still queued after
+        ``timeout_ms``; the row is then dropped and never written. Once its
+        batch is sent the call waits for the outcome, which the write
+        statement_timeout bounds.
+        """
+        loop = asyncio.get_running_loop()
+        batch = self._pending.get(shard)
+        if batch is None:
+            batch = self._pending[shard] = _Batch()
+            batch.timer = loop.call_later(self.max_wait_ms / 1000, self._flush, shard, batch)
+
+        future = loop.create_future()
+        item = (params, future, time.perf_counter())
+        batch.items.append(item)
+        if len(batch.items) >= self.max_rows:
+            self._flush(shard, batch)
+        await asyncio.wait({future}, timeout=self.timeout_ms / 1000)
+        if not future.done() and self._pending.get(shard) is batch:
+            # Sigue en cola (bucle de eventos bloqueado): se retira del lote.
+            # Un lote ya enviado no se abandona: la fila podría confirmarse
+            # después de responder con error.
+            batch.items.remove(item)
+            future.cancel()
+            metrics.increment("write_batch_timeouts_total")
+            raise asyncio.TimeoutError()
+        return await future
+
+    def _flush(self, shard: int, batch: _Batch):
+        if self._pending.get(shard) is batch:
+            del self._pending[shard]
+        batch.timer.cancel()
+        if not batch.items:
+            return
+        # El lote mezcla filas de varias peticiones: no hereda las
+        # ContextVars (span, statement_timeout) de la primera
+        task = contextvars.Context().run(asyncio.ensure_future, self._write(shard, batch.items))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _write(self, shard: int, items: list):
+        set_statement_timeout(get_settings().statement_timeout_write_ms)
+        start = time.perf_counter()
+        metrics.observe("write_batch_size", len(items))
+        for _, _, queued_at in items:
+            metrics.observe("write_batch_wait_ms", (start - queued_at) * 1000)
+
+        try:
+            # Dos envíos idénticos en el mismo lote no se verían entre sí: el
+            # segundo se escribe después, cuando el primero ya está confirmado
+            primary, deferred, seen = [], [], set()
+            for item in items:
+                submission_hash, allow_duplicate = item[0][14], item[0][15]
+                if not allow_duplicate and submission_hash in seen:
+                    deferred.append(item)
+                else:
+                    seen.add(submission_hash)
+                    primary.append(item)
+
+            await self._write_batch(shard, primary)
+            for row_params, future, _ in deferred:
+                await self._write_one(shard, row_params, future)
+        except BaseException as e:
+            # Ninguna llamada puede quedar esperando un lote que ya no se escribe
+            metrics.increment("write_batch_errors_total")
+            for _, future, _ in items:
+                if not future.done():
+                    future.set_exception(e if isinstance(e, Exception) else RuntimeError(str(e)))
+            if not isinstance(e, Exception):
+                raise
+        metrics.increment("write_batch_flushes_total")
+        metrics.observe("write_batch_flush_ms", (time.perf_counter() - start) * 1000)
+
+    async def _write_batch(self, shard: int, items: list):
+        try:
+            rows = await execute(
+                build_insert_cases_query(len(items)),
+                insert_cases_params([row_params for row_params, _, _ in items]),
+                fetch_all=True,
+                shard=shard,
+                idempotent=False,
+            )
+            inserted = {str(row[0]) for row in rows or []}
+            for row_params, future, _ in items:
+                if not future.done():
+                    future.set_result((row_params[0],) if row_params[0] in inserted else None)
+        except Exception as e:
+            if len(items) == 1 or is_connection_error(e):
+                # Sin conexión el lote pudo llegar a escribirse: repetir las
+                # filas por separado podría duplicarlas
+                for _, future, _ in items:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                # Una fila inválida no debe tumbar el lote entero: se
+                # reintenta cada fila por separado para que cada llamada
+                # reciba su propio resultado o error
+                metrics.increment("write_batch_fallback_total")
+                await asyncio.gather(*(
+                    self._write_one(shard, row_params, future)
+                    for row_params, future, _ in items
+                ))
+
+    @staticmethod
+    async def _write_one(shard: int, params: tuple, future: asyncio.Future):
+        try:
+            result = await execute(
+                INSERT_CASE, insert_cases_params([params]), fetch_one=True, shard=shard,
+                idempotent=False,
+            )
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+
+    async def drain(self):
+        """Flush pending batches and wait for in-flight writes (shutdown)"""
+        for shard, batch in list(self._pending.items()):
+            self._flush(shard, batch)
+        if self._flushing:
+            await asyncio.gather(*list(self._flushing), return_exceptions=True)
+
+
+case_batcher = CaseWriteBatcher()
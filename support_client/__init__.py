@@ -0,0 +1,3 @@
+from support_client.client import RetryPolicy, SupportClient, SupportClientError
+
+__all__ = ["RetryPolicy", "SupportClient", "SupportClientError"]
@@ -0,0 +1,371 @@
+import asyncio
+import random
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, List, NamedTuple, Optional, Union
+import httpx
+from models.support_responses import (
+    BatchCaseResponse,
+    BulkUpdateResponse,
+    CaseEventsResponse,
+    FacetsResponse,
+    PaginatedResponse,
+    SupportCase,
+    SupportCaseCreatedResponse,
+    SupportCaseCreateRequest,
+)
+
+# Cliente asíncrono de la API de casos de soporte para herramientas
+# internas. Reutiliza las conexiones (keep-alive) de un pool de httpx, pide
+# varias páginas a la vez con un límite de concurrencia, agrupa las
+# consultas por id sueltas en POST /batch y reintenta con espera
+# exponencial (y Retry-After) los fallos de conexión y los 429/502/503/504.
+# Las creaciones llevan siempre Idempotency-Key, así que un reintento nunca
+# crea un caso repetido.
+
+API_PREFIX = "/api/support-cases"
+# Límites de la API: tamaño de página, IDs por lote y por actualización masiva
+MAX_PAGE_SIZE = 100
+MAX_BATCH_IDS = 200
+MAX_BULK_IDS = 1000
+RETRY_STATUSES = {429, 502, 503, 504}
+# Página del listado con su ETag: las consultas repetidas reciben 304
+ETAG_CACHE_SIZE = 128
+
+CaseId = Union[str, uuid.UUID]
+
+
+class SupportClientError(Exception):
+    """Error response from the API (after retries)"""
+
+    def __init__(self, status_code: int, message: str, error_code: Optional[str] = None, body=None):
+        super().__init__(f"{status_code} {error_code or ''}: {message}".strip())
+        self.status_code = status_code
+        self.message = message
+        self.error_code = error_code
+        self.body = body
+
+
+class RetryPolicy(NamedTuple):
+    # Intentos en total, espera base y espera máxima (segundos) entre ellos
+    attempts: int = 4
+    backoff: float = 0.1
+    backoff_max: float = 5.0
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter exponential backoff, never shorter than Retry-After"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+def _should_retry(response: httpx.Response) -> bool:
+    if response.status_code in RETRY_STATUSES:
+        return True
+    # Otra petición con la misma Idempotency-Key sigue en curso
+    return response.status_code == 409 and "Retry-After" in response.headers
+
+
+def _query(filters: dict) -> list:
+    params = []
+    for name, value in filters.items():
+        if value is None:
+            continue
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        for item in values:
+            params.append((name, item.isoformat() if isinstance(item, datetime) else str(item)))
+    return params
+
+
+def _chunks(items: list, size: int) -> Iterable[list]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class _LookupBatcher:
+    """Coalesce single-id lookups made at about the same time into POST /batch"""
+
+    def __init__(self, client: "SupportClient", window: float):
+        self._client = client
+        self._window = window
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    async def get(self, case_id: str) -> Optional[SupportCase]:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(case_id, []).append(future)
+        if len(self._pending) >= MAX_BATCH_IDS:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self._window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, {}
+        if pending:
+            task = asyncio.ensure_future(self._resolve(pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _resolve(self, pending: Dict[str, List[asyncio.Future]]):
+        try:
+            found = await self._client.get_cases(list(pending))
+        except Exception as e:
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for case_id, futures in pending.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(found.get(case_id))
+
+
+class SupportClient:
+    """Async client of the support-cases API.
+
+    Use it as ``async with SupportClient("http://host:8000") as client:`` so
+    the pooled connections are closed at the end. ``max_connections`` also
+    bounds how many requests are in flight at once.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        *,
+        max_connections: int = 10,
+        timeout: float = 30.0,
+        retry: RetryPolicy = RetryPolicy(),
+        batch_window: float = 0.005,
+        headers: Optional[dict] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.retry = retry
+        self._http = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            timeout=timeout,
+            headers=headers,
+            transport=transport,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=30,
+            ),
+        )
+        self._lookups = _LookupBatcher(self, batch_window)
+        self._etags: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+    async def __aenter__(self) -> "SupportClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        await self._http.aclose()
+
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Send a request, retrying connection errors and retryable statuses"""
+        for attempt in range(self.retry.attempts):
+            last = attempt == self.retry.attempts - 1
+            try:
+                response = await self._http.request(method, API_PREFIX + path, **kwargs)
+            except httpx.TransportError:
+                if last:
+                    raise
+                await asyncio.sleep(self.retry.delay(attempt))
+                continue
+            if last or not _should_retry(response):
+                return response
+            await asyncio.sleep(self.retry.delay(attempt, _retry_after(response)))
+
+    @staticmethod
+    def _raise_for_error(response: httpx.Response):
+        if response.status_code < 400:
+            return
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        if isinstance(body, dict):
+            raise SupportClientError(
+                response.status_code, body.get("message") or response.reason_phrase,
+                body.get("error_code"), body,
+            )
+        raise SupportClientError(response.status_code, response.text or response.reason_phrase)
+
+    async def list_cases(self, page: int = 1, size: int = 10, **filters) -> PaginatedResponse:
+        """One page of the listing; filters take a value or a list of values.
+
+        Pages already fetched are revalidated with their ETag, so an
+        unchanged page costs a 304 without a body.
+        """
+        params = _query({**filters, "page": page, "size": size})
+        key = tuple(params)
+        cached = self._etags.get(key)
+        headers = {"If-None-Match": cached[0]} if cached else None
+        response = await self._request("GET", "/", params=params, headers=headers)
+        if response.status_code == 304 and cached:
+            self._etags.move_to_end(key)
+            return cached[1]
+        self._raise_for_error(response)
+        result = PaginatedResponse.model_validate(response.json())
+        etag = response.headers.get("ETag")
+        if etag:
+            self._etags[key] = (etag, result)
+            self._etags.move_to_end(key)
+            while len(self._etags) > ETAG_CACHE_SIZE:
+                self._etags.popitem(last=False)
+        return result
+
+    async def iter_cases(
+        self, size: int = MAX_PAGE_SIZE, concurrency: int = 4, **filters
+    ) -> AsyncIterator[SupportCase]:
+        """Every case matching ``filters``, newest first.
+
+        After the first page, up to ``concurrency`` pages are fetched at once
+        and yielded in order. Pages are by offset: cases created while
+        iterating shift the pages, so a case may be skipped; none is yielded
+        twice.
+        """
+        first = await self.list_cases(page=1, size=size, **filters)
+        seen = set()
+        in_flight = deque()
+        try:
+            pages = iter(range(2, first.total_pages + 1))
+            result = first
+            while True:
+                for case in result.items:
+                    if case.id not in seen:
+                        seen.add(case.id)
+                        yield case
+                # Mantener la ventana de páginas en curso llena
+                for page in pages:
+                    in_flight.append(asyncio.ensure_future(
+                        self.list_cases(page=page, size=size, **filters)
+                    ))
+                    if len(in_flight) >= concurrency:
+                        break
+                if not in_flight:
+                    return
+                result = await in_flight.popleft()
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    async def get_case(self, case_id: CaseId) -> Optional[SupportCase]:
+        """One case by id, or None. Concurrent calls are sent as one batch lookup"""
+        return await self._lookups.get(str(uuid.UUID(str(case_id))))
+
+    async def get_cases(self, ids: Iterable[CaseId]) -> Dict[str, SupportCase]:
+        """Cases found among ``ids``, by id; batches of 200 are fetched concurrently"""
+        unique_ids = list(dict.fromkeys(str(uuid.UUID(str(case_id))) for case_id in ids))
+
+        async def fetch(chunk: list) -> BatchCaseResponse:
+            response = await self._request("POST", "/batch", json={"ids": chunk})
+            self._raise_for_error(response)
+            return BatchCaseResponse.model_validate(response.json())
+
+        batches = await asyncio.gather(*(fetch(chunk) for chunk in _chunks(unique_ids, MAX_BATCH_IDS)))
+        return {
+            str(result.id): result.case
+            for batch in batches
+            for result in batch.results
+            if result.found
+        }
+
+    async def create_case(
+        self, case: Union[SupportCaseCreateRequest, dict], idempotency_key: Optional[str] = None
+    ) -> SupportCaseCreatedResponse:
+        """Create a case; a duplicate open case comes back in ``existing_case``"""
+        if isinstance(case, dict):
+            case = SupportCaseCreateRequest(**case)
+        response = await self._request(
+            "POST", "/",
+            json=case.model_dump(mode="json", exclude_unset=True),
+            headers={"Idempotency-Key": idempotency_key or str(uuid.uuid4())},
+        )
+        if response.status_code == 409:
+            body = response.json()
+            if body.get("error_code") == "DUPLICATE_CASE":
+                return SupportCaseCreatedResponse(
+                    success=False,
+                    message=body["message"],
+                    existing_case=body.get("existing_case"),
+                )
+        self._raise_for_error(response)
+        return SupportCaseCreatedResponse.model_validate(response.json())
+
+    async def create_cases(
+        self, cases: Iterable[Union[SupportCaseCreateRequest, dict]], concurrency: int = 8
+    ) -> List[SupportCaseCreatedResponse]:
+        """Create many cases, ``concurrency`` at a time, in input order.
+
+        The API has no bulk create: the requests go out concurrently over the
+        pooled connections, and with WRITE_BATCH_ENABLED the server commits
+        concurrent inserts together.
+        """
+        slots = asyncio.Semaphore(concurrency)
+
+        async def create(case):
+            async with slots:
+                return await self.create_case(case)
+
+        return await asyncio.gather(*(create(case) for case in cases))
+
+    async def _bulk_update(self, path: str, ids: Iterable[CaseId], body: dict) -> BulkUpdateResponse:
+        unique_ids = list(dict.fromkeys(str(case_id) for case_id in ids))
+        results = []
+        updated = 0
+        for chunk in _chunks(unique_ids, MAX_BULK_IDS):
+            response = await self._request("PATCH", path, json={**body, "ids": chunk})
+            self._raise_for_error(response)
+            part = BulkUpdateResponse.model_validate(response.json())
+            updated += part.updated
+            results.extend(part.results)
+        return BulkUpdateResponse(
+            success=True,
+            message=f"Se actualizaron {updated} de {len(unique_ids)} casos",
+            updated=updated,
+            results=results,
+        )
+
+    async def update_status(
+        self, ids: Iterable[CaseId], status: str, changed_by: Optional[str] = None
+    ) -> BulkUpdateResponse:
+        """Move cases to ``status`` (in requests of up to 1000 ids)"""
+        return await self._bulk_update("/status", ids, {"status": status, "changed_by": changed_by})
+
+    async def update_priority(
+        self, ids: Iterable[CaseId], priority: str, changed_by: Optional[str] = None
+    ) -> BulkUpdateResponse:
+        """Set the priority of cases (in requests of up to 1000 ids)"""
+        return await self._bulk_update("/priority", ids, {"priority": priority, "changed_by": changed_by})
+
+    async def get_facets(self, **filters) -> FacetsResponse:
+        response = await self._request("GET", "/facets", params=_query(filters))
+        self._raise_for_error(response)
+        return FacetsResponse.model_validate(response.json())
+
+    async def get_case_events(
+        self, case_id: CaseId, limit: int = 100, after_id: Optional[int] = None
+    ) -> CaseEventsResponse:
+        response = await self._request(
+            "GET", f"/case/{case_id}/events", params=_query({"limit": limit, "after_id": after_id})
+        )
+        self._raise_for_error(response)
+        return CaseEventsResponse.model_validate(response.json())
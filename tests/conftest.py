@@ -0,0 +1,12 @@
+import os
+
+# Valores ficticios para que Settings() pueda construirse en las pruebas; las
+# consultas se simulan, así que nunca se abre una conexión real.
+for key, value in {
+    "DB_HOST": "localhost",
+    "DB_PORT": "5432",
+    "DB_NAME": "finkargo_support_test",
+    "DB_USER": "postgres",
+    "DB_PASSWORD": "postgres",
+}.items():
+    os.environ.setdefault(key, value)
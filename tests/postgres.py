@@ -0,0 +1,181 @@
+import glob
+import hashlib
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import uuid
+from typing import Optional
+
+# PostgreSQL efímero para las pruebas de regresión de rendimiento. Usa, por
+# orden:
+# - TEST_DATABASE_URL: un servidor existente (p. ej. un servicio de CI); se
+#   crea una base de datos propia y se borra al terminar.
+# - initdb/pg_ctl (PATH, PG_BIN o pg_config --bindir): un clúster temporal
+#   con socket Unix, sin fsync, que se elimina al terminar.
+# Si no hay ninguno, las pruebas que lo usan se omiten.
+
+DATABASE_NAME = "finkargo_support_regress"
+
+
+class PostgresUnavailable(Exception):
+    """No PostgreSQL server or binaries to start one"""
+
+
+def _bin_dir() -> Optional[str]:
+    if os.environ.get("PG_BIN"):
+        return os.environ["PG_BIN"]
+    initdb = shutil.which("initdb")
+    if initdb:
+        return os.path.dirname(initdb)
+    pg_config = shutil.which("pg_config")
+    if pg_config:
+        output = subprocess.run([pg_config, "--bindir"], capture_output=True, text=True)
+        if output.returncode == 0 and os.path.exists(os.path.join(output.stdout.strip(), "initdb")):
+            return output.stdout.strip()
+    # Paquetes de Debian/Ubuntu: los binarios no están en el PATH
+    candidates = sorted(glob.glob("/usr/lib/postgresql/*/bin/initdb"))
+    return os.path.dirname(candidates[-1]) if candidates else None
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _connect(dsn: str):
+    import psycopg2
+    from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+    connection = psycopg2.connect(dsn)
+    connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    return connection
+
+
+class EphemeralPostgres:
+    """A throwaway database; ``dsn`` points at it once started"""
+
+    def __init__(self):
+        self.dsn = None
+        self._server_dsn = None
+        self._data_dir = None
+        self._bin = None
+
+    def start(self) -> "EphemeralPostgres":
+        server_dsn = os.environ.get("TEST_DATABASE_URL")
+        if not server_dsn:
+            server_dsn = self._start_cluster()
+        self._server_dsn = server_dsn
+        try:
+            admin = _connect(server_dsn)
+        except Exception as e:
+            self.stop()
+            raise PostgresUnavailable(f"No se pudo conectar a PostgreSQL: {e}")
+        try:
+            with admin.cursor() as cursor:
+                cursor.execute(f"DROP DATABASE IF EXISTS {DATABASE_NAME}")
+                cursor.execute(f"CREATE DATABASE {DATABASE_NAME}")
+        finally:
+            admin.close()
+
+        import psycopg2.extensions
+        params = psycopg2.extensions.parse_dsn(server_dsn)
+        params["dbname"] = DATABASE_NAME
+        self.dsn = psycopg2.extensions.make_dsn(**params)
+        return self
+
+    def _start_cluster(self) -> str:
+        self._bin = _bin_dir()
+        if self._bin is None:
+            raise PostgresUnavailable("No se encontró initdb ni TEST_DATABASE_URL")
+        self._data_dir = tempfile.mkdtemp(prefix="finkargo-pg-")
+        data = os.path.join(self._data_dir, "data")
+        port = _free_port()
+        try:
+            subprocess.run(
+                [os.path.join(self._bin, "initdb"), "-D", data, "-U", "postgres",
+                 "-A", "trust", "--no-sync", "-E", "UTF8"],
+                check=True, capture_output=True, text=True,
+            )
+            subprocess.run(
+                [os.path.join(self._bin, "pg_ctl"), "-D", data, "-w",
+                 "-l", os.path.join(self._data_dir, "postgres.log"),
+                 "-o", f"-p {port} -k {self._data_dir} -c listen_addresses='' "
+                       "-c fsync=off -c synchronous_commit=off -c full_page_writes=off",
+                 "start"],
+                check=True, capture_output=True, text=True,
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            detail = getattr(e, "stderr", None) or str(e)
+            self.stop()
+            raise PostgresUnavailable(f"No se pudo iniciar PostgreSQL: {detail.strip()}")
+        return f"host={self._data_dir} port={port} user=postgres dbname=postgres"
+
+    def stop(self):
+        if self._data_dir is None:
+            if self._server_dsn and self.dsn:
+                try:
+                    admin = _connect(self._server_dsn)
+                    with admin.cursor() as cursor:
+                        cursor.execute(f"DROP DATABASE IF EXISTS {DATABASE_NAME} WITH (FORCE)")
+                    admin.close()
+                except Exception:
+                    pass
+            return
+        data = os.path.join(self._data_dir, "data")
+        if os.path.exists(os.path.join(data, "postmaster.pid")):
+            subprocess.run(
+                [os.path.join(self._bin, "pg_ctl"), "-D", data, "-m", "immediate", "stop"],
+                capture_output=True,
+            )
+        shutil.rmtree(self._data_dir, ignore_errors=True)
+        self._data_dir = None
+
+
+# Conjunto de datos fijo: 20 000 casos con valores repartidos de forma
+# determinista (sin random) para que el plan de cada consulta sea estable
+SEED_CASES = """
+INSERT INTO support_cases (
+    id, title, description, database_name, schema_name, sql_query, executed_by,
+    status, priority, created_at, updated_at, execution_result,
+    statement_type, target_tables, sql_fingerprint, submission_hash
+)
+SELECT
+    md5('case-' || i)::uuid,
+    'Caso de soporte ' || i,
+    'Descripción del caso ' || i,
+    (ARRAY['finkargo_transacciones', 'finkargo_clientes', 'finkargo_facturacion'])[1 + mod(i, 3)],
+    (ARRAY['operaciones', 'clientes', 'facturas', 'envios'])[1 + mod(i, 4)],
+    'UPDATE clientes SET estado = ''x'' WHERE id = ' || i,
+    (ARRAY['juan.perez@finkargo.com', 'maria.gonzalez@finkargo.com',
+           'carlos.rodriguez@finkargo.com', 'ana.martinez@finkargo.com'])[1 + mod(i, 4)],
+    (ARRAY['pendiente', 'completado', 'en_proceso', 'rechazado', 'en_pausa'])[1 + mod(i, 5)],
+    (ARRAY['baja', 'media', 'alta'])[1 + mod(i, 3)],
+    timestamp '2025-01-01' + i * interval '7 minutes',
+    timestamp '2025-01-01' + i * interval '7 minutes' + interval '30 minutes',
+    NULL,
+    (ARRAY['UPDATE', 'INSERT', 'DELETE'])[1 + mod(i, 3)],
+    ARRAY[(ARRAY['clientes', 'envios', 'facturas'])[1 + mod(i, 3)]],
+    substr(md5('fingerprint-' || mod(i, 50)), 1, 16),
+    md5('submission-' || i)
+FROM generate_series(1, %s) AS i
+"""
+
+SEED_EVENTS = """
+INSERT INTO support_case_events (case_id, event_type, to_value, actor, occurred_at)
+SELECT id, 'created', status, executed_by, created_at FROM support_cases
+"""
+
+SEED_CASE_COUNT = 20000
+
+
+def seed_case_id(i: int) -> str:
+    """Id of the ``i``-th seeded case (same md5 as SEED_CASES)"""
+    return str(uuid.UUID(hashlib.md5(f"case-{i}".encode()).hexdigest()))
+
+
+def seed_fingerprint(i: int) -> str:
+    """sql_fingerprint of the seeded cases with ``i % 50 == i``"""
+    return hashlib.md5(f"fingerprint-{i}".encode()).hexdigest()[:16]
@@ -0,0 +1,111 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from utils import admission
+from utils.admission import AdmissionController, Overloaded, route_class_for
+from utils.metrics import metrics
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def fresh_controllers():
+    admission.reset_controllers()
+    yield
+    admission.reset_controllers()
+
+
+@pytest.mark.asyncio
+async def test_waiters_are_admitted_in_order():
+    """Prueba que al liberar un hueco entra el primero de la cola"""
+    controller = AdmissionController("read", limit=1, queue_size=5, queue_timeout_ms=1000)
+    await controller.acquire()
+    order = []
+
+    async def request(name):
+        await controller.acquire()
+        order.append(name)
+
+    waiting = [asyncio.create_task(request(name)) for name in ("a", "b")]
+    await asyncio.sleep(0.01)
+    assert controller.queued == 2 and order == []
+
+    controller.release()
+    await asyncio.sleep(0.01)
+    controller.release()
+    await asyncio.gather(*waiting)
+
+    assert order == ["a", "b"]
+    assert controller.active == 1
+
+
+@pytest.mark.asyncio
+async def test_full_queue_fails_fast():
+    """Prueba que con la cola llena se rechaza sin esperar"""
+    metrics.reset()
+    controller = AdmissionController("write", limit=1, queue_size=1, queue_timeout_ms=10_000)
+    await controller.acquire()
+    queued = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0)
+
+    with pytest.raises(Overloaded):
+        await asyncio.wait_for(controller.acquire(), timeout=0.1)
+
+    assert metrics.snapshot()["counters"]["admission_write_rejected_total"] == 1
+    controller.release()
+    await queued
+
+
+@pytest.mark.asyncio
+async def test_wait_deadline_rejects_and_frees_queue():
+    """Prueba que al vencer el plazo la petición sale de la cola"""
+    controller = AdmissionController("read", limit=1, queue_size=5, queue_timeout_ms=20)
+    await controller.acquire()
+
+    with pytest.raises(Overloaded):
+        await controller.acquire()
+
+    assert controller.queued == 0
+    controller.release()
+    assert controller.active == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak_slot():
+    """Prueba que una petición cancelada en la cola no se queda con un hueco"""
+    controller = AdmissionController("read", limit=1, queue_size=5, queue_timeout_ms=1000)
+    await controller.acquire()
+    waiter = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+
+    controller.release()
+    assert controller.active == 0 and controller.queued == 0
+
+
+def test_route_classes():
+    """Prueba la clasificación de rutas en lecturas y escrituras"""
+    assert route_class_for({"path": "/api/support-cases/", "method": "GET"}) == "read"
+    assert route_class_for({"path": "/api/support-cases/batch", "method": "POST"}) == "read"
+    assert route_class_for({"path": "/api/support-cases/", "method": "POST"}) == "write"
+    assert route_class_for({"path": "/api/support-cases/status", "method": "PATCH"}) == "write"
+    assert route_class_for({"path": "/api/metrics/", "method": "GET"}) is None
+
+
+def test_overloaded_route_returns_503_with_retry_after():
+    """Prueba que una petición no admitida recibe 503 y Retry-After"""
+    admission._controllers["read"] = AdmissionController("read", limit=0, queue_size=0, queue_timeout_ms=10)
+
+    response = client.get("/api/support-cases/")
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert response.json()["error_code"] == "SERVICE_OVERLOADED"
+    assert "detail" not in response.json()
+    # Las métricas siguen disponibles con el servicio saturado
+    gauges = client.get("/api/metrics/").json()["gauges"]
+    assert gauges["admission_read_active"] == 0
+    assert "admission_write_queued" in gauges
@@ -0,0 +1,240 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+from uuid import uuid4
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from models.support_responses import SupportCase
+from services.case_cache import case_cache, listing_cache
+from services.support_service import SupportService
+from utils.cache import (
+    MemoryCacheBackend,
+    TwoLevelCache,
+    _backend_state,
+    decode_value,
+    encode_value,
+    get_cache_backend,
+    set_cache_backend,
+)
+from utils.redis_protocol import RedisConnection, RedisError, encode_command
+
+client = TestClient(app)
+
+
+def make_row(case_id: str, status: str = "pendiente"):
+    """Fila con el orden de CASE_COLUMNS"""
+    created = datetime(2025, 4, 1)
+    return (
+        case_id, "Corregir dirección cliente", "Dirección incorrecta en registro",
+        "finkargo_clientes", "clientes", "UPDATE clientes SET direccion = 'x' WHERE id = 1",
+        "maria.gonzalez@finkargo.com", status, "media", created, created, None,
+        "UPDATE", ["clientes"], "0f1e2d3c4b5a6978", None, None,
+    )
+
+
+@pytest.fixture
+def shared_backend():
+    """L2 en memoria compartida por la caché del servicio y un "segundo worker\""""
+    backend = MemoryCacheBackend()
+    set_cache_backend(backend)
+    case_cache.clear()
+    listing_cache.clear()
+    yield backend
+    case_cache.clear()
+    listing_cache.clear()
+    _backend_state.update(loaded=False, backend=None)
+
+
+async def settle():
+    """Dejar que los listeners procesen los mensajes publicados"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_serialization_is_compact_and_lossless():
+    """Prueba que la entrada omite los valores por defecto y se comprime si es grande"""
+    case = SupportService._row_to_case(make_row(str(uuid4())))
+    small = encode_value(case, compress_min_bytes=10_000)
+    large = encode_value(case, compress_min_bytes=16)
+
+    assert small.startswith(b"j") and b"execution_result" not in small
+    assert large.startswith(b"z") and len(large) < len(small)
+    assert decode_value(small, SupportCase) == case
+    assert decode_value(large, SupportCase) == case
+
+
+@pytest.mark.asyncio
+async def test_lookup_is_cached_across_workers(shared_backend):
+    """Prueba que un caso leído por un worker lo sirve la L2 al otro sin consultar la BD"""
+    case_id = str(uuid4())
+    other_worker = TwoLevelCache("case")
+    with patch("services.support_service.execute", new_callable=AsyncMock) as mock_execute:
+        mock_execute.return_value = make_row(case_id)
+        first = await SupportService.get_case_by_id(case_id)
+        second = await SupportService.get_case_by_id(case_id.upper())
+        from_other = await other_worker.get_or_load(case_id, SupportCase, AsyncMock())
+
+    assert first.success and second.case == first.case
+    assert from_other == first.case
+    assert mock_execute.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_missing_case_is_not_cached(shared_backend):
+    """Prueba que un caso inexistente no queda en caché (puede crearse después)"""
+    with patch("services.support_service.execute", new=AsyncMock(return_value=None)) as mock_execute:
+        case_id = str(uuid4())
+        await SupportService.get_case_by_id(case_id)
+        response = await SupportService.get_case_by_id(case_id)
+
+    assert not response.success
+    assert mock_execute.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_load_once(shared_backend):
+    """Prueba la protección contra estampidas: muchas lecturas simultáneas, una consulta"""
+    case_id = str(uuid4())
+
+    async def slow_row(*args, **kwargs):
+        await asyncio.sleep(0.01)
+        return make_row(case_id)
+
+    with patch("services.support_service.execute", side_effect=slow_row) as mock_execute:
+        responses = await asyncio.gather(*(SupportService.get_case_by_id(case_id) for _ in range(20)))
+
+    assert all(response.success for response in responses)
+    assert mock_execute.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_other_worker_waits_for_the_fill(shared_backend):
+    """Prueba que otro worker con la clave bloqueada espera el valor en vez de ir a la BD"""
+    case_id = str(uuid4())
+    other_worker = TwoLevelCache("case")
+    other_loader = AsyncMock()
+
+    async def slow_row(*args, **kwargs):
+        await asyncio.sleep(0.05)
+        return make_row(case_id)
+
+    with patch("services.support_service.execute", side_effect=slow_row):
+        first, second = await asyncio.gather(
+            SupportService.get_case_by_id(case_id),
+            other_worker.get_or_load(case_id, SupportCase, other_loader),
+        )
+
+    assert second == first.case
+    other_loader.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_update_invalidates_every_worker(shared_backend):
+    """Prueba que una actualización borra el caso de la L1 de los demás workers y de la L2"""
+    case_id = str(uuid4())
+    other_worker = TwoLevelCache("case")
+    case_cache.start()
+    other_worker.start()
+    try:
+        await settle()
+        with patch("services.support_service.execute", new=AsyncMock(return_value=make_row(case_id))):
+            cached = await SupportService.get_case_by_id(case_id)
+        assert await other_worker.get_or_load(case_id, SupportCase, AsyncMock()) == cached.case
+
+        # Otro worker cambia el estado
+        updated_row = make_row(case_id, status="completado")
+        with patch("services.support_service.execute", new=AsyncMock(return_value=[(case_id, "pendiente", True)])):
+            with patch("services.support_service.case_cache", other_worker):
+                await SupportService.bulk_update_status([case_id], "completado")
+        await settle()
+
+        # La L2 tiene una lápida: un valor viejo leído antes no puede volver a entrar
+        stale = SupportService._row_to_case(make_row(case_id))
+        await other_worker._store({case_id: stale})
+        with patch("services.support_service.execute", new=AsyncMock(return_value=updated_row)) as mock_execute:
+            response = await SupportService.get_case_by_id(case_id)
+
+        assert response.case.status == "completado"
+        mock_execute.assert_awaited_once()
+    finally:
+        await case_cache.stop()
+        await other_worker.stop()
+
+
+@pytest.mark.asyncio
+async def test_batch_lookup_only_queries_missing_ids(shared_backend):
+    """Prueba que el lote pide a la BD solo los casos que no están en caché"""
+    cached_id, new_id, unknown_id = str(uuid4()), str(uuid4()), str(uuid4())
+    with patch("services.support_service.execute", new=AsyncMock(return_value=make_row(cached_id))):
+        await SupportService.get_case_by_id(cached_id)
+    with patch("services.support_service.execute", new=AsyncMock(return_value=[make_row(new_id)])) as mock_execute:
+        response = await SupportService.get_cases_by_ids([cached_id, new_id, unknown_id])
+
+    assert response.found == 2
+    assert [result.found for result in response.results] == [True, True, False]
+    assert mock_execute.call_args.args[1][0] == [new_id, unknown_id]
+    assert response.message == "Se encontraron 2 de 3 casos"
+
+
+@pytest.mark.asyncio
+async def test_backend_failure_falls_back_to_database(shared_backend, monkeypatch):
+    """Prueba que si la L2 falla la lectura se sirve desde la BD"""
+    async def broken(*args, **kwargs):
+        raise ConnectionError("sin conexión")
+
+    monkeypatch.setattr(shared_backend, "get_many", broken)
+    monkeypatch.setattr(shared_backend, "set", broken)
+    case_id = str(uuid4())
+    with patch("services.support_service.execute", new=AsyncMock(return_value=make_row(case_id))):
+        response = await SupportService.get_case_by_id(case_id)
+
+    assert response.success and str(response.case.id) == case_id
+
+
+def test_listing_page_is_cached_by_etag(shared_backend):
+    """Prueba que la página de un ETag se reutiliza y que un ETag nuevo la recalcula"""
+    rows = [make_row(str(uuid4())) for _ in range(3)]
+    etags = AsyncMock(side_effect=['W/"v1"', 'W/"v1"', 'W/"v2"'])
+
+    async def fake_execute(query, params=None, fetch_one=False, fetch_all=False, shard=None):
+        return (3,) if fetch_one else rows
+
+    with patch("routes.support_cases.SupportService.get_listing_etag", new=etags), \
+            patch("services.support_service.execute", side_effect=fake_execute) as mock_execute:
+        responses = [client.get("/api/support-cases/") for _ in range(3)]
+
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    assert responses[0].json() == responses[1].json()
+    # Página y COUNT para v1 y de nuevo para v2
+    assert mock_execute.await_count == 4
+
+
+def test_cache_is_off_by_default(monkeypatch):
+    """Prueba que con CACHE_BACKEND=none no hay caché y cada lectura va a la BD"""
+    monkeypatch.setattr("utils.cache.get_settings", lambda: SimpleNamespace(cache_backend="none"))
+    _backend_state.update(loaded=False, backend=None)
+    try:
+        assert get_cache_backend() is None
+        assert not case_cache.enabled
+    finally:
+        _backend_state.update(loaded=False, backend=None)
+
+
+@pytest.mark.asyncio
+async def test_resp_replies_are_parsed():
+    """Prueba el codificado de comandos y la lectura de respuestas RESP"""
+    assert encode_command(["SET", "k", b"v", "PX", 100]) == (
+        b"*5\r\n$3\r\nSET\r\n$1\r\nk\r\n$1\r\nv\r\n$2\r\nPX\r\n$3\r\n100\r\n"
+    )
+    reader = asyncio.StreamReader()
+    reader.feed_data(b"+OK\r\n$-1\r\n*2\r\n$3\r\nabc\r\n$-1\r\n:3\r\n-ERR malo\r\n")
+    connection = RedisConnection(reader, None)
+
+    assert await connection.read_reply() == b"OK"
+    assert await connection.read_reply() is None
+    assert await connection.read_reply() == [b"abc", None]
+    assert await connection.read_reply() == 3
+    assert isinstance(await connection.read_reply(), RedisError)
@@ -0,0 +1,108 @@
+import gzip
+import json
+import zlib
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+from uuid import uuid4
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from models.support_responses import PaginatedResponse, SupportCase
+from utils.compression import negotiate
+
+client = TestClient(app)
+
+# Página de 100 casos casi iguales, como las del listado real
+PAGE = PaginatedResponse(
+    success=True,
+    message="Se obtuvieron 100 casos",
+    items=[
+        SupportCase(
+            id=uuid4(), title="Corregir dirección cliente", description="Dirección incorrecta en registro",
+            database_name="finkargo_clientes", schema_name="clientes",
+            sql_query=f"UPDATE clientes SET direccion = 'x' WHERE id = {i}",
+            executed_by="maria.gonzalez@finkargo.com", status="pendiente", priority="media",
+            created_at=datetime(2025, 4, 1), updated_at=datetime(2025, 4, 1),
+        )
+        for i in range(100)
+    ],
+    total=100, page=1, size=100, total_pages=1,
+)
+
+
+@pytest.fixture
+def listing():
+    with patch(
+        "routes.support_cases.SupportService.get_paginated_cases", new=AsyncMock(return_value=PAGE)
+    ), patch(
+        "routes.support_cases.SupportService.get_listing_etag", new=AsyncMock(return_value=None)
+    ):
+        yield
+
+
+@pytest.mark.parametrize("header, available, expected", [
+    ("gzip, deflate, br, zstd", ("zstd", "br", "gzip"), "zstd"),
+    ("gzip, deflate, br, zstd", ("gzip",), "gzip"),
+    ("gzip;q=0.5, br;q=0.8", ("zstd", "br", "gzip"), "br"),
+    ("br;q=0, gzip", ("br", "gzip"), "gzip"),
+    ("*", ("br", "gzip"), "br"),
+    ("identity", ("zstd", "br", "gzip"), None),
+    (None, ("gzip",), None),
+])
+def test_negotiation(header, available, expected):
+    """Prueba la elección de codificación: q del cliente y, a igual q, preferencia del servidor"""
+    assert negotiate(header, available) == expected
+
+
+def test_large_listing_is_compressed(listing):
+    """Prueba que un listado grande se envía comprimido con su Content-Length"""
+    identity = client.get("/api/support-cases/?size=100", headers={"Accept-Encoding": "identity"})
+    response = client.get("/api/support-cases/?size=100", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in identity.headers
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) < len(identity.content) / 5
+    assert response.json() == identity.json()
+
+
+def test_small_response_is_not_compressed():
+    """Prueba que una respuesta por debajo del umbral se envía tal cual"""
+    missing = SimpleNamespace(success=False)
+    with patch("routes.support_cases.SupportService.get_case_by_id", new=AsyncMock(return_value=missing)):
+        response = client.get(f"/api/support-cases/case/{uuid4()}", headers={"Accept-Encoding": "gzip"})
+
+    assert response.status_code == 404
+    assert "content-encoding" not in response.headers
+    assert "Accept-Encoding" in response.headers["vary"]
+
+
+def test_streamed_payload_is_compressed_in_chunks():
+    """Prueba que una descarga por streaming se comprime sin conocer su tamaño"""
+    text = "INSERT INTO facturas VALUES (1, 'pendiente');\n" * 20000
+    compressed = zlib.compress(text.encode())
+    rows = [(text[:100], len(text), "zlib", len(compressed)), (compressed,)]
+    with patch("services.payload_service.execute", new=AsyncMock(side_effect=rows)):
+        with client.stream(
+            "GET", f"/api/support-cases/case/{uuid4()}/payload/sql_query",
+            headers={"Accept-Encoding": "gzip"},
+        ) as response:
+            raw = b"".join(response.iter_raw())
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert gzip.decompress(raw).decode() == text
+
+
+def test_compression_can_be_disabled(listing, monkeypatch):
+    """Prueba que COMPRESSION_ENABLED=false envía todo sin comprimir"""
+    monkeypatch.setattr(
+        "utils.compression.get_settings",
+        lambda: SimpleNamespace(compression_enabled=False, compression_min_bytes=1024),
+    )
+    response = client.get("/api/support-cases/?size=100", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert json.loads(response.content)["total"] == 100
@@ -0,0 +1,278 @@
+import threading
+from types import SimpleNamespace
+import psycopg2
+import pytest
+
+from database.connection import Database, execute
+from database.support_queries import BULK_UPDATE_STATUS, INSERT_CASE
+from database.resilience import (
+    CircuitBreaker,
+    DatabaseUnavailable,
+    get_breaker,
+    is_connection_error,
+    reset_breakers,
+)
+from utils.metrics import metrics
+
+
+def connection_lost():
+    return psycopg2.OperationalError("server closed the connection unexpectedly")
+
+
+class FlakyConnection:
+    """Conexión cuya consulta lanza el error indicado (si lo hay)"""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.queries = []
+        self.rolled_back = False
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params):
+        self.queries.append(query)
+        if self.error is not None:
+            raise self.error
+
+    def fetchall(self):
+        return [("fila",)]
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+class FlakyDatabase:
+    """Falla con los errores de ``failures`` (uno por intento) y después responde"""
+
+    def __init__(self, failures, on_connect=False):
+        self.failures = list(failures)
+        self.on_connect = on_connect
+        self.connections = []
+        self.returned = []
+        self.discarded = []
+
+    def get_connection(self, autocommit=False):
+        error = self.failures.pop(0) if self.failures else None
+        if error is not None and self.on_connect:
+            raise error
+        connection = FlakyConnection(None if self.on_connect else error)
+        self.connections.append(connection)
+        return connection
+
+    def return_connection(self, conn):
+        self.returned.append(conn)
+
+    def discard_connection(self, conn):
+        self.discarded.append(conn)
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(
+        "database.connection.get_settings",
+        lambda: SimpleNamespace(db_retry_attempts=3, db_retry_backoff_ms=1, db_retry_backoff_max_ms=5),
+    )
+    monkeypatch.setattr(
+        "database.resilience.get_settings",
+        lambda: SimpleNamespace(db_breaker_failure_threshold=3, db_breaker_reset_seconds=60),
+    )
+    reset_breakers()
+    yield
+    reset_breakers()
+
+
+def use(monkeypatch, database):
+    monkeypatch.setattr("database.connection.get_database", lambda shard=None: database)
+    return database
+
+
+@pytest.mark.parametrize("error, expected", [
+    (psycopg2.OperationalError("server closed the connection unexpectedly"), True),
+    (psycopg2.InterfaceError("connection already closed"), True),
+    (psycopg2.ProgrammingError("syntax error"), False),
+    (psycopg2.IntegrityError("duplicate key"), False),
+    (ValueError("otro"), False),
+])
+def test_connection_errors_are_told_apart(error, expected):
+    assert is_connection_error(error) is expected
+
+
+@pytest.mark.asyncio
+async def test_read_is_retried_on_a_fresh_connection(monkeypatch):
+    """Prueba que una lectura se reintenta y la conexión rota no vuelve al pool"""
+    database = use(monkeypatch, FlakyDatabase([connection_lost()]))
+    retries = metrics.snapshot()["counters"].get("db_retries_total", 0)
+
+    rows = await execute("SELECT * FROM support_cases", fetch_all=True)
+
+    assert rows == [("fila",)]
+    assert database.discarded == database.connections[:1]
+    assert database.returned == database.connections[1:]
+    # Una conexión rota no admite rollback
+    assert database.connections[0].rolled_back is False
+    assert metrics.snapshot()["counters"]["db_retries_total"] == retries + 1
+    assert get_breaker().state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_sent_write_is_not_retried(monkeypatch):
+    """Prueba que una escritura que pudo llegar al servidor no se repite"""
+    database = use(monkeypatch, FlakyDatabase([connection_lost()]))
+
+    with pytest.raises(psycopg2.OperationalError):
+        await execute("INSERT INTO support_cases (id) VALUES (%s)", ("x",))
+
+    assert len(database.connections) == 1
+    assert database.discarded == database.connections
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("query", [
+    INSERT_CASE,
+    BULK_UPDATE_STATUS,
+    "WITH gone AS (DELETE FROM support_cases WHERE id = %s RETURNING id) SELECT * FROM gone",
+    "SELECT * INTO archivo FROM support_cases",
+    "SELECT * FROM support_cases WHERE id = %s FOR UPDATE",
+])
+async def test_statements_that_write_are_not_resent(monkeypatch, query):
+    """Prueba que una sentencia que escribe (aunque empiece por SELECT o WITH) no se repite"""
+    database = use(monkeypatch, FlakyDatabase([connection_lost()]))
+
+    with pytest.raises(psycopg2.OperationalError):
+        await execute(query, ("x",))
+
+    assert len(database.connections) == 1
+
+
+@pytest.mark.asyncio
+async def test_write_is_retried_when_no_connection_was_obtained(monkeypatch):
+    """Prueba que una escritura se reintenta si no llegó a enviarse"""
+    database = use(monkeypatch, FlakyDatabase([connection_lost()], on_connect=True))
+
+    await execute("INSERT INTO support_cases (id) VALUES (%s)", ("x",))
+
+    assert len(database.connections) == 1
+    assert database.connections[0].queries == ["INSERT INTO support_cases (id) VALUES (%s)"]
+
+
+@pytest.mark.asyncio
+async def test_query_errors_are_not_retried(monkeypatch):
+    """Prueba que un error de la consulta no se reintenta ni cuenta para el breaker"""
+    database = use(monkeypatch, FlakyDatabase([psycopg2.ProgrammingError("syntax error")] * 5))
+
+    for _ in range(5):
+        with pytest.raises(psycopg2.ProgrammingError):
+            await execute("SELECT * FROM support_cases", fetch_all=True)
+
+    assert len(database.connections) == 5
+    assert database.connections[0].rolled_back is True
+    assert get_breaker().state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_and_fails_fast(monkeypatch):
+    """Prueba que con la BD caída las consultas fallan sin tocar el pool"""
+    database = use(monkeypatch, FlakyDatabase([connection_lost()] * 10, on_connect=True))
+
+    # Tres intentos fallidos alcanzan el umbral (3) y abren el breaker
+    with pytest.raises(psycopg2.OperationalError):
+        await execute("SELECT 1", fetch_all=True)
+    assert len(database.failures) == 7
+    assert get_breaker().state == "open"
+
+    with pytest.raises(DatabaseUnavailable):
+        await execute("SELECT 1", fetch_all=True)
+    assert len(database.failures) == 7
+    gauges = metrics.snapshot()["gauges"]
+    assert gauges["db_breaker_main_state"] == 2
+    assert gauges["db_breakers_open"] == 1
+
+
+def test_breaker_probes_for_recovery():
+    """Prueba el paso a semiabierto, con una sola consulta de prueba a la vez"""
+    now = [0.0]
+    breaker = CircuitBreaker("main", failure_threshold=2, reset_seconds=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(DatabaseUnavailable):
+        breaker.before_call()
+
+    now[0] = 10
+    assert breaker.state == "half_open"
+    probe = breaker.before_call()
+    assert probe is True
+    with pytest.raises(DatabaseUnavailable):
+        breaker.before_call()
+
+    # La prueba falla: vuelve a abrirse otros 10 s
+    breaker.record_failure(probe)
+    assert breaker.state == "open"
+    now[0] = 20
+    probe = breaker.before_call()
+    breaker.record_success(probe)
+    assert breaker.state == "closed"
+    assert breaker.before_call() is False
+
+
+def test_success_resets_consecutive_failures():
+    breaker = CircuitBreaker("main", failure_threshold=2, reset_seconds=10)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+class _Pool:
+    def __init__(self):
+        self.closed_on_put = []
+
+    def putconn(self, conn, close=False):
+        if close:
+            self.closed_on_put.append(conn)
+
+
+def test_broken_connection_is_closed_by_the_pool():
+    """Prueba que una conexión rota se devuelve al pool para cerrarla y libera su hueco"""
+    database = Database("dbname=test")
+    database._connection_pool = _Pool()
+    database._slots = threading.BoundedSemaphore(1)
+    database._slots.acquire()
+    broken = SimpleNamespace(closed=2)
+    evicted = metrics.snapshot()["counters"].get("db_connections_evicted_total", 0)
+
+    database.discard_connection(broken)
+
+    assert database._connection_pool.closed_on_put == [broken]
+    assert metrics.snapshot()["counters"]["db_connections_evicted_total"] == evicted + 1
+    # El hueco del pool queda libre
+    assert database._slots.acquire(blocking=False)
+
+
+def test_connection_returned_after_close_is_closed():
+    """Prueba que devolver una conexión con el pool cerrado no lo vuelve a abrir"""
+    database = Database("dbname=test")
+    closed = []
+    connection = SimpleNamespace(close=lambda: closed.append(True))
+
+    database.return_connection(connection)
+
+    assert closed == [True]
+    assert not database.is_open
+
+
+def test_main_node_and_shard_zero_share_a_breaker_without_sharding():
+    """Prueba que sin sharding None y 0 son el mismo nodo y el mismo breaker"""
+    assert get_breaker(None) is get_breaker(0)
+    assert get_breaker(0).name == "main"
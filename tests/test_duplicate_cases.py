@@ -0,0 +1,123 @@
+from datetime import datetime
+from unittest.mock import AsyncMock, patch
+from uuid import uuid4
+import pytest
+from fastapi.testclient import TestClient
+
+from database.connection import Database
+from database.sharding import ShardRouter, set_router
+from database.support_queries import GET_OPEN_CASE_BY_SUBMISSION, insert_cases_params
+from main import app
+from utils.sql_analyzer import submission_hash
+
+client = TestClient(app)
+
+CASE_DATA = {
+    "title": "Anular facturas duplicadas",
+    "description": "Facturas emitidas dos veces",
+    "database_name": "finkargo_transacciones",
+    "schema_name": "operaciones",
+    "sql_query": "DELETE FROM facturas WHERE id IN (10, 11)",
+    "executed_by": "juan.perez@finkargo.com",
+    "priority": "alta",
+}
+
+
+def open_case_row(case_id=None):
+    """Fila con el orden de CASE_COLUMNS de un caso abierto con CASE_DATA"""
+    now = datetime(2025, 4, 1, 12, 0)
+    return (
+        case_id or str(uuid4()), CASE_DATA["title"], CASE_DATA["description"],
+        CASE_DATA["database_name"], CASE_DATA["schema_name"], CASE_DATA["sql_query"],
+        CASE_DATA["executed_by"], "en_proceso", "alta", now, now, None,
+        "DELETE", ["facturas"], "0f1e2d3c4b5a6978", None, None,
+    )
+
+
+@pytest.fixture
+def three_shards():
+    router = ShardRouter([Database(f"dbname=shard{i}", name=f"shard{i}") for i in range(3)])
+    set_router(router)
+    yield router
+    set_router(None)
+
+
+def test_submission_hash_keeps_literals():
+    """Prueba que el hash ignora formato pero no literales ni base de datos"""
+    base = submission_hash("DELETE FROM facturas WHERE id = 10", "finkargo", "operaciones")
+    assert base == submission_hash("delete  from facturas\nwhere id = 10; -- otra vez", "finkargo", "operaciones")
+    assert base != submission_hash("DELETE FROM facturas WHERE id = 11", "finkargo", "operaciones")
+    assert base != submission_hash("DELETE FROM facturas WHERE id = 10", "finkargo", "clientes")
+
+
+def test_insert_cases_params_puts_lock_keys_first():
+    """Prueba que los hashes a bloquear van antes de las filas"""
+    rows = [tuple(range(16)), tuple(range(100, 116))]
+    params = insert_cases_params(rows)
+    assert params[0] == [14, 114]
+    assert params[1:] == rows[0] + rows[1]
+
+
+def test_new_case_id_belongs_to_requested_shard(three_shards):
+    """Prueba que el id generado pertenece siempre al shard pedido"""
+    for shard in range(three_shards.count):
+        for _ in range(50):
+            assert three_shards.shard_for(three_shards.new_case_id(shard)) == shard
+    key = submission_hash(CASE_DATA["sql_query"], "finkargo", "operaciones")
+    assert three_shards.shard_for_key(key) == int(key, 16) % 3
+
+
+def test_duplicate_submission_returns_conflict():
+    """Prueba que un envío repetido devuelve 409 con el caso abierto"""
+    existing = open_case_row()
+    with patch("services.support_service.execute", new_callable=AsyncMock) as mock_execute:
+        # El INSERT no devuelve fila (duplicado) y la búsqueda encuentra el caso
+        mock_execute.side_effect = [None, existing]
+        response = client.post("/api/support-cases/", json=CASE_DATA)
+
+    assert response.status_code == 409
+    body = response.json()
+    assert body["error_code"] == "DUPLICATE_CASE"
+    assert body["existing_case"]["id"] == existing[0]
+    lookup = mock_execute.call_args_list[1]
+    assert lookup.args[0] == GET_OPEN_CASE_BY_SUBMISSION
+    assert lookup.args[1] == (
+        submission_hash(CASE_DATA["sql_query"], CASE_DATA["database_name"], CASE_DATA["schema_name"]),
+    )
+
+
+def test_allow_duplicate_skips_the_check():
+    """Prueba que allow_duplicate crea el caso aunque exista otro abierto"""
+    with patch("services.support_service.execute", new_callable=AsyncMock) as mock_execute:
+        mock_execute.return_value = (str(uuid4()),)
+        response = client.post("/api/support-cases/", json={**CASE_DATA, "allow_duplicate": True})
+
+    assert response.status_code == 200
+    assert response.json()["success"] is True
+    mock_execute.assert_called_once()
+    assert mock_execute.call_args.args[1][-3] is True
+
+
+@pytest.mark.asyncio
+async def test_legacy_duplicate_on_another_shard(three_shards):
+    """Prueba que se detectan casos antiguos guardados en otro shard"""
+    key = submission_hash(CASE_DATA["sql_query"], CASE_DATA["database_name"], CASE_DATA["schema_name"])
+    home = three_shards.shard_for_key(key)
+    legacy_shard = (home + 1) % 3
+    existing = open_case_row()
+    calls = []
+
+    async def fake_execute(query, params=None, fetch_one=False, fetch_all=False, shard=None, **kwargs):
+        calls.append((query, shard))
+        if query == GET_OPEN_CASE_BY_SUBMISSION and shard == legacy_shard:
+            return existing
+        return None
+
+    with patch("services.support_service.execute", fake_execute):
+        from services.support_service import SupportService
+        response = await SupportService.create_support_case(**CASE_DATA)
+
+    assert response.success is False
+    assert str(response.existing_case.id) == existing[0]
+    # Solo búsquedas en los otros shards; no se intentó insertar
+    assert sorted(shard for _, shard in calls) == sorted({0, 1, 2} - {home})
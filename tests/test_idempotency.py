@@ -0,0 +1,236 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock, patch
+from uuid import uuid4
+import psycopg2
+import pytest
+from fastapi.testclient import TestClient
+
+from database.support_queries import (
+    CLAIM_IDEMPOTENCY_KEY,
+    COMPLETE_IDEMPOTENCY_KEY,
+    GET_IDEMPOTENCY_KEY,
+    RELEASE_IDEMPOTENCY_KEY,
+    SWEEP_IDEMPOTENCY_KEYS,
+)
+from main import app
+from models.support_responses import SupportCaseCreatedResponse
+from services.idempotency_service import IdempotencyService, request_fingerprint
+from services.support_service import SupportService
+from utils.metrics import metrics
+
+client = TestClient(app)
+
+CASE_DATA = {
+    "title": "Corregir dirección cliente",
+    "description": "Dirección incorrecta en registro",
+    "database_name": "finkargo_clientes",
+    "schema_name": "clientes",
+    "sql_query": "UPDATE clientes SET direccion = 'x' WHERE id = 1",
+    "executed_by": "maria.gonzalez@finkargo.com",
+    "priority": "media",
+}
+
+
+class FakeKeyTable:
+    """Tabla idempotency_keys en memoria que interpreta las sentencias del servicio"""
+
+    def __init__(self):
+        self.rows = {}
+        self.expired = set()
+
+    async def __call__(self, query, params=None, fetch_one=False, row_count=False, **kwargs):
+        await asyncio.sleep(0)
+        if query == CLAIM_IDEMPOTENCY_KEY:
+            key, request_hash = params[0], params[1]
+            if key in self.rows and key not in self.expired:
+                return None
+            self.expired.discard(key)
+            self.rows[key] = {"request_hash": request_hash, "status_code": None, "response": None}
+            return (key,)
+        if query == GET_IDEMPOTENCY_KEY:
+            row = self.rows.get(params[0])
+            if row is None or params[0] in self.expired:
+                return None
+            return row["request_hash"], row["status_code"], row["response"]
+        if query == COMPLETE_IDEMPOTENCY_KEY:
+            status_code, body, key, request_hash = params
+            self.rows[key].update(status_code=status_code, response=json.loads(body))
+            return None
+        if query == RELEASE_IDEMPOTENCY_KEY:
+            self.rows.pop(params[0], None)
+            return None
+        if query == SWEEP_IDEMPOTENCY_KEYS:
+            swept = list(self.expired)[:params[0]]
+            for key in swept:
+                self.rows.pop(key, None)
+                self.expired.discard(key)
+            return len(swept)
+        raise AssertionError(f"consulta inesperada: {query}")
+
+
+@pytest.fixture
+def key_table(monkeypatch):
+    table = FakeKeyTable()
+    monkeypatch.setattr("services.idempotency_service.execute", table)
+    return table
+
+
+def created_response():
+    return SupportCaseCreatedResponse(
+        success=True,
+        message="Caso de soporte creado exitosamente",
+        case_id=str(uuid4()),
+    )
+
+
+def test_replay_returns_stored_response_without_writing(key_table):
+    """Prueba que un reintento con la misma clave no crea otro caso"""
+    with patch(
+        "routes.support_cases.SupportService.create_support_case", new_callable=AsyncMock
+    ) as mock_create:
+        mock_create.return_value = created_response()
+        headers = {"Idempotency-Key": "crm-retry-1"}
+
+        first = client.post("/api/support-cases/", json=CASE_DATA, headers=headers)
+        second = client.post("/api/support-cases/", json=CASE_DATA, headers=headers)
+
+    assert mock_create.await_count == 1
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+
+
+def test_key_reused_with_other_body_is_rejected(key_table):
+    """Prueba que la misma clave con otro cuerpo responde 422"""
+    with patch(
+        "routes.support_cases.SupportService.create_support_case", new_callable=AsyncMock
+    ) as mock_create:
+        mock_create.return_value = created_response()
+        headers = {"Idempotency-Key": "crm-retry-2"}
+        client.post("/api/support-cases/", json=CASE_DATA, headers=headers)
+        response = client.post(
+            "/api/support-cases/", json={**CASE_DATA, "priority": "alta"}, headers=headers
+        )
+
+    assert response.status_code == 422
+    assert response.json()["error_code"] == "IDEMPOTENCY_KEY_REUSED"
+    assert mock_create.await_count == 1
+
+
+def test_server_error_releases_key(key_table):
+    """Prueba que tras un 500 el reintento con la misma clave se procesa"""
+    with patch(
+        "routes.support_cases.SupportService.create_support_case", new_callable=AsyncMock
+    ) as mock_create:
+        mock_create.side_effect = [RuntimeError("conexión perdida"), created_response()]
+        headers = {"Idempotency-Key": "crm-retry-3"}
+
+        failed = client.post("/api/support-cases/", json=CASE_DATA, headers=headers)
+        retried = client.post("/api/support-cases/", json=CASE_DATA, headers=headers)
+
+    assert failed.status_code == 500
+    assert retried.status_code == 200
+    assert mock_create.await_count == 2
+
+
+def test_database_failure_is_not_stored(key_table):
+    """Prueba que una caída de la BD responde 503 y libera la clave para el reintento"""
+    lost = psycopg2.OperationalError("server closed the connection unexpectedly")
+    with patch(
+        "routes.support_cases.SupportService.create_support_case", new_callable=AsyncMock
+    ) as mock_create:
+        mock_create.side_effect = [lost, created_response()]
+        headers = {"Idempotency-Key": "crm-retry-db"}
+
+        failed = client.post("/api/support-cases/", json=CASE_DATA, headers=headers)
+        assert "crm-retry-db" not in key_table.rows
+        retried = client.post("/api/support-cases/", json=CASE_DATA, headers=headers)
+
+    assert failed.status_code == 503
+    assert failed.json()["error_code"] == "DATABASE_UNAVAILABLE"
+    assert failed.headers["Retry-After"] == "1"
+    assert retried.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_service_raises_database_failures():
+    """Prueba que create_support_case no convierte una caída de la BD en un error de la solicitud"""
+    lost = psycopg2.OperationalError("server closed the connection unexpectedly")
+    with patch("services.support_service.execute", new=AsyncMock(side_effect=lost)):
+        with pytest.raises(psycopg2.OperationalError):
+            await SupportService.create_support_case(**CASE_DATA)
+
+
+@pytest.mark.asyncio
+async def test_vanishing_key_waits_with_deadline(monkeypatch):
+    """Prueba que si la clave desaparece entre CLAIM y GET se espera con el mismo plazo"""
+    from types import SimpleNamespace
+    monkeypatch.setattr(
+        "services.idempotency_service.get_settings",
+        lambda: SimpleNamespace(
+            idempotency_wait_seconds=0.1, idempotency_lock_seconds=30, idempotency_ttl_hours=24
+        ),
+    )
+    calls = []
+
+    async def never_claimed(query, params=None, **kwargs):
+        calls.append(query)
+        return None
+
+    monkeypatch.setattr("services.idempotency_service.execute", never_claimed)
+
+    assert (await IdempotencyService.claim("k", "h")).outcome == "in_progress"
+    assert calls.count(CLAIM_IDEMPOTENCY_KEY) < 10
+
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicate_waits_for_first(key_table, monkeypatch):
+    """Prueba que un envío simultáneo espera la respuesta del primero"""
+    from types import SimpleNamespace
+    monkeypatch.setattr(
+        "services.idempotency_service.get_settings",
+        lambda: SimpleNamespace(
+            idempotency_wait_seconds=2, idempotency_lock_seconds=30, idempotency_ttl_hours=24
+        ),
+    )
+    request_hash = request_fingerprint(CASE_DATA)
+    first = await IdempotencyService.claim("k", request_hash)
+    assert first.outcome == "acquired"
+
+    waiting = asyncio.create_task(IdempotencyService.claim("k", request_hash))
+    await asyncio.sleep(0.1)
+    assert not waiting.done()
+    await IdempotencyService.complete("k", request_hash, 200, {"success": True})
+
+    second = await asyncio.wait_for(waiting, timeout=1)
+    assert second == ("replay", 200, {"success": True})
+
+
+@pytest.mark.asyncio
+async def test_unfinished_key_reports_in_progress(key_table, monkeypatch):
+    """Prueba que si el primero no termina a tiempo se responde en curso"""
+    from types import SimpleNamespace
+    monkeypatch.setattr(
+        "services.idempotency_service.get_settings",
+        lambda: SimpleNamespace(
+            idempotency_wait_seconds=0.1, idempotency_lock_seconds=30, idempotency_ttl_hours=24
+        ),
+    )
+    metrics.reset()
+    await IdempotencyService.claim("k", "h")
+
+    assert (await IdempotencyService.claim("k", "h")).outcome == "in_progress"
+    assert metrics.snapshot()["counters"]["idempotency_in_progress_total"] == 1
+
+
+@pytest.mark.asyncio
+async def test_sweep_deletes_expired_keys_in_batches(key_table):
+    """Prueba el barrido por lotes de las claves vencidas"""
+    for index in range(5):
+        key_table.rows[f"k{index}"] = {"request_hash": "h", "status_code": 200, "response": {}}
+    key_table.expired = {"k0", "k1", "k2"}
+
+    assert await IdempotencyService.sweep(batch_size=2) == 3
+    assert sorted(key_table.rows) == ["k3", "k4"]
@@ -0,0 +1,161 @@
+import zlib
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+from uuid import uuid4
+import pytest
+from fastapi.testclient import TestClient
+
+from database.support_queries import (
+    GET_CASES_WITH_LARGE_PAYLOADS,
+    GET_PAYLOAD_SLICE,
+    STORE_CASE_PAYLOAD,
+)
+from main import app
+from services.payload_service import externalize_shard, iter_decompressed, split_payload
+
+client = TestClient(app)
+
+# Script de varios cientos de KB con caracteres multibyte
+LARGE_SCRIPT = "UPDATE clientes SET nombre = 'Muñoz' WHERE id = 1;\n" * 8000
+
+
+def test_small_payload_stays_inline():
+    """Prueba que un texto pequeño se guarda entero en la fila"""
+    assert split_payload("SELECT 1", 1024, 64) == ("SELECT 1", None, None)
+    assert split_payload(None, 1024, 64) == (None, None, None)
+
+
+def test_large_payload_keeps_preview_and_size():
+    """Prueba el avance (cortado en un límite de carácter), el tamaño y la compresión"""
+    data = LARGE_SCRIPT.encode("utf-8")
+    preview, byte_length, compressed = split_payload(LARGE_SCRIPT, 1024, 33)
+
+    assert byte_length == len(data)
+    # El byte 33 cae en medio de la "ñ": el avance termina antes
+    assert preview == "UPDATE clientes SET nombre = 'Mu"
+    assert len(compressed) < len(data) / 10
+    assert zlib.decompress(compressed) == data
+
+
+def test_decompression_is_bounded_per_chunk():
+    """Prueba que la descompresión por bloques no produce bloques mayores que chunk_size"""
+    data = b"x" * 1_000_000
+    chunks = list(iter_decompressed(zlib.compress(data), "zlib", chunk_size=4096))
+
+    assert b"".join(chunks) == data
+    assert max(len(chunk) for chunk in chunks) <= 4096
+
+
+def test_create_stores_large_query_out_of_row():
+    """Prueba que el INSERT lleva el avance en la fila y el texto comprimido aparte"""
+    case = {
+        "title": "Corregir nombres",
+        "description": "Nombres con tilde mal guardados",
+        "database_name": "finkargo_clientes",
+        "schema_name": "clientes",
+        "sql_query": LARGE_SCRIPT,
+        "executed_by": "maria.gonzalez@finkargo.com",
+        "priority": "media",
+    }
+    with patch("services.support_service.execute", new_callable=AsyncMock) as mock_execute:
+        mock_execute.return_value = (str(uuid4()),)
+        response = client.post("/api/support-cases/", json=case)
+
+    assert response.status_code == 200
+    created = response.json()["case"]
+    assert created["sql_query_bytes"] == len(LARGE_SCRIPT.encode("utf-8"))
+    assert len(created["sql_query"]) <= 2048
+    # Los metadatos salen del texto completo
+    assert created["statement_type"] == "UPDATE"
+
+    params = mock_execute.call_args.args[1]
+    assert params[6] == created["sql_query"]
+    assert params[-2] == created["sql_query_bytes"]
+    assert zlib.decompress(params[-1]).decode("utf-8") == LARGE_SCRIPT
+
+
+def test_stream_full_payload(monkeypatch):
+    """Prueba que el endpoint devuelve el texto completo leyendo los datos comprimidos por trozos"""
+    data = LARGE_SCRIPT.encode("utf-8")
+    compressed = zlib.compress(data)
+    slices = []
+
+    async def fake_execute(query, params=None, fetch_one=False, shard=None, **kwargs):
+        if query == GET_PAYLOAD_SLICE:
+            start, length = params[0] - 1, params[1]
+            slices.append(length)
+            return (compressed[start:start + length],)
+        assert "support_case_payloads" in query
+        return (LARGE_SCRIPT[:100], len(data), "zlib", len(compressed))
+
+    monkeypatch.setattr("services.payload_service.execute", fake_execute)
+    monkeypatch.setattr("services.payload_service.READ_CHUNK_BYTES", 256)
+    response = client.get(
+        f"/api/support-cases/case/{uuid4()}/payload/sql_query",
+        headers={"Accept-Encoding": "identity"},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert response.headers["content-length"] == str(len(data))
+    assert response.text == LARGE_SCRIPT
+    # Nunca se pide el valor comprimido entero
+    assert len(slices) == -(-len(compressed) // 256) > 1
+
+
+def test_stream_inline_payload():
+    """Prueba que un campo guardado en la fila también se descarga entero"""
+    with patch("services.payload_service.execute", new_callable=AsyncMock) as mock_execute:
+        mock_execute.return_value = ("Sin filas afectadas", None, None, None)
+        response = client.get(f"/api/support-cases/case/{uuid4()}/payload/execution_result")
+
+    assert response.status_code == 200
+    assert response.text == "Sin filas afectadas"
+
+
+@pytest.mark.parametrize("row, status", [(None, 404), ((None, None, None, None), 404)])
+def test_stream_missing_case_or_value(row, status):
+    """Prueba el 404 de un caso inexistente o de un campo vacío"""
+    with patch("services.payload_service.execute", new_callable=AsyncMock) as mock_execute:
+        mock_execute.return_value = row
+        response = client.get(f"/api/support-cases/case/{uuid4()}/payload/execution_result")
+
+    assert response.status_code == status
+    assert response.json()["error_code"] == "NOT_FOUND"
+
+
+def test_stream_rejects_bad_input():
+    """Prueba el id inválido y un campo que no se guarda aparte"""
+    assert client.get("/api/support-cases/case/no-es-uuid/payload/sql_query").status_code == 400
+    assert client.get(f"/api/support-cases/case/{uuid4()}/payload/title").status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_externalize_existing_cases(monkeypatch):
+    """Prueba que la migración mueve solo los textos grandes, por lotes de id"""
+    monkeypatch.setattr(
+        "services.payload_service.get_settings",
+        lambda: SimpleNamespace(payload_inline_max_bytes=1024, payload_preview_bytes=64),
+    )
+    first, second = str(uuid4()), str(uuid4())
+    pages = [[(first, LARGE_SCRIPT, "OK"), (second, "SELECT 1", LARGE_SCRIPT)], []]
+    stored = []
+
+    async def fake_execute(query, params=None, fetch_all=False, shard=None, **kwargs):
+        if query == GET_CASES_WITH_LARGE_PAYLOADS:
+            return pages.pop(0)
+        for field, statement in STORE_CASE_PAYLOAD.items():
+            if query == statement:
+                stored.append((field, params[0], params[1], params[3]))
+        return None
+
+    monkeypatch.setattr("services.payload_service.execute", fake_execute)
+    moved = await externalize_shard(0, batch_size=2)
+
+    size = len(LARGE_SCRIPT.encode("utf-8"))
+    preview = LARGE_SCRIPT[:63]
+    assert moved == 2
+    assert stored == [
+        ("sql_query", first, size, preview),
+        ("execution_result", second, size, preview),
+    ]
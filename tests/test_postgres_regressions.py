@@ -0,0 +1,250 @@
+import asyncio
+import json
+import os
+from pathlib import Path
+import pytest
+from fastapi.testclient import TestClient
+
+import database.connection as connection
+from database.connection import Database, create_tables, execute
+from database.resilience import reset_breakers
+from database.sharding import ShardRouter, get_router, set_router
+from main import app
+from services.facet_service import facet_cache
+from tests.postgres import (
+    SEED_CASE_COUNT,
+    SEED_CASES,
+    SEED_EVENTS,
+    EphemeralPostgres,
+    PostgresUnavailable,
+    seed_case_id,
+    seed_fingerprint,
+)
+from utils.sql_analyzer import analyze_sql
+
+# Regresiones de rendimiento contra un PostgreSQL real con un conjunto de
+# datos fijo: número de consultas por endpoint y forma del plan (EXPLAIN) de
+# cada consulta de lectura. Se omiten si no hay PostgreSQL disponible (ver
+# tests/postgres.py). Las firmas de los planes están en query_plans.json;
+# UPDATE_QUERY_PLANS=1 las vuelve a registrar.
+
+pytestmark = pytest.mark.postgres
+
+PLANS_FILE = Path(__file__).with_name("query_plans.json")
+UPDATE_PLANS = os.environ.get("UPDATE_QUERY_PLANS") == "1"
+
+client = TestClient(app)
+
+NEW_CASE = {
+    "title": "Error en consulta SQL",
+    "description": "La consulta no devuelve los resultados esperados",
+    "database_name": "finkargo_db",
+    "schema_name": "clientes",
+    "sql_query": "SELECT * FROM clientes WHERE id = 123",
+    "executed_by": "juan.perez@finkargo.com",
+    "priority": "alta",
+}
+
+
+async def _prepare():
+    await create_tables()
+    await execute(SEED_CASES, (SEED_CASE_COUNT,))
+    await execute(SEED_EVENTS)
+    await execute("ANALYZE")
+
+
+@pytest.fixture(scope="module")
+def postgres():
+    server = EphemeralPostgres()
+    try:
+        server.start()
+    except PostgresUnavailable as e:
+        pytest.skip(str(e))
+    database = Database(server.dsn, name="regress")
+    previous_db, previous_router = connection.db, get_router()
+    connection.db = database
+    set_router(ShardRouter([database]))
+    reset_breakers()
+    try:
+        asyncio.run(_prepare())
+        yield database
+    finally:
+        connection.db = previous_db
+        set_router(previous_router)
+        database.close_all_connections()
+        server.stop()
+
+
+@pytest.fixture
+def queries(postgres, monkeypatch):
+    """(query, params) of every execute() made while the test runs"""
+    recorded = []
+    original = connection._execute_sync
+
+    def recording(database, query, params, *args, **kwargs):
+        recorded.append((query, params))
+        return original(database, query, params, *args, **kwargs)
+
+    monkeypatch.setattr(connection, "_execute_sync", recording)
+    facet_cache.clear()
+    return recorded
+
+
+@pytest.fixture(scope="module")
+def plan_baselines():
+    baselines = json.loads(PLANS_FILE.read_text()) if PLANS_FILE.exists() else {}
+    yield baselines
+    if UPDATE_PLANS:
+        PLANS_FILE.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+
+
+def plan_signature(node: dict) -> str:
+    """Shape of a plan: node types with their index or table, without costs or row estimates"""
+    label = node["Node Type"]
+    target = node.get("Index Name") or node.get("Relation Name")
+    if target:
+        label += f"[{target}]"
+    children = [plan_signature(child) for child in node.get("Plans", [])]
+    return label + (f"({', '.join(children)})" if children else "")
+
+
+def explain(database: Database, query: str, params) -> str:
+    conn = database.get_connection()
+    try:
+        with conn.cursor() as cursor:
+            # Sin paralelismo ni JIT el plan no depende de la máquina
+            cursor.execute("SET LOCAL max_parallel_workers_per_gather = 0; SET LOCAL jit = off")
+            cursor.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            plan = cursor.fetchone()[0]
+        conn.rollback()
+    finally:
+        database.return_connection(conn)
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan_signature(plan[0]["Plan"])
+
+
+def check_plans(name, database, recorded, baselines):
+    signatures = [
+        explain(database, query, params)
+        for query, params in recorded
+        if analyze_sql(query).statement_type == "SELECT"
+    ]
+    assert signatures, f"{name}: no se registró ninguna consulta de lectura"
+    if UPDATE_PLANS:
+        baselines[name] = signatures
+        return
+    # Sin referencia no hay nada que comparar: omitirla haría que la prueba
+    # no pudiera fallar nunca
+    if name not in baselines:
+        pytest.fail(
+            f"Sin plan registrado para {name} en {PLANS_FILE.name}: ejecuta "
+            "UPDATE_QUERY_PLANS=1 pytest tests/test_postgres_regressions.py e incluye el fichero en el commit"
+        )
+    assert signatures == baselines[name], (
+        f"El plan de {name} cambió. Si el cambio es intencionado, vuelve a "
+        "registrar los planes con UPDATE_QUERY_PLANS=1"
+    )
+
+
+READ_ENDPOINTS = [
+    ("listing", "GET", "/api/support-cases/?status=pendiente", None, 3),
+    ("case_by_id", "GET", f"/api/support-cases/case/{seed_case_id(1)}", None, 1),
+    ("batch", "POST", "/api/support-cases/batch",
+     {"ids": [seed_case_id(i) for i in (1, 2, 3)]}, 1),
+    ("case_events", "GET", f"/api/support-cases/case/{seed_case_id(1)}/events", None, 1),
+    ("events_window", "GET",
+     "/api/support-cases/events?start=2025-01-01T00:00:00&end=2025-01-08T00:00:00", None, 1),
+    ("facets", "GET", "/api/support-cases/facets?status=pendiente", None, 1),
+]
+
+
+@pytest.mark.parametrize(
+    "name, method, url, body, expected", READ_ENDPOINTS, ids=[e[0] for e in READ_ENDPOINTS]
+)
+def test_read_endpoint_query_count_and_plans(
+    name, method, url, body, expected, postgres, queries, plan_baselines
+):
+    """Prueba cuántas consultas emite cada lectura y la forma de su plan"""
+    response = client.request(method, url, json=body)
+
+    assert response.status_code == 200, response.text
+    assert len(queries) == expected, [query for query, _ in queries]
+    check_plans(name, postgres, queries, plan_baselines)
+
+
+def test_cached_facets_issue_no_queries(postgres, queries):
+    """Prueba que los facets en caché no consultan la base de datos"""
+    client.get("/api/support-cases/facets")
+    queries.clear()
+    response = client.get("/api/support-cases/facets")
+    assert response.status_code == 200
+    assert queries == []
+
+
+def test_unchanged_listing_returns_304_after_one_query(postgres, queries):
+    """Prueba que un listado sin cambios solo consulta la versión de la tabla"""
+    etag = client.get("/api/support-cases/?status=pendiente").headers["ETag"]
+    queries.clear()
+    response = client.get("/api/support-cases/?status=pendiente", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert len(queries) == 1
+
+    # Cualquier escritura cambia la versión
+    client.patch(
+        "/api/support-cases/status", json={"ids": [seed_case_id(15)], "status": "en_proceso"}
+    )
+    response = client.get("/api/support-cases/?status=pendiente", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+LISTING_FILTERS = {
+    "none": "",
+    "status": "status=pendiente",
+    "status_priority": "status=pendiente&priority=alta",
+    "database_schema": "database_name=finkargo_clientes&schema_name=clientes",
+    "executed_by": "executed_by=ana.martinez@finkargo.com",
+    "created_range": "start_date=2025-02-01T00:00:00&end_date=2025-02-08T00:00:00",
+    "updated_range": "updated_start_date=2025-02-01T00:00:00&updated_end_date=2025-02-08T00:00:00",
+    "statement_type": "statement_type=DELETE",
+    "target_table": "target_table=envios",
+    "sql_fingerprint": f"sql_fingerprint={seed_fingerprint(7)}",
+    "id": f"id={seed_case_id(42)}",
+    "multi_status_range": "status=pendiente,en_proceso&start_date=2025-02-01T00:00:00",
+    "deep_page": "page=150&size=100",
+}
+
+
+@pytest.mark.parametrize("name", list(LISTING_FILTERS))
+def test_listing_plan_per_filter(name, postgres, queries, plan_baselines):
+    """Prueba que cada combinación de filtros del listado conserva su plan"""
+    response = client.get(f"/api/support-cases/?{LISTING_FILTERS[name]}")
+
+    assert response.status_code == 200, response.text
+    assert response.json()["success"] is True
+    # Versión de la tabla (ETag), página y COUNT, nada más
+    assert len(queries) == 3
+    check_plans(f"listing:{name}", postgres, queries, plan_baselines)
+
+
+def test_write_endpoints_query_count(postgres, queries):
+    """Prueba cuántas consultas emiten las escrituras"""
+    response = client.post("/api/support-cases/", json=NEW_CASE)
+    assert response.status_code == 200, response.text
+    assert len(queries) == 1
+
+    # El mismo envío otra vez: la inserción se omite y se busca el caso abierto
+    queries.clear()
+    response = client.post("/api/support-cases/", json=NEW_CASE)
+    assert response.status_code == 409
+    assert len(queries) == 2
+
+    queries.clear()
+    response = client.patch(
+        "/api/support-cases/status",
+        json={"ids": [seed_case_id(5), seed_case_id(10)], "status": "en_proceso"},
+    )
+    assert response.status_code == 200
+    assert len(queries) == 1
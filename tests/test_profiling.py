@@ -0,0 +1,163 @@
+import marshal
+import pstats
+import threading
+from datetime import datetime
+from types import SimpleNamespace
+from uuid import uuid4
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+
+client = TestClient(app)
+
+ADMIN = {"X-Admin-Token": "secreto"}
+
+
+class FakeCursor:
+    def __init__(self, row):
+        self.row = row
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params):
+        pass
+
+    def fetchone(self):
+        return self.row
+
+
+class FakeDatabase:
+    def __init__(self, row):
+        self.row = row
+
+    def get_connection(self, autocommit=False):
+        return SimpleNamespace(cursor=lambda: FakeCursor(self.row), commit=lambda: None)
+
+    def return_connection(self, conn):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def admin_token(monkeypatch):
+    monkeypatch.setattr("utils.profiling.get_settings", lambda: SimpleNamespace(admin_token="secreto"))
+
+
+@pytest.fixture
+def fake_case(monkeypatch):
+    case_id = str(uuid4())
+    now = datetime(2025, 4, 1, 12, 0)
+    row = (
+        case_id, "Corregir dirección cliente", "Dirección incorrecta en registro",
+        "finkargo_clientes", "clientes", "UPDATE clientes SET direccion = 'x' WHERE id = 1",
+        "maria.gonzalez@finkargo.com", "pendiente", "media", now, now, None,
+        "UPDATE", ["clientes"], "0f1e2d3c4b5a6978", None, None,
+    )
+    monkeypatch.setattr("database.connection.get_database", lambda shard=None: FakeDatabase(row))
+    return case_id
+
+
+@pytest.mark.parametrize("headers", [{}, {"X-Admin-Token": "otro"}])
+def test_admin_routes_require_token(headers):
+    """Prueba que las rutas de administración exigen el token"""
+    for method, path in [
+        ("post", "/api/admin/profile?seconds=0.1"),
+        ("get", "/api/admin/profiles"),
+        ("post", "/api/admin/tracemalloc/start"),
+        ("get", "/api/admin/tracemalloc"),
+    ]:
+        response = getattr(client, method)(path, headers=headers)
+        assert response.status_code == 403
+        assert response.json()["error_code"] == "FORBIDDEN"
+
+
+def test_admin_routes_disabled_without_configured_token(monkeypatch):
+    """Prueba que sin ADMIN_TOKEN configurado ningún token sirve"""
+    monkeypatch.setattr("utils.profiling.get_settings", lambda: SimpleNamespace(admin_token=""))
+    assert client.get("/api/admin/profiles", headers={"X-Admin-Token": ""}).status_code == 403
+
+
+def test_profile_single_request(fake_case, tmp_path):
+    """Prueba el perfil de una petición, incluido el trabajo en el hilo de la consulta"""
+    response = client.get(
+        f"/api/support-cases/case/{fake_case}", headers={"X-Profile": "1", **ADMIN}
+    )
+    assert response.status_code == 200
+    profile_id = response.headers["X-Profile-Id"]
+
+    listed = client.get("/api/admin/profiles", headers=ADMIN).json()["profiles"]
+    assert listed[0]["id"] == profile_id
+    assert listed[0]["path"] == f"/api/support-cases/case/{fake_case}"
+
+    text = client.get(f"/api/admin/profiles/{profile_id}?limit=1000", headers=ADMIN).text
+    assert "get_case_by_id" in text
+    assert "_execute_sync" in text
+
+    raw = client.get(f"/api/admin/profiles/{profile_id}?format=pstats", headers=ADMIN).content
+    path = tmp_path / "request.pstats"
+    path.write_bytes(raw)
+    functions = {name for _, _, name in pstats.Stats(str(path)).stats}
+    assert "_execute_sync" in functions
+    assert marshal.loads(raw)
+
+
+def test_profile_header_ignored_without_token(fake_case):
+    """Prueba que X-Profile sin token no perfila la petición"""
+    response = client.get(f"/api/support-cases/case/{fake_case}", headers={"X-Profile": "1"})
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+
+
+def test_unknown_profile_returns_404():
+    response = client.get("/api/admin/profiles/noexiste", headers=ADMIN)
+    assert response.status_code == 404
+
+
+def busy_loop_for_sampling(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sampling_profile_returns_collapsed_stacks():
+    """Prueba que el muestreo devuelve pilas colapsadas de los demás hilos"""
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_loop_for_sampling, args=(stop,), name="ocupado")
+    worker.start()
+    try:
+        response = client.post("/api/admin/profile?seconds=0.2&interval_ms=2", headers=ADMIN)
+    finally:
+        stop.set()
+        worker.join()
+
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    busy = [line for line in lines if line.startswith("ocupado;")]
+    assert busy
+    stack, count = busy[0].rsplit(" ", 1)
+    assert "busy_loop_for_sampling (test_profiling.py:" in stack
+    assert int(count) > 0
+
+
+def test_tracemalloc_reports_allocation_growth():
+    """Prueba el informe de los sitios que más memoria asignan desde el inicio"""
+    assert client.post("/api/admin/tracemalloc/start", headers=ADMIN).status_code == 200
+    try:
+        retained = [bytearray(1024) for _ in range(2000)]
+        response = client.get("/api/admin/tracemalloc?compare=true&limit=5", headers=ADMIN)
+        assert response.status_code == 200
+        report = response.json()
+        assert report["traced_current_bytes"] > 0
+        top = report["top"][0]
+        assert "test_profiling.py" in top["site"]
+        assert top["size_diff_bytes"] >= 2000 * 1024
+        del retained
+    finally:
+        client.post("/api/admin/tracemalloc/stop", headers=ADMIN)
+
+    response = client.get("/api/admin/tracemalloc", headers=ADMIN)
+    assert response.status_code == 409
+    assert response.json()["error_code"] == "TRACEMALLOC_NOT_STARTED"
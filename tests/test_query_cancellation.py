@@ -0,0 +1,156 @@
+import asyncio
+import threading
+from unittest.mock import AsyncMock, patch
+import pytest
+from fastapi.testclient import TestClient
+
+from database.connection import execute
+from main import app
+from models.support_responses import PaginatedResponse
+from utils.disconnect import CancelOnDisconnectMiddleware
+from utils.metrics import metrics
+from utils.statement_timeout import (
+    current_statement_timeout,
+    reset_statement_timeout,
+    set_statement_timeout,
+)
+
+client = TestClient(app)
+
+
+class BlockingConnection:
+    """Conexión cuya consulta no termina hasta que se cancela en el servidor"""
+
+    def __init__(self):
+        self.queries = []
+        self.cancelled = threading.Event()
+        self.rolled_back = False
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params):
+        self.queries.append(query)
+        if "pg_sleep" in query and not self.cancelled.wait(timeout=5):
+            raise AssertionError("la consulta no se canceló")
+        if self.cancelled.is_set():
+            raise RuntimeError("canceling statement due to user request")
+
+    def fetchall(self):
+        return []
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.connection = BlockingConnection()
+        self.returned = threading.Event()
+
+    def get_connection(self, autocommit=False):
+        return self.connection
+
+    def return_connection(self, conn):
+        self.returned.set()
+
+
+@pytest.fixture
+def fake_database(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr("database.connection.get_database", lambda shard=None: database)
+    return database
+
+
+@pytest.mark.asyncio
+async def test_statement_timeout_is_set_in_the_query_transaction(fake_database):
+    """Prueba que el presupuesto de la ruta se aplica con SET LOCAL en el mismo envío"""
+    token = set_statement_timeout(1500)
+    try:
+        await execute("SELECT 1", fetch_all=True)
+    finally:
+        reset_statement_timeout(token)
+    await execute("SELECT 2", fetch_all=True)
+
+    assert fake_database.connection.queries == [
+        "SET LOCAL statement_timeout = 1500;\nSELECT 1",
+        "SELECT 2",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_request_cancels_query_on_server(fake_database):
+    """Prueba que cancelar la petición cancela la consulta y devuelve la conexión"""
+    metrics.reset()
+    task = asyncio.create_task(execute("SELECT pg_sleep(60)", fetch_all=True))
+    await asyncio.sleep(0.05)
+    task.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert fake_database.connection.cancelled.is_set()
+    assert fake_database.returned.is_set()
+    assert fake_database.connection.rolled_back
+    assert metrics.snapshot()["counters"]["db_queries_cancelled_total"] == 1
+
+
+@pytest.mark.asyncio
+async def test_client_disconnect_cancels_running_request():
+    """Prueba que una desconexión antes de la respuesta cancela la app"""
+    metrics.reset()
+    started, cancelled = asyncio.Event(), asyncio.Event()
+
+    async def slow_app(scope, receive, send):
+        await receive()
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await started.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        raise AssertionError("no debe enviarse respuesta")
+
+    middleware = CancelOnDisconnectMiddleware(slow_app)
+    await asyncio.wait_for(middleware({"type": "http", "method": "GET", "path": "/"}, receive, send), 1)
+
+    assert cancelled.is_set()
+    assert metrics.snapshot()["counters"]["requests_cancelled_on_disconnect_total"] == 1
+
+
+def test_routes_apply_their_budget():
+    """Prueba que cada ruta fija su statement_timeout para sus consultas"""
+    seen = {}
+
+    async def fake_list(**kwargs):
+        seen["timeout"] = current_statement_timeout()
+        return PaginatedResponse(success=True, message="ok", items=[], total=0, page=1, size=10, total_pages=0)
+
+    with patch("routes.support_cases.SupportService.get_paginated_cases", side_effect=fake_list), \
+            patch("routes.support_cases.SupportService.get_listing_etag", new=AsyncMock(return_value=None)):
+        response = client.get("/api/support-cases/")
+
+    assert response.status_code == 200
+    assert seen["timeout"] == 10000
@@ -0,0 +1,101 @@
+import json
+import logging
+from datetime import datetime
+from types import SimpleNamespace
+from uuid import uuid4
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+
+client = TestClient(app)
+
+
+class FakeCursor:
+    def __init__(self, row):
+        self.row = row
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params):
+        pass
+
+    def fetchone(self):
+        return self.row
+
+
+class FakeDatabase:
+    """Sustituye al pool: devuelve siempre la misma fila"""
+
+    def __init__(self, row):
+        self.row = row
+
+    def get_connection(self, autocommit=False):
+        return SimpleNamespace(cursor=lambda: FakeCursor(self.row), commit=lambda: None)
+
+    def return_connection(self, conn):
+        pass
+
+
+@pytest.fixture
+def fake_case(monkeypatch):
+    case_id = str(uuid4())
+    now = datetime(2025, 4, 1, 12, 0)
+    row = (
+        case_id, "Corregir dirección cliente", "Dirección incorrecta en registro",
+        "finkargo_clientes", "clientes", "UPDATE clientes SET direccion = 'x' WHERE id = 1",
+        "maria.gonzalez@finkargo.com", "pendiente", "media", now, now, None,
+        "UPDATE", ["clientes"], "0f1e2d3c4b5a6978", None, None,
+    )
+    monkeypatch.setattr("database.connection.get_database", lambda shard=None: FakeDatabase(row))
+    return case_id
+
+
+def parse_server_timing(header: str) -> dict:
+    entries = {}
+    for entry in header.split(", "):
+        name, *params = entry.split(";")
+        entries[name] = dict(param.split("=", 1) for param in params)
+    return entries
+
+
+def test_server_timing_header_breakdown(fake_case):
+    """Prueba que la respuesta incluye el desglose de tiempos por fase"""
+    response = client.get(f"/api/support-cases/case/{fake_case}")
+
+    assert response.status_code == 200
+    entries = parse_server_timing(response.headers["Server-Timing"])
+    for name in ("validation", "db-acquire", "db-1", "mapping", "endpoint", "serialization", "total"):
+        assert name in entries, entries
+        assert float(entries[name]["dur"]) >= 0
+    assert entries["db-1"]["desc"] == '"SELECT support_cases shard 0"'
+    assert float(entries["total"]["dur"]) >= float(entries["db-1"]["dur"])
+
+
+def test_server_timing_header_without_database():
+    """Prueba que las rutas sin consultas también llevan la cabecera"""
+    response = client.get("/openapi.json")
+
+    entries = parse_server_timing(response.headers["Server-Timing"])
+    assert list(entries) == ["total"]
+
+
+def test_slow_requests_are_logged(fake_case, monkeypatch, caplog):
+    """Prueba que una petición lenta deja una línea de log estructurada"""
+    monkeypatch.setattr(
+        "config.get_settings",
+        lambda: SimpleNamespace(timing_log_sample_rate=0.0, timing_log_slow_ms=0.0),
+    )
+    with caplog.at_level(logging.INFO, logger="server_timing"):
+        client.get(f"/api/support-cases/case/{fake_case}")
+
+    entry = json.loads(caplog.records[-1].getMessage())
+    assert entry["path"] == f"/api/support-cases/case/{fake_case}"
+    assert entry["status"] == 200
+    assert entry["slow"] is True
+    assert entry["db_queries"] == 1
+    assert {"validation", "mapping", "serialization"} <= set(entry["phases"])
@@ -0,0 +1,212 @@
+import os
+import uuid
+from datetime import datetime, timedelta
+from uuid import uuid4
+import pytest
+
+from database.connection import Database
+from database.sharding import ShardRouter, build_router, get_router, set_router
+
+
+@pytest.fixture
+def three_shards():
+    """Router con tres shards sin conexión (las consultas se simulan)"""
+    router = ShardRouter([Database(f"dbname=shard{i}", name=f"shard{i}") for i in range(3)])
+    set_router(router)
+    yield router
+    set_router(None)
+
+
+def make_row(created_at: datetime):
+    """Fila con el orden de CASE_COLUMNS"""
+    return (
+        str(uuid4()), "Corregir dirección cliente", "Dirección incorrecta en registro",
+        "finkargo_clientes", "clientes", "UPDATE clientes SET direccion = 'x' WHERE id = 1",
+        "maria.gonzalez@finkargo.com", "pendiente", "media", created_at, created_at, None,
+        "UPDATE", ["clientes"], "0f1e2d3c4b5a6978", None, None,
+    )
+
+
+def test_shard_for_is_stable_and_balanced():
+    """Prueba que el reparto por hash es determinista y equilibrado"""
+    router = ShardRouter([Database(f"dbname=shard{i}") for i in range(4)])
+    ids = [uuid4() for _ in range(4000)]
+    assert all(router.shard_for(i) == router.shard_for(str(i)) for i in ids[:100])
+
+    groups = router.group_by_shard(ids)
+    assert sorted(groups) == [0, 1, 2, 3]
+    assert all(800 < len(group) < 1200 for group in groups.values())
+
+
+def test_build_router_without_shards_uses_main_database():
+    """Prueba que sin DB_SHARDS todo va al nodo principal"""
+    from database.connection import db
+    router = build_router("")
+    assert router.count == 1
+    assert router.databases[0] is db
+    assert router.shard_for(uuid4()) == 0
+
+    router = build_router("dbname=a, dbname=b")
+    assert [d.dsn for d in router.databases] == ["dbname=a", "dbname=b"]
+    assert not any(d.is_open for d in router.databases)
+
+
+@pytest.mark.asyncio
+async def test_paginated_cases_merges_shards(three_shards, monkeypatch):
+    """Prueba el fan-out: prefijos de cada shard y merge por created_at DESC"""
+    base = datetime(2025, 4, 1)
+    shard_rows = {
+        shard: sorted(
+            (make_row(base - timedelta(hours=shard + 3 * i)) for i in range(10)),
+            key=lambda row: row[9], reverse=True,
+        )
+        for shard in range(3)
+    }
+    calls = []
+
+    async def fake_execute(query, params=None, fetch_one=False, fetch_all=False, shard=None, **kwargs):
+        calls.append((shard, query, params))
+        if fetch_one:
+            return (len(shard_rows[shard]),)
+        return shard_rows[shard][:params[-1]]
+
+    monkeypatch.setattr("services.support_service.execute", fake_execute)
+    from services.support_service import SupportService
+    response = await SupportService.get_paginated_cases(page=2, size=4)
+
+    everything = sorted(
+        (row for rows in shard_rows.values() for row in rows), key=lambda row: row[9], reverse=True
+    )
+    assert response.success is True
+    assert response.total == 30
+    assert [str(case.id) for case in response.items] == [row[0] for row in everything[4:8]]
+    # Cada shard solo entrega los primeros page * size registros
+    page_calls = [c for c in calls if "LIMIT" in c[1]]
+    assert sorted(c[0] for c in page_calls) == [0, 1, 2]
+    assert all(c[2][-1] == 8 and "OFFSET" not in c[1] for c in page_calls)
+
+
+@pytest.mark.asyncio
+async def test_get_case_by_id_goes_to_owning_shard(three_shards, monkeypatch):
+    """Prueba que la búsqueda por ID consulta solo el shard dueño"""
+    row = make_row(datetime(2025, 4, 1))
+    shards = []
+
+    async def fake_execute(query, params=None, fetch_one=False, fetch_all=False, shard=None, **kwargs):
+        shards.append(shard)
+        return row
+
+    monkeypatch.setattr("services.support_service.execute", fake_execute)
+    from services.support_service import SupportService
+    response = await SupportService.get_case_by_id(row[0])
+
+    assert response.success is True
+    assert shards == [three_shards.shard_for(row[0])]
+
+
+@pytest.mark.asyncio
+async def test_events_merge_shards_by_time_and_id(three_shards, monkeypatch):
+    """Prueba que los eventos de varios shards se combinan por (occurred_at, id)"""
+    base = datetime(2025, 4, 1)
+    case_id = str(uuid4())
+    # Ids intercalados por shard (k+1, k+1+3, ...) que no siguen el orden temporal
+    shard_rows = {
+        0: [(1, case_id, "created", None, "pendiente", "a", base + timedelta(minutes=5))],
+        1: [
+            (2, case_id, "created", None, "pendiente", "a", base + timedelta(minutes=1)),
+            (5, case_id, "created", None, "pendiente", "a", base + timedelta(minutes=5)),
+        ],
+        2: [(3, case_id, "created", None, "pendiente", "a", base + timedelta(minutes=9))],
+    }
+    calls = []
+
+    async def fake_execute(query, params=None, fetch_one=False, fetch_all=False, shard=None, **kwargs):
+        calls.append((query, params))
+        return shard_rows[shard]
+
+    monkeypatch.setattr("services.event_service.execute", fake_execute)
+    from services.event_service import EventService
+    response = await EventService.get_events(base, base + timedelta(days=1), limit=3)
+
+    assert [e.id for e in response.items] == [2, 1, 5]
+    assert response.next_after_id == 5
+    assert response.next_after_occurred_at == base + timedelta(minutes=5)
+    assert "ORDER BY occurred_at, id" in calls[0][0]
+
+
+def test_events_keyset_raises_window_start():
+    """Prueba que el cursor acota el inicio de la ventana y compara (occurred_at, id)"""
+    from database.support_queries import build_events_query
+    start, end = datetime(2025, 4, 1), datetime(2025, 4, 2)
+    cursor = datetime(2025, 4, 1, 12)
+
+    query, params = build_events_query(start, end, ["created"], None, (cursor, 42), 100)
+
+    assert "occurred_at >= %s AND occurred_at < %s AND (occurred_at, id) > (%s, %s)" in query
+    assert params == [cursor, end, cursor, 42, ["created"], 100]
+
+
+def test_events_cursor_requires_both_fields():
+    """Prueba que after_id sin after_occurred_at se rechaza"""
+    from fastapi.testclient import TestClient
+    from main import app
+    response = TestClient(app).get(
+        "/api/support-cases/events?start=2025-04-01T00:00:00&end=2025-04-02T00:00:00&after_id=3"
+    )
+    assert response.status_code == 400
+
+
+# --- Integración con varias instancias locales de PostgreSQL -----------------
+# TEST_SHARD_DSNS="dbname=s0 host=localhost port=5433 user=postgres,dbname=s1 ..."
+
+SHARD_DSNS = os.getenv("TEST_SHARD_DSNS", "")
+
+
+@pytest.mark.skipif(not SHARD_DSNS, reason="TEST_SHARD_DSNS no configurado")
+@pytest.mark.asyncio
+async def test_sharding_against_local_postgres():
+    """Prueba de extremo a extremo contra varias instancias de PostgreSQL"""
+    from database.connection import create_tables, execute
+    from services.support_service import SupportService
+
+    router = build_router(SHARD_DSNS)
+    set_router(router)
+    try:
+        for shard in range(router.count):
+            await execute("DROP TABLE IF EXISTS support_cases", shard=shard)
+            await execute("DROP TABLE IF EXISTS support_case_events", shard=shard)
+            await execute("DROP SEQUENCE IF EXISTS support_case_events_id_seq", shard=shard)
+        await create_tables()
+
+        created = []
+        for i in range(12):
+            response = await SupportService.create_support_case(
+                title=f"Caso {i}",
+                description="Prueba de sharding",
+                database_name="finkargo_clientes",
+                schema_name="clientes",
+                sql_query=f"UPDATE clientes SET estado = 'x' WHERE id = {i}",
+                executed_by="juan.perez@finkargo.com",
+                priority="media",
+            )
+            assert response.success is True, response.message
+            created.append(response.case)
+
+        for case in created:
+            owner = router.shard_for(case.id)
+            for shard in range(router.count):
+                row = await execute(
+                    "SELECT id FROM support_cases WHERE id = %s", (str(case.id),),
+                    fetch_one=True, shard=shard,
+                )
+                assert (row is not None) == (shard == owner)
+            found = await SupportService.get_case_by_id(str(case.id))
+            assert found.success is True
+
+        page = await SupportService.get_paginated_cases(page=2, size=5)
+        expected = sorted(created, key=lambda c: (c.created_at, str(c.id)), reverse=True)[5:10]
+        assert page.total == 12
+        assert [c.id for c in page.items] == [c.id for c in expected]
+    finally:
+        router.close_all_connections()
+        set_router(None)
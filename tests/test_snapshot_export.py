@@ -0,0 +1,174 @@
+import json
+import os
+from datetime import datetime
+from uuid import uuid4
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+from services.snapshot_export import (
+    DICTIONARY_COLUMNS,
+    INCREMENTAL_EXPORT_QUERY,
+    WATERMARK_FILE,
+    SnapshotDirectoryNotEmpty,
+    SnapshotExporter,
+    read_watermark,
+)
+
+
+def make_row(created_at: datetime, updated_at: datetime, status: str = "pendiente"):
+    """Fila con el orden de CASE_COLUMNS"""
+    return (
+        uuid4(), "Actualizar estado de envío", "Cliente reportó envío pendiente",
+        "finkargo_transacciones", "operaciones",
+        "UPDATE operaciones SET estado = 'enviado' WHERE id = 123",
+        "juan.perez@finkargo.com", status, "alta", created_at, updated_at, None,
+    )
+
+
+class FakeShards:
+    """Sustituye a los shards: filas con el id de la transacción que las escribió.
+
+    ``horizon`` es el xmin del snapshot: la menor transacción aún en curso.
+    """
+
+    def __init__(self, shards=1):
+        self.rows = {shard: [] for shard in range(shards)}
+        self.horizons = {shard: 100 for shard in range(shards)}
+        self.calls = []
+
+    def write(self, row, txid, shard=0):
+        self.rows[shard].append((txid, row))
+
+    def horizon(self, shard):
+        return self.horizons[shard]
+
+    def stream(self, query, params, chunk_size, shard):
+        self.calls.append((query, params, shard))
+        if len(params) == 2:
+            lower, upper = params
+            rows = [r for txid, r in self.rows[shard] if lower <= txid < upper]
+        else:
+            rows = [r for txid, r in self.rows[shard] if txid < params[0]]
+        for start in range(0, len(rows), chunk_size):
+            yield rows[start:start + chunk_size]
+
+    def exporter(self, output_dir, **kwargs):
+        return SnapshotExporter(
+            str(output_dir), stream=self.stream, horizon=self.horizon,
+            shards=len(self.rows), **kwargs
+        )
+
+
+def test_export_partitions_by_month(tmp_path):
+    """Prueba que el snapshot se particiona por mes con columnas de diccionario"""
+    shards = FakeShards()
+    shards.write(make_row(datetime(2025, 3, 10), datetime(2025, 3, 11)), txid=10)
+    shards.write(make_row(datetime(2025, 3, 20), datetime(2025, 3, 21), status="completado"), txid=11)
+    shards.write(make_row(datetime(2025, 4, 2), datetime(2025, 4, 3)), txid=12)
+    summary = shards.exporter(tmp_path, chunk_size=2).run()
+
+    assert summary["rows"] == 3
+    assert summary["partitions"] == ["2025-03", "2025-04"]
+    assert summary["watermark"] == {0: 100}
+
+    march = pq.read_table(os.path.join(tmp_path, "created_month=2025-03"))
+    assert march.num_rows == 2
+    for column in DICTIONARY_COLUMNS:
+        assert pa.types.is_dictionary(march.schema.field(column).type)
+    assert sorted(march.column("status").to_pylist()) == ["completado", "pendiente"]
+    assert not any(name.endswith(".tmp") for _, _, files in os.walk(tmp_path) for name in files)
+
+
+def test_incremental_export_uses_watermark(tmp_path):
+    """Prueba que la segunda ejecución solo exporta filas escritas desde el horizonte"""
+    shards = FakeShards()
+    shards.write(make_row(datetime(2025, 3, 10), datetime(2025, 3, 11)), txid=10)
+    shards.exporter(tmp_path).run()
+    assert read_watermark(str(tmp_path)) == {0: 100}
+
+    shards.write(make_row(datetime(2025, 3, 15), datetime(2025, 5, 1)), txid=120)
+    shards.horizons[0] = 150
+    summary = shards.exporter(tmp_path).run()
+
+    assert summary["incremental"] is True
+    assert summary["rows"] == 1
+    assert summary["partitions"] == ["2025-03"]
+    assert shards.calls[-1] == (INCREMENTAL_EXPORT_QUERY, (100, 150), 0)
+    assert read_watermark(str(tmp_path)) == {0: 150}
+
+
+def test_late_commit_is_exported_by_next_run(tmp_path):
+    """Prueba que una transacción abierta durante la exportación no se pierde.
+
+    Con una marca de agua por updated_at, una fila fechada antes de la marca
+    pero confirmada después nunca se exportaba.
+    """
+    shards = FakeShards()
+    shards.write(make_row(datetime(2025, 3, 10), datetime(2025, 3, 11)), txid=90)
+    # La transacción 95 sigue abierta: el horizonte se queda en 95
+    shards.horizons[0] = 95
+    assert shards.exporter(tmp_path).run()["rows"] == 1
+
+    # Confirma con un updated_at anterior a todo lo ya exportado
+    shards.write(make_row(datetime(2025, 3, 1), datetime(2025, 3, 2)), txid=95)
+    shards.horizons[0] = 200
+    summary = shards.exporter(tmp_path).run()
+
+    assert summary["rows"] == 1
+    assert read_watermark(str(tmp_path)) == {0: 200}
+
+
+def test_watermark_is_tracked_per_shard(tmp_path):
+    """Prueba que cada shard avanza con su propio horizonte"""
+    shards = FakeShards(shards=2)
+    shards.horizons = {0: 100, 1: 7000}
+    shards.write(make_row(datetime(2025, 3, 10), datetime(2025, 3, 11)), txid=50, shard=0)
+    shards.write(make_row(datetime(2025, 4, 10), datetime(2025, 4, 11)), txid=6000, shard=1)
+    assert shards.exporter(tmp_path).run()["rows"] == 2
+
+    shards.write(make_row(datetime(2025, 4, 12), datetime(2025, 4, 13)), txid=7001, shard=1)
+    shards.horizons = {0: 110, 1: 7100}
+    summary = shards.exporter(tmp_path).run()
+
+    assert summary["rows"] == 1
+    assert [call[1] for call in shards.calls[-2:]] == [(100, 110), (7000, 7100)]
+
+
+def test_incremental_export_without_changes_writes_no_files(tmp_path):
+    """Prueba que una ejecución sin cambios no escribe archivos"""
+    shards = FakeShards()
+    shards.write(make_row(datetime(2025, 3, 10), datetime(2025, 3, 11)), txid=10)
+    shards.exporter(tmp_path).run()
+    summary = shards.exporter(tmp_path).run()
+
+    assert summary["rows"] == 0
+    assert summary["files"] == []
+    assert read_watermark(str(tmp_path)) == {0: 100}
+
+
+def test_legacy_watermark_triggers_full_export(tmp_path):
+    """Prueba que una marca de agua por updated_at provoca una exportación completa"""
+    with open(os.path.join(tmp_path, WATERMARK_FILE), "w") as f:
+        json.dump({"updated_at": "2025-03-11T00:00:00", "rows": 1}, f)
+    shards = FakeShards()
+    shards.write(make_row(datetime(2025, 3, 10), datetime(2025, 3, 11)), txid=10)
+
+    summary = shards.exporter(tmp_path).run()
+
+    assert summary["incremental"] is False
+    assert summary["rows"] == 1
+
+
+def test_full_export_refuses_existing_snapshot(tmp_path):
+    """Prueba que --full sobre un snapshot existente no duplica las filas"""
+    shards = FakeShards()
+    shards.write(make_row(datetime(2025, 3, 10), datetime(2025, 3, 11)), txid=10)
+    shards.exporter(tmp_path).run()
+
+    with pytest.raises(SnapshotDirectoryNotEmpty):
+        shards.exporter(tmp_path).run(incremental=False)
+
+    assert pq.read_table(os.path.join(tmp_path, "created_month=2025-03")).num_rows == 1
+    assert len(shards.calls) == 1
@@ -0,0 +1,162 @@
+import uuid
+from unittest.mock import AsyncMock, patch
+import pytest
+from fastapi.testclient import TestClient
+
+from database.support_queries import INSERT_CASE, LOCK_SUBMISSIONS, build_case_filters
+from main import app
+from utils.sql_analyzer import analyze_sql, submission_hash
+
+client = TestClient(app)
+
+
+@pytest.mark.parametrize("sql, statement_type, tables", [
+    ("UPDATE operaciones.facturas SET estado = 'pagada' WHERE id = 123", "UPDATE", ["facturas"]),
+    ("delete from facturas where id in (1, 2, 3)", "DELETE", ["facturas"]),
+    ("INSERT INTO clientes (id, nombre) VALUES (1, 'a'), (2, 'b')", "INSERT", ["clientes"]),
+    ("SELECT * FROM pedidos p JOIN envios e ON e.pedido_id = p.id", "SELECT", ["pedidos", "envios"]),
+    (
+        "WITH vencidas AS (SELECT id FROM facturas WHERE EXTRACT(YEAR FROM fecha) < 2024)"
+        " DELETE FROM pagos USING vencidas WHERE pagos.factura_id = vencidas.id",
+        "DELETE", ["pagos", "facturas"],
+    ),
+    ("ALTER TABLE IF EXISTS public.clientes ADD COLUMN telefono TEXT", "ALTER", ["clientes"]),
+    ("TRUNCATE TABLE logs; DELETE FROM pagos WHERE id = 1", "MULTIPLE", ["logs", "pagos"]),
+    ("-- solo un comentario", "OTHER", []),
+    ("UPDATE ONLY facturas SET estado = 'anulada' WHERE id = 7", "UPDATE", ["facturas"]),
+    ("DELETE FROM ONLY operaciones.facturas WHERE id = 7", "DELETE", ["facturas"]),
+    (
+        "SELECT * FROM facturas f, pagos AS p, clientes WHERE p.factura_id = f.id",
+        "SELECT", ["facturas", "pagos", "clientes"],
+    ),
+    (
+        "DELETE FROM pagos USING facturas f, clientes c WHERE pagos.factura_id = f.id",
+        "DELETE", ["pagos", "facturas", "clientes"],
+    ),
+    ("BEGIN; DELETE FROM facturas WHERE id = 7; COMMIT;", "DELETE", ["facturas"]),
+    (
+        "START TRANSACTION; SET LOCAL statement_timeout = '5s';"
+        " UPDATE pagos SET monto = 0 WHERE id = 1; END;",
+        "UPDATE", ["pagos"],
+    ),
+    ("BEGIN; ROLLBACK;", "OTHER", []),
+    (
+        "WITH x AS (DELETE FROM facturas WHERE vencida RETURNING id) SELECT * FROM x",
+        "DELETE", ["facturas"],
+    ),
+    (
+        "WITH nuevas AS (INSERT INTO pagos (monto) VALUES (1) RETURNING id),"
+        " borradas AS MATERIALIZED (DELETE FROM pagos_pendientes WHERE id = 1)"
+        " SELECT * FROM nuevas",
+        "DELETE", ["pagos_pendientes", "pagos"],
+    ),
+    (
+        "WITH datos (id, estado) AS (VALUES (1, 'pagada'))"
+        " UPDATE facturas f SET estado = d.estado FROM datos d WHERE f.id = d.id",
+        "UPDATE", ["facturas"],
+    ),
+    ("SELECT * FROM facturas WHERE id = 1 FOR UPDATE", "SELECT", ["facturas"]),
+    (
+        "INSERT INTO pagos (id) VALUES (1) ON CONFLICT (id) DO UPDATE SET monto = 0",
+        "INSERT", ["pagos"],
+    ),
+])
+def test_analyze_sql(sql, statement_type, tables):
+    """Prueba el tipo de sentencia y las tablas extraídas"""
+    analysis = analyze_sql(sql)
+    assert analysis.statement_type == statement_type
+    assert analysis.target_tables == tables
+
+
+def test_insert_case_tables_do_not_include_its_ctes():
+    """Prueba que las CTE con lista de columnas no aparecen como tablas"""
+    statement = INSERT_CASE[len(LOCK_SUBMISSIONS):]
+    analysis = analyze_sql(statement)
+
+    assert analysis.statement_type == "INSERT"
+    assert analysis.target_tables == ["support_cases", "support_case_events", "support_case_payloads"]
+    assert analyze_sql(INSERT_CASE).statement_type == "MULTIPLE"
+
+
+def test_fingerprint_ignores_literals_and_formatting():
+    """Prueba que la huella no depende de literales, mayúsculas ni espacios"""
+    first = analyze_sql("DELETE FROM facturas WHERE id IN (1, 2, 3) AND estado = 'anulada'")
+    second = analyze_sql("delete  from facturas\nwhere id in (42) and estado = 'x' -- limpieza")
+    other = analyze_sql("DELETE FROM pagos WHERE id IN (1, 2, 3) AND estado = 'anulada'")
+    assert first.fingerprint == second.fingerprint
+    assert first.fingerprint != other.fingerprint
+    assert len(first.fingerprint) == 16
+
+
+def test_target_table_filter_uses_array_overlap():
+    """Prueba que el filtro por tabla compila a && sobre target_tables"""
+    where, params = build_case_filters({
+        "statement_type": ["DELETE"],
+        "target_table": ["facturas", "pagos"],
+    })
+    assert where == " WHERE statement_type = %s AND target_tables && %s::text[]"
+    assert params == ["DELETE", ["facturas", "pagos"]]
+
+
+def test_target_table_filter_is_case_insensitive():
+    """Prueba que el filtro por tabla usa los nombres en minúsculas salvo entre comillas"""
+    from models.support_schema import PaginationParams
+    params = PaginationParams(target_table=['Facturas,"Pagos"'])
+    assert params.target_table == ["facturas", "Pagos"]
+
+
+def test_statement_type_filter_validation():
+    """Prueba que el tipo de sentencia se normaliza y se valida"""
+    with patch("services.support_service.execute", new_callable=AsyncMock) as mock_execute:
+        # Versión de la tabla (ETag), página y conteo
+        mock_execute.side_effect = [(0, []), [], (0,)]
+        response = client.get("/api/support-cases/?statement_type=delete&target_table=facturas")
+        assert response.status_code == 200
+        page_params = mock_execute.call_args_list[1].args[1]
+        assert "DELETE" in page_params and ["facturas"] in page_params
+
+    response = client.get("/api/support-cases/?statement_type=BORRAR")
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_create_case_stores_sql_metadata():
+    """Prueba que la creación guarda el análisis de la consulta"""
+    with patch("services.support_service.execute", new_callable=AsyncMock) as mock_execute:
+        mock_execute.return_value = (str(uuid.uuid4()),)
+        from services.support_service import SupportService
+        response = await SupportService.create_support_case(
+            title="Anular facturas", description="Facturas duplicadas",
+            database_name="finkargo_transacciones", schema_name="operaciones",
+            sql_query="DELETE FROM facturas WHERE id IN (10, 11)",
+            executed_by="juan.perez@finkargo.com", priority="alta",
+        )
+
+    # Parámetros: hashes a bloquear y la fila (..., tipo, tablas, huella, hash, allow_duplicate)
+    params = mock_execute.call_args.args[1]
+    assert params[12:15] == ("DELETE", ["facturas"], response.case.sql_fingerprint)
+    assert response.case.statement_type == "DELETE"
+
+
+@pytest.mark.asyncio
+async def test_backfill_updates_rows_in_batches():
+    """Prueba el backfill por lotes con cursor por id"""
+    ids = [uuid.UUID(int=i) for i in range(1, 4)]
+    rows = [
+        (case_id, "UPDATE clientes SET estado = 'x' WHERE id = 1", "finkargo_clientes", "clientes")
+        for case_id in ids
+    ]
+    with patch("services.sql_metadata_backfill.execute", new_callable=AsyncMock) as mock_execute, \
+            patch("services.sql_metadata_backfill.create_indexes", new_callable=AsyncMock):
+        mock_execute.side_effect = [None, rows[:2], None, rows[2:], None]
+        from services.sql_metadata_backfill import backfill_shard
+        updated = await backfill_shard(0, batch_size=2)
+
+    assert updated == 3
+    selects = [c for c in mock_execute.call_args_list if "SELECT id, sql_query" in c.args[0]]
+    assert selects[1].args[1] == (str(ids[1]), 2)
+    last_update = mock_execute.call_args_list[-1].args
+    assert last_update[1] == (
+        str(ids[2]), "UPDATE", ["clientes"], analyze_sql(rows[2][1]).fingerprint,
+        submission_hash(rows[2][1], "finkargo_clientes", "clientes"),
+    )
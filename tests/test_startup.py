@@ -0,0 +1,64 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# Presupuestos en segundos; se pueden ajustar por entorno en máquinas lentas
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "1.5"))
+COLD_START_BUDGET = float(os.getenv("COLD_START_BUDGET", "2.5"))
+
+COLD_START_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+client = TestClient(main.app)
+client.get("/openapi.json")
+ready = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "cold_start": ready - start,
+    "psycopg2_loaded": "psycopg2" in sys.modules,
+    "pool_open": main.db.is_open,
+}))
+"""
+
+
+def measure_cold_start(runs: int = 3) -> dict:
+    """Run the cold-start script in fresh interpreters and keep the best run"""
+    # Sin variables DB_*: importar la app no debe necesitar la base de datos
+    env = {k: v for k, v in os.environ.items() if not k.upper().startswith("DB_")}
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", COLD_START_SCRIPT],
+            cwd=PROJECT_ROOT,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    return min(results, key=lambda r: r["cold_start"])
+
+
+def test_import_does_not_touch_database():
+    """Importar main no carga psycopg2 ni abre el pool"""
+    result = measure_cold_start(runs=1)
+    assert result["psycopg2_loaded"] is False
+    assert result["pool_open"] is False
+
+
+def test_import_time_budget():
+    """El import de la app y el primer request quedan dentro del presupuesto"""
+    result = measure_cold_start()
+    assert result["import"] < IMPORT_TIME_BUDGET, result
+    assert result["cold_start"] < COLD_START_BUDGET, result
+
+
+if __name__ == "__main__":
+    print(json.dumps(measure_cold_start(), indent=2))
@@ -58,19 +58,27 @@ def mock_db_success(monkeypatch):
     async def mock_get_paginated_cases(
         page: int, 
         size: int,
+        id: Optional[str] = None,
         status: Optional[str] = None,
         database_name: Optional[str] = None,
         schema_name: Optional[str] = None,
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None,
-        executed_by: Optional[str] = None
+        executed_by: Optional[str] = None,
+        priority: Optional[str] = None,
+        updated_start_date: Optional[datetime] = None,
+        updated_end_date: Optional[datetime] = None,
+        statement_type: Optional[str] = None,
+        target_table: Optional[str] = None,
+        sql_fingerprint: Optional[str] = None,
+        etag: Optional[str] = None
     ):
-        # Aplicar filtros a los casos de prueba
+        # Aplicar filtros a los casos de prueba (los filtros llegan como listas)
         filtered_cases = TEST_CASES
         if status:
-            filtered_cases = [c for c in filtered_cases if c.status == status]
+            filtered_cases = [c for c in filtered_cases if c.status in status]
         if database_name:
-            filtered_cases = [c for c in filtered_cases if c.database_name == database_name]
+            filtered_cases = [c for c in filtered_cases if c.database_name in database_name]
         # Aplicar otros filtros según sea necesario...
         
         start = (page - 1) * size
@@ -83,13 +91,18 @@ def mock_db_success(monkeypatch):
             items=paginated_items,
             total=len(filtered_cases),
             page=page,
-            size=size
+            size=size,
+            total_pages=-(-len(filtered_cases) // size)
         )
     
     monkeypatch.setattr(
         "services.support_service.SupportService.get_paginated_cases",
         mock_get_paginated_cases
     )
+    monkeypatch.setattr(
+        "services.support_service.SupportService.get_listing_etag",
+        AsyncMock(return_value=None),
+    )
 
 @pytest.fixture
 def mock_db_error(monkeypatch):
@@ -101,6 +114,10 @@ def mock_db_error(monkeypatch):
         "services.support_service.SupportService.get_paginated_cases",
         mock_get_paginated_cases
     )
+    monkeypatch.setattr(
+        "services.support_service.SupportService.get_listing_etag",
+        AsyncMock(return_value=None),
+    )
 
 def test_get_support_cases_success(mock_db_success):
     """Prueba obtener casos de soporte exitosamente"""
@@ -202,6 +219,53 @@ def test_multiple_filters(mock_db_success):
         for case in data["items"]
     )
 
+def test_multi_value_filters(mock_db_success):
+    """Prueba filtros con valores repetidos y separados por comas"""
+    response = client.get(
+        "/api/support-cases/?status=pendiente,completado"
+        "&database_name=finkargo_clientes&database_name=finkargo_transacciones"
+    )
+    assert response.status_code == 200
+    assert response.json()["total"] == 2
+
+    response = client.get("/api/support-cases/?status=pendiente,en_proceso")
+    data = response.json()
+    assert data["total"] == 1
+    assert data["items"][0]["status"] == "pendiente"
+
+def test_invalid_status_filter():
+    """Prueba que un estado desconocido devuelve error de validación"""
+    response = client.get("/api/support-cases/?status=pendiente,cerrado")
+    assert response.status_code == 422
+    error_data = response.json()
+    assert error_data["error_code"] == "VALIDATION_ERROR"
+    assert any(e["field"] == "status" for e in error_data["errors"])
+
+@pytest.mark.asyncio
+async def test_paginated_cases_compiles_any_filters():
+    """Prueba que los filtros multivalor se compilan a = ANY(%s) en una sola consulta"""
+    with patch('services.support_service.execute', new_callable=AsyncMock) as mock_execute:
+        mock_execute.side_effect = [[], (0,)]
+
+        from services.support_service import SupportService
+        updated_from = datetime(2025, 1, 1)
+        response = await SupportService.get_paginated_cases(
+            page=2,
+            size=5,
+            status=["pendiente", "en_proceso"],
+            priority=["alta"],
+            updated_start_date=updated_from,
+        )
+
+        assert response.success is True
+        page_query, page_params = mock_execute.call_args_list[0].args
+        count_query, count_params = mock_execute.call_args_list[1].args
+        assert "status = ANY(%s)" in page_query
+        assert "priority = %s" in page_query
+        assert "updated_at >= %s" in page_query
+        assert page_params == (["pendiente", "en_proceso"], "alta", updated_from, 5, 5)
+        assert count_params == (["pendiente", "en_proceso"], "alta", updated_from)
+
 @pytest.mark.asyncio
 async def test_create_support_case_success():
     """Prueba creación exitosa de caso de soporte"""
@@ -278,3 +342,357 @@ async def test_create_support_case_data_structure():
         assert isinstance(response.case.id, uuid.UUID)
         assert isinstance(response.case.created_at, datetime)
         assert response.case.updated_at == response.case.created_at
+
+@pytest.mark.asyncio
+async def test_bulk_update_status_outcomes():
+    """Prueba el resultado por ID de la actualización masiva de estado"""
+    updated_id, completed_id, same_id, missing_id = (str(uuid4()) for _ in range(4))
+    with patch('services.support_service.execute', new_callable=AsyncMock) as mock_execute:
+        mock_execute.return_value = [
+            (updated_id, "pendiente", True),
+            (completed_id, "completado", False),
+            (same_id, "en_proceso", False),
+        ]
+
+        from services.support_service import SupportService
+        response = await SupportService.bulk_update_status(
+            ids=[updated_id, completed_id, same_id, missing_id, updated_id],
+            status="en_proceso",
+        )
+
+        # Una sola sentencia para todos los IDs, sin repetidos
+        mock_execute.assert_called_once()
+        query, params = mock_execute.call_args.args
+        assert "id = ANY(%s::uuid[])" in query
+        assert params[0] == [updated_id, completed_id, same_id, missing_id]
+        assert params[1] == "en_proceso"
+        assert "completado" not in params[3]
+
+        assert response.success is True
+        assert response.updated == 1
+        outcomes = {str(r.id): r.outcome for r in response.results}
+        assert outcomes == {
+            updated_id: "updated",
+            completed_id: "invalid_transition",
+            same_id: "unchanged",
+            missing_id: "not_found",
+        }
+        assert [str(r.id) for r in response.results] == [updated_id, completed_id, same_id, missing_id]
+
+def test_bulk_update_status_endpoint(monkeypatch):
+    """Prueba el endpoint de actualización masiva de estado"""
+    case_id = str(uuid4())
+
+    async def mock_bulk_update_status(ids, status, changed_by=None):
+        from models.support_responses import BulkUpdateResponse, BulkUpdateResult
+        return BulkUpdateResponse(
+            success=True,
+            message="Se actualizaron 1 de 1 casos",
+            updated=1,
+            results=[BulkUpdateResult(id=ids[0], outcome="updated", previous="pendiente", current=status)],
+        )
+
+    monkeypatch.setattr(
+        "services.support_service.SupportService.bulk_update_status",
+        mock_bulk_update_status
+    )
+    response = client.patch("/api/support-cases/status", json={"ids": [case_id], "status": "en_proceso"})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["updated"] == 1
+    assert data["results"][0]["outcome"] == "updated"
+
+def test_bulk_update_invalid_status():
+    """Prueba que un estado fuera de CaseStatus se rechaza"""
+    response = client.patch("/api/support-cases/status", json={"ids": [str(uuid4())], "status": "cerrado"})
+    assert response.status_code == 422
+    assert response.json()["error_code"] == "VALIDATION_ERROR"
+
+def _case_row(case: SupportCase):
+    """Fila con el orden de CASE_COLUMNS"""
+    return (
+        case.id, case.title, case.description, case.database_name, case.schema_name,
+        case.sql_query, case.executed_by, case.status, case.priority,
+        case.created_at, case.updated_at, case.execution_result,
+        case.statement_type, case.target_tables, case.sql_fingerprint,
+        case.sql_query_bytes, case.execution_result_bytes,
+    )
+
+@pytest.mark.asyncio
+async def test_get_cases_by_ids_keeps_request_order():
+    """Prueba la búsqueda en lote: una consulta, orden de la solicitud y no encontrados"""
+    first, second = TEST_CASES
+    missing_id = uuid4()
+    with patch('services.support_service.execute', new_callable=AsyncMock) as mock_execute:
+        # La BD devuelve las filas en cualquier orden
+        mock_execute.return_value = [_case_row(first), _case_row(second)]
+
+        from services.support_service import SupportService
+        response = await SupportService.get_cases_by_ids([second.id, missing_id, first.id, second.id])
+
+        mock_execute.assert_called_once()
+        query, params = mock_execute.call_args.args
+        assert "id = ANY(%s::uuid[])" in query
+        assert params == ([str(second.id), str(missing_id), str(first.id)],)
+
+        assert response.success is True
+        assert response.found == 2
+        assert [str(r.id) for r in response.results] == [
+            str(second.id), str(missing_id), str(first.id), str(second.id)
+        ]
+        assert [r.found for r in response.results] == [True, False, True, True]
+        assert response.results[1].case is None
+        assert response.results[0].case.title == second.title
+
+def test_get_cases_batch_limit():
+    """Prueba el límite de IDs por solicitud"""
+    response = client.post("/api/support-cases/batch", json={"ids": [str(uuid4()) for _ in range(201)]})
+    assert response.status_code == 422
+
+def _slow_execute(delay: float):
+    """execute simulado que tarda ``delay`` segundos por consulta"""
+    import asyncio
+
+    async def fake_execute(query, params=None, fetch_one=False, fetch_all=False, **kwargs):
+        await asyncio.sleep(delay)
+        return (1,) if fetch_one else [_case_row(TEST_CASES[0])]
+    return fake_execute
+
+@pytest.mark.asyncio
+async def test_page_and_count_run_concurrently(monkeypatch):
+    """Prueba que la página y el COUNT se ejecutan en paralelo con holgura en el pool"""
+    from services.support_service import SupportService
+    from utils.metrics import metrics
+    metrics.reset()
+    monkeypatch.setattr("services.support_service.execute", _slow_execute(0.2))
+    monkeypatch.setattr("database.connection.db.has_headroom", lambda needed: True)
+
+    start = datetime.now()
+    response = await SupportService.get_paginated_cases(page=1, size=10)
+    elapsed = (datetime.now() - start).total_seconds()
+
+    assert response.success is True
+    assert response.total == 1
+    assert elapsed < 0.35
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]["paginated_queries_parallel_total"] == 1
+    assert snapshot["histograms"]["paginated_queries_saved_ms"]["sum"] > 100
+
+@pytest.mark.asyncio
+async def test_page_and_count_sequential_under_pool_pressure(monkeypatch):
+    """Prueba la ejecución secuencial cuando el pool no tiene holgura"""
+    from services.support_service import SupportService
+    from utils.metrics import metrics
+    metrics.reset()
+    monkeypatch.setattr("services.support_service.execute", _slow_execute(0.01))
+    monkeypatch.setattr("database.connection.db.has_headroom", lambda needed: False)
+
+    response = await SupportService.get_paginated_cases(page=1, size=10)
+
+    assert response.success is True
+    counters = metrics.snapshot()["counters"]
+    assert counters["paginated_queries_sequential_total"] == 1
+    assert "paginated_queries_parallel_total" not in counters
+
+class _TinyPool:
+    """Pool de una conexión que, como ThreadedConnectionPool, falla si se agota"""
+    maxconn = 1
+
+    def __init__(self):
+        self._used = {}
+
+    def getconn(self):
+        from psycopg2.pool import PoolError
+        if self._used:
+            raise PoolError("connection pool exhausted")
+        conn = _TinyConnection()
+        self._used[id(conn)] = conn
+        return conn
+
+    def putconn(self, conn):
+        del self._used[id(conn)]
+
+    def closeall(self):
+        self._used.clear()
+
+
+class _TinyConnection:
+    closed = 0
+
+    def set_isolation_level(self, level):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_exhausted_pool_waits_for_free_connection(monkeypatch):
+    """Prueba que una consulta espera una conexión libre en vez de fallar"""
+    import asyncio
+    from psycopg2.pool import PoolError
+    from database.connection import Database
+
+    database = Database("dbname=test")
+    monkeypatch.setattr(database, "_create_pool", lambda: _TinyPool())
+    first = database.get_connection()
+
+    waiting = asyncio.create_task(asyncio.to_thread(database.get_connection))
+    await asyncio.sleep(0.05)
+    assert not waiting.done()
+    database.return_connection(first)
+    second = await asyncio.wait_for(waiting, timeout=1)
+    database.return_connection(second)
+
+    database.acquire_timeout = 0.01
+    held = database.get_connection()
+    with pytest.raises(PoolError):
+        database.get_connection()
+    database.return_connection(held)
+
+def test_metrics_endpoint():
+    """Prueba que el endpoint de métricas expone el registro"""
+    response = client.get("/api/metrics/")
+    assert response.status_code == 200
+    data = response.json()
+    assert set(data) == {"counters", "gauges", "histograms"}
+    assert "db_pool_in_use" in data["gauges"]
+
+def test_facets_query_excludes_own_filter():
+    """Prueba que cada facet se cuenta con los demás filtros activos"""
+    from database.support_queries import build_facets_query
+    query, params = build_facets_query({"status": ["pendiente", "en_proceso"], "priority": ["alta"]})
+    parts = query.split("UNION ALL")
+    assert len(parts) == 6
+    status_part = next(p for p in parts if "'status' AS facet" in p)
+    priority_part = next(p for p in parts if "'priority' AS facet" in p)
+    assert "status = ANY(%s)" not in status_part and "priority = %s" in status_part
+    assert "priority = %s" not in priority_part and "status = ANY(%s)" in priority_part
+    # 4 facets con ambos filtros + 2 facets con uno solo
+    assert len(params) == 4 * 2 + 2
+
+@pytest.mark.asyncio
+async def test_facets_cached_and_updated_on_create():
+    """Prueba que los facets se sirven desde caché y se ajustan al crear casos"""
+    from services.facet_service import FacetService, facet_cache
+    facet_cache.clear()
+    rows = [
+        ("database_name", "finkargo_db", 3),
+        ("schema_name", "clientes", 3),
+        ("executed_by", "juan.perez@finkargo.com", 3),
+        ("status", "pendiente", 2),
+        ("status", "completado", 1),
+        ("priority", "alta", 3),
+    ]
+    with patch('services.facet_service.execute', new_callable=AsyncMock) as mock_facets_execute, \
+            patch('services.support_service.execute', new_callable=AsyncMock) as mock_execute:
+        mock_facets_execute.return_value = rows
+        mock_execute.return_value = {"id": str(uuid.uuid4())}
+
+        first = await FacetService.get_facets({})
+        assert first.cached is False
+        assert [(f.value, f.count) for f in first.facets["status"]] == [("pendiente", 2), ("completado", 1)]
+
+        from services.support_service import SupportService
+        await SupportService.create_support_case(**VALID_CASE_DATA)
+
+        second = await FacetService.get_facets({})
+        mock_facets_execute.assert_called_once()
+        assert second.cached is True
+        assert [(f.value, f.count) for f in second.facets["status"]] == [("pendiente", 3), ("completado", 1)]
+    facet_cache.clear()
+
+def test_facets_endpoint(monkeypatch):
+    """Prueba el endpoint de facets con filtros"""
+    received = {}
+
+    async def mock_get_facets(filters):
+        from models.support_responses import FacetsResponse, FacetValue
+        received.update(filters)
+        return FacetsResponse(
+            success=True,
+            message="Facets obtenidos exitosamente",
+            facets={"status": [FacetValue(value="pendiente", count=4)]},
+        )
+
+    monkeypatch.setattr("services.facet_service.FacetService.get_facets", mock_get_facets)
+    response = client.get("/api/support-cases/facets?database_name=finkargo_db,finkargo_clientes")
+    assert response.status_code == 200
+    assert response.json()["facets"]["status"][0]["count"] == 4
+    assert received["database_name"] == ["finkargo_db", "finkargo_clientes"]
+    assert "page" not in received
+
+@pytest.mark.asyncio
+async def test_create_support_case_records_event_in_same_statement():
+    """Prueba que la creación y su evento van en una única sentencia"""
+    with patch('services.support_service.execute', new_callable=AsyncMock) as mock_execute:
+        mock_execute.return_value = (str(uuid.uuid4()),)
+
+        from services.support_service import SupportService
+        await SupportService.create_support_case(**VALID_CASE_DATA)
+
+        mock_execute.assert_called_once()
+        query = mock_execute.call_args.args[0]
+        assert "INSERT INTO support_cases" in query
+        assert "INSERT INTO support_case_events" in query
+
+@pytest.mark.asyncio
+async def test_case_timeline_pagination():
+    """Prueba la línea de tiempo de un caso con cursor"""
+    case_id = str(uuid4())
+    now = datetime.now()
+    rows = [
+        (1, case_id, "created", None, "pendiente", "juan.perez@finkargo.com", now),
+        (7, case_id, "status_changed", "pendiente", "en_proceso", "ana.martinez@finkargo.com", now),
+    ]
+    with patch('services.event_service.execute', new_callable=AsyncMock) as mock_execute:
+        mock_execute.return_value = rows
+
+        from services.event_service import EventService
+        response = await EventService.get_case_timeline(case_id, limit=2)
+
+        assert response.success is True
+        assert [e.event_type for e in response.items] == ["created", "status_changed"]
+        assert response.next_after_id == 7
+        assert mock_execute.call_args.args[1] == (case_id, 0, 2)
+
+def test_events_window_validation():
+    """Prueba que la ventana de tiempo de eventos está acotada"""
+    response = client.get("/api/support-cases/events?start=2025-01-01T00:00:00&end=2025-03-01T00:00:00")
+    assert response.status_code == 400
+    assert "31 días" in response.json()["message"]
+
+    response = client.get("/api/support-cases/events?start=2025-01-01T00:00:00")
+    assert response.status_code == 422
+
+def test_listing_etag_and_not_modified():
+    """Prueba el ETag del listado y el 304 mientras la tabla no cambia"""
+    page = PaginatedResponse(
+        success=True, message="ok", items=TEST_CASES, total=2, page=1, size=10, total_pages=1
+    )
+    with patch('services.support_service.execute', new_callable=AsyncMock) as mock_execute, \
+            patch('routes.support_cases.SupportService.get_paginated_cases',
+                  new=AsyncMock(return_value=page)) as listing:
+        mock_execute.return_value = (120, [])
+        first = client.get("/api/support-cases/?status=pendiente")
+        etag = first.headers["ETag"]
+        assert etag.startswith('W/"')
+        assert first.headers["Cache-Control"] == "private, no-cache"
+
+        # Sin cambios: 304 sin cuerpo y sin leer la página
+        cached = client.get(
+            "/api/support-cases/?status=pendiente",
+            headers={"If-None-Match": f'W/"otro", {etag}'},
+        )
+        assert cached.status_code == 304
+        assert cached.content == b""
+        assert cached.headers["ETag"] == etag
+        assert listing.await_count == 1
+
+        # Otros filtros u otra página: otro ETag
+        assert client.get("/api/support-cases/?status=completado").headers["ETag"] != etag
+        assert client.get("/api/support-cases/?status=pendiente&page=2").headers["ETag"] != etag
+
+        # Una escritura nueva o una transacción en curso por debajo del máximo cambian la versión
+        for version in [(121, []), (120, [118])]:
+            mock_execute.return_value = version
+            changed = client.get("/api/support-cases/?status=pendiente", headers={"If-None-Match": etag})
+            assert changed.status_code == 200
+            assert changed.headers["ETag"] != etag
@@ -0,0 +1,183 @@
+import asyncio
+from datetime import datetime
+from unittest.mock import AsyncMock, patch
+from uuid import uuid4
+import httpx
+import pytest
+
+from main import app
+from models.support_responses import (
+    BatchCaseResponse,
+    BatchCaseResult,
+    PaginatedResponse,
+    SupportCase,
+    SupportCaseCreatedResponse,
+)
+from support_client import RetryPolicy, SupportClient, SupportClientError
+
+NO_WAIT = RetryPolicy(attempts=3, backoff=0, backoff_max=0)
+
+NEW_CASE = {
+    "title": "Corregir dirección cliente",
+    "description": "Dirección incorrecta en registro",
+    "database_name": "finkargo_clientes",
+    "schema_name": "clientes",
+    "sql_query": "UPDATE clientes SET direccion = 'x' WHERE id = 1",
+    "executed_by": "maria.gonzalez@finkargo.com",
+    "priority": "media",
+}
+
+
+def make_case(**overrides) -> SupportCase:
+    fields = {
+        **NEW_CASE,
+        "id": uuid4(),
+        "status": "pendiente",
+        "created_at": datetime(2025, 4, 1),
+        "updated_at": datetime(2025, 4, 1),
+    }
+    fields.update(overrides)
+    return SupportCase(**fields)
+
+
+def api_client(**kwargs) -> SupportClient:
+    """Cliente contra la aplicación en proceso (los servicios se simulan)"""
+    return SupportClient("http://test", transport=httpx.ASGITransport(app=app), retry=NO_WAIT, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_iter_cases_fetches_pages_concurrently_in_order():
+    """Prueba que las páginas se piden en paralelo (con límite) y los casos salen en orden"""
+    cases = [make_case() for _ in range(23)]
+    active = {"now": 0, "max": 0}
+
+    async def fake_page(page, size, **filters):
+        active["now"] += 1
+        active["max"] = max(active["max"], active["now"])
+        await asyncio.sleep(0.01)
+        active["now"] -= 1
+        items = cases[(page - 1) * size:page * size]
+        return PaginatedResponse(
+            success=True, message="ok", items=items, total=len(cases),
+            page=page, size=size, total_pages=-(-len(cases) // size),
+        )
+
+    with patch("routes.support_cases.SupportService.get_paginated_cases", side_effect=fake_page), \
+            patch("routes.support_cases.SupportService.get_listing_etag", new=AsyncMock(return_value=None)):
+        async with api_client() as client:
+            received = [case async for case in client.iter_cases(size=5, concurrency=2, status="pendiente")]
+
+    assert [case.id for case in received] == [case.id for case in cases]
+    assert active["max"] == 2
+
+
+@pytest.mark.asyncio
+async def test_listing_is_revalidated_with_etag():
+    """Prueba que una página repetida se pide con If-None-Match y un 304 devuelve la guardada"""
+    page = PaginatedResponse(success=True, message="ok", items=[make_case()], total=1, page=1, size=10, total_pages=1)
+    listing = AsyncMock(return_value=page)
+    with patch("routes.support_cases.SupportService.get_paginated_cases", new=listing), \
+            patch("routes.support_cases.SupportService.get_listing_etag", new=AsyncMock(return_value='W/"v1"')):
+        async with api_client() as client:
+            first = await client.list_cases(status=["pendiente", "en_proceso"])
+            second = await client.list_cases(status=["pendiente", "en_proceso"])
+
+    assert second == first
+    assert listing.await_count == 1
+    assert listing.call_args.kwargs["status"] == ["pendiente", "en_proceso"]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_lookups_are_batched():
+    """Prueba que varias consultas por id simultáneas salen en un solo POST /batch"""
+    known = make_case()
+    missing = uuid4()
+
+    async def fake_batch(ids):
+        return BatchCaseResponse(
+            success=True, message="ok", found=1,
+            results=[BatchCaseResult(id=i, found=i == known.id, case=known if i == known.id else None) for i in ids],
+        )
+
+    with patch("routes.support_cases.SupportService.get_cases_by_ids", side_effect=fake_batch) as batch:
+        async with api_client() as client:
+            results = await asyncio.gather(
+                client.get_case(known.id), client.get_case(missing), client.get_case(str(known.id)),
+            )
+
+    assert results == [known, None, known]
+    batch.assert_awaited_once()
+    assert sorted(batch.call_args.args[0]) == sorted([known.id, missing])
+
+
+@pytest.mark.asyncio
+async def test_create_cases_send_idempotency_keys():
+    """Prueba que cada creación lleva su Idempotency-Key y que un duplicado no es una excepción"""
+    created = make_case()
+    duplicate = make_case()
+    seen_keys = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        seen_keys.append(request.headers["Idempotency-Key"])
+        if len(seen_keys) == 1:
+            return httpx.Response(200, json=SupportCaseCreatedResponse(
+                success=True, message="Caso de soporte creado exitosamente", case=created
+            ).model_dump(mode="json"))
+        return httpx.Response(409, json={
+            "success": False, "message": "Ya existe un caso abierto", "error_code": "DUPLICATE_CASE",
+            "existing_case": duplicate.model_dump(mode="json"),
+        })
+
+    async with SupportClient("http://test", transport=httpx.MockTransport(handler), retry=NO_WAIT) as client:
+        first, second = await client.create_cases([NEW_CASE, NEW_CASE], concurrency=1)
+
+    assert first.success and first.case == created
+    assert not second.success and second.existing_case == duplicate
+    assert len(set(seen_keys)) == 2
+
+
+@pytest.mark.asyncio
+async def test_retries_overload_and_connection_errors():
+    """Prueba el reintento de un 503 con Retry-After y de un fallo de conexión con la misma clave"""
+    attempts = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(request.headers["Idempotency-Key"])
+        if len(attempts) == 1:
+            return httpx.Response(503, headers={"Retry-After": "0"}, json={"error_code": "OVERLOADED"})
+        if len(attempts) == 2:
+            raise httpx.ConnectError("conexión rechazada")
+        return httpx.Response(200, json={"success": True, "message": "ok", "case": make_case().model_dump(mode="json")})
+
+    async with SupportClient("http://test", transport=httpx.MockTransport(handler), retry=NO_WAIT) as client:
+        response = await client.create_case(NEW_CASE)
+
+    assert response.success
+    assert len(attempts) == 3 and len(set(attempts)) == 1
+
+
+@pytest.mark.asyncio
+async def test_errors_are_raised_after_retries():
+    """Prueba que un error no reintentable o los reintentos agotados se informan con su código"""
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/status"):
+            return httpx.Response(503, json={"success": False, "message": "Servicio saturado", "error_code": "OVERLOADED"})
+        return httpx.Response(400, json={"success": False, "message": "Filtro inválido", "error_code": "INVALID_REQUEST"})
+
+    async with SupportClient("http://test", transport=httpx.MockTransport(handler), retry=NO_WAIT) as client:
+        with pytest.raises(SupportClientError) as invalid:
+            await client.list_cases()
+        with pytest.raises(SupportClientError) as overloaded:
+            await client.update_status([uuid4()], "completado")
+
+    assert invalid.value.status_code == 400 and invalid.value.error_code == "INVALID_REQUEST"
+    assert overloaded.value.status_code == 503 and overloaded.value.error_code == "OVERLOADED"
+
+
+def test_backoff_is_bounded_and_honours_retry_after():
+    """Prueba la espera exponencial con jitter acotada y el mínimo de Retry-After"""
+    policy = RetryPolicy(attempts=5, backoff=0.1, backoff_max=1.0)
+
+    assert all(0 <= policy.delay(attempt) <= min(1.0, 0.1 * 2 ** attempt) for attempt in range(8))
+    assert policy.delay(0, retry_after=0.5) >= 0.5
+    assert policy.delay(0, retry_after=30) == 1.0
@@ -0,0 +1,148 @@
+import json
+from datetime import datetime
+from types import SimpleNamespace
+from uuid import uuid4
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from utils.tracing import FileSpanExporter, parse_traceparent, set_exporter, start_trace
+
+client = TestClient(app)
+
+CALLER_TRACE = "4bf92f3577b34da6a3ce929d0e0e4736"
+CALLER_SPAN = "00f067aa0ba902b7"
+
+
+class ListExporter:
+    """Guarda en memoria las trazas exportadas"""
+
+    def __init__(self):
+        self.traces = []
+
+    def export(self, spans):
+        self.traces.append(spans)
+
+    def shutdown(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, row):
+        self.row = row
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params):
+        pass
+
+    def fetchone(self):
+        return self.row
+
+
+class FakeDatabase:
+    def __init__(self, row):
+        self.row = row
+
+    def get_connection(self, autocommit=False):
+        return SimpleNamespace(cursor=lambda: FakeCursor(self.row), commit=lambda: None)
+
+    def return_connection(self, conn):
+        pass
+
+
+@pytest.fixture
+def exporter():
+    exporter = ListExporter()
+    set_exporter(exporter)
+    yield exporter
+    set_exporter(None)
+
+
+@pytest.fixture
+def fake_case(monkeypatch):
+    case_id = str(uuid4())
+    now = datetime(2025, 4, 1, 12, 0)
+    row = (
+        case_id, "Corregir dirección cliente", "Dirección incorrecta en registro",
+        "finkargo_clientes", "clientes", "UPDATE clientes SET direccion = 'x' WHERE id = 1",
+        "maria.gonzalez@finkargo.com", "pendiente", "media", now, now, None,
+        "UPDATE", ["clientes"], "0f1e2d3c4b5a6978", None, None,
+    )
+    monkeypatch.setattr("database.connection.get_database", lambda shard=None: FakeDatabase(row))
+    return case_id
+
+
+@pytest.mark.parametrize("header, expected", [
+    (f"00-{CALLER_TRACE}-{CALLER_SPAN}-01", (CALLER_TRACE, CALLER_SPAN, True)),
+    (f"00-{CALLER_TRACE}-{CALLER_SPAN}-00", (CALLER_TRACE, CALLER_SPAN, False)),
+    (f"00-{'0' * 32}-{CALLER_SPAN}-01", None),
+    (f"ff-{CALLER_TRACE}-{CALLER_SPAN}-01", None),
+    ("00-xyz-00f067aa0ba902b7-01", None),
+    (None, None),
+])
+def test_parse_traceparent(header, expected):
+    """Prueba la lectura de la cabecera W3C traceparent"""
+    assert parse_traceparent(header) == expected
+
+
+def test_request_spans_follow_the_call_path(exporter, fake_case):
+    """Prueba los spans de ruta, servicio y base de datos bajo la traza de quien llama"""
+    response = client.get(
+        f"/api/support-cases/case/{fake_case}",
+        headers={"traceparent": f"00-{CALLER_TRACE}-{CALLER_SPAN}-01"},
+    )
+
+    assert response.status_code == 200
+    assert len(exporter.traces) == 1
+    spans = {span.name: span for span in exporter.traces[0]}
+    assert {span.trace_id for span in spans.values()} == {CALLER_TRACE}
+
+    root = spans["GET /api/support-cases/case/{case_id}"]
+    route = spans["route get_case_by_id"]
+    service = spans["SupportService.get_case_by_id"]
+    query = spans["db.query"]
+    assert root.parent_id == CALLER_SPAN
+    assert route.parent_id == root.span_id
+    assert service.parent_id == route.span_id
+    assert query.parent_id == service.span_id
+
+    assert root.attributes["http.response.status_code"] == 200
+    assert query.attributes["db.operation"] == "SELECT"
+    assert query.attributes["db.sql.table"] == ["support_cases"]
+    assert query.attributes["db.rows"] == 1
+    assert query.attributes["db.pool_wait_ms"] >= 0
+    # Nunca los parámetros de la consulta
+    assert fake_case not in json.dumps(query.attributes)
+
+
+def test_unsampled_caller_is_not_recorded(exporter, fake_case):
+    """Prueba que se respeta la decisión de muestreo de quien llama"""
+    client.get(
+        f"/api/support-cases/case/{fake_case}",
+        headers={"traceparent": f"00-{CALLER_TRACE}-{CALLER_SPAN}-00"},
+    )
+    assert exporter.traces == []
+
+
+def test_file_exporter_writes_otlp_json(tmp_path):
+    """Prueba que el exportador de archivo escribe OTLP-JSON, una traza por línea"""
+    path = tmp_path / "traces.jsonl"
+    set_exporter(FileSpanExporter(str(path)))
+    try:
+        with start_trace("GET /api/support-cases/") as root:
+            root.set_attribute("http.response.status_code", 200)
+    finally:
+        set_exporter(None)
+
+    document = json.loads(path.read_text().splitlines()[0])
+    scope_spans = document["resourceSpans"][0]["scopeSpans"][0]
+    span = scope_spans["spans"][0]
+    assert span["name"] == "GET /api/support-cases/"
+    assert len(span["traceId"]) == 32 and "parentSpanId" not in span
+    assert {"key": "http.response.status_code", "value": {"intValue": "200"}} in span["attributes"]
+    assert span["status"] == {"code": 1}
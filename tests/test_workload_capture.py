@@ -0,0 +1,197 @@
+import json
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+from uuid import uuid4
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from models.support_responses import (
+    BatchCaseResponse,
+    PaginatedResponse,
+    SupportCase,
+    SupportCaseCreatedResponse,
+)
+from services.workload_replay import Materializer, WorkloadReplayer, build_pools
+from utils.workload_capture import close_capture, normalize_params, token
+
+client = TestClient(app)
+
+CASE = SupportCase(
+    id=str(uuid4()),
+    title="Corregir dirección cliente",
+    description="Dirección incorrecta en registro",
+    database_name="finkargo_clientes",
+    schema_name="clientes",
+    sql_query="UPDATE clientes SET direccion = 'x' WHERE id = 456",
+    executed_by="maria.gonzalez@finkargo.com",
+    status="pendiente",
+    priority="media",
+    created_at=datetime(2025, 4, 1, 12, 0),
+    updated_at=datetime(2025, 4, 1, 12, 0),
+)
+
+PAGE = PaginatedResponse(
+    message="ok", success=True, items=[CASE], total=1, page=1, size=10, total_pages=1
+)
+
+
+@pytest.fixture
+def capture_file(tmp_path, monkeypatch):
+    path = tmp_path / "workload_capture.jsonl"
+    monkeypatch.setattr(
+        "utils.workload_capture.get_settings",
+        lambda: SimpleNamespace(
+            workload_capture_enabled=True,
+            workload_capture_path=str(path),
+            workload_capture_max_mb=1,
+            workload_capture_backups=1,
+            workload_capture_sample_rate=1.0,
+        ),
+    )
+    yield path
+    close_capture()
+
+
+def records(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_normalize_params_sanitizes_values():
+    """Prueba la normalización de filtros: enumeraciones tal cual, tokens y fechas relativas"""
+    now = datetime(2025, 4, 10, tzinfo=timezone.utc)
+    params = normalize_params(
+        "status=pendiente,completado&status=pendiente&database_name=finkargo_clientes"
+        "&start_date=2025-04-09T00:00:00&page=2&size=100",
+        now,
+    )
+    assert params == {
+        "database_name": [token("finkargo_clientes")],
+        "page": "2",
+        "size": "100",
+        "start_date": "-86400s",
+        "status": ["pendiente", "completado"],
+    }
+
+
+def test_listing_request_is_captured_without_identifying_values(capture_file):
+    """Prueba que la captura guarda la forma de la petición, no sus datos"""
+    with patch(
+        "routes.support_cases.SupportService.get_paginated_cases",
+        new=AsyncMock(return_value=PAGE),
+    ), patch(
+        "routes.support_cases.SupportService.get_listing_etag", new=AsyncMock(return_value=None)
+    ):
+        response = client.get(
+            "/api/support-cases/?status=pendiente&database_name=finkargo_clientes"
+            "&executed_by=maria.gonzalez@finkargo.com&size=50"
+        )
+    client.get("/api/metrics/")
+    client.get("/api/support-cases/no-existe/de-verdad")
+
+    [record] = records(capture_file)
+    assert record["method"] == "GET"
+    assert record["route"] == "/api/support-cases/"
+    assert record["params"]["status"] == ["pendiente"]
+    assert record["params"]["size"] == "50"
+    assert record["params"]["database_name"] == [token("finkargo_clientes")]
+    assert record["status"] == 200
+    assert record["response_bytes"] == len(response.content)
+    assert record["duration_ms"] > 0
+    line = capture_file.read_text()
+    assert "finkargo_clientes" not in line and "maria.gonzalez" not in line
+
+
+def test_body_shape_is_captured(capture_file):
+    """Prueba que del cuerpo se guardan longitudes de listas y tamaños de texto"""
+    ids = [str(uuid4()), str(uuid4())]
+    with patch(
+        "routes.support_cases.SupportService.get_cases_by_ids",
+        new=AsyncMock(return_value=BatchCaseResponse(success=True, message="ok")),
+    ):
+        client.post("/api/support-cases/batch", json={"ids": ids})
+
+    created = SupportCaseCreatedResponse(success=True, message="ok", case=CASE)
+    with patch(
+        "routes.support_cases.SupportService.create_support_case",
+        new=AsyncMock(return_value=created),
+    ):
+        client.post("/api/support-cases/", json={
+            "title": "Error en consulta SQL",
+            "description": "La consulta no devuelve los resultados esperados",
+            "database_name": "finkargo_db",
+            "schema_name": "clientes",
+            "sql_query": "SELECT * FROM clientes WHERE id = 123",
+            "executed_by": "juan.perez@finkargo.com",
+            "priority": "alta",
+        })
+
+    batch, create = records(capture_file)
+    assert batch["body"] == {"ids": {"count": 2}}
+    assert create["body"]["sql_query"] == {"bytes": len("SELECT * FROM clientes WHERE id = 123")}
+    assert create["body"]["priority"] == "alta"
+    assert create["body"]["database_name"] == token("finkargo_db")
+
+
+def test_materializer_resolves_tokens_from_local_cases():
+    """Prueba que la reproducción sustituye tokens, fechas y textos"""
+    pools = build_pools([CASE.model_dump(mode="json")])
+    materializer = Materializer(pools, now=datetime(2025, 4, 10, tzinfo=timezone.utc).timestamp())
+    method, url, params, body = materializer.request({
+        "method": "POST",
+        "route": "/api/support-cases/case/{case_id}",
+        "path_params": {"case_id": token("otro-id")},
+        "params": {"database_name": [token("x")], "start_date": "-86400s", "size": "50"},
+        "body": {"ids": {"count": 3}, "sql_query": {"bytes": 100}},
+    })
+    assert url == f"/api/support-cases/case/{CASE.id}"
+    assert params == [
+        ("database_name", "finkargo_clientes"),
+        ("start_date", "2025-04-09T00:00:00Z"),
+        ("size", "50"),
+    ]
+    assert body["ids"] == [str(CASE.id)] * 3
+    assert body["sql_query"].startswith("SELECT 1") and len(body["sql_query"]) == 100
+
+
+@pytest.mark.asyncio
+async def test_replay_reports_latency_against_capture():
+    """Prueba la reproducción tan rápida como sea posible y su informe"""
+    capture = [
+        {"ts": 100.0 + i, "method": "GET", "route": "/api/support-cases/",
+         "path_params": {}, "params": {"status": ["pendiente"]}, "body": None,
+         "status": 200, "duration_ms": 10.0, "response_bytes": 500}
+        for i in range(3)
+    ] + [
+        {"ts": 104.0, "method": "GET", "route": "/api/support-cases/case/{case_id}",
+         "path_params": {"case_id": token("a")}, "params": {}, "body": None,
+         "status": 200, "duration_ms": 5.0, "response_bytes": 300},
+        {"ts": 105.0, "method": "PATCH", "route": "/api/support-cases/status",
+         "path_params": {}, "params": {}, "body": {"ids": {"count": 1}, "status": "cerrado"},
+         "status": 200, "duration_ms": 8.0, "response_bytes": 200},
+    ]
+    found = SupportCaseCreatedResponse(success=True, message="ok", case=CASE)
+    with patch(
+        "routes.support_cases.SupportService.get_paginated_cases", new=AsyncMock(return_value=PAGE)
+    ) as listing, patch(
+        "routes.support_cases.SupportService.get_listing_etag", new=AsyncMock(return_value=None)
+    ), patch(
+        "routes.support_cases.SupportService.get_case_by_id", new=AsyncMock(return_value=found)
+    ) as by_id:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app)) as http:
+            report = await WorkloadReplayer("http://test", speed=None, client=http).run(capture)
+
+    assert report["requests"] == 4
+    assert report["excluded_writes"] == 1
+    assert report["captured_rps"] == 1.0
+    listing_report = report["routes"]["GET /api/support-cases/"]
+    assert listing_report["requests"] == 3
+    assert listing_report["errors"] == 0
+    assert listing_report["captured_ms"]["p50"] == 10.0
+    assert report["routes"]["GET /api/support-cases/case/{case_id}"]["status_mismatches"] == 0
+    # Una llamada para los valores locales y tres de la captura
+    assert listing.await_count == 4
+    assert listing.await_args.kwargs["status"] == ["pendiente"]
+    assert by_id.await_args.args == (str(CASE.id),)
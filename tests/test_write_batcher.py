@@ -0,0 +1,224 @@
+import asyncio
+from types import SimpleNamespace
+from uuid import uuid4
+import psycopg2
+import pytest
+
+from database.support_queries import INSERT_CASE_ROW
+from services.write_batcher import CaseWriteBatcher
+from utils.metrics import metrics
+
+
+def case_params(title="Corregir dirección cliente", submission_hash=None, allow_duplicate=False):
+    """Parámetros de INSERT_CASE para un caso nuevo"""
+    return (
+        str(uuid4()), title, "Dirección incorrecta en registro", "finkargo_clientes",
+        "clientes", "UPDATE clientes SET direccion = 'x' WHERE id = 1",
+        "maria.gonzalez@finkargo.com", "pendiente", None, None, "media",
+        "UPDATE", ["clientes"], "0f1e2d3c4b5a6978",
+        submission_hash or uuid4().hex, allow_duplicate, None, None,
+    )
+
+
+class FakeExecute:
+    """Registra las sentencias y falla en las que contienen ``bad_title``"""
+
+    def __init__(self, bad_title=None):
+        self.calls = []
+        self.bad_title = bad_title
+
+    async def __call__(self, query, params=None, fetch_one=False, fetch_all=False, shard=None, **kwargs):
+        self.calls.append((query, params, shard))
+        await asyncio.sleep(0)
+        if self.bad_title is not None and self.bad_title in params:
+            raise ValueError("valor inválido")
+        # El primer parámetro es el array de hashes que se bloquean
+        ids = params[1::INSERT_CASE_ROW.count("%s")]
+        return (ids[0],) if fetch_one else [(case_id,) for case_id in ids]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_inserts_share_one_statement(monkeypatch):
+    """Prueba que las inserciones concurrentes salen en un solo INSERT"""
+    fake = FakeExecute()
+    monkeypatch.setattr("services.write_batcher.execute", fake)
+    metrics.reset()
+    batcher = CaseWriteBatcher(max_rows=50, max_wait_ms=20)
+
+    params = [case_params() for _ in range(5)]
+    results = await asyncio.gather(*(batcher.submit(p) for p in params))
+
+    assert len(fake.calls) == 1
+    assert fake.calls[0][0].count("(%s::uuid") == 5
+    assert results == [(p[0],) for p in params]
+    assert metrics.snapshot()["histograms"]["write_batch_size"]["max"] == 5
+
+
+@pytest.mark.asyncio
+async def test_batch_flushes_at_max_rows(monkeypatch):
+    """Prueba que un lote lleno se escribe sin esperar al temporizador"""
+    fake = FakeExecute()
+    monkeypatch.setattr("services.write_batcher.execute", fake)
+    batcher = CaseWriteBatcher(max_rows=3, max_wait_ms=10_000)
+
+    results = await asyncio.wait_for(
+        asyncio.gather(*(batcher.submit(case_params()) for _ in range(6))), timeout=1
+    )
+
+    assert len(results) == 6
+    assert [call[0].count("(%s::uuid") for call in fake.calls] == [3, 3]
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_reports_error_per_caller(monkeypatch):
+    """Prueba que una fila inválida solo hace fallar a su llamada"""
+    fake = FakeExecute(bad_title="inválido")
+    monkeypatch.setattr("services.write_batcher.execute", fake)
+    batcher = CaseWriteBatcher(max_rows=50, max_wait_ms=5)
+
+    good, bad = case_params(), case_params(title="inválido")
+    results = await asyncio.gather(batcher.submit(good), batcher.submit(bad), return_exceptions=True)
+
+    assert results[0] == (good[0],)
+    assert isinstance(results[1], ValueError)
+    # Un intento en lote y luego una sentencia por fila
+    assert len(fake.calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_lost_connection_does_not_resend_rows(monkeypatch):
+    """Prueba que un lote que pudo escribirse no se repite fila a fila"""
+    calls = []
+
+    async def lost_execute(query, params=None, **kwargs):
+        calls.append(kwargs)
+        raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    monkeypatch.setattr("services.write_batcher.execute", lost_execute)
+    batcher = CaseWriteBatcher(max_rows=50, max_wait_ms=5)
+
+    results = await asyncio.gather(*(batcher.submit(case_params()) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(r, psycopg2.OperationalError) for r in results)
+    assert len(calls) == 1 and calls[0]["idempotent"] is False
+
+
+@pytest.mark.asyncio
+async def test_create_case_uses_batcher_when_enabled(monkeypatch):
+    """Prueba que create_support_case pasa por el lote si está activado"""
+    fake = FakeExecute()
+    monkeypatch.setattr("services.write_batcher.execute", fake)
+    monkeypatch.setattr(
+        "services.support_service.get_settings",
+        lambda: SimpleNamespace(
+            write_batch_enabled=True, payload_inline_max_bytes=65536, payload_preview_bytes=2048
+        ),
+    )
+    monkeypatch.setattr("services.support_service.case_batcher", CaseWriteBatcher(max_rows=10, max_wait_ms=5))
+    from services.support_service import SupportService
+
+    responses = await asyncio.gather(*(
+        SupportService.create_support_case(
+            title=f"Caso {i}", description="Prueba", database_name="finkargo_clientes",
+            schema_name="clientes", sql_query=f"SELECT {i}", executed_by="juan.perez@finkargo.com",
+            priority="media",
+        )
+        for i in range(4)
+    ))
+
+    assert all(r.success for r in responses)
+    assert len(fake.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_identical_submissions_in_one_batch_are_written_after(monkeypatch):
+    """Prueba que un envío repetido dentro del lote se escribe por separado"""
+    fake = FakeExecute()
+    monkeypatch.setattr("services.write_batcher.execute", fake)
+    batcher = CaseWriteBatcher(max_rows=50, max_wait_ms=5)
+
+    first = case_params(submission_hash="a" * 32)
+    repeated = case_params(submission_hash="a" * 32)
+    other = case_params()
+    await asyncio.gather(*(batcher.submit(p) for p in (first, repeated, other)))
+
+    assert [call[0].count("(%s::uuid") for call in fake.calls] == [2, 1]
+    assert fake.calls[0][1][0] == ["a" * 32, other[14]]
+    assert fake.calls[1][1][1] == repeated[0]
+
+
+@pytest.mark.asyncio
+async def test_unexpected_error_fails_every_caller(monkeypatch):
+    """Prueba que un error fuera del INSERT no deja llamadas esperando"""
+    fake = FakeExecute()
+    monkeypatch.setattr("services.write_batcher.execute", fake)
+    batcher = CaseWriteBatcher(max_rows=50, max_wait_ms=5)
+
+    results = await asyncio.wait_for(asyncio.gather(
+        batcher.submit(case_params()), batcher.submit(("incompleto",)), return_exceptions=True,
+    ), timeout=1)
+
+    assert all(isinstance(r, IndexError) for r in results)
+    assert fake.calls == []
+
+
+@pytest.mark.asyncio
+async def test_queued_row_times_out_and_is_not_written(monkeypatch):
+    """Prueba que una fila que no sale de la cola a tiempo se retira sin escribirse"""
+    fake = FakeExecute()
+    monkeypatch.setattr("services.write_batcher.execute", fake)
+    metrics.reset()
+    batcher = CaseWriteBatcher(max_rows=50, max_wait_ms=10_000, timeout_ms=20)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await batcher.submit(case_params())
+    await batcher.drain()
+
+    assert fake.calls == []
+    assert metrics.snapshot()["counters"]["write_batch_timeouts_total"] == 1
+
+
+@pytest.mark.asyncio
+async def test_sent_batch_is_awaited_past_the_timeout(monkeypatch):
+    """Prueba que un lote ya enviado no se abandona: la fila puede confirmarse"""
+    release = asyncio.Event()
+    fake = FakeExecute()
+
+    async def slow_execute(query, params=None, **kwargs):
+        await release.wait()
+        return await fake(query, params, **kwargs)
+
+    monkeypatch.setattr("services.write_batcher.execute", slow_execute)
+    metrics.reset()
+    batcher = CaseWriteBatcher(max_rows=50, max_wait_ms=1, timeout_ms=20)
+
+    params = case_params()
+    pending = asyncio.ensure_future(batcher.submit(params))
+    await asyncio.sleep(0.05)
+    assert not pending.done()
+    release.set()
+
+    assert await pending == (params[0],)
+    assert "write_batch_timeouts_total" not in metrics.snapshot()["counters"]
+
+
+@pytest.mark.asyncio
+async def test_batch_runs_outside_the_submitter_context(monkeypatch):
+    """Prueba que el lote no hereda las ContextVars de la petición que lo abrió"""
+    from utils.statement_timeout import current_statement_timeout, set_statement_timeout
+    seen = []
+
+    async def recording_execute(query, params=None, **kwargs):
+        seen.append(current_statement_timeout())
+        return [(params[1],)]
+
+    monkeypatch.setattr("services.write_batcher.execute", recording_execute)
+    monkeypatch.setattr("services.write_batcher.get_settings", lambda: SimpleNamespace(
+        statement_timeout_write_ms=5000,
+    ))
+    batcher = CaseWriteBatcher(max_rows=50, max_wait_ms=1, timeout_ms=1000)
+
+    set_statement_timeout(123)
+    await batcher.submit(case_params())
+
+    assert seen == [5000]
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Optional
+from config import get_settings
+from utils.metrics import metrics
+from utils.timing import record
+
+# Control de admisión delante del pool de conexiones. Cada clase de ruta
+# (lecturas y escrituras) admite un número limitado de peticiones a la vez;
+# las demás esperan en una cola acotada, en orden de llegada, hasta un plazo.
+# Si la cola está llena o el plazo vence, la petición se rechaza enseguida
+# con 503 y Retry-After en lugar de acumularse detrás del pool.
+
+# POST que solo leen
+READ_ONLY_POSTS = {"/api/support-cases/batch"}
+# Fuera del control: deben responder también con el servicio saturado
+EXEMPT_PREFIXES = ("/api/metrics", "/api/admin", "/docs", "/openapi.json", "/redoc")
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted (queue full or deadline passed)"""
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded FIFO wait queue and a wait deadline"""
+
+    def __init__(self, name: str, limit: int, queue_size: int, queue_timeout_ms: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout_ms = queue_timeout_ms
+        self.active = 0
+        self._waiters = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            metrics.increment(f"admission_{self.name}_rejected_total")
+            raise Overloaded(f"cola de {self.name} llena")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        start = time.perf_counter()
+        try:
+            # release() pasa su hueco directamente al primero de la cola
+            await asyncio.wait_for(future, self.queue_timeout_ms / 1000)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                return
+            metrics.increment(f"admission_{self.name}_rejected_total")
+            metrics.increment(f"admission_{self.name}_timeouts_total")
+            raise Overloaded(f"plazo de espera de {self.name} vencido")
+        except asyncio.CancelledError:
+            # El cliente se fue: si el hueco ya era suyo, se devuelve
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            if future in self._waiters:
+                self._waiters.remove(future)
+            wait_ms = (time.perf_counter() - start) * 1000
+            metrics.observe(f"admission_{self.name}_wait_ms", wait_ms)
+            record("admission", wait_ms)
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+_controllers = {}
+
+
+def get_controller(route_class: str) -> AdmissionController:
+    """Controller of a route class ("read" or "write"), built from the settings on first use"""
+    controller = _controllers.get(route_class)
+    if controller is None:
+        settings = get_settings()
+        limit = settings.admission_read_limit if route_class == "read" else settings.admission_write_limit
+        controller = _controllers[route_class] = AdmissionController(
+            route_class, limit, settings.admission_queue_size, settings.admission_queue_timeout_ms
+        )
+    return controller
+
+
+def reset_controllers():
+    _controllers.clear()
+
+
+for _route_class in ("read", "write"):
+    metrics.register_gauge(
+        f"admission_{_route_class}_active",
+        lambda c=_route_class: _controllers[c].active if c in _controllers else 0,
+    )
+    metrics.register_gauge(
+        f"admission_{_route_class}_queued",
+        lambda c=_route_class: _controllers[c].queued if c in _controllers else 0,
+    )
+
+
+def route_class_for(scope) -> Optional[str]:
+    """"read", "write" or None (not subject to admission control)"""
+    path = scope.get("path", "")
+    if not path.startswith("/api/") or path.startswith(EXEMPT_PREFIXES):
+        return None
+    method = scope.get("method", "GET")
+    if method in ("GET", "HEAD", "OPTIONS") or path.rstrip("/") in READ_ONLY_POSTS:
+        return "read"
+    return "write"
+
+
+class AdmissionMiddleware:
+    """Admit each API request through its route class controller or answer 503"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        route_class = route_class_for(scope) if scope["type"] == "http" else None
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        settings = get_settings()
+        if not settings.admission_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        controller = get_controller(route_class)
+        try:
+            await controller.acquire()
+        except Overloaded:
+            await self._reject(send, settings.admission_retry_after_seconds)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release()
+
+    @staticmethod
+    async def _reject(send, retry_after: int):
+        body = json.dumps({
+            "success": False,
+            "message": "El servicio está saturado, intenta de nuevo en unos segundos",
+            "error_code": "SERVICE_OVERLOADED",
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
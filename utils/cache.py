@@ -0,0 +1,407 @@
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+import zlib
+from collections import OrderedDict, defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional, Type
+from pydantic import BaseModel
+from config import get_settings
+from utils.metrics import metrics
+
+# Caché en dos niveles para lecturas que se repiten entre workers:
+# - L1: diccionario LRU en cada proceso, con vigencia corta.
+# - L2: compartida por todos los workers (Redis o compatible), con los
+#   valores serializados en JSON compacto y comprimidos si son grandes.
+# Las escrituras invalidan: la clave se reemplaza en L2 por una lápida
+# durante CACHE_INVALIDATION_WINDOW_MS (una lectura anterior a la escritura
+# no puede volver a dejar el valor viejo) y se publica en un canal para que
+# los demás workers la borren de su L1. Cada clave se carga una sola vez a
+# la vez: en el proceso, las peticiones simultáneas comparten la carga; entre
+# procesos, quien no obtiene el candado de L2 espera el valor un momento.
+# Cualquier fallo de L2 se trata como un fallo de caché: la lectura va a la
+# base de datos.
+
+logger = logging.getLogger(__name__)
+
+# Cambiarlo descarta las entradas de L2 escritas con otra forma
+CACHE_FORMAT = "1"
+TOMBSTONE = b""
+LOCK_POLL_SECONDS = 0.02
+_MISSING = object()
+
+
+def encode_value(value: BaseModel, compress_min_bytes: int) -> bytes:
+    """Compact bytes for L2: JSON without default-valued fields, zlib if large"""
+    data = value.model_dump_json(exclude_defaults=True).encode()
+    if len(data) >= compress_min_bytes:
+        return b"z" + zlib.compress(data, 1)
+    return b"j" + data
+
+
+def decode_value(data: bytes, model: Type[BaseModel]) -> BaseModel:
+    kind, body = data[:1], data[1:]
+    if kind == b"z":
+        body = zlib.decompress(body)
+    elif kind != b"j":
+        raise ValueError(f"Entrada de caché no válida: {kind!r}")
+    return model.model_validate_json(body)
+
+
+class MemoryCacheBackend:
+    """In-process stand-in for the shared tier (tests, a single worker)"""
+
+    def __init__(self):
+        self._values: Dict[str, tuple] = {}
+        self._listeners = defaultdict(list)
+
+    def _live(self, key: str) -> Optional[bytes]:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._values[key]
+            return None
+        return entry[1]
+
+    async def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        return [self._live(key) for key in keys]
+
+    async def set(self, key: str, value: bytes, ttl_ms: int, only_if_absent: bool = False) -> bool:
+        if only_if_absent and self._live(key) is not None:
+            return False
+        self._values[key] = (time.monotonic() + ttl_ms / 1000, value)
+        return True
+
+    async def set_many(self, items: dict, ttl_ms: int):
+        for key, value in items.items():
+            await self.set(key, value, ttl_ms)
+
+    async def delete(self, keys: List[str]):
+        for key in keys:
+            self._values.pop(key, None)
+
+    async def publish(self, channel: str, message: bytes):
+        for queue in self._listeners[channel]:
+            queue.put_nowait(message)
+
+    async def listen(self, channel: str, callback: Callable[[Optional[bytes]], None]):
+        queue = asyncio.Queue()
+        self._listeners[channel].append(queue)
+        try:
+            callback(None)
+            while True:
+                callback(await queue.get())
+        finally:
+            self._listeners[channel].remove(queue)
+
+    async def close(self):
+        pass
+
+
+def _memory_backend(settings):
+    return MemoryCacheBackend()
+
+
+def _redis_backend(settings):
+    from utils.redis_protocol import RedisCacheBackend
+    return RedisCacheBackend(
+        settings.cache_redis_url,
+        pool_size=settings.cache_redis_pool_size,
+        timeout=settings.cache_redis_timeout_ms / 1000,
+    )
+
+
+# Fábricas por nombre (CACHE_BACKEND); register_cache_backend añade otras
+BACKENDS: Dict[str, Callable] = {
+    "memory": _memory_backend,
+    "redis": _redis_backend,
+}
+
+_backend_state = {"loaded": False, "backend": None}
+
+
+def register_cache_backend(name: str, factory: Callable):
+    """Register a backend factory ``(settings) -> backend`` under ``name``"""
+    BACKENDS[name] = factory
+
+
+def set_cache_backend(backend):
+    """Use ``backend`` as the shared tier, or None to disable caching"""
+    _backend_state.update(loaded=True, backend=backend)
+
+
+def get_cache_backend():
+    if not _backend_state["loaded"]:
+        settings = get_settings()
+        name = settings.cache_backend.lower()
+        factory = BACKENDS.get(name)
+        if factory is None and name != "none":
+            logger.warning("Backend de caché desconocido: %s", name)
+        set_cache_backend(factory(settings) if factory else None)
+    return _backend_state["backend"]
+
+
+def _is_not_none(value) -> bool:
+    return value is not None
+
+
+class TwoLevelCache:
+    """Per-process L1 in front of the shared backend, for one kind of value.
+
+    Values are pydantic models. L1 keeps the model objects themselves, so
+    callers must not modify what they get back.
+    """
+
+    def __init__(self, namespace: str, l1_max_entries: Optional[int] = None):
+        self.namespace = namespace
+        self.channel = f"cache:{namespace}:invalidate"
+        self.origin = uuid.uuid4().hex
+        self._l1_max_entries = l1_max_entries
+        self._l1: "OrderedDict[str, tuple]" = OrderedDict()
+        # Cambia con cada invalidación: una carga empezada antes no se guarda en L1
+        self._generation = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._listener: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return get_cache_backend() is not None
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{CACHE_FORMAT}:{key}"
+
+    def _l1_get(self, key: str):
+        entry = self._l1.get(key)
+        if entry is None:
+            return _MISSING
+        if entry[0] <= time.monotonic():
+            del self._l1[key]
+            return _MISSING
+        self._l1.move_to_end(key)
+        return entry[1]
+
+    def _l1_put(self, key: str, value, generation: int):
+        if generation != self._generation:
+            return
+        settings = get_settings()
+        self._l1[key] = (time.monotonic() + settings.cache_l1_ttl_seconds, value)
+        self._l1.move_to_end(key)
+        max_entries = self._l1_max_entries or settings.cache_l1_max_entries
+        while len(self._l1) > max_entries:
+            self._l1.popitem(last=False)
+
+    def _decode(self, data: Optional[bytes], model: Type[BaseModel]):
+        if not data:
+            return _MISSING
+        try:
+            return decode_value(data, model)
+        except Exception as e:
+            metrics.increment("cache_decode_errors_total")
+            logger.warning("Entrada de caché ilegible en %s: %s", self.namespace, e)
+            return _MISSING
+
+    async def _backend_call(self, operation: str, *args, default=None):
+        # Un fallo de la L2 nunca hace fallar la lectura ni la escritura
+        try:
+            return await getattr(get_cache_backend(), operation)(*args)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            metrics.increment("cache_backend_errors_total")
+            logger.debug("Operación %s de caché fallida: %s", operation, e)
+            return default
+
+    async def _store(self, items: Dict[str, BaseModel]):
+        # NX: no pisar un valor más reciente ni la lápida de una invalidación
+        settings = get_settings()
+        ttl_ms = settings.cache_ttl_seconds * 1000
+        for key, value in items.items():
+            data = encode_value(value, settings.cache_compress_min_bytes)
+            metrics.observe("cache_entry_bytes", len(data))
+            # Vigencias algo distintas para que no expiren todas a la vez
+            await self._backend_call(
+                "set", self._key(key), data, int(ttl_ms * random.uniform(0.9, 1.0)), True
+            )
+
+    async def get_or_load(
+        self,
+        key: str,
+        model: Type[BaseModel],
+        loader: Callable[[], Awaitable],
+        cacheable: Callable[[object], bool] = _is_not_none,
+    ):
+        """Cached value of ``key``, or the result of ``loader()``.
+
+        Results for which ``cacheable`` is false (by default None, e.g. not
+        found) are returned but not stored.
+        """
+        if not self.enabled:
+            return await loader()
+        value = self._l1_get(key)
+        if value is not _MISSING:
+            metrics.increment(f"cache_{self.namespace}_l1_hits_total")
+            return value
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fill(key, model, loader, cacheable))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            metrics.increment(f"cache_{self.namespace}_coalesced_total")
+        # shield: si quien inició la carga se cancela, los demás la reciben igual
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()
+
+    async def _fill(self, key, model, loader, cacheable):
+        generation = self._generation
+        full_key = self._key(key)
+        settings = get_settings()
+        data = await self._backend_call("get_many", [full_key], default=[None])
+        value = self._decode(data[0], model)
+        lock_key = f"{full_key}:lock"
+        locked = False
+        if value is _MISSING:
+            locked = await self._backend_call(
+                "set", lock_key, self.origin, int(settings.cache_lock_ms), True,
+                default=True,
+            )
+            if not locked:
+                value = await self._wait_for_fill(full_key, model, settings.cache_lock_wait_ms)
+        if value is not _MISSING:
+            metrics.increment(f"cache_{self.namespace}_l2_hits_total")
+            self._l1_put(key, value, generation)
+            return value
+
+        metrics.increment(f"cache_{self.namespace}_misses_total")
+        try:
+            value = await loader()
+            if cacheable(value):
+                self._l1_put(key, value, generation)
+                await self._store({key: value})
+        finally:
+            if locked:
+                await self._backend_call("delete", [lock_key])
+        return value
+
+    async def _wait_for_fill(self, full_key: str, model, wait_ms: float):
+        # Otro worker está cargando la clave: esperar su valor antes de ir a la BD
+        deadline = time.monotonic() + wait_ms / 1000
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_SECONDS)
+            data = await self._backend_call("get_many", [full_key], default=[None])
+            value = self._decode(data[0], model)
+            if value is not _MISSING:
+                return value
+        metrics.increment(f"cache_{self.namespace}_lock_wait_expired_total")
+        return _MISSING
+
+    async def get_many_or_load(
+        self,
+        keys: List[str],
+        model: Type[BaseModel],
+        loader: Callable[[List[str]], Awaitable[Dict[str, BaseModel]]],
+    ) -> Dict[str, BaseModel]:
+        """Values of ``keys`` found in either tier plus ``loader(missing)``.
+
+        Keys the loader does not return are absent from the result and not
+        cached.
+        """
+        if not self.enabled:
+            return await loader(keys)
+        generation = self._generation
+        found = {}
+        pending = []
+        for key in keys:
+            value = self._l1_get(key)
+            if value is _MISSING:
+                pending.append(key)
+            else:
+                found[key] = value
+        metrics.increment(f"cache_{self.namespace}_l1_hits_total", len(found))
+        if pending:
+            data = await self._backend_call(
+                "get_many", [self._key(key) for key in pending], default=[None] * len(pending)
+            )
+            missing = []
+            for key, item in zip(pending, data):
+                value = self._decode(item, model)
+                if value is _MISSING:
+                    missing.append(key)
+                else:
+                    found[key] = value
+                    self._l1_put(key, value, generation)
+            metrics.increment(f"cache_{self.namespace}_l2_hits_total", len(pending) - len(missing))
+            if missing:
+                metrics.increment(f"cache_{self.namespace}_misses_total", len(missing))
+                loaded = await loader(missing)
+                for key, value in loaded.items():
+                    self._l1_put(key, value, generation)
+                await self._store(loaded)
+                found.update(loaded)
+        return found
+
+    async def invalidate(self, keys: List[str]):
+        """Drop ``keys`` here, tombstone them in L2 and tell the other workers"""
+        if not keys or not self.enabled:
+            return
+        self._drop(keys)
+        window_ms = int(get_settings().cache_invalidation_window_ms)
+        await self._backend_call(
+            "set_many", {self._key(key): TOMBSTONE for key in keys}, window_ms
+        )
+        message = json.dumps({"origin": self.origin, "keys": keys}).encode()
+        await self._backend_call("publish", self.channel, message)
+        metrics.increment(f"cache_{self.namespace}_invalidations_total", len(keys))
+
+    def _drop(self, keys: Optional[List[str]]):
+        self._generation += 1
+        if keys is None:
+            self._l1.clear()
+            return
+        for key in keys:
+            self._l1.pop(key, None)
+
+    def _on_message(self, message: Optional[bytes]):
+        # None: (re)suscripción; pudo perderse alguna invalidación
+        if message is None:
+            self._drop(None)
+            return
+        try:
+            payload = json.loads(message)
+        except ValueError:
+            return
+        if payload.get("origin") != self.origin:
+            self._drop(payload.get("keys") or [])
+
+    def start(self):
+        """Start listening for invalidations from other workers"""
+        backend = get_cache_backend()
+        if backend is not None and self._listener is None:
+            self._listener = asyncio.ensure_future(backend.listen(self.channel, self._on_message))
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._listener = None
+
+    def clear(self):
+        self._drop(None)
+        self._inflight.clear()
+
+
+async def close_cache_backend():
+    backend = _backend_state["backend"]
+    if backend is not None:
+        await backend.close()
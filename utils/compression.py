@@ -0,0 +1,225 @@
+import zlib
+from functools import lru_cache
+from typing import Dict, Optional
+from config import get_settings
+from utils.metrics import metrics
+
+# Compresión negociada de las respuestas de la API según Accept-Encoding:
+# zstd y br si sus paquetes (zstandard, brotli) están instalados, gzip
+# siempre. Las respuestas por debajo de COMPRESSION_MIN_BYTES, las que ya
+# vienen comprimidas y los tipos no textuales se envían tal cual. Las
+# respuestas por streaming se comprimen por bloques.
+
+# Preferencia del servidor entre codificaciones con el mismo q
+PREFERENCE = ("zstd", "br", "gzip")
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml")
+
+
+class _Gzip:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self, brotli, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _Zstd:
+    def __init__(self, zstandard, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+@lru_cache
+def available_encodings() -> tuple:
+    """Encodings this process can produce, in server preference order"""
+    available = []
+    for encoding, module in (("zstd", "zstandard"), ("br", "brotli")):
+        try:
+            __import__(module)
+        except ImportError:
+            continue
+        available.append(encoding)
+    available.append("gzip")
+    return tuple(available)
+
+
+def new_compressor(encoding: str):
+    # Niveles rápidos: la respuesta se comprime en cada petición
+    if encoding == "zstd":
+        import zstandard
+        return _Zstd(zstandard, 3)
+    if encoding == "br":
+        import brotli
+        return _Brotli(brotli, 4)
+    return _Gzip(6)
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Accept-Encoding as {coding: q}"""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def negotiate(header: Optional[str], available=None) -> Optional[str]:
+    """Best encoding for an Accept-Encoding header, or None for identity"""
+    if not header:
+        return None
+    accepted = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for encoding in available or available_encodings():
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _compressible(headers: list) -> bool:
+    content_type = ""
+    for name, value in headers:
+        if name == b"content-encoding":
+            return False
+        if name == b"content-type":
+            content_type = value.decode("latin-1").lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def _add_vary(headers: list) -> list:
+    for index, (name, value) in enumerate(headers):
+        if name == b"vary":
+            if b"accept-encoding" not in value.lower():
+                headers[index] = (name, value + b", Accept-Encoding")
+            return headers
+    headers.append((b"vary", b"Accept-Encoding"))
+    return headers
+
+
+def _compressed_headers(headers: list, encoding: str, length: Optional[int]) -> list:
+    result = []
+    for name, value in headers:
+        if name == b"content-length":
+            continue
+        # La codificación cambia los bytes: un ETag fuerte deja de valer
+        if name == b"etag" and not value.startswith(b"W/"):
+            value = b"W/" + value
+        result.append((name, value))
+    result.append((b"content-encoding", encoding.encode()))
+    if length is not None:
+        result.append((b"content-length", str(length).encode()))
+    return result
+
+
+class CompressionMiddleware:
+    """Compress API responses with the best encoding the client accepts"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "") if scope["type"] == "http" else ""
+        if not path.startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+        settings = get_settings()
+        accept = None
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+        encoding = negotiate(accept) if settings.compression_enabled else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        min_bytes = settings.compression_min_bytes
+        state = {"start": None, "mode": None, "buffer": bytearray(), "compressor": None, "raw": 0}
+
+        async def start_compressed(length: Optional[int]):
+            start = state["start"]
+            start["headers"] = _compressed_headers(start["headers"], encoding, length)
+            await send(start)
+
+        async def compressed_send(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                compressible = message["status"] not in (204, 304) and _compressible(headers)
+                if compressible:
+                    headers = _add_vary(headers)
+                state["start"] = {**message, "headers": headers}
+                state["mode"] = "pending" if compressible else "identity"
+                if not compressible:
+                    await send(state["start"])
+                return
+            if message["type"] != "http.response.body" or state["mode"] == "identity":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if state["mode"] == "pending":
+                state["buffer"].extend(body)
+                if len(state["buffer"]) < min_bytes:
+                    if more_body:
+                        return
+                    # Pequeña: no compensa comprimirla
+                    state["mode"] = "identity"
+                    await send(state["start"])
+                    await send({"type": "http.response.body", "body": bytes(state["buffer"])})
+                    return
+                body, state["buffer"] = bytes(state["buffer"]), bytearray()
+                state["compressor"] = new_compressor(encoding)
+                state["mode"] = "compressing"
+                if not more_body:
+                    compressed = state["compressor"].compress(body) + state["compressor"].finish()
+                    _record(encoding, len(body), len(compressed))
+                    await start_compressed(len(compressed))
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                await start_compressed(None)
+
+            state["raw"] += len(body)
+            chunk = state["compressor"].compress(body)
+            if not more_body:
+                chunk += state["compressor"].finish()
+                _record(encoding, state["raw"], None)
+            if chunk or not more_body:
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, compressed_send)
+
+
+def _record(encoding: str, raw_bytes: int, compressed_bytes: Optional[int]):
+    metrics.increment(f"responses_compressed_{encoding}_total")
+    if compressed_bytes:
+        metrics.observe("response_compression_ratio", raw_bytes / compressed_bytes)
@@ -0,0 +1,59 @@
+import asyncio
+import logging
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CancelOnDisconnectMiddleware:
+    """Cancel the request when the client disconnects before the response.
+
+    The middleware reads ``receive`` itself and relays the messages to the
+    app; an ``http.disconnect`` before the response is complete cancels the
+    task running the app, so pending ``execute()`` calls cancel their queries
+    on the server and give their connections back to the pool instead of
+    finishing for nobody.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        messages = asyncio.Queue()
+        state = {"disconnected": False, "responded": False}
+
+        async def send_response(message):
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                state["responded"] = True
+            await send(message)
+
+        app_task = asyncio.ensure_future(self.app(scope, messages.get, send_response))
+
+        async def relay():
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    state["disconnected"] = True
+                    if not app_task.done() and not state["responded"]:
+                        metrics.increment("requests_cancelled_on_disconnect_total")
+                        logger.info(
+                            "Cliente desconectado, se cancela %s %s",
+                            scope.get("method"), scope.get("path"),
+                        )
+                        app_task.cancel()
+                    return
+
+        relay_task = asyncio.ensure_future(relay())
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            if not state["disconnected"]:
+                # La cancelación viene de fuera (apagado del servidor)
+                raise
+        finally:
+            relay_task.cancel()
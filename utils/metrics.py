@@ -0,0 +1,92 @@
+from collections import defaultdict, deque
+from threading import Lock
+
+# Registro de métricas en proceso. Es deliberadamente simple: contadores,
+# gauges (valores fijos o calculados al leer) e histogramas con una ventana
+# de las últimas observaciones para percentiles.
+
+HISTOGRAM_WINDOW = 1024
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = Lock()
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._gauge_callbacks = {}
+        self._histograms = {}
+
+    def increment(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self._gauges[name] = value
+
+    def register_gauge(self, name: str, callback):
+        """Register a gauge whose value is computed when metrics are read"""
+        with self._lock:
+            self._gauge_callbacks[name] = callback
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = {
+                    "count": 0,
+                    "sum": 0.0,
+                    "window": deque(maxlen=HISTOGRAM_WINDOW),
+                }
+            histogram["count"] += 1
+            histogram["sum"] += value
+            histogram["window"].append(value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            callbacks = dict(self._gauge_callbacks)
+            histograms = {
+                name: (h["count"], h["sum"], sorted(h["window"]))
+                for name, h in self._histograms.items()
+            }
+
+        for name, callback in callbacks.items():
+            try:
+                gauges[name] = callback()
+            except Exception:
+                gauges[name] = None
+
+        return {
+            "counters": counters,
+            "gauges": gauges,
+            "histograms": {
+                name: {
+                    "count": count,
+                    "sum": round(total, 3),
+                    "avg": round(total / count, 3) if count else 0.0,
+                    "p50": round(_percentile(window, 0.50), 3),
+                    "p95": round(_percentile(window, 0.95), 3),
+                    "p99": round(_percentile(window, 0.99), 3),
+                    "max": round(window[-1], 3) if window else 0.0,
+                }
+                for name, (count, total, window) in histograms.items()
+            },
+        }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+metrics = Metrics()
@@ -0,0 +1,310 @@
+import cProfile
+import hmac
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from typing import Optional
+from config import get_settings
+
+# Perfilado bajo demanda, sin herramientas externas:
+# - Una petición con X-Profile: 1 (y el token de administración) se ejecuta
+#   bajo cProfile, tanto en el hilo del event loop como en los hilos donde
+#   execute() hace el trabajo de psycopg2. El resultado se guarda y se
+#   descarga en formato pstats o como texto.
+# - Un muestreo de pila de todos los hilos durante N segundos (reloj de
+#   pared) que produce pilas colapsadas, el formato de flamegraph.pl y
+#   speedscope.
+# - Instantáneas de tracemalloc con los principales puntos de asignación.
+
+MAX_STORED_PROFILES = 20
+MAX_SAMPLE_SECONDS = 60
+
+# Hojas de pila de hilos que esperan trabajo (se omiten salvo include_idle)
+_IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+class ProfilerBusy(Exception):
+    """Raised when a sampling profile is already running"""
+
+
+class RequestProfile:
+    """cProfile data of one request, gathered from every thread it ran on"""
+
+    def __init__(self, method: str, path: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.started = time.time()
+        self.duration_ms = None
+        self._profiles = []
+        self._lock = threading.Lock()
+
+    def add(self, profile: cProfile.Profile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def stats(self) -> Optional[pstats.Stats]:
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    def pstats_bytes(self) -> bytes:
+        """Same content as ``Stats.dump_stats`` (loadable with pstats, snakeviz, gprof2dot)"""
+        stats = self.stats()
+        return marshal.dumps(stats.stats if stats else {})
+
+    def text(self, limit: int = 50, sort: str = "cumulative") -> str:
+        stats = self.stats()
+        if stats is None:
+            return ""
+        out = io.StringIO()
+        stats.stream = out
+        stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "started": self.started,
+            "duration_ms": self.duration_ms,
+        }
+
+
+_request_profile: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+_profiles = OrderedDict()
+_profiles_lock = threading.Lock()
+_request_profiling = threading.Lock()
+
+
+def _store(profile: RequestProfile):
+    with _profiles_lock:
+        _profiles[profile.id] = profile
+        while len(_profiles) > MAX_STORED_PROFILES:
+            _profiles.popitem(last=False)
+
+
+def get_profile(profile_id: str) -> Optional[RequestProfile]:
+    with _profiles_lock:
+        return _profiles.get(profile_id)
+
+
+def list_profiles() -> list:
+    with _profiles_lock:
+        return [profile.summary() for profile in reversed(_profiles.values())]
+
+
+def _enable(profile: cProfile.Profile) -> bool:
+    try:
+        profile.enable()
+        return True
+    except ValueError:
+        # Otro perfilador activo en este hilo (p. ej. un depurador)
+        return False
+
+
+def run_profiled(function, *args):
+    """Call ``function(*args)``, under cProfile if the current request is being profiled.
+
+    Meant for work handed to other threads (``asyncio.to_thread`` copies the
+    request context), so their time shows up in the request's profile.
+    """
+    request_profile = _request_profile.get()
+    if request_profile is None:
+        return function(*args)
+    profile = cProfile.Profile()
+    if not _enable(profile):
+        return function(*args)
+    try:
+        return function(*args)
+    finally:
+        profile.disable()
+        request_profile.add(profile)
+
+
+class ProfileRequestMiddleware:
+    """Profile a single API request when it carries ``X-Profile: 1`` and the admin token.
+
+    The response gets an ``X-Profile-Id`` header; the profile is downloaded
+    from ``/api/admin/profiles/{id}``. Other requests served by the event
+    loop at the same time also show up in the loop thread's profile. One
+    request is profiled at a time: the profiler of the loop thread is shared.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope.get("path", "").startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers", []))
+        if headers.get(b"x-profile") not in (b"1", b"true") or not is_admin(
+            headers.get(b"x-admin-token", b"").decode("latin-1")
+        ) or not _request_profiling.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        request_profile = RequestProfile(scope.get("method"), scope.get("path"))
+        profile = cProfile.Profile()
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"x-profile-id", request_profile.id.encode())
+                ]
+            await send(message)
+
+        token = _request_profile.set(request_profile)
+        enabled = _enable(profile)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            if enabled:
+                profile.disable()
+                request_profile.add(profile)
+            request_profile.duration_ms = round((time.perf_counter() - start) * 1000, 3)
+            _request_profile.reset(token)
+            _request_profiling.release()
+            _store(request_profile)
+
+
+def is_admin(token: Optional[str]) -> bool:
+    """True when ``token`` matches ADMIN_TOKEN (admin endpoints are off without one)"""
+    expected = get_settings().admin_token
+    return bool(expected) and bool(token) and hmac.compare_digest(token, expected)
+
+
+# --- Muestreo de pilas --------------------------------------------------------
+
+_sampling_lock = threading.Lock()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds: float, interval_ms: float = 5, include_idle: bool = False) -> Counter:
+    """Wall-clock samples of every thread's stack for ``seconds``.
+
+    Returns ``Counter`` of collapsed stacks (``thread;outer;...;inner``).
+    Blocking: run it in a worker thread. Only one sampling runs at a time.
+    """
+    if not _sampling_lock.acquire(blocking=False):
+        raise ProfilerBusy("ya hay un perfilado en curso")
+    try:
+        own = threading.get_ident()
+        counts = Counter()
+        deadline = time.monotonic() + min(seconds, MAX_SAMPLE_SECONDS)
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                code = frame.f_code
+                if not include_idle and (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                counts[";".join(reversed(stack))] += 1
+            time.sleep(interval_ms / 1000)
+        return counts
+    finally:
+        _sampling_lock.release()
+
+
+def collapsed(counts: Counter) -> str:
+    """Collapsed-stack text, one ``stack count`` line per stack (most frequent first)"""
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+# --- tracemalloc --------------------------------------------------------------
+
+_tracemalloc_state = {"baseline": None}
+
+
+def start_tracemalloc(frames: int = 1) -> bool:
+    """Start tracing allocations and take the baseline snapshot; False if already running"""
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(frames)
+    _tracemalloc_state["baseline"] = tracemalloc.take_snapshot()
+    return True
+
+
+def stop_tracemalloc() -> bool:
+    if not tracemalloc.is_tracing():
+        return False
+    tracemalloc.stop()
+    _tracemalloc_state["baseline"] = None
+    return True
+
+
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def allocation_report(limit: int = 20, group_by: str = "lineno", compare: bool = False) -> dict:
+    """Top allocation sites now, or their growth since tracing started with ``compare``"""
+    if not tracemalloc.is_tracing():
+        return {"tracing": False, "top": []}
+    snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+    baseline = _tracemalloc_state["baseline"]
+    if compare and baseline is not None:
+        entries = snapshot.compare_to(baseline.filter_traces(_SNAPSHOT_FILTERS), group_by)
+    else:
+        entries = snapshot.statistics(group_by)
+
+    top = []
+    for entry in entries[:limit]:
+        frame = entry.traceback[0]
+        site = {
+            "site": f"{frame.filename}:{frame.lineno}",
+            "size_bytes": entry.size,
+            "count": entry.count,
+        }
+        if compare:
+            site["size_diff_bytes"] = entry.size_diff
+            site["count_diff"] = entry.count_diff
+        if group_by == "traceback":
+            site["traceback"] = [f"{f.filename}:{f.lineno}" for f in entry.traceback]
+        top.append(site)
+
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "tracing": True,
+        "traced_current_bytes": current,
+        "traced_peak_bytes": peak,
+        "group_by": group_by,
+        "compare": compare,
+        "top": top,
+    }
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+from typing import Callable, List, Optional, Sequence
+from urllib.parse import unquote, urlsplit
+from utils.metrics import metrics
+
+# Cliente mínimo del protocolo de Redis (RESP2) sobre asyncio, suficiente
+# para la L2 de la caché: GET/MGET, SET con PX y NX, PUBLISH y SUBSCRIBE.
+# Sirve para Redis, Valkey, KeyDB o cualquier servidor compatible, sin
+# añadir dependencias.
+
+logger = logging.getLogger(__name__)
+
+LISTEN_BACKOFF_SECONDS = 0.1
+LISTEN_BACKOFF_MAX_SECONDS = 5.0
+
+
+class RedisError(Exception):
+    """Error reply from the server"""
+
+
+def encode_command(args: Sequence) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode("utf-8")
+        elif not isinstance(arg, (bytes, bytearray)):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+class RedisConnection:
+    """One connection; replies are read in the order commands were sent"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+
+    @classmethod
+    async def open(cls, url: str) -> "RedisConnection":
+        """Connect to ``redis://[[user]:password@]host[:port][/db]`` (rediss:// for TLS)"""
+        parsed = urlsplit(url)
+        reader, writer = await asyncio.open_connection(
+            parsed.hostname or "localhost", parsed.port or 6379,
+            ssl=True if parsed.scheme == "rediss" else None,
+        )
+        connection = cls(reader, writer)
+        try:
+            if parsed.password:
+                credentials = [unquote(parsed.password)]
+                if parsed.username:
+                    credentials.insert(0, unquote(parsed.username))
+                await connection.execute("AUTH", *credentials)
+            db = parsed.path.lstrip("/")
+            if db and db != "0":
+                await connection.execute("SELECT", db)
+        except BaseException:
+            connection.close()
+            raise
+        return connection
+
+    async def read_reply(self):
+        line = await self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Conexión con la caché cerrada")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b"+":
+            return payload
+        if prefix == b"-":
+            return RedisError(payload.decode("utf-8", "replace"))
+        if prefix == b":":
+            return int(payload)
+        if prefix == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            return (await self._reader.readexactly(length + 2))[:-2]
+        if prefix == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self.read_reply() for _ in range(length)]
+        raise ConnectionError(f"Respuesta de la caché no válida: {line[:20]!r}")
+
+    async def send(self, *commands: Sequence):
+        self._writer.write(b"".join(encode_command(command) for command in commands))
+        await self._writer.drain()
+
+    async def pipeline(self, commands: List[Sequence]) -> list:
+        """Send every command at once, then read one reply per command"""
+        await self.send(*commands)
+        replies = [await self.read_reply() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    async def execute(self, *args):
+        return (await self.pipeline([args]))[0]
+
+    def close(self):
+        self._writer.close()
+
+
+class RedisCacheBackend:
+    """Shared cache tier on a Redis-protocol server.
+
+    Commands go through a small pool of connections, each bounded by
+    ``timeout`` seconds; a connection that fails or times out is dropped.
+    """
+
+    def __init__(self, url: str, pool_size: int = 8, timeout: float = 0.1):
+        self.url = url
+        self.timeout = timeout
+        self._slots = asyncio.Semaphore(pool_size)
+        self._idle: List[RedisConnection] = []
+
+    async def _call(self, commands: List[Sequence]) -> list:
+        async with self._slots:
+            connection = self._idle.pop() if self._idle else None
+            try:
+                if connection is None:
+                    connection = await asyncio.wait_for(RedisConnection.open(self.url), self.timeout)
+                replies = await asyncio.wait_for(connection.pipeline(commands), self.timeout)
+            except RedisError:
+                # Respuesta de error: la conexión sigue sincronizada
+                self._idle.append(connection)
+                raise
+            except BaseException:
+                if connection is not None:
+                    connection.close()
+                raise
+            self._idle.append(connection)
+            return replies
+
+    async def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        return (await self._call([("MGET", *keys)]))[0]
+
+    async def set(self, key: str, value: bytes, ttl_ms: int, only_if_absent: bool = False) -> bool:
+        command = ["SET", key, value, "PX", ttl_ms]
+        if only_if_absent:
+            command.append("NX")
+        return (await self._call([command]))[0] is not None
+
+    async def set_many(self, items: dict, ttl_ms: int):
+        await self._call([("SET", key, value, "PX", ttl_ms) for key, value in items.items()])
+
+    async def delete(self, keys: List[str]):
+        await self._call([("DEL", *keys)])
+
+    async def publish(self, channel: str, message: bytes):
+        await self._call([("PUBLISH", channel, message)])
+
+    async def listen(self, channel: str, callback: Callable[[Optional[bytes]], None]):
+        """Call ``callback`` with every message on ``channel`` until cancelled.
+
+        The subscription reconnects with backoff; after (re)subscribing
+        ``callback(None)`` is called because messages may have been missed.
+        """
+        delay = LISTEN_BACKOFF_SECONDS
+        while True:
+            connection = None
+            try:
+                connection = await asyncio.wait_for(RedisConnection.open(self.url), self.timeout * 10)
+                await connection.send(("SUBSCRIBE", channel))
+                await connection.read_reply()
+                callback(None)
+                delay = LISTEN_BACKOFF_SECONDS
+                while True:
+                    reply = await connection.read_reply()
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                        callback(reply[2])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                metrics.increment("cache_subscription_errors_total")
+                logger.warning("Suscripción de invalidaciones de caché perdida: %s", e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, LISTEN_BACKOFF_MAX_SECONDS)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    async def close(self):
+        while self._idle:
+            self._idle.pop().close()
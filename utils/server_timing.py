@@ -0,0 +1,115 @@
+import functools
+import inspect
+import json
+import logging
+import random
+import time
+from fastapi.routing import APIRoute
+from starlette.datastructures import MutableHeaders
+from utils.timing import current_timing, end_request_timing, start_request_timing
+from utils.tracing import start_span
+
+logger = logging.getLogger("server_timing")
+
+
+def _timed_endpoint(endpoint):
+    """Wrap an endpoint to record validation (time until it runs) and its own time"""
+    # include_router vuelve a construir la ruta con el endpoint ya envuelto
+    if not inspect.iscoroutinefunction(endpoint) or getattr(endpoint, "_timed", False):
+        return endpoint
+
+    span_name = f"route {endpoint.__name__}"
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        with start_span(span_name):
+            timing = current_timing()
+            if timing is None:
+                return await endpoint(*args, **kwargs)
+            start = time.perf_counter()
+            # Enrutado, dependencias y validación de parámetros y cuerpo
+            timing.add("validation", (start - timing.started) * 1000)
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                timing.endpoint_finished = time.perf_counter()
+                timing.add("endpoint", (timing.endpoint_finished - start) * 1000)
+
+    wrapper._timed = True
+    return wrapper
+
+
+class TimedRoute(APIRoute):
+    """APIRoute that also measures validation and response serialization"""
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            response = await handler(request)
+            timing = current_timing()
+            if timing is not None and timing.endpoint_finished is not None:
+                timing.add(
+                    "serialization", (time.perf_counter() - timing.endpoint_finished) * 1000
+                )
+            return response
+
+        return timed_handler
+
+
+class ServerTimingMiddleware:
+    """Add a Server-Timing header to every HTTP response and log a sample.
+
+    A request is logged (one JSON line on the ``server_timing`` logger) with
+    probability ``TIMING_LOG_SAMPLE_RATE``, and always when it takes longer
+    than ``TIMING_LOG_SLOW_MS``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing, token = start_request_timing()
+        state = {"status": None, "total_ms": None}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                state["total_ms"] = timing.elapsed_ms()
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", timing.header(state["total_ms"]))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            end_request_timing(token)
+            if state["total_ms"] is not None:
+                self._log(scope, state["status"], timing, state["total_ms"])
+
+    @staticmethod
+    def _log(scope, status, timing, total_ms):
+        try:
+            from config import get_settings
+            settings = get_settings()
+            slow = total_ms >= settings.timing_log_slow_ms
+            if not slow and random.random() >= settings.timing_log_sample_rate:
+                return
+            entry = {
+                "method": scope.get("method"),
+                "path": scope.get("path"),
+                "status": status,
+                "slow": slow,
+                **timing.as_dict(total_ms),
+            }
+            logger.info(json.dumps(entry))
+        except Exception as e:
+            # El registro de tiempos nunca debe afectar a la respuesta
+            logger.debug("No se pudo registrar el desglose de tiempos: %s", e)
@@ -0,0 +1,381 @@
+import hashlib
+import re
+from collections import OrderedDict
+from threading import Lock
+from typing import List, NamedTuple, Optional
+
+# Análisis ligero del sql_query de un caso: tipo de sentencia, tablas
+# afectadas y una huella (fingerprint) de la consulta normalizada. No es un
+# parser completo de SQL; cubre las sentencias que registra soporte (DML y
+# DDL simple) y nunca lanza excepciones: lo que no reconoce queda como OTHER.
+
+MAX_MEMO_ENTRIES = 4096
+
+STATEMENT_TYPES = [
+    "SELECT", "INSERT", "UPDATE", "DELETE", "MERGE", "CREATE", "ALTER",
+    "DROP", "TRUNCATE", "OTHER", "MULTIPLE",
+]
+
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<comment>--[^\n]*|/\*.*?\*/)
+    | (?P<string>(?:[eE])?'(?:[^']|'')*')
+    | (?P<dollar>\$(?P<tag>[A-Za-z_]*)\$.*?\$(?P=tag)\$)
+    | (?P<quoted>"(?:[^"]|"")*")
+    | (?P<number>\b\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b)
+    | (?P<param>\$\d+|%s|\?)
+    | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    | (?P<punct>[(),;.])
+    | (?P<op>[^\sA-Za-z0-9_(),;.'"]+)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+_MAIN_KEYWORDS = {"SELECT", "INSERT", "UPDATE", "DELETE", "MERGE"}
+# Una sentencia se clasifica por el DML más destructivo que ejecuta,
+# contando las CTE que modifican datos (WITH x AS (DELETE ...) SELECT ...)
+_DML_SEVERITY = {"SELECT": 0, "INSERT": 1, "UPDATE": 2, "MERGE": 3, "DELETE": 4}
+# Palabras entre el nombre de una CTE y su cuerpo: AS [NOT] MATERIALIZED
+_CTE_BODY_PREFIX = {"AS", "NOT", "MATERIALIZED"}
+_DDL_KEYWORDS = {"CREATE", "ALTER", "DROP", "TRUNCATE"}
+_DDL_OBJECT_SKIP = {
+    "OR", "REPLACE", "TEMP", "TEMPORARY", "UNLOGGED", "UNIQUE", "IF", "NOT",
+    "EXISTS", "ONLY", "TABLE", "CONCURRENTLY",
+}
+_TABLE_INTRODUCERS = {"FROM", "JOIN", "INTO", "UPDATE", "USING"}
+_NOT_TABLES = {"SELECT", "LATERAL", "UNNEST", "VALUES"}
+# Palabras que pueden seguir a una tabla y no son su alias
+_AFTER_TABLE = {
+    "WHERE", "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS", "NATURAL", "ON",
+    "USING", "GROUP", "ORDER", "LIMIT", "OFFSET", "HAVING", "WINDOW", "UNION",
+    "EXCEPT", "INTERSECT", "RETURNING", "SET", "FOR", "FETCH", "TABLESAMPLE", "WHEN",
+}
+# Control de transacción y de sesión: no cambian el tipo de lo que se ejecuta
+_TRANSACTION_KEYWORDS = {"BEGIN", "START", "COMMIT", "END", "ROLLBACK", "SAVEPOINT", "RELEASE", "SET"}
+# Funciones cuya sintaxis usa FROM sin referirse a una tabla
+_FROM_FUNCTIONS = {"EXTRACT", "SUBSTRING", "TRIM", "POSITION", "OVERLAY"}
+# Palabras que, en cualquier parte de una sentencia, indican que escribe
+# (CTE que modifica datos, SELECT INTO, SELECT ... FOR UPDATE)
+_WRITE_KEYWORDS = {"INSERT", "UPDATE", "DELETE", "MERGE", "INTO"}
+_LIST_RE = re.compile(r"\?(?: , \?)+")
+_TUPLES_RE = re.compile(r"\( \? \)(?: , \( \? \))+")
+
+
+class SqlAnalysis(NamedTuple):
+    statement_type: str
+    target_tables: List[str]
+    fingerprint: str
+    # Hash de la consulta normalizada conservando los literales
+    exact_hash: str
+
+
+def _tokenize(sql: str):
+    """Tokens as (kind, text), without comments"""
+    tokens = []
+    for match in _TOKEN_RE.finditer(sql):
+        kind = match.lastgroup
+        if kind == "tag":
+            kind = "dollar"
+        if kind == "comment":
+            continue
+        tokens.append((kind, match.group(0)))
+    return tokens
+
+
+def _identifier(text: str) -> str:
+    if text.startswith('"'):
+        return text[1:-1].replace('""', '"')
+    return text.lower()
+
+
+def _split_statements(tokens):
+    statements, current = [], []
+    for kind, text in tokens:
+        if kind == "punct" and text == ";":
+            if current:
+                statements.append(current)
+            current = []
+        else:
+            current.append((kind, text))
+    if current:
+        statements.append(current)
+    return statements
+
+
+def _read_table(tokens, index) -> Optional[str]:
+    """Table name starting at ``index`` (schema-qualified names keep the last part)"""
+    return _read_table_at(tokens, index)[0]
+
+
+def _read_table_at(tokens, index):
+    """(table name or None, index of the token after it)"""
+    # UPDATE ONLY t / DELETE FROM ONLY t / FROM ONLY t
+    if index < len(tokens) and tokens[index][0] == "word" and tokens[index][1].upper() == "ONLY":
+        index += 1
+    name = None
+    while index < len(tokens):
+        kind, text = tokens[index]
+        if kind not in ("word", "quoted"):
+            break
+        if kind == "word" and text.upper() in _NOT_TABLES:
+            break
+        name = _identifier(text)
+        if index + 1 < len(tokens) and tokens[index + 1] == ("punct", "."):
+            index += 2
+            continue
+        index += 1
+        break
+    return name, index
+
+
+def _read_table_list(tokens, index):
+    """Tables of a comma-separated FROM/USING list (``FROM a, b x, c AS y``)"""
+    tables = []
+    while True:
+        table, index = _read_table_at(tokens, index)
+        if not table:
+            break
+        tables.append(table)
+        # Alias opcional: [AS] nombre
+        if index < len(tokens) and tokens[index][0] == "word" and tokens[index][1].upper() == "AS":
+            index += 1
+        if index < len(tokens) and (
+            tokens[index][0] == "quoted"
+            or (tokens[index][0] == "word" and tokens[index][1].upper() not in _AFTER_TABLE)
+        ):
+            index += 1
+        if index < len(tokens) and tokens[index] == ("punct", ","):
+            index += 1
+            continue
+        break
+    return tables
+
+
+def _skip_parens(tokens, index) -> int:
+    """Index of the token after the parenthesis opened at ``index``"""
+    depth = 0
+    while index < len(tokens):
+        if tokens[index] == ("punct", "("):
+            depth += 1
+        elif tokens[index] == ("punct", ")"):
+            depth -= 1
+            if depth == 0:
+                return index + 1
+        index += 1
+    return index
+
+
+def _cte_names(tokens, index) -> set:
+    """Names of ``WITH [RECURSIVE] name [(columns)] AS [[NOT] MATERIALIZED] (...), ...``"""
+    names = set()
+    if index < len(tokens) and tokens[index][0] == "word" and tokens[index][1].upper() == "RECURSIVE":
+        index += 1
+    while index < len(tokens) and tokens[index][0] in ("word", "quoted"):
+        names.add(_identifier(tokens[index][1]))
+        index += 1
+        # Lista de columnas opcional
+        if index < len(tokens) and tokens[index] == ("punct", "("):
+            index = _skip_parens(tokens, index)
+        while index < len(tokens) and tokens[index][0] == "word" and tokens[index][1].upper() in _CTE_BODY_PREFIX:
+            index += 1
+        if index >= len(tokens) or tokens[index] != ("punct", "("):
+            break
+        index = _skip_parens(tokens, index)
+        if index < len(tokens) and tokens[index] == ("punct", ","):
+            index += 1
+            continue
+        break
+    return names
+
+
+def _analyze_statement(tokens):
+    """(statement type, tables) of one statement"""
+    words = [(i, text.upper()) for i, (kind, text) in enumerate(tokens) if kind == "word"]
+    if not words:
+        return "OTHER", []
+
+    first_index, first = words[0]
+    if first in _DDL_KEYWORDS:
+        tables = []
+        index = first_index + 1
+        while index < len(tokens) and tokens[index][0] == "word" and tokens[index][1].upper() in _DDL_OBJECT_SKIP:
+            index += 1
+        # CREATE INDEX ... ON tabla
+        if first == "CREATE" and index < len(tokens) and tokens[index][1].upper() == "INDEX":
+            for position, word in words:
+                if word == "ON" and position > index:
+                    index = position + 1
+                    break
+        table = _read_table(tokens, index)
+        if table:
+            tables.append(table)
+        return first, tables
+
+    # La sentencia principal es la primera palabra clave DML a nivel 0 de
+    # paréntesis (tras la lista de CTEs); un DML justo tras "(" es el cuerpo
+    # de una CTE (FOR UPDATE u ON CONFLICT DO UPDATE nunca van ahí)
+    depth = 0
+    main, cte_dml = None, []
+    for index, (kind, text) in enumerate(tokens):
+        if kind == "punct" and text == "(":
+            depth += 1
+        elif kind == "punct" and text == ")":
+            depth -= 1
+        elif kind == "word" and text.upper() in _MAIN_KEYWORDS:
+            if depth == 0 and main is None:
+                main = (text.upper(), index)
+            elif index > 0 and tokens[index - 1] == ("punct", "("):
+                cte_dml.append((text.upper(), index))
+    statement_type, main_index = main or (None, 0)
+    for keyword, index in cte_dml:
+        if statement_type is None or _DML_SEVERITY[keyword] > _DML_SEVERITY[statement_type]:
+            statement_type, main_index = keyword, index
+    if statement_type is None:
+        return "OTHER", []
+
+    cte_names = _cte_names(tokens, first_index + 1) if first == "WITH" else set()
+
+    tables = []
+    openers = []
+    for index, (kind, text) in enumerate(tokens):
+        if kind == "punct" and text == "(":
+            previous = tokens[index - 1][1].upper() if index > 0 else ""
+            openers.append(previous)
+        elif kind == "punct" and text == ")" and openers:
+            openers.pop()
+        if kind != "word" or text.upper() not in _TABLE_INTRODUCERS:
+            continue
+        keyword = text.upper()
+        if keyword == "FROM" and openers and openers[-1] in _FROM_FUNCTIONS:
+            continue
+        # DELETE ... USING / MERGE ... USING solo leen; UPDATE como palabra
+        # clave de ON CONFLICT DO UPDATE no introduce tabla
+        if keyword == "UPDATE" and index > 0 and tokens[index - 1][1].upper() == "DO":
+            continue
+        if keyword in ("FROM", "USING"):
+            found = _read_table_list(tokens, index + 1)
+        else:
+            found = [_read_table(tokens, index + 1)]
+        for table in found:
+            if table and table not in cte_names and table not in tables:
+                tables.append(table)
+
+    if statement_type != "SELECT":
+        # Para DML la tabla destino es la que se modifica: la primera tras
+        # UPDATE / INSERT INTO / DELETE FROM / MERGE INTO del DML elegido
+        introducer = {"UPDATE": "UPDATE", "INSERT": "INTO", "DELETE": "FROM", "MERGE": "INTO"}[statement_type]
+        for index in range(main_index, len(tokens)):
+            kind, text = tokens[index]
+            if kind == "word" and text.upper() == introducer:
+                target = _read_table(tokens, index + 1)
+                if target:
+                    tables = [target] + [t for t in tables if t != target]
+                break
+    return statement_type, tables
+
+
+def _fingerprint(tokens) -> str:
+    """Hash of the query with literals replaced and whitespace/case normalized"""
+    parts = []
+    for kind, text in tokens:
+        if kind in ("string", "dollar", "number", "param"):
+            token = "?"
+        elif kind == "word":
+            token = text.lower()
+        else:
+            token = text
+        parts.append(token)
+    # IN (?, ?, ?) y VALUES (?, ?), (?, ?) se reducen a una sola aparición
+    normalized = _LIST_RE.sub("?", " ".join(parts))
+    normalized = _TUPLES_RE.sub("( ? )", normalized).rstrip(" ;")
+    return hashlib.sha256(normalized.encode()).hexdigest()[:16]
+
+
+def _exact_hash(tokens) -> str:
+    """Hash of the query without comments, whitespace or keyword case changes"""
+    parts = [text.lower() if kind == "word" else text for kind, text in tokens]
+    normalized = " ".join(parts).rstrip(" ;")
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def _analyze(sql: str) -> SqlAnalysis:
+    tokens = _tokenize(sql)
+    statements = _split_statements(tokens)
+    types, tables = [], []
+    for statement in statements:
+        first = next((text.upper() for kind, text in statement if kind == "word"), None)
+        if first in _TRANSACTION_KEYWORDS:
+            continue
+        statement_type, statement_tables = _analyze_statement(statement)
+        types.append(statement_type)
+        tables.extend(t for t in statement_tables if t not in tables)
+    if not types:
+        statement_type = "OTHER"
+    elif len(set(types)) == 1:
+        statement_type = types[0]
+    else:
+        statement_type = "MULTIPLE"
+    return SqlAnalysis(statement_type, tables, _fingerprint(tokens), _exact_hash(tokens))
+
+
+class _AnalysisMemo:
+    """LRU of analyses keyed by the SHA-256 of the query text"""
+
+    def __init__(self, max_entries: int = MAX_MEMO_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def analyze(self, sql: str) -> SqlAnalysis:
+        key = hashlib.sha256(sql.encode()).digest()
+        with self._lock:
+            analysis = self._entries.get(key)
+            if analysis is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return analysis
+        analysis = _analyze(sql)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = analysis
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return analysis
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+_memo = _AnalysisMemo()
+
+
+def analyze_sql(sql: str) -> SqlAnalysis:
+    """Statement type, target tables and fingerprint of ``sql`` (memoized)"""
+    return _memo.analyze(sql or "")
+
+
+def is_read_only(sql: str) -> bool:
+    """Whether ``sql`` is only plain SELECTs: no data-modifying CTE, SELECT INTO or locking read"""
+    selects = 0
+    for statement in _split_statements(_tokenize(sql or "")):
+        words = [text.upper() for kind, text in statement if kind == "word"]
+        if not words or words[0] in _TRANSACTION_KEYWORDS:
+            continue
+        if words[0] not in ("SELECT", "WITH") or _WRITE_KEYWORDS.intersection(words):
+            return False
+        selects += 1
+    return selects > 0
+
+
+def submission_hash(sql: str, database_name: str, schema_name: str) -> str:
+    """Key of "the same fix": same normalized query against the same database/schema.
+
+    Unlike the fingerprint, literals are kept: two UPDATEs that only differ
+    in the id they touch are different fixes.
+    """
+    key = "\0".join([database_name.lower(), schema_name.lower(), analyze_sql(sql).exact_hash])
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
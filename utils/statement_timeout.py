@@ -0,0 +1,33 @@
+from contextvars import ContextVar
+from typing import Optional
+from config import get_settings
+
+# Presupuesto de statement_timeout por ruta. Cada ruta declara su presupuesto
+# con la dependencia statement_timeout("<nombre>"), que lee
+# STATEMENT_TIMEOUT_<NOMBRE>_MS de la configuración; execute() lo aplica en
+# la transacción de cada consulta de esa petición.
+
+_statement_timeout_ms: ContextVar[Optional[int]] = ContextVar("statement_timeout_ms", default=None)
+
+
+def current_statement_timeout() -> Optional[int]:
+    """statement_timeout (ms) for queries of the current request, or None"""
+    return _statement_timeout_ms.get()
+
+
+def set_statement_timeout(ms: Optional[int]):
+    """Set the budget for the current context; returns a token for ``reset_statement_timeout``"""
+    return _statement_timeout_ms.set(ms or None)
+
+
+def reset_statement_timeout(token):
+    _statement_timeout_ms.reset(token)
+
+
+def statement_timeout(budget: str):
+    """Route dependency applying the ``statement_timeout_<budget>_ms`` setting"""
+
+    async def apply_statement_timeout():
+        set_statement_timeout(getattr(get_settings(), f"statement_timeout_{budget}_ms"))
+
+    return apply_statement_timeout
@@ -0,0 +1,108 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Optional
+from utils.sql_analyzer import analyze_sql
+
+# Desglose de tiempos por petición. El middleware de Server-Timing crea un
+# RequestTiming por petición y lo deja en un ContextVar; execute(), el pool y
+# los servicios van sumando sus fases. asyncio.to_thread copia el contexto,
+# así que lo que se mide en los hilos del pool llega al mismo objeto.
+
+# Consultas listadas una a una en la cabecera; el resto se agrupa
+MAX_LISTED_QUERIES = 20
+
+_current_timing: ContextVar[Optional["RequestTiming"]] = ContextVar("request_timing", default=None)
+
+
+class RequestTiming:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.endpoint_finished = None
+        self.phases = {}
+        self.queries = []
+        self._lock = Lock()
+
+    def add(self, name: str, ms: float):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + ms
+
+    def add_query(self, ms: float, description: str):
+        with self._lock:
+            self.queries.append((ms, description))
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def header(self, total_ms: float) -> str:
+        """Server-Timing header value (durations in ms)"""
+        entries = [f"{name};dur={ms:.2f}" for name, ms in self.phases.items()]
+        for index, (ms, description) in enumerate(self.queries[:MAX_LISTED_QUERIES], start=1):
+            entries.append(f'db-{index};desc="{description}";dur={ms:.2f}')
+        rest = self.queries[MAX_LISTED_QUERIES:]
+        if rest:
+            entries.append(
+                f'db-other;desc="{len(rest)} queries";dur={sum(ms for ms, _ in rest):.2f}'
+            )
+        entries.append(f"total;dur={total_ms:.2f}")
+        return ", ".join(entries)
+
+    def as_dict(self, total_ms: float) -> dict:
+        return {
+            "total_ms": round(total_ms, 3),
+            "phases": {name: round(ms, 3) for name, ms in self.phases.items()},
+            "db_queries": len(self.queries),
+            "db_ms": round(sum(ms for ms, _ in self.queries), 3),
+            "queries": [
+                {"desc": description, "ms": round(ms, 3)} for ms, description in self.queries
+            ],
+        }
+
+
+def current_timing() -> Optional[RequestTiming]:
+    return _current_timing.get()
+
+
+def start_request_timing():
+    """Attach a new RequestTiming to the current context; returns (timing, token)"""
+    timing = RequestTiming()
+    return timing, _current_timing.set(timing)
+
+
+def end_request_timing(token):
+    _current_timing.reset(token)
+
+
+def record(name: str, ms: float):
+    timing = _current_timing.get()
+    if timing is not None:
+        timing.add(name, ms)
+
+
+def record_query(query: str, shard, ms: float):
+    timing = _current_timing.get()
+    if timing is None:
+        return
+    # Tipo de sentencia y tabla destino, como los atributos del span
+    analysis = analyze_sql(query)
+    description = analysis.statement_type
+    if analysis.target_tables:
+        description += f" {analysis.target_tables[0]}"
+    if shard is not None:
+        description += f" shard {shard}"
+    timing.add_query(ms, description)
+
+
+@contextmanager
+def timing_span(name: str):
+    """Add the duration of the block to phase ``name`` of the current request"""
+    timing = _current_timing.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, (time.perf_counter() - start) * 1000)
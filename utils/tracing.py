@@ -0,0 +1,411 @@
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger("tracing")
+
+# Trazas distribuidas en proceso, sin dependencias: un span por petición HTTP
+# (middleware), por handler de ruta, por método de servicio y por cada
+# execute(). Las trazas terminadas se entregan a un exportador intercambiable
+# (archivo OTLP-JSON, OTLP/HTTP o log). Con TRACING_EXPORTER=none (por
+# defecto) no se crea ningún span y el coste es una lectura de ContextVar.
+# La cabecera W3C traceparent de quien llama se usa como padre de la traza.
+
+SERVICE_NAME = "finkargo-support-backend"
+SCOPE_NAME = "finkargo.support"
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class _Trace:
+    """Spans of one request, exported together when the root span ends"""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans = []
+        self.finished = False
+        self._lock = threading.Lock()
+
+    def add(self, span: "Span"):
+        with self._lock:
+            # Un lote de escritura puede terminar después de su petición
+            if not self.finished:
+                self.spans.append(span)
+
+
+class Span:
+    __slots__ = (
+        "trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns",
+        "attributes", "status", "status_message",
+    )
+
+    def __init__(self, trace: _Trace, name: str, parent_id: Optional[str], kind: int):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = {}
+        self.status = None
+        self.status_message = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        self.status = STATUS_ERROR
+        self.status_message = str(error)
+        self.attributes["exception.type"] = type(error).__name__
+
+    def end(self):
+        self.end_ns = time.time_ns()
+        if self.status is None:
+            self.status = STATUS_OK
+        self.trace.add(self)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def parse_traceparent(header: Optional[str]):
+    """(trace_id, parent span id, sampled) from a W3C traceparent, or None if invalid"""
+    if not header:
+        return None
+    parts = header.strip().lower().split("-")
+    if len(parts) < 4 or len(parts[0]) != 2 or parts[0] == "ff":
+        return None
+    version, trace_id, parent_id, flags = parts[:4]
+    if len(trace_id) != 32 or len(parent_id) != 16 or len(flags) != 2:
+        return None
+    try:
+        int(trace_id, 16), int(parent_id, 16)
+        sampled = bool(int(flags, 16) & 1)
+    except ValueError:
+        return None
+    if trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    # Versión 00: exactamente cuatro campos
+    if version == "00" and len(parts) != 4:
+        return None
+    return trace_id, parent_id, sampled
+
+
+@contextmanager
+def start_span(name: str, kind: int = SPAN_KIND_INTERNAL, attributes: Optional[dict] = None):
+    """Child span of the current one; does nothing outside a sampled trace"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    span = Span(parent.trace, name, parent.span_id, kind)
+    if attributes:
+        span.attributes.update(attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+
+def traced(name: str):
+    """Decorator running an async function inside a span named ``name``"""
+
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return await function(*args, **kwargs)
+            with start_span(name):
+                return await function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# --- Exportadores -------------------------------------------------------------
+
+def _attribute_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_attribute_value(v) for v in value]}}
+    return {"stringValue": str(value)}
+
+
+def _attributes(values: dict) -> list:
+    return [{"key": key, "value": _attribute_value(value)} for key, value in values.items()]
+
+
+def to_otlp_json(spans) -> dict:
+    """OTLP/JSON ExportTraceServiceRequest for ``spans``"""
+    otlp_spans = []
+    for span in spans:
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": span.kind,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": _attributes(span.attributes),
+            "status": {"code": span.status},
+        }
+        if span.parent_id:
+            otlp_span["parentSpanId"] = span.parent_id
+        if span.status_message:
+            otlp_span["status"]["message"] = span.status_message
+        otlp_spans.append(otlp_span)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _attributes({"service.name": SERVICE_NAME})},
+            "scopeSpans": [{"scope": {"name": SCOPE_NAME}, "spans": otlp_spans}],
+        }]
+    }
+
+
+class FileSpanExporter:
+    """Append one OTLP-JSON document per trace to a local file (works offline)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        line = json.dumps(to_otlp_json(spans), separators=(",", ":"))
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+    def shutdown(self):
+        pass
+
+
+class LoggingSpanExporter:
+    """Write each finished trace as one JSON line on the ``tracing`` logger"""
+
+    def export(self, spans):
+        logger.info(json.dumps(to_otlp_json(spans), separators=(",", ":")))
+
+    def shutdown(self):
+        pass
+
+
+class OtlpHttpSpanExporter:
+    """POST traces as OTLP/JSON to a collector from a background thread.
+
+    The request path never waits on the collector: traces go through a
+    bounded queue and are dropped (``traces_dropped_total``) when it is full
+    or the collector is unreachable.
+    """
+
+    def __init__(self, endpoint: str, timeout: float = 2.0, max_queue: int = 1000):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="otlp-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, spans):
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            from utils.metrics import metrics
+            metrics.increment("traces_dropped_total")
+
+    def _run(self):
+        import urllib.request
+        while True:
+            spans = self._queue.get()
+            if spans is None:
+                return
+            request = urllib.request.Request(
+                self.endpoint,
+                data=json.dumps(to_otlp_json(spans)).encode(),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            try:
+                urllib.request.urlopen(request, timeout=self.timeout).close()
+            except Exception as e:
+                from utils.metrics import metrics
+                metrics.increment("traces_dropped_total")
+                logger.debug("No se pudo enviar la traza a %s: %s", self.endpoint, e)
+
+    def shutdown(self):
+        self._queue.put(None)
+        self._thread.join(timeout=self.timeout)
+
+
+def _file_exporter(settings):
+    return FileSpanExporter(settings.tracing_file_path)
+
+
+def _otlp_exporter(settings):
+    return OtlpHttpSpanExporter(settings.tracing_otlp_endpoint)
+
+
+def _logging_exporter(settings):
+    return LoggingSpanExporter()
+
+
+# Fábricas por nombre (TRACING_EXPORTER); register_exporter añade otras
+EXPORTERS: Dict[str, Callable] = {
+    "file": _file_exporter,
+    "otlp": _otlp_exporter,
+    "log": _logging_exporter,
+}
+
+_exporter_state = {"loaded": False, "exporter": None}
+
+
+def register_exporter(name: str, factory: Callable):
+    """Register an exporter factory ``(settings) -> exporter`` under ``name``"""
+    EXPORTERS[name] = factory
+
+
+def set_exporter(exporter):
+    """Use ``exporter`` (an object with ``export(spans)``) or None to disable tracing"""
+    _exporter_state.update(loaded=True, exporter=exporter)
+
+
+def get_exporter():
+    if not _exporter_state["loaded"]:
+        from config import get_settings
+        settings = get_settings()
+        name = settings.tracing_exporter.lower()
+        factory = EXPORTERS.get(name)
+        if factory is None and name != "none":
+            logger.warning("Exportador de trazas desconocido: %s", name)
+        set_exporter(factory(settings) if factory else None)
+    return _exporter_state["exporter"]
+
+
+def shutdown_tracing():
+    exporter = _exporter_state["exporter"]
+    if exporter is not None:
+        exporter.shutdown()
+
+
+@contextmanager
+def start_trace(name: str, traceparent: Optional[str] = None, sample_rate: float = 1.0,
+                attributes: Optional[dict] = None):
+    """Root span of a request, continuing the caller's trace if ``traceparent`` is valid"""
+    exporter = get_exporter()
+    parent = parse_traceparent(traceparent)
+    if exporter is None:
+        yield None
+        return
+    if parent is not None:
+        trace_id, parent_id, sampled = parent
+    else:
+        trace_id, parent_id = os.urandom(16).hex(), None
+        sampled = random.random() < sample_rate
+    if not sampled:
+        yield None
+        return
+
+    trace = _Trace(trace_id)
+    span = Span(trace, name, parent_id, SPAN_KIND_SERVER)
+    if attributes:
+        span.attributes.update(attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+        with trace._lock:
+            trace.finished = True
+            spans = list(trace.spans)
+        try:
+            exporter.export(spans)
+        except Exception as e:
+            # Exportar nunca debe afectar a la respuesta
+            logger.debug("No se pudo exportar la traza: %s", e)
+
+
+class TracingMiddleware:
+    """Open the root span of each HTTP request (``traceparent`` aware)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # Solo la API: /docs y /openapi.json no necesitan configuración
+        if (
+            scope["type"] != "http"
+            or not scope.get("path", "").startswith("/api/")
+            or get_exporter() is None
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        from config import get_settings
+        traceparent = None
+        for key, value in scope.get("headers", []):
+            if key == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+
+        method = scope.get("method")
+        with start_trace(
+            f"{method} {scope.get('path')}",
+            traceparent,
+            get_settings().tracing_sample_rate,
+            {"http.request.method": method, "url.path": scope.get("path")},
+        ) as span:
+            if span is None:
+                await self.app(scope, receive, send)
+                return
+
+            async def send_with_status(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.response.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.status = STATUS_ERROR
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                # Nombre de baja cardinalidad: la plantilla de la ruta, no la URL
+                route_path = getattr(scope.get("route"), "path", None)
+                if route_path:
+                    span.name = f"{method} {route_path}"
+                    span.set_attribute("http.route", route_path)
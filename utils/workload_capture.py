@@ -0,0 +1,188 @@
+import hashlib
+import json
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+from typing import Optional
+from urllib.parse import parse_qsl
+from config import get_settings
+from models.support_schema import MULTI_VALUE_FIELDS
+
+# Captura de la carga real: una línea NDJSON por petición a la API con la
+# forma de la petición (ruta, filtros normalizados, tamaño del cuerpo),
+# su estado, su duración y el tamaño de la respuesta. Los valores que
+# identifican datos (ids, bases de datos, usuarios) se sustituyen por tokens
+# estables y los textos libres por su longitud; las fechas se guardan
+# relativas al momento de la petición. services/workload_replay.py
+# reproduce el archivo contra una instancia local.
+
+# Valores que se guardan tal cual: enumeraciones, números y paginación
+VERBATIM_FIELDS = {
+    "page", "size", "status", "priority", "statement_type", "event_type",
+    "limit", "after_id", "allow_duplicate", "field",
+}
+DATE_FIELDS = {
+    "start_date", "end_date", "updated_start_date", "updated_end_date",
+    "start", "end", "after_occurred_at",
+}
+# Valores que la reproducción sustituye por datos de la instancia local
+TOKEN_FIELDS = {
+    "id", "ids", "case_id", "database_name", "schema_name", "executed_by",
+    "actor", "changed_by", "target_table", "sql_fingerprint",
+}
+EXCLUDED_PREFIXES = ("/api/admin", "/api/metrics")
+MAX_CAPTURED_BODY = 1024 * 1024
+
+_writer = {"logger": None, "path": None}
+
+
+def token(value) -> str:
+    """Stable, non-reversible stand-in for an identifying value"""
+    return "~" + hashlib.sha256(str(value).encode()).hexdigest()[:12]
+
+
+def _relative(value: str, now: datetime) -> str:
+    try:
+        moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return value
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return f"{round((moment - now).total_seconds())}s"
+
+
+def sanitize_value(name: str, value, now: datetime):
+    if name in DATE_FIELDS and isinstance(value, str):
+        return _relative(value, now)
+    if isinstance(value, (bool, int, float)) or value is None or name in VERBATIM_FIELDS:
+        return value
+    if name in TOKEN_FIELDS:
+        return token(value)
+    # Texto libre: solo su longitud
+    return {"bytes": len(str(value).encode())}
+
+
+def normalize_params(query_string: str, now: datetime) -> dict:
+    """Query params as PaginationParams reads them (repeated or comma-separated), sanitized"""
+    params = {}
+    for name, value in parse_qsl(query_string, keep_blank_values=False):
+        if name in MULTI_VALUE_FIELDS or name in ("event_type", "actor"):
+            values = params.setdefault(name, [])
+            for part in value.split(","):
+                part = part.strip()
+                if part and part not in values:
+                    values.append(part)
+        else:
+            params[name] = value
+    return {
+        name: (
+            [sanitize_value(name, item, now) for item in value]
+            if isinstance(value, list) else sanitize_value(name, value, now)
+        )
+        for name, value in sorted(params.items())
+        if value != []
+    }
+
+
+def body_shape(body: bytes, now: datetime) -> Optional[dict]:
+    """Sanitized shape of a JSON body: list lengths, verbatim enums, tokens and text sizes"""
+    if not body:
+        return None
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return {"bytes": len(body)}
+    if not isinstance(data, dict):
+        return {"bytes": len(body)}
+    return {
+        name: {"count": len(value)} if isinstance(value, list) else sanitize_value(name, value, now)
+        for name, value in sorted(data.items())
+    }
+
+
+def _get_logger(path: str, max_bytes: int, backups: int) -> logging.Logger:
+    if _writer["path"] != path:
+        logger = logging.getLogger("workload_capture")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        _writer.update(logger=logger, path=path)
+    return _writer["logger"]
+
+
+def close_capture():
+    logger = _writer["logger"]
+    if logger is not None:
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+    _writer.update(logger=None, path=None)
+
+
+class WorkloadCaptureMiddleware:
+    """Append the sanitized shape of each API request to a rotating NDJSON file"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "") if scope["type"] == "http" else ""
+        if not path.startswith("/api/") or path.startswith(EXCLUDED_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+        settings = get_settings()
+        if not settings.workload_capture_enabled or random.random() >= settings.workload_capture_sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.time()
+        start = time.perf_counter()
+        body = bytearray()
+        response = {"status": None, "bytes": 0}
+
+        async def capture_receive():
+            message = await receive()
+            if message["type"] == "http.request" and len(body) < MAX_CAPTURED_BODY:
+                body.extend(message.get("body", b""))
+            return message
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, capture_receive, capture_send)
+        finally:
+            route = getattr(scope.get("route"), "path", None)
+            # Sin ruta (404) la URL podría contener cualquier cosa: no se guarda
+            if route is not None and response["status"] is not None:
+                now = datetime.fromtimestamp(started, timezone.utc)
+                record = {
+                    "ts": round(started, 6),
+                    "method": scope.get("method"),
+                    "route": route,
+                    "path_params": {
+                        name: sanitize_value(name, value, now)
+                        for name, value in (scope.get("path_params") or {}).items()
+                    },
+                    "params": normalize_params(scope.get("query_string", b"").decode("latin-1"), now),
+                    "body": body_shape(bytes(body), now),
+                    "status": response["status"],
+                    "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+                    "response_bytes": response["bytes"],
+                }
+                _get_logger(
+                    settings.workload_capture_path,
+                    int(settings.workload_capture_max_mb * 1024 * 1024),
+                    settings.workload_capture_backups,
+                ).info(json.dumps(record, separators=(",", ":"), ensure_ascii=False))